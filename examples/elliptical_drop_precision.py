@@ -0,0 +1,58 @@
+""" Compare single precision storage with double precision on the
+elliptical drop test case
+
+The drop is evaluated twice, with the bulk properties (u, v, w, m, rho,
+p, e, cs) stored in double and in single precision. The SPH functions
+accumulate in double precision in both runs. The differences between
+the runs and the error in the x semi-axis of the drop with respect
+to the exact solution are printed.
+
+"""
+import time
+import numpy
+
+import pysph.base.api as base
+import pysph.solver.api as solver
+
+from elliptical_drop_exact import exact_solution
+
+tf = 0.00076
+dt = 1e-5
+
+def run(precision):
+    pa = solver.get_circular_patch(name='fluid', type=0, precision=precision)
+    particles = base.Particles(arrays=[pa])
+
+    s = solver.FluidSolver(dim=2, integrator_type=solver.RK2Integrator)
+    s.set_final_time(tf)
+    s.set_time_step(dt)
+    s.set_print_freq(int(tf/dt) + 10)
+    s.setup_integrator(particles)
+
+    t1 = time.time()
+    s.solve()
+
+    return pa, time.time() - t1
+
+def report(pa_double, pa_single):
+    xe, ye, pe = exact_solution(tf, dt)
+    a = xe.max()
+
+    ad = numpy.abs(pa_double.x).max()
+    asingle = numpy.abs(pa_single.x).max()
+    print 'error in the x semi-axis: double %g, single %g'%(abs(ad - a),
+                                                           abs(asingle - a))
+
+    for prop in ('x', 'y', 'u', 'v', 'rho', 'p'):
+        d = pa_double.get(prop)
+        s = pa_single.get(prop)
+        scale = max(numpy.abs(d).max(), 1e-300)
+        print 'max relative difference in %-3s: %g'%(
+            prop, numpy.abs(d - s).max()/scale)
+
+if __name__ == '__main__':
+    pa_double, t_double = run('double')
+    pa_single, t_single = run('single')
+
+    print 'time: double %g s, single %g s'%(t_double, t_single)
+    report(pa_double, pa_single)
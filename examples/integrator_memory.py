@@ -0,0 +1,34 @@
+""" Report the memory used by the integrators on the elliptical drop
+
+The fluid solver is set up with each integrator and the bytes allocated
+for the properties added by the integrator (initial arrays, k arrays
+and registers) are printed, together with the bytes of all the
+properties of the particle array.
+
+"""
+import pysph.base.api as base
+import pysph.solver.api as solver
+
+integrators = [solver.EulerIntegrator, solver.RK2Integrator,
+               solver.RK4Integrator, solver.PredictorCorrectorIntegrator,
+               solver.LowStorageRK3Integrator,
+               solver.LowStorageRK4Integrator,
+               solver.VelocityVerletIntegrator]
+
+def get_total_bytes(pa):
+    nbytes = 0
+    for arr in pa.properties.values():
+        nbytes += arr.alloc * arr.get_npy_array().itemsize
+    return nbytes
+
+for integrator_type in integrators:
+    pa = solver.get_circular_patch(name='fluid', type=0)
+    particles = base.Particles(arrays=[pa])
+
+    s = solver.FluidSolver(dim=2, integrator_type=integrator_type)
+    s.setup_integrator(particles)
+
+    nbytes = s.integrator.get_memory_usage()['fluid']
+
+    print '%-30s integrator %10d bytes, total %10d bytes'%(
+        integrator_type.__name__, nbytes, get_total_bytes(pa))
@@ -19,6 +19,7 @@ from Cython.Build import cythonize
 from numpy.distutils.extension import Extension
 
 import numpy
+import os
 import sys
 import multiprocessing
 ncpu = multiprocessing.cpu_count()
@@ -32,6 +33,53 @@ mpi_compile_args = []
 mpi_link_args = []
 
 USE_CPP = True
+
+# OpenMP for the threaded neighbor cache construction and function
+# evaluation. Without it the parallel loops run on a single thread.
+# Set PYSPH_USE_OPENMP=0 (1) to disable (force) it, by default it is
+# used if a test program builds with the OpenMP flags.
+openmp_modules = ["pysph.base.nnps", "pysph.sph.sph_func"]
+openmp_compile_args = ['-fopenmp']
+openmp_link_args = ['-fopenmp']
+
+def has_openmp():
+    """ Return True if the compiler builds and links an OpenMP program """
+    import shutil
+    import tempfile
+    from distutils.ccompiler import new_compiler
+    from distutils.sysconfig import customize_compiler
+    from distutils.errors import CompileError, LinkError
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmp_dir, 'test_openmp.c')
+        f = open(src, 'w')
+        f.write('#include <omp.h>\n'
+                'int main(void) { return omp_get_max_threads() < 1; }\n')
+        f.close()
+
+        compiler = new_compiler()
+        customize_compiler(compiler)
+        try:
+            objects = compiler.compile([src], output_dir=tmp_dir,
+                                       extra_postargs=openmp_compile_args)
+            compiler.link_executable(objects,
+                                     os.path.join(tmp_dir, 'test_openmp'),
+                                     extra_postargs=openmp_link_args)
+        except (CompileError, LinkError):
+            return False
+        return True
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if os.environ.get('PYSPH_USE_OPENMP') is not None:
+    USE_OPENMP = os.environ['PYSPH_USE_OPENMP'] not in ('', '0')
+else:
+    USE_OPENMP = has_openmp()
+
+if not USE_OPENMP:
+    print 'OpenMP is not used, the parallel loops run on a single thread'
+
 HAS_MPI4PY = True
 try:
     import mpi4py
@@ -69,6 +117,9 @@ base = [Extension("pysph.base.carray",
         Extension("pysph.base.polygon_array",
                   ["source/pysph/base/polygon_array.pyx"],),
 
+        Extension("pysph.base.tree",
+                  ["source/pysph/base/tree.pyx"],),
+
         Extension("pysph.base.nnps",
                   ["source/pysph/base/nnps.pyx"],),
 
@@ -143,6 +194,9 @@ kernels = [Extension("pysph.base.kernels",
 solver = [
           Extension("pysph.solver.particle_generator",
                     ["source/pysph/solver/particle_generator.pyx"],),
+
+          Extension("pysph.solver.integrator_utils",
+                    ["source/pysph/solver/integrator_utils.pyx"],),
           ]
 
 
@@ -160,6 +214,13 @@ for extn in ext_modules:
     if USE_CPP:
         extn.language = 'c++'
 
+if USE_OPENMP:
+    for extn in ext_modules:
+        if extn.name in openmp_modules:
+            extn.extra_compile_args = extn.extra_compile_args + \
+                openmp_compile_args
+            extn.extra_link_args = extn.extra_link_args + openmp_link_args
+
 for extn in parallel:
     extn.include_dirs.extend(mpi_inc_dirs)
     extn.extra_compile_args.extend(mpi_compile_args)
@@ -9,10 +9,13 @@ from kernels import KernelBase, DummyKernel, CubicSplineKernel, \
         QuinticSplineKernel, WendlandQuinticSplineKernel, Poly6Kernel
 
 from nnps import NbrParticleLocatorBase, FixedDestNbrParticleLocator, \
-        VarHNbrParticleLocator, NNPSManager, brute_force_nnps
+        VarHNbrParticleLocator, TreeNbrParticleLocator, NNPSManager, \
+        brute_force_nnps
 
 from nnps import NeighborLocatorType
 
+from tree import KDTree, TreeQueryType
+
 from particle_array import ParticleArray
 from particles import Particles, get_particle_array
 
@@ -25,6 +25,14 @@ cdef class BaseArray:
     cdef public long length, alloc
     cdef np.ndarray _npy_array
 
+    # incremented when the length or the data buffer changes
+    cdef readonly long generation
+
+    # file-mapped storage (see use_mmap)
+    cdef readonly bint mapped
+    cdef readonly object mmap_path
+    cdef object _mmap
+
     cpdef reserve(self, long size)
     cpdef resize(self, long size)
     cpdef np.ndarray get_npy_array(self)
@@ -40,6 +48,7 @@ cdef class BaseArray:
     cpdef copy_values(self, LongArray indices, BaseArray dest)
     cpdef copy_subset(self, BaseArray source, long start_index=*, long end_index=*)
     cpdef update_min_max(self)
+    cpdef use_mmap(self, str directory, str prefix=*)
 
 
 ################################################################################
@@ -65,8 +74,10 @@ cdef class IntArray(BaseArray):
     cpdef extend(self, np.ndarray in_array)
     cpdef reset(self)
     cpdef long index(self, int value)
+    cpdef use_mmap(self, str directory, str prefix=*)
 
     cdef void _align_array(self, LongArray new_indices)
+    cdef _map_file(self, long size, str mode)
 
 
 ################################################################################
@@ -92,8 +103,10 @@ cdef class DoubleArray(BaseArray):
     cpdef extend(self, np.ndarray in_array)
     cpdef reset(self)
     cpdef long index(self, double value)
+    cpdef use_mmap(self, str directory, str prefix=*)
 
     cdef void _align_array(self, LongArray new_indices)
+    cdef _map_file(self, long size, str mode)
 
 
 ################################################################################
@@ -119,8 +132,10 @@ cdef class FloatArray(BaseArray):
     cpdef extend(self, np.ndarray in_array)
     cpdef reset(self)
     cpdef long index(self, float value)
+    cpdef use_mmap(self, str directory, str prefix=*)
 
     cdef void _align_array(self, LongArray new_indices)
+    cdef _map_file(self, long size, str mode)
 
 
 ################################################################################
@@ -146,7 +161,9 @@ cdef class LongArray(BaseArray):
     cpdef extend(self, np.ndarray in_array)
     cpdef reset(self)
     cpdef long index(self, long value)
+    cpdef use_mmap(self, str directory, str prefix=*)
 
     cdef void _align_array(self, LongArray new_indices)
+    cdef _map_file(self, long size, str mode)
 
 
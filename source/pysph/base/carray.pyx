@@ -12,6 +12,7 @@ All arrays provide for the following operations:
  - appending values at the end of the array.
  - reserving space for future appends.
  - access to internal data through a numpy array.
+ - access to internal data through the buffer protocol.
 
 ** Numpy array access **
 Each array also provides an interface to its data through a numpy array. This
@@ -24,16 +25,28 @@ used just like any other numpy array but for the following restrictions:
 
 The numpy array may however be copied and used in any manner.
 
+** Buffer protocol **
+The arrays also export their data through the buffer protocol, so that
+numpy.asarray(arr) or memoryview(arr) is a writable view of the data
+which keeps the array alive. Such a view remains valid until the array
+is resized or reallocated. These changes increment the `generation` of
+the array, which may be recorded with the view to detect stale views.
+
 ** Examples **
 
 """
 # For malloc etc.
-from stdlib cimport *
+from libc.stdlib cimport *
+
+from cpython.buffer cimport PyBUF_FORMAT, PyBUF_ND, PyBUF_STRIDES
 
 cimport numpy as np
 
 import numpy as np
 
+import os
+import tempfile
+
 # logging imports
 import logging
 logger = logging.getLogger()
@@ -126,6 +139,7 @@ cdef class BaseArray:
         """ Reset the length of the array to 0. """
         cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
         self.length = 0
+        self.generation += 1
         arr.dimensions[0] = self.length
 
     cpdef copy_values(self, LongArray indices, BaseArray dest):
@@ -140,6 +154,10 @@ cdef class BaseArray:
     cpdef update_min_max(self):
         """ Update the min and max values of the array. """
         raise NotImplementedError, 'BaseArray::update_min_max'
+
+    cpdef use_mmap(self, str directory, str prefix='carray_'):
+        """ Store the data in a file mapped into memory. """
+        raise NotImplementedError, 'BaseArray::use_mmap'
     
     def __len__(self):
         return self.length
@@ -200,8 +218,15 @@ cdef class IntArray(BaseArray):
         self._setup_npy_array()
 
     def __dealloc__(self):
-        """ Frees the array. """
-        free(<void*>self.data)
+        """ Frees the array and removes the file of a mapped array. """
+        if not self.mapped:
+            free(<void*>self.data)
+        else:
+            # the file was created for this array (see use_mmap)
+            try:
+                os.unlink(self.mmap_path)
+            except OSError:
+                pass
 
     def __getitem__(self, long idx):
         """ Get item at position idx. """
@@ -222,6 +247,45 @@ cdef class IntArray(BaseArray):
     def __contains__(self, int value):
         """ Returns True if value is in self. """
         return (self.index(value) >= 0)
+
+    def __getbuffer__(self, Py_buffer* buffer, int flags):
+        """ Export the data as a writable one dimensional buffer.
+
+        The buffer remains valid until the `generation` changes.
+
+        """
+        # shape and strides of this buffer, freed in __releasebuffer__
+        cdef Py_ssize_t* shape = <Py_ssize_t*>malloc(2*sizeof(Py_ssize_t))
+        if shape == NULL:
+            raise MemoryError
+
+        shape[0] = self.length
+        shape[1] = sizeof(int)
+
+        buffer.buf = <void*>self.data
+        buffer.obj = self
+        buffer.len = self.length*sizeof(int)
+        buffer.readonly = 0
+        buffer.itemsize = sizeof(int)
+        buffer.ndim = 1
+        buffer.suboffsets = NULL
+        buffer.internal = <void*>shape
+
+        buffer.format = NULL
+        if flags & PyBUF_FORMAT:
+            buffer.format = 'i'
+
+        buffer.shape = NULL
+        if flags & PyBUF_ND:
+            buffer.shape = shape
+
+        buffer.strides = NULL
+        if (flags & PyBUF_STRIDES) == PyBUF_STRIDES:
+            buffer.strides = shape + 1
+
+    def __releasebuffer__(self, Py_buffer* buffer):
+        """ Free the shape and strides of the buffer. """
+        free(buffer.internal)
     
     def __reduce__(self):
         """ Implemented to facilitate pickling. """
@@ -269,6 +333,7 @@ cdef class IntArray(BaseArray):
             self.reserve(l*2)
         self.data[l] = value
         self.length += 1
+        self.generation += 1
 
         # update the numpy arrays length
         arr.dimensions[0] = self.length
@@ -277,7 +342,10 @@ cdef class IntArray(BaseArray):
         """ Resizes the internal data to size*sizeof(int) bytes. """
         cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
         cdef void* data = NULL
-        if size > self.alloc:
+        if size > self.alloc and self.mapped:
+            self._map_file(size, 'r+')
+            self.alloc = size
+        elif size > self.alloc:
             data = <int*>realloc(self.data, size*sizeof(int))
 
             if data == NULL:
@@ -286,6 +354,7 @@ cdef class IntArray(BaseArray):
 
             self.data = <int*>data
             self.alloc = size
+            self.generation += 1
             arr.data = <char *>self.data
 
     cpdef resize(self, long size):
@@ -300,13 +369,21 @@ cdef class IntArray(BaseArray):
         self.reserve(size)
 
         # update the lengths
+        if size != self.length:
+            self.generation += 1
         self.length = size
         arr.dimensions[0] = self.length
 
     cpdef squeeze(self):
-        """ Release any unused memory. """
+        """ Release any unused memory.
+
+        File-mapped arrays keep their mapping.
+
+        """
         cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
         cdef void* data = NULL
+        if self.mapped:
+            return
         data = <int*>realloc(self.data, self.length*sizeof(int))
 
         if data == NULL:
@@ -316,6 +393,7 @@ cdef class IntArray(BaseArray):
 
         self.data = <int*>data
         self.alloc = self.length
+        self.generation += 1
         arr.data = <char *>self.data
 
     cpdef remove(self, np.ndarray index_list, bint input_sorted=0):
@@ -355,6 +433,7 @@ cdef class IntArray(BaseArray):
             if id < self.length:
                 self.data[id] = self.data[self.length-1]
                 self.length = self.length - 1
+                self.generation += 1
                 arr.dimensions[0] = self.length
 
     cpdef extend(self, np.ndarray in_array):
@@ -498,6 +577,65 @@ cdef class IntArray(BaseArray):
         self.minimum = min_val
         self.maximum = max_val
 
+    cpdef use_mmap(self, str directory, str prefix='carray_'):
+        """
+        Store the data in a file mapped into memory.
+
+        **Parameters**
+
+         - directory - the directory of the file backing the array.
+         - prefix - the prefix of the file name.
+
+        **Notes**
+
+         A new file with a unique name is created in the directory, so
+         that no file mapped by another array is overwritten. Its path
+         is `mmap_path`.
+
+         The current contents are copied to the file and the malloc'ed
+         buffer is released. Growing the array remaps the file, so the
+         data pointer and the numpy array change as they do with
+         realloc. The file is removed when the array is freed.
+
+        """
+        cdef int* old_data = self.data
+        cdef int fd
+
+        if self.mapped:
+            raise ValueError, 'array already mapped to %s'%(self.mmap_path)
+
+        fd, path = tempfile.mkstemp(suffix='.dat', prefix=prefix,
+                                    dir=directory)
+        os.close(fd)
+
+        self.mmap_path = path
+        self._map_file(max(self.alloc, 1), 'r+')
+        self.alloc = max(self.alloc, 1)
+
+        memcpy(<void*>self.data, <void*>old_data,
+               self.length*sizeof(int))
+        free(<void*>old_data)
+        self.mapped = True
+
+    cdef _map_file(self, long size, str mode):
+        """ Map size elements of the file at mmap_path as the data. """
+        cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
+        cdef np.ndarray mapped
+
+        # the old mapping is flushed and unmapped once the new one is
+        # made, the data is read back from the file.
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap = None
+
+        mapped = np.memmap(self.mmap_path, dtype=self._npy_array.dtype,
+                           mode=mode, shape=(size,))
+        self._mmap = mapped
+
+        self.data = <int*>(<PyArrayObject*>mapped).data
+        self.generation += 1
+        arr.data = <char *>self.data
+
 
 ###############################################################################
 # `DoubleArray` class.
@@ -534,8 +672,15 @@ cdef class DoubleArray(BaseArray):
         self._setup_npy_array()
 
     def __dealloc__(self):
-        """ Frees the array. """
-        free(<void*>self.data)
+        """ Frees the array and removes the file of a mapped array. """
+        if not self.mapped:
+            free(<void*>self.data)
+        else:
+            # the file was created for this array (see use_mmap)
+            try:
+                os.unlink(self.mmap_path)
+            except OSError:
+                pass
 
     def __getitem__(self, long idx):
         """ Get item at position idx. """
@@ -556,6 +701,45 @@ cdef class DoubleArray(BaseArray):
     def __contains__(self, double value):
         """ Returns True if value is in self. """
         return (self.index(value) >= 0)
+
+    def __getbuffer__(self, Py_buffer* buffer, int flags):
+        """ Export the data as a writable one dimensional buffer.
+
+        The buffer remains valid until the `generation` changes.
+
+        """
+        # shape and strides of this buffer, freed in __releasebuffer__
+        cdef Py_ssize_t* shape = <Py_ssize_t*>malloc(2*sizeof(Py_ssize_t))
+        if shape == NULL:
+            raise MemoryError
+
+        shape[0] = self.length
+        shape[1] = sizeof(double)
+
+        buffer.buf = <void*>self.data
+        buffer.obj = self
+        buffer.len = self.length*sizeof(double)
+        buffer.readonly = 0
+        buffer.itemsize = sizeof(double)
+        buffer.ndim = 1
+        buffer.suboffsets = NULL
+        buffer.internal = <void*>shape
+
+        buffer.format = NULL
+        if flags & PyBUF_FORMAT:
+            buffer.format = 'd'
+
+        buffer.shape = NULL
+        if flags & PyBUF_ND:
+            buffer.shape = shape
+
+        buffer.strides = NULL
+        if (flags & PyBUF_STRIDES) == PyBUF_STRIDES:
+            buffer.strides = shape + 1
+
+    def __releasebuffer__(self, Py_buffer* buffer):
+        """ Free the shape and strides of the buffer. """
+        free(buffer.internal)
     
     def __reduce__(self):
         """ Implemented to facilitate pickling. """
@@ -603,6 +787,7 @@ cdef class DoubleArray(BaseArray):
             self.reserve(l*2)
         self.data[l] = value
         self.length += 1
+        self.generation += 1
 
         # update the numpy arrays length
         arr.dimensions[0] = self.length
@@ -611,7 +796,10 @@ cdef class DoubleArray(BaseArray):
         """ Resizes the internal data to size*sizeof(double) bytes. """
         cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
         cdef void* data = NULL
-        if size > self.alloc:
+        if size > self.alloc and self.mapped:
+            self._map_file(size, 'r+')
+            self.alloc = size
+        elif size > self.alloc:
             data = <double*>realloc(self.data, size*sizeof(double))
 
             if data == NULL:
@@ -620,6 +808,7 @@ cdef class DoubleArray(BaseArray):
 
             self.data = <double*>data
             self.alloc = size
+            self.generation += 1
             arr.data = <char *>self.data
 
     cpdef resize(self, long size):
@@ -634,13 +823,21 @@ cdef class DoubleArray(BaseArray):
         self.reserve(size)
 
         # update the lengths
+        if size != self.length:
+            self.generation += 1
         self.length = size
         arr.dimensions[0] = self.length
 
     cpdef squeeze(self):
-        """ Release any unused memory. """
+        """ Release any unused memory.
+
+        File-mapped arrays keep their mapping.
+
+        """
         cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
         cdef void* data = NULL
+        if self.mapped:
+            return
         data = <double*>realloc(self.data, self.length*sizeof(double))
 
         if data == NULL:
@@ -650,6 +847,7 @@ cdef class DoubleArray(BaseArray):
 
         self.data = <double*>data
         self.alloc = self.length
+        self.generation += 1
         arr.data = <char *>self.data
 
     cpdef remove(self, np.ndarray index_list, bint input_sorted=0):
@@ -689,6 +887,7 @@ cdef class DoubleArray(BaseArray):
             if id < self.length:
                 self.data[id] = self.data[self.length-1]
                 self.length = self.length - 1
+                self.generation += 1
                 arr.dimensions[0] = self.length
 
     cpdef extend(self, np.ndarray in_array):
@@ -832,6 +1031,65 @@ cdef class DoubleArray(BaseArray):
         self.minimum = min_val
         self.maximum = max_val
 
+    cpdef use_mmap(self, str directory, str prefix='carray_'):
+        """
+        Store the data in a file mapped into memory.
+
+        **Parameters**
+
+         - directory - the directory of the file backing the array.
+         - prefix - the prefix of the file name.
+
+        **Notes**
+
+         A new file with a unique name is created in the directory, so
+         that no file mapped by another array is overwritten. Its path
+         is `mmap_path`.
+
+         The current contents are copied to the file and the malloc'ed
+         buffer is released. Growing the array remaps the file, so the
+         data pointer and the numpy array change as they do with
+         realloc. The file is removed when the array is freed.
+
+        """
+        cdef double* old_data = self.data
+        cdef int fd
+
+        if self.mapped:
+            raise ValueError, 'array already mapped to %s'%(self.mmap_path)
+
+        fd, path = tempfile.mkstemp(suffix='.dat', prefix=prefix,
+                                    dir=directory)
+        os.close(fd)
+
+        self.mmap_path = path
+        self._map_file(max(self.alloc, 1), 'r+')
+        self.alloc = max(self.alloc, 1)
+
+        memcpy(<void*>self.data, <void*>old_data,
+               self.length*sizeof(double))
+        free(<void*>old_data)
+        self.mapped = True
+
+    cdef _map_file(self, long size, str mode):
+        """ Map size elements of the file at mmap_path as the data. """
+        cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
+        cdef np.ndarray mapped
+
+        # the old mapping is flushed and unmapped once the new one is
+        # made, the data is read back from the file.
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap = None
+
+        mapped = np.memmap(self.mmap_path, dtype=self._npy_array.dtype,
+                           mode=mode, shape=(size,))
+        self._mmap = mapped
+
+        self.data = <double*>(<PyArrayObject*>mapped).data
+        self.generation += 1
+        arr.data = <char *>self.data
+
 
 ###############################################################################
 # `FloatArray` class.
@@ -868,8 +1126,15 @@ cdef class FloatArray(BaseArray):
         self._setup_npy_array()
 
     def __dealloc__(self):
-        """ Frees the array. """
-        free(<void*>self.data)
+        """ Frees the array and removes the file of a mapped array. """
+        if not self.mapped:
+            free(<void*>self.data)
+        else:
+            # the file was created for this array (see use_mmap)
+            try:
+                os.unlink(self.mmap_path)
+            except OSError:
+                pass
 
     def __getitem__(self, long idx):
         """ Get item at position idx. """
@@ -890,6 +1155,45 @@ cdef class FloatArray(BaseArray):
     def __contains__(self, float value):
         """ Returns True if value is in self. """
         return (self.index(value) >= 0)
+
+    def __getbuffer__(self, Py_buffer* buffer, int flags):
+        """ Export the data as a writable one dimensional buffer.
+
+        The buffer remains valid until the `generation` changes.
+
+        """
+        # shape and strides of this buffer, freed in __releasebuffer__
+        cdef Py_ssize_t* shape = <Py_ssize_t*>malloc(2*sizeof(Py_ssize_t))
+        if shape == NULL:
+            raise MemoryError
+
+        shape[0] = self.length
+        shape[1] = sizeof(float)
+
+        buffer.buf = <void*>self.data
+        buffer.obj = self
+        buffer.len = self.length*sizeof(float)
+        buffer.readonly = 0
+        buffer.itemsize = sizeof(float)
+        buffer.ndim = 1
+        buffer.suboffsets = NULL
+        buffer.internal = <void*>shape
+
+        buffer.format = NULL
+        if flags & PyBUF_FORMAT:
+            buffer.format = 'f'
+
+        buffer.shape = NULL
+        if flags & PyBUF_ND:
+            buffer.shape = shape
+
+        buffer.strides = NULL
+        if (flags & PyBUF_STRIDES) == PyBUF_STRIDES:
+            buffer.strides = shape + 1
+
+    def __releasebuffer__(self, Py_buffer* buffer):
+        """ Free the shape and strides of the buffer. """
+        free(buffer.internal)
     
     def __reduce__(self):
         """ Implemented to facilitate pickling. """
@@ -937,6 +1241,7 @@ cdef class FloatArray(BaseArray):
             self.reserve(l*2)
         self.data[l] = value
         self.length += 1
+        self.generation += 1
 
         # update the numpy arrays length
         arr.dimensions[0] = self.length
@@ -945,7 +1250,10 @@ cdef class FloatArray(BaseArray):
         """ Resizes the internal data to size*sizeof(float) bytes. """
         cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
         cdef void* data = NULL
-        if size > self.alloc:
+        if size > self.alloc and self.mapped:
+            self._map_file(size, 'r+')
+            self.alloc = size
+        elif size > self.alloc:
             data = <float*>realloc(self.data, size*sizeof(float))
 
             if data == NULL:
@@ -954,6 +1262,7 @@ cdef class FloatArray(BaseArray):
 
             self.data = <float*>data
             self.alloc = size
+            self.generation += 1
             arr.data = <char *>self.data
 
     cpdef resize(self, long size):
@@ -968,13 +1277,21 @@ cdef class FloatArray(BaseArray):
         self.reserve(size)
 
         # update the lengths
+        if size != self.length:
+            self.generation += 1
         self.length = size
         arr.dimensions[0] = self.length
 
     cpdef squeeze(self):
-        """ Release any unused memory. """
+        """ Release any unused memory.
+
+        File-mapped arrays keep their mapping.
+
+        """
         cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
         cdef void* data = NULL
+        if self.mapped:
+            return
         data = <float*>realloc(self.data, self.length*sizeof(float))
 
         if data == NULL:
@@ -984,6 +1301,7 @@ cdef class FloatArray(BaseArray):
 
         self.data = <float*>data
         self.alloc = self.length
+        self.generation += 1
         arr.data = <char *>self.data
 
     cpdef remove(self, np.ndarray index_list, bint input_sorted=0):
@@ -1023,6 +1341,7 @@ cdef class FloatArray(BaseArray):
             if id < self.length:
                 self.data[id] = self.data[self.length-1]
                 self.length = self.length - 1
+                self.generation += 1
                 arr.dimensions[0] = self.length
 
     cpdef extend(self, np.ndarray in_array):
@@ -1166,6 +1485,65 @@ cdef class FloatArray(BaseArray):
         self.minimum = min_val
         self.maximum = max_val
 
+    cpdef use_mmap(self, str directory, str prefix='carray_'):
+        """
+        Store the data in a file mapped into memory.
+
+        **Parameters**
+
+         - directory - the directory of the file backing the array.
+         - prefix - the prefix of the file name.
+
+        **Notes**
+
+         A new file with a unique name is created in the directory, so
+         that no file mapped by another array is overwritten. Its path
+         is `mmap_path`.
+
+         The current contents are copied to the file and the malloc'ed
+         buffer is released. Growing the array remaps the file, so the
+         data pointer and the numpy array change as they do with
+         realloc. The file is removed when the array is freed.
+
+        """
+        cdef float* old_data = self.data
+        cdef int fd
+
+        if self.mapped:
+            raise ValueError, 'array already mapped to %s'%(self.mmap_path)
+
+        fd, path = tempfile.mkstemp(suffix='.dat', prefix=prefix,
+                                    dir=directory)
+        os.close(fd)
+
+        self.mmap_path = path
+        self._map_file(max(self.alloc, 1), 'r+')
+        self.alloc = max(self.alloc, 1)
+
+        memcpy(<void*>self.data, <void*>old_data,
+               self.length*sizeof(float))
+        free(<void*>old_data)
+        self.mapped = True
+
+    cdef _map_file(self, long size, str mode):
+        """ Map size elements of the file at mmap_path as the data. """
+        cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
+        cdef np.ndarray mapped
+
+        # the old mapping is flushed and unmapped once the new one is
+        # made, the data is read back from the file.
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap = None
+
+        mapped = np.memmap(self.mmap_path, dtype=self._npy_array.dtype,
+                           mode=mode, shape=(size,))
+        self._mmap = mapped
+
+        self.data = <float*>(<PyArrayObject*>mapped).data
+        self.generation += 1
+        arr.data = <char *>self.data
+
 
 ###############################################################################
 # `LongArray` class.
@@ -1202,8 +1580,15 @@ cdef class LongArray(BaseArray):
         self._setup_npy_array()
 
     def __dealloc__(self):
-        """ Frees the array. """
-        free(<void*>self.data)
+        """ Frees the array and removes the file of a mapped array. """
+        if not self.mapped:
+            free(<void*>self.data)
+        else:
+            # the file was created for this array (see use_mmap)
+            try:
+                os.unlink(self.mmap_path)
+            except OSError:
+                pass
 
     def __getitem__(self, long idx):
         """ Get item at position idx. """
@@ -1224,6 +1609,45 @@ cdef class LongArray(BaseArray):
     def __contains__(self, long value):
         """ Returns True if value is in self. """
         return (self.index(value) >= 0)
+
+    def __getbuffer__(self, Py_buffer* buffer, int flags):
+        """ Export the data as a writable one dimensional buffer.
+
+        The buffer remains valid until the `generation` changes.
+
+        """
+        # shape and strides of this buffer, freed in __releasebuffer__
+        cdef Py_ssize_t* shape = <Py_ssize_t*>malloc(2*sizeof(Py_ssize_t))
+        if shape == NULL:
+            raise MemoryError
+
+        shape[0] = self.length
+        shape[1] = sizeof(long)
+
+        buffer.buf = <void*>self.data
+        buffer.obj = self
+        buffer.len = self.length*sizeof(long)
+        buffer.readonly = 0
+        buffer.itemsize = sizeof(long)
+        buffer.ndim = 1
+        buffer.suboffsets = NULL
+        buffer.internal = <void*>shape
+
+        buffer.format = NULL
+        if flags & PyBUF_FORMAT:
+            buffer.format = 'l'
+
+        buffer.shape = NULL
+        if flags & PyBUF_ND:
+            buffer.shape = shape
+
+        buffer.strides = NULL
+        if (flags & PyBUF_STRIDES) == PyBUF_STRIDES:
+            buffer.strides = shape + 1
+
+    def __releasebuffer__(self, Py_buffer* buffer):
+        """ Free the shape and strides of the buffer. """
+        free(buffer.internal)
     
     def __reduce__(self):
         """ Implemented to facilitate pickling. """
@@ -1271,6 +1695,7 @@ cdef class LongArray(BaseArray):
             self.reserve(l*2)
         self.data[l] = value
         self.length += 1
+        self.generation += 1
 
         # update the numpy arrays length
         arr.dimensions[0] = self.length
@@ -1279,7 +1704,10 @@ cdef class LongArray(BaseArray):
         """ Resizes the internal data to size*sizeof(long) bytes. """
         cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
         cdef void* data = NULL
-        if size > self.alloc:
+        if size > self.alloc and self.mapped:
+            self._map_file(size, 'r+')
+            self.alloc = size
+        elif size > self.alloc:
             data = <long*>realloc(self.data, size*sizeof(long))
 
             if data == NULL:
@@ -1288,6 +1716,7 @@ cdef class LongArray(BaseArray):
 
             self.data = <long*>data
             self.alloc = size
+            self.generation += 1
             arr.data = <char *>self.data
 
     cpdef resize(self, long size):
@@ -1302,13 +1731,21 @@ cdef class LongArray(BaseArray):
         self.reserve(size)
 
         # update the lengths
+        if size != self.length:
+            self.generation += 1
         self.length = size
         arr.dimensions[0] = self.length
 
     cpdef squeeze(self):
-        """ Release any unused memory. """
+        """ Release any unused memory.
+
+        File-mapped arrays keep their mapping.
+
+        """
         cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
         cdef void* data = NULL
+        if self.mapped:
+            return
         data = <long*>realloc(self.data, self.length*sizeof(long))
 
         if data == NULL:
@@ -1318,6 +1755,7 @@ cdef class LongArray(BaseArray):
 
         self.data = <long*>data
         self.alloc = self.length
+        self.generation += 1
         arr.data = <char *>self.data
 
     cpdef remove(self, np.ndarray index_list, bint input_sorted=0):
@@ -1357,6 +1795,7 @@ cdef class LongArray(BaseArray):
             if id < self.length:
                 self.data[id] = self.data[self.length-1]
                 self.length = self.length - 1
+                self.generation += 1
                 arr.dimensions[0] = self.length
 
     cpdef extend(self, np.ndarray in_array):
@@ -1500,4 +1939,63 @@ cdef class LongArray(BaseArray):
         self.minimum = min_val
         self.maximum = max_val
 
+    cpdef use_mmap(self, str directory, str prefix='carray_'):
+        """
+        Store the data in a file mapped into memory.
+
+        **Parameters**
+
+         - directory - the directory of the file backing the array.
+         - prefix - the prefix of the file name.
+
+        **Notes**
+
+         A new file with a unique name is created in the directory, so
+         that no file mapped by another array is overwritten. Its path
+         is `mmap_path`.
+
+         The current contents are copied to the file and the malloc'ed
+         buffer is released. Growing the array remaps the file, so the
+         data pointer and the numpy array change as they do with
+         realloc. The file is removed when the array is freed.
+
+        """
+        cdef long* old_data = self.data
+        cdef int fd
+
+        if self.mapped:
+            raise ValueError, 'array already mapped to %s'%(self.mmap_path)
+
+        fd, path = tempfile.mkstemp(suffix='.dat', prefix=prefix,
+                                    dir=directory)
+        os.close(fd)
+
+        self.mmap_path = path
+        self._map_file(max(self.alloc, 1), 'r+')
+        self.alloc = max(self.alloc, 1)
+
+        memcpy(<void*>self.data, <void*>old_data,
+               self.length*sizeof(long))
+        free(<void*>old_data)
+        self.mapped = True
+
+    cdef _map_file(self, long size, str mode):
+        """ Map size elements of the file at mmap_path as the data. """
+        cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
+        cdef np.ndarray mapped
+
+        # the old mapping is flushed and unmapped once the new one is
+        # made, the data is read back from the file.
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap = None
+
+        mapped = np.memmap(self.mmap_path, dtype=self._npy_array.dtype,
+                           mode=mode, shape=(size,))
+        self._mmap = mapped
+
+        self.data = <long*>(<PyArrayObject*>mapped).data
+        self.generation += 1
+        arr.data = <char *>self.data
+
 
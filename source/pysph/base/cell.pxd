@@ -9,12 +9,19 @@ from pysph.base.particle_array cimport ParticleArray
 cdef class CellManager
 cdef class PeriodicDomain
 
-cdef inline int real_to_int(double val, double step)
-cdef inline cIntPoint find_cell_id(cPoint pnt, double cell_size)
+cdef inline int real_to_int(double val, double step) nogil
+cdef inline cIntPoint find_cell_id(cPoint pnt, double cell_size) nogil
 
 cdef inline vector[cIntPoint] construct_immediate_neighbor_list(
     cIntPoint cell_id,
-    bint include_self=*, int distance=*)
+    bint include_self=*, int distance=*, int dim=*)
+
+cdef inline double cell_distance2(cPoint pnt, cIntPoint cid,
+                                  double cell_size, int dim) nogil
+
+cdef inline bint clip_cell_row(cPoint pnt, double radius, int j, int k,
+                               double cell_size, int dim,
+                               int* lo, int* hi) nogil
 
 cdef inline bint cell_encloses_sphere(IntPoint id,
                           double cell_size, cPoint pnt, double radius)
@@ -34,7 +41,7 @@ cdef class Cell:
     cdef public list index_lists
     cdef int num_arrays
 
-    # Periodicity and ghost cells
+    # Periodicity
     cdef public PeriodicDomain periodic_domain
     
     # Member functions.
@@ -75,9 +82,11 @@ cdef class CellManager:
 
     cdef public bint initialized
 
-    # Periodicity and ghost cells
+    # number of coordinates spanned by the cell stencils
+    cdef public int dimension
+
+    # Periodicity
     cdef public PeriodicDomain periodic_domain
-    cdef public dict ghost_cells
     
     cdef public str coord_x, coord_y, coord_z
 
@@ -85,6 +94,20 @@ cdef class CellManager:
 
     cdef double min_h, max_h
 
+    # number of cells per interaction radius
+    cdef public int cell_subdivisions
+
+    # flat (counting sort) binning
+    cdef public bint use_flat_index
+    cdef public list cell_start
+    cdef public list cell_count
+    cdef public list sorted_index
+    cdef public long num_flat_cells
+    cdef public long max_flat_cells
+    cdef readonly bint flat_index_active
+    cdef cIntPoint flat_origin
+    cdef cIntPoint flat_dims
+
     cpdef int update(self) except -1
     cpdef int update_status(self) except -1
     cpdef initialize(self)
@@ -98,10 +121,13 @@ cdef class CellManager:
     cpdef _build_cell(self)
     cpdef _rebuild_array_indices(self)
     cpdef _setup_cells_dict(self)
+    cpdef set_dimension(self, int dimension)
     cpdef set_jump_tolerance(self, int jump_tolerance)
     cdef check_jump_tolerance(self, cIntPoint myid, cIntPoint newid)
     cpdef list delete_empty_cells(self)
     cpdef insert_particles(self, int parray_id, LongArray indices)
+    cpdef int remap_particle_indices(self, int array_index,
+                                     LongArray new_index) except -1
     cpdef Cell get_new_cell(self, IntPoint id)
     
     cdef int get_potential_cells(self, cPoint pnt, double radius,
@@ -110,10 +136,15 @@ cdef class CellManager:
     cdef int _get_cells_within_radius(self, cPoint pnt, double radius,
                                       list cell_list) except -1
     cdef void _reset_jump_tolerance(self)
+
+    cpdef int flat_index_update(self) except -1
+    cdef long get_max_flat_cells(self)
+    cdef bint get_flat_cell_range(self, cPoint pnt, double radius,
+                                  cIntPoint* lo, cIntPoint* hi)
+    cdef long get_flat_cell_key(self, int i, int j, int k)
     cpdef long get_number_of_particles(self)
 
-    cpdef create_ghost_cells(self)
-    cpdef remove_ghost_particles(self)
+    cpdef wrap_positions(self, ParticleArray parray)
 
 
 cdef class PeriodicDomain:
@@ -124,3 +155,8 @@ cdef class PeriodicDomain:
     cdef public double xtranslate
     cdef public double ytranslate
     cdef public double ztranslate
+
+    cdef void wrap(self, cPoint* pnt) nogil
+    cdef void nearest_image(self, cPoint* pnt, cPoint ref) nogil
+    cdef int get_image_shifts(self, cPoint pnt, double radius,
+                              cPoint* shifts) nogil
@@ -14,11 +14,12 @@ from cpython cimport *
 
 cdef extern from 'math.h':
     int abs(int)
+    double sqrt(double) nogil
 
 cdef extern from 'limits.h':
     cdef int INT_MAX
-    cdef double ceil(double)
-    cdef double floor(double)
+    cdef double ceil(double) nogil
+    cdef double floor(double) nogil
     cdef double fabs(double)
 
 
@@ -28,6 +29,10 @@ import numpy
 
 import pickle
 
+# default size limits of the box of the flat index
+DEF MIN_FLAT_CELLS = 4096
+DEF FLAT_CELLS_PER_PARTICLE = 8
+
 def INT_INF():
     return INT_MAX
 
@@ -39,7 +44,7 @@ def py_find_cell_id(Point pnt, double cell_size):
     p.data = find_cell_id(pnt.data, cell_size)
     return p
 
-cdef inline int real_to_int(double real_val, double step):
+cdef inline int real_to_int(double real_val, double step) nogil:
     """ Return the bin index to which the given position belongs.
 
     Parameters:
@@ -58,7 +63,7 @@ cdef inline int real_to_int(double real_val, double step):
 
     return ret_val
 
-cdef inline cIntPoint find_cell_id(cPoint pnt, double cell_size):
+cdef inline cIntPoint find_cell_id(cPoint pnt, double cell_size) nogil:
     """ Find the cell index for the corresponding point 
 
     Parameters:
@@ -76,43 +81,49 @@ cdef inline cIntPoint find_cell_id(cPoint pnt, double cell_size):
     Uses the function  `real_to_int`
     
     """
-    cdef cIntPoint p = cIntPoint(real_to_int(pnt.x, cell_size),
-                        real_to_int(pnt.y, cell_size),
-                        real_to_int(pnt.z, cell_size))
+    cdef cIntPoint p = cIntPoint_new(real_to_int(pnt.x, cell_size),
+                                     real_to_int(pnt.y, cell_size),
+                                     real_to_int(pnt.z, cell_size))
     return p
 
 def py_construct_immediate_neighbor_list(IntPoint cell_id, neighbor_list,
-                                         include_self=True, distance=1):
+                                         include_self=True, distance=1,
+                                         dim=3):
     """ Construct a list of cell ids neighboring the given cell."""
     cdef vector[cIntPoint] v = construct_immediate_neighbor_list(cell_id.data,
-                                    include_self, distance)
+                                    include_self, distance, dim)
     cdef int i
     for i in range(v.size()):
         neighbor_list.append(IntPoint_from_cIntPoint(v[i]))
 
 cdef inline vector[cIntPoint] construct_immediate_neighbor_list(
     cIntPoint cell_id,
-    bint include_self=True, int distance=1):    
-    """Return the 27 nearest neighbors for a given cell when distance = 1"""
+    bint include_self=True, int distance=1, int dim=3):    
+    """Return the 3**dim nearest neighbors for a given cell when distance = 1
+
+    The stencil only extends along the first `dim` coordinates, so that
+    a 1D or 2D run looks up 3 or 9 cells instead of 27.
+
+    """
 
     cdef vector[cIntPoint] ret
-    cdef int n = ((distance*2+1)*(distance*2+1)*(distance*2+1)-1)
+    cdef int dy = distance if dim > 1 else 0
+    cdef int dz = distance if dim > 2 else 0
+    cdef int n = (distance*2+1)*(dy*2+1)*(dz*2+1)
     ret.reserve(n)
     cdef cIntPoint p
     cdef int i,j,k
     for i in range(-distance, distance+1):
         p.x = cell_id.x + i
-        for j in range(-distance, distance+1):
+        for j in range(-dy, dy+1):
             p.y = cell_id.y + j
-            for k in range(-distance, distance+1):
+            for k in range(-dz, dz+1):
                 p.z = cell_id.z + k
-                #cell_list.append(IntPoint_new(cell_id.x+i, cell_id.y+j,
-                #                          cell_id.z+k))
                 ret.push_back(p)
     if not include_self:
+        # the cell itself is at the center of the stencil
         ret[n//2] = ret[n-1]
         ret.pop_back()
-    #neighbor_list.extend(cell_list)
     return ret
 
 def py_construct_face_neighbor_list(cell_id, neighbor_list, include_self=True):
@@ -143,6 +154,80 @@ cdef inline construct_face_neighbor_list(IntPoint cell_id, list neighbor_list,
         neighbor_list.append(IntPoint(cell_id.x, cell_id.y, cell_id.z+1))
         neighbor_list.append(IntPoint(cell_id.x, cell_id.y, cell_id.z-1))
                                       
+def py_clip_cell_row(Point pnt, double radius, int j, int k,
+                     double cell_size, int dim=3):
+    """ Return the range of cells (lo, hi) of the row (j, k) that
+    intersect the sphere or None if the row misses it. """
+    cdef int lo, hi
+    if clip_cell_row(pnt.data, radius, j, k, cell_size, dim, &lo, &hi):
+        return lo, hi
+
+cdef inline double _slab_distance(double x, int i, double cell_size) nogil:
+    """ Distance of x from the cells with index i along an axis """
+    cdef double lo = i*cell_size
+    if x < lo:
+        return lo - x
+    if x > lo + cell_size:
+        return x - lo - cell_size
+    return 0.0
+
+cdef inline double cell_distance2(cPoint pnt, cIntPoint cid,
+                                  double cell_size, int dim) nogil:
+    """ Squared distance of a point from the nearest point of a cell,
+    in the first `dim` coordinates """
+    cdef double d = _slab_distance(pnt.x, cid.x, cell_size)
+    cdef double dist2 = d*d
+
+    if dim > 1:
+        d = _slab_distance(pnt.y, cid.y, cell_size)
+        dist2 += d*d
+    if dim > 2:
+        d = _slab_distance(pnt.z, cid.z, cell_size)
+        dist2 += d*d
+
+    return dist2
+
+cdef inline bint clip_cell_row(cPoint pnt, double radius, int j, int k,
+                               double cell_size, int dim,
+                               int* lo, int* hi) nogil:
+    """ Find the cells of a row along x that intersect a sphere.
+
+    Parameters:
+    -----------
+    pnt -- center of the sphere.
+    radius -- radius of the sphere.
+    j, k -- the y and z cell index of the row.
+    cell_size -- size of the sides of the cells.
+    dim -- the dimension. The y (z) index is ignored for dim < 2 (3).
+    lo, hi -- output parameters for the (inclusive) x index range.
+
+    Returns False if the row does not intersect the sphere.
+
+    Notes:
+    ------
+    A row touching the sphere only near its rim has a short x range.
+    With cells smaller than the radius (see
+    `CellManager.cell_subdivisions`) this skips most of the cells of
+    the enclosing box in the corners.
+
+    """
+    cdef double d, rest = radius*radius
+
+    if dim > 1:
+        d = _slab_distance(pnt.y, j, cell_size)
+        rest -= d*d
+    if dim > 2:
+        d = _slab_distance(pnt.z, k, cell_size)
+        rest -= d*d
+
+    if rest < 0.0:
+        return False
+
+    d = sqrt(rest)
+    lo[0] = real_to_int(pnt.x - d, cell_size)
+    hi[0] = real_to_int(pnt.x + d, cell_size)
+    return True
+
 def py_cell_encloses_sphere(IntPoint id, double cell_size,
                             Point pnt, double radius):
     """Check if sphere of `radius` center 'pnt' is enclosed by a cell."""
@@ -389,19 +474,13 @@ cdef class Cell:
                     pnt.y = ya.data[particle_id]
                     pnt.z = za.data[particle_id]
 
-                    if self.periodic_domain:
-
-                        if pnt.x >= self.periodic_domain.xmax:
-                            pnt.x -= self.periodic_domain.xtranslate
-
-                        if pnt.x <= self.periodic_domain.xmin:
-                            pnt.x += self.periodic_domain.xtranslate
-
-                    # find the cell containing this point
+                    # find the cell containing this point. The positions
+                    # are wrapped into a periodic domain by the manager
 
                     id.data = find_cell_id(pnt, self.cell_size)
 
-                    # check for jump tolerance if not periodic
+                    # check for jump tolerance if not periodic, particles
+                    # leaving a periodic domain enter at the other end
 
                     if not self.periodic_domain:
                         self.cell_manager.check_jump_tolerance(self.id.data,
@@ -806,12 +885,70 @@ cdef class CellManager:
     periodic_domain -- A periodic domain specified by limits in each
     coordinate direction.
 
+    use_flat_index -- Bin the particles with a counting sort into flat
+    arrays instead of the `cells_dict`. Defaults to False.
+
+    cell_start, cell_count, sorted_index -- The flat index (one
+    LongArray per binned array). The indices of particles of array `i`
+    in the flat cell `key` are sorted_index[i][cell_start[i][key]:
+    cell_start[i][key] + cell_count[i][key]]
+
+    num_flat_cells -- Number of cells in the box spanned by the flat index.
+
+    max_flat_cells -- Largest box of cells allocated by the flat index.
+    Defaults to -1, that is FLAT_CELLS_PER_PARTICLE cells per particle
+    and at least MIN_FLAT_CELLS cells.
+
+    flat_index_active -- True if the particles were binned with the flat
+    index at the last update, False if binned with the `cells_dict`.
+
+    dimension -- The dimension of the problem. The cell stencils of the
+    neighbor queries span 3 cells in 1D, 9 in 2D and 27 in 3D. Defaults
+    to 3.
+
+    cell_subdivisions -- Number of cells per interaction radius. The cell
+    size computed from the smoothing lengths, or bounded by
+    `min_cell_size` and `max_cell_size`, is divided by this number.
+    Smaller cells hold fewer particles outside the interaction sphere
+    of a query. The jump tolerance is `cell_subdivisions` cells, that
+    is one interaction radius. Defaults to 1.
+
+    Notes:
+    ------
+
+    With `use_flat_index`, all particles are rebinned on every update
+    and the `cells_dict` is left empty. The flat index covers the
+    bounding box of the occupied cells, so it is meant for compact
+    particle distributions. If the box exceeds `max_flat_cells`, for
+    instance because of a stray particle far from the others, the
+    particles are binned in the `cells_dict` instead until the box is
+    small enough again.
+
+    With a `periodic_domain`, the particles leaving the domain are moved
+    back in at the other end when they are binned. No ghost particles
+    are created, the neighbor locators search the periodic images of the
+    domain instead (see `PeriodicDomain.get_image_shifts`).
+
+    The neighbor queries skip the cells of the box around a point that
+    do not intersect the sphere of the search radius (see
+    `cell_distance2` and `clip_cell_row`). With a `cell_subdivisions`
+    of 2 or 3 the cells visited cover little more than the sphere of
+    radius r, instead of the box of (3 r)**3 in 3D.
+
     """
 
     def __init__(self, list arrays_to_bin=[], double min_cell_size=-1.0,
                  double max_cell_size=0, PeriodicDomain periodic_domain=None,
-                 bint initialize=True, double max_radius_scale=2.0):
+                 bint initialize=True, double max_radius_scale=2.0,
+                 bint use_flat_index=False, int dimension=3,
+                 int cell_subdivisions=1):
         
+        if cell_subdivisions < 1:
+            raise ValueError, 'cell_subdivisions must be at least 1'
+
+        self.set_dimension(dimension)
+        self.cell_subdivisions = cell_subdivisions
+
         self.max_radius_scale = max_radius_scale
         self.min_cell_size = min_cell_size
         self.max_cell_size = max_cell_size
@@ -837,7 +974,13 @@ cdef class CellManager:
 
         self.initialized = False
 
-        self.ghost_cells = dict()
+        self.use_flat_index = use_flat_index
+        self.cell_start = []
+        self.cell_count = []
+        self.sorted_index = []
+        self.num_flat_cells = 0
+        self.max_flat_cells = -1
+        self.flat_index_active = use_flat_index
 
         if initialize == True:
             self.initialize()
@@ -876,9 +1019,10 @@ cdef class CellManager:
 
         self.compute_cell_size(self.min_cell_size, self.max_cell_size)
         
-        # build cell.
+        # build cell. The flat index is built from scratch in update
 
-        self._build_cell()
+        if not self.use_flat_index:
+            self._build_cell()
 
         # update
 
@@ -902,6 +1046,9 @@ cdef class CellManager:
         may want to use something more sophisticated or probably set the cell
         sizes manually.
 
+        The sizes bound the cell of one interaction radius, which is then
+        divided into `cell_subdivisions` cells.
+
         """
         if min_size <= 0:
             min_h, max_h = self._compute_minmax_h()
@@ -921,6 +1068,8 @@ cdef class CellManager:
         if self.cell_size == 0.0:
             self.cell_size = 1.0
 
+        self.cell_size /= self.cell_subdivisions
+
         logger.info('using cell size of %f'%(self.cell_size))
         return self.cell_size
 
@@ -931,12 +1080,36 @@ cdef class CellManager:
         cdef int i
 
         cdef int num_arrays = self.num_arrays
+
+        # bring the particles that have left a periodic domain back in
+
+        if self.is_dirty and self.periodic_domain is not None:
+            for i in range(num_arrays):
+                parray = self.arrays_to_bin[i]
+                if parray.is_dirty:
+                    self.wrap_positions(parray)
         
-        if self.is_dirty:
+        if self.is_dirty and self.use_flat_index:
 
-            # delete ghost cells and particles from a previous step
+            # rebin all particles into the flat index, or into the cells
+            # if the box of the flat index is too large
 
-            self.remove_ghost_particles()
+            if self.flat_index_update():
+                self.cells_dict.clear()
+            else:
+                self.cells_dict.clear()
+                self._build_cell()
+                self.cells_update()
+                self.delete_empty_cells()
+                self._reset_jump_tolerance()
+
+            for i in range(num_arrays):
+                parray = self.arrays_to_bin[i]
+                parray.set_dirty(False)
+
+            self.is_dirty = False
+
+        elif self.is_dirty:
 
             # update the cells.
 
@@ -946,11 +1119,6 @@ cdef class CellManager:
 
             self.delete_empty_cells()
 
-            # create ghost cells
-
-            if self.periodic_domain:
-                self.create_ghost_cells()
-
             # reset the dirty bit of all particle arrays.
 
             for i in range(num_arrays):
@@ -1014,6 +1182,20 @@ cdef class CellManager:
 
         return 0    
     
+    cpdef set_dimension(self, int dimension):
+        """ Set the dimension spanned by the cell stencils of the queries
+
+        Parameters:
+        -----------
+
+        dimension -- the dimension of the problem (1, 2 or 3)
+
+        """
+        if dimension < 1 or dimension > 3:
+            raise ValueError, 'The dimension must be 1, 2 or 3'
+
+        self.dimension = dimension
+
     cpdef set_jump_tolerance(self, int jump_tolerance):
         """Sets the jump tolerance value of the cells."""
         cdef int i
@@ -1118,8 +1300,9 @@ cdef class CellManager:
         Algorithm::
         -----------
         find the cell id to which the point belongs
-        construct an immediate neighbor id list
-        return cells corresponding to these cell ids
+        construct the ids of the box of cells within the radius in
+        `dimension` dimensions
+        return the cells of these ids that intersect the sphere
         
     	"""
         cdef IntPoint cell_id = IntPoint_new(0,0,0)
@@ -1130,9 +1313,19 @@ cdef class CellManager:
 
         cdef vector[cIntPoint] v = construct_immediate_neighbor_list(
                                         find_cell_id(pnt, self.cell_size),
-                                        True, <int>ceil(radius/self.cell_size))
+                                        True, <int>ceil(radius/self.cell_size),
+                                        self.dimension)
+
+        cdef double radius2 = radius*radius
 
         for i in range(v.size()):
+
+            # skip the cells of the box outside the sphere
+
+            if cell_distance2(pnt, v[i], self.cell_size,
+                              self.dimension) >= radius2:
+                continue
+
             cell_id.data = v[i]
 
             if PyDict_Contains( self.cells_dict, cell_id ):
@@ -1208,6 +1401,241 @@ cdef class CellManager:
                         PyList_Append(cell_list, cell)
         return 0
   
+    cdef long get_max_flat_cells(self):
+        """ Return the largest number of cells of the flat index """
+        if self.max_flat_cells >= 0:
+            return self.max_flat_cells
+
+        return max(MIN_FLAT_CELLS,
+                   FLAT_CELLS_PER_PARTICLE*self.get_number_of_particles())
+
+    cpdef int flat_index_update(self) except -1:
+        """ Bin all particles into the flat index.
+
+        Returns 1 if the particles were binned, 0 if the box of cells
+        exceeds the maximum number of flat cells. The flat index is then
+        left unchanged and `flat_index_active` is set to False.
+
+        Algorithm:
+        ----------
+        compute the integer cell ids of all particles (vectorized)
+        find the box of cells enclosing all particles
+        return 0 if the box has too many cells
+        compute a linear key for every particle within this box
+        counting sort the particle indices on the key
+
+        Notes:
+        ------
+        The sort is stable so that the particle indices within a cell
+        are in increasing order.
+
+        """
+        cdef ParticleArray parray
+        cdef LongArray start, count, sorted_index
+        cdef numpy.ndarray[ndim=1, dtype=numpy.int_t] keys
+        cdef long i, key, np, ncells, offset
+        cdef int j
+
+        cdef int num_arrays = self.num_arrays
+        cdef double cell_size = self.cell_size
+        cdef double box_cells
+        cdef list cids = []
+
+        cdef cIntPoint lo = cIntPoint(INT_MAX, INT_MAX, INT_MAX)
+        cdef cIntPoint hi = cIntPoint(-INT_MAX, -INT_MAX, -INT_MAX)
+
+        # integer cell ids for all particles
+
+        for j in range(num_arrays):
+            parray = self.arrays_to_bin[j]
+            np = parray.get_number_of_particles()
+
+            ix = numpy.floor(parray.get_carray(self.coord_x).get_npy_array()/
+                             cell_size).astype(numpy.int)
+            iy = numpy.floor(parray.get_carray(self.coord_y).get_npy_array()/
+                             cell_size).astype(numpy.int)
+            iz = numpy.floor(parray.get_carray(self.coord_z).get_npy_array()/
+                             cell_size).astype(numpy.int)
+
+            cids.append((ix, iy, iz))
+
+            if np > 0:
+                lo.x = min(lo.x, ix.min()); hi.x = max(hi.x, ix.max())
+                lo.y = min(lo.y, iy.min()); hi.y = max(hi.y, iy.max())
+                lo.z = min(lo.z, iz.min()); hi.z = max(hi.z, iz.max())
+
+        if hi.x < lo.x:
+            # no particles to bin
+            lo = cIntPoint(0, 0, 0)
+            hi = cIntPoint(-1, -1, -1)
+
+        # the number of cells is computed in double precision to avoid
+        # an overflow for widely separated particles
+
+        box_cells = ((<double>hi.x - lo.x + 1) * (<double>hi.y - lo.y + 1) *
+                     (<double>hi.z - lo.z + 1))
+
+        if box_cells > self.get_max_flat_cells():
+            if self.flat_index_active:
+                logger.info('CellManager: flat index box of %g cells too '
+                            'large, binning in the cells dict'%(box_cells))
+            self.flat_index_active = False
+            return 0
+
+        self.flat_index_active = True
+
+        self.flat_origin = lo
+        self.flat_dims = cIntPoint(hi.x - lo.x + 1, hi.y - lo.y + 1,
+                                   hi.z - lo.z + 1)
+
+        ncells = (<long>self.flat_dims.x) * self.flat_dims.y * self.flat_dims.z
+        self.num_flat_cells = ncells
+
+        if len(self.cell_start) != num_arrays:
+            self.cell_start = [LongArray() for j in range(num_arrays)]
+            self.cell_count = [LongArray() for j in range(num_arrays)]
+            self.sorted_index = [LongArray() for j in range(num_arrays)]
+
+        for j in range(num_arrays):
+            ix, iy, iz = cids[j]
+            np = len(ix)
+
+            keys = (ix - lo.x) + self.flat_dims.x * (
+                (iy - lo.y) + self.flat_dims.y * (iz - lo.z))
+
+            start = self.cell_start[j]
+            count = self.cell_count[j]
+            sorted_index = self.sorted_index[j]
+
+            start.resize(ncells)
+            count.resize(ncells)
+            sorted_index.resize(np)
+
+            for i in range(ncells):
+                count.data[i] = 0
+
+            # histogram and exclusive prefix sum
+
+            for i in range(np):
+                count.data[keys[i]] += 1
+
+            offset = 0
+            for i in range(ncells):
+                start.data[i] = offset
+                offset += count.data[i]
+
+            # scatter, using count as the fill pointer and restoring it
+
+            for i in range(ncells):
+                count.data[i] = 0
+
+            for i in range(np):
+                key = keys[i]
+                sorted_index.data[start.data[key] + count.data[key]] = i
+                count.data[key] += 1
+
+        return 1
+
+    cdef bint get_flat_cell_range(self, cPoint pnt, double radius,
+                                  cIntPoint* lo, cIntPoint* hi):
+        """ Find the range of flat cells within a radius of a point.
+
+        Parameters:
+        -----------
+
+        pnt -- point around which cells are to be searched for.
+        radius -- search radius
+        lo, hi -- output parameters for the (inclusive) cell id range,
+        clipped to the flat index.
+
+        Returns False if the range does not intersect the flat index.
+
+        """
+        cdef cPoint tmp_pt
+        cdef cIntPoint origin = self.flat_origin
+        cdef cIntPoint dims = self.flat_dims
+
+        # the range only extends along the first `dimension` coordinates
+        cdef double ry = radius if self.dimension > 1 else 0.0
+        cdef double rz = radius if self.dimension > 2 else 0.0
+
+        tmp_pt.x = pnt.x - radius
+        tmp_pt.y = pnt.y - ry
+        tmp_pt.z = pnt.z - rz
+
+        lo[0] = find_cell_id(tmp_pt, self.cell_size)
+
+        tmp_pt.x = pnt.x + radius
+        tmp_pt.y = pnt.y + ry
+        tmp_pt.z = pnt.z + rz
+
+        hi[0] = find_cell_id(tmp_pt, self.cell_size)
+
+        lo.x = max(lo.x, origin.x); hi.x = min(hi.x, origin.x + dims.x - 1)
+        lo.y = max(lo.y, origin.y); hi.y = min(hi.y, origin.y + dims.y - 1)
+        lo.z = max(lo.z, origin.z); hi.z = min(hi.z, origin.z + dims.z - 1)
+
+        return (lo.x <= hi.x and lo.y <= hi.y and lo.z <= hi.z)
+
+    cdef long get_flat_cell_key(self, int i, int j, int k):
+        """ Return the flat index key for the cell (i, j, k) """
+        return ((i - self.flat_origin.x) + (<long>self.flat_dims.x) * (
+            (j - self.flat_origin.y) + (<long>self.flat_dims.y) *
+            (k - self.flat_origin.z)))
+
+    def get_flat_cell_particles(self, IntPoint cid, int array_index=0):
+        """ Return the indices of particles from the array at
+        `array_index` that are in the cell `cid` of the flat index. """
+        cdef LongArray start = self.cell_start[array_index]
+        cdef LongArray count = self.cell_count[array_index]
+        cdef LongArray sorted_index = self.sorted_index[array_index]
+        cdef cIntPoint origin = self.flat_origin
+        cdef cIntPoint dims = self.flat_dims
+        cdef long key, s
+
+        if not (origin.x <= cid.x < origin.x + dims.x and
+                origin.y <= cid.y < origin.y + dims.y and
+                origin.z <= cid.z < origin.z + dims.z):
+            return numpy.empty(0, dtype=numpy.int)
+
+        key = self.get_flat_cell_key(cid.x, cid.y, cid.z)
+        s = start.data[key]
+        return sorted_index.get_npy_array()[s:s + count.data[key]].copy()
+
+    cpdef int remap_particle_indices(self, int array_index,
+                                     LongArray new_index) except -1:
+        """ Renumber the binned particles of an array that was reordered
+
+        Parameters:
+        -----------
+        array_index -- index of the reordered array in `arrays_to_bin`
+        new_index -- new_index[i] is the new index of the particle that
+        was at index i
+
+        Notes:
+        ------
+        The particles are not moved from their cells, only the indices
+        held by the cells (or by the flat index) are replaced.
+
+        """
+        cdef Cell cell
+        cdef LongArray indices
+        cdef long k
+
+        if self.flat_index_active:
+            if array_index < len(self.sorted_index):
+                indices = self.sorted_index[array_index]
+                for k in range(indices.length):
+                    indices.data[k] = new_index.data[indices.data[k]]
+            return 0
+
+        for cell in self.cells_dict.values():
+            indices = cell.index_lists[array_index]
+            for k in range(indices.length):
+                indices.data[k] = new_index.data[indices.data[k]]
+
+        return 0
+
     cpdef insert_particles(self, int parray_id, LongArray indices):
         """ Insert particles from a given particle array
 
@@ -1274,106 +1702,27 @@ cdef class CellManager:
         
         return cells_created
 
-    cpdef create_ghost_cells(self):
-        """ Replicate cells for periodicity """
-
-        cdef cPoint ghost_pnt
-        cdef IntPoint cid
-        cdef Cell cell
-
-        cdef dict ghost_cells = dict()
-        cdef int i, nghost_cells
-        cdef list ghost_cids
-        cdef Cell ghost_cell
-
-        cdef IntPoint ghost_cid = IntPoint_new(0,0,0)
-        cdef Point centroid = Point(0,0,0)
-
-        cdef list cells = PyDict_Values( self.cells_dict )
-        cdef int ncells = PyList_Size( cells )
+    cpdef wrap_positions(self, ParticleArray parray):
+        """ Move the particles of an array that have left the periodic
+        domain to their image within the domain """
 
+        cdef DoubleArray xa = parray.get_carray(self.coord_x)
+        cdef DoubleArray ya = parray.get_carray(self.coord_y)
+        cdef DoubleArray za = parray.get_carray(self.coord_z)
         cdef PeriodicDomain domain = self.periodic_domain
+        cdef long i
+        cdef cPoint pnt
 
-        cdef double dist = self.max_radius_scale  * self.max_h
-        cdef double half_cell_size = 0.5 * self.cell_size
-
-        nghost_cells = 0
-
-        for i in range(ncells):
-            cell = cells[i]
-            cid = cell.id
-
-            cell.get_centroid(centroid)
-
-            # Check for X periodicity at left end
-
-            ghost_pnt.y = centroid.y
-            ghost_pnt.z = centroid.z
-
-            if ( (centroid.data.x - half_cell_size) <= domain.xmin ):
-
-                ghost_pnt.x = centroid.x + domain.xtranslate
-               
-                ghost_cid.data = find_cell_id(ghost_pnt, self.cell_size)
-
-                ghost_cells[ghost_cid.copy()] = cell.copy(ghost_cid)
-                nghost_cells += 1
-
-            elif ( ((centroid.data.x - half_cell_size) - domain.xmin) < dist ):
-
-                ghost_pnt.x = centroid.x + domain.xtranslate
-
-                ghost_cid.data = find_cell_id(ghost_pnt, self.cell_size)
-                ghost_cells[ghost_cid.copy()] = cell.copy(ghost_cid)
-                nghost_cells += 1
-
-            # check for X periodicity at right end
-
-            if ( (centroid.data.x + half_cell_size) >= domain.xmax ):
-
-                ghost_pnt.x = centroid.x - domain.xtranslate
-
-                ghost_cid.data = find_cell_id(ghost_pnt, self.cell_size)
-
-                ghost_cells[ghost_cid.copy()] = cell.copy(ghost_cid)
-                nghost_cells += 1
-
-            elif ((domain.xmax - (centroid.data.x + half_cell_size)) < dist):
-
-                ghost_pnt.x = centroid.x - domain.xtranslate
-
-                ghost_cid.data = find_cell_id(ghost_pnt, self.cell_size)
-
-                ghost_cells[ghost_cid.copy()] = cell.copy(ghost_cid)
-                nghost_cells += 1
-
-        ghost_cids = PyDict_Keys( ghost_cells )
-        for i in range(nghost_cells):
-
-            ghost_cid = ghost_cids[i]
-            ghost_cell = <Cell>PyDict_GetItem( ghost_cells, ghost_cid )
-            
-            if PyDict_Contains( self.cells_dict, ghost_cid ):
-                cell = <Cell>PyDict_GetItem( self.cells_dict, ghost_cid )
-                cell.add_particles( ghost_cell )
-            else:
-                self.cells_dict[ghost_cid] = ghost_cell
-
-        self.ghost_cells = ghost_cells
-
-    cpdef remove_ghost_particles(self):
-        """ Remove all particles with tag GhostParticle """
-
-        cdef ParticleArray pa
-        cdef int i
+        for i in range(parray.get_number_of_particles()):
+            pnt.x = xa.data[i]
+            pnt.y = ya.data[i]
+            pnt.z = za.data[i]
 
-        cdef IntPoint ghost_cid
+            domain.wrap(&pnt)
 
-        for i in range(self.num_arrays):
-            pa = self.arrays_to_bin[i]
-            pa.remove_tagged_particles(GhostParticle)
-
-        self.ghost_cells = dict()
+            xa.data[i] = pnt.x
+            ya.data[i] = pnt.y
+            za.data[i] = pnt.z
 
     cpdef add_array_to_bin(self, ParticleArray parr):
         """ Add an array to the CellManager (before initialization)"""
@@ -1392,7 +1741,8 @@ cdef class CellManager:
         """ Return a new cell with the given id. """
         return Cell(id=id, cell_manager=self, 
                     cell_size=self.cell_size,
-                    jump_tolerance=self.jump_tolerance)
+                    jump_tolerance=self.jump_tolerance,
+                    periodic_domain=self.periodic_domain)
     
     cpdef list delete_empty_cells(self):
         """delete empty cells and return the ids of deleted cells"""
@@ -1428,7 +1778,7 @@ cdef class CellManager:
             self.jump_tolerance or abs(pdiff.z) >
             self.jump_tolerance):
             
-            msg = 'Particle moved by more than one cell width\n'
+            msg = 'Particle moved by more than the jump tolerance\n'
             msg += 'self id : (%d, %d, %d)\n'%(myid.x, myid.y,
                                                myid.z)
             msg += 'new id  : (%d, %d, %d)\n'%(newid.x, newid.y, newid.z)
@@ -1440,6 +1790,25 @@ cdef class CellManager:
         """Sets/Resets the dirty flag."""
         self.is_dirty = value
 
+    def set_use_flat_index(self, bint value):
+        """ Select the binning engine, rebinning if already initialized. """
+        if value == self.use_flat_index:
+            return
+
+        self.use_flat_index = value
+        self.flat_index_active = value
+        self.cells_dict.clear()
+
+        if self.initialized:
+            if not value:
+                self._build_cell()
+
+            self.is_dirty = True
+            self.update()
+
+            if not value:
+                self._reset_jump_tolerance()
+
     cpdef clear(self):
         """Clear the dictionary `cells_dict`."""
         self.cells_dict.clear()
@@ -1485,12 +1854,13 @@ cdef class CellManager:
         return min_h, max_h        
 
     cdef void _reset_jump_tolerance(self):
-        """Resets the jump tolerance of all cells to 1."""
+        """Resets the jump tolerance of all cells to one interaction
+        radius, that is `cell_subdivisions` cells."""
         cdef list cells_list
         cdef Cell cell
         cdef int i, num_cells
 
-        self.jump_tolerance = 1
+        self.jump_tolerance = self.cell_subdivisions
 
         if len(self.cells_dict) == 0:
             return
@@ -1500,7 +1870,7 @@ cdef class CellManager:
         
         for i in range(len(self.cells_dict)):
             cell = cells_list[i]
-            cell.jump_tolerance = 1
+            cell.jump_tolerance = self.jump_tolerance
 
     def get_particle_representation(self, fname):
         
@@ -1516,7 +1886,8 @@ cdef class CellManager:
     def is_boundary_cell(self, IntPoint cid):
         """ Returns true if this cell is a boundary cell, false otherwise. """
         cdef IntPoint p=IntPoint_new(0,0,0)
-        cdef vector[cIntPoint] v = construct_immediate_neighbor_list(cid.data)
+        cdef vector[cIntPoint] v = construct_immediate_neighbor_list(
+            cid.data, True, 1, self.dimension)
         cdef int j=0, i
         for i in range(v.size()):
             p.data = v[i]
@@ -1565,8 +1936,35 @@ cdef class CellManager:
         return self.get_number_of_particles()
 
 
+###############################################################################
+# `PeriodicDomain` class.
+###############################################################################
 cdef class PeriodicDomain:
 
+    #Defined in the .pxd file
+    #cdef public double xmin, xmax, ymin, ymax, zmin, zmax
+    #cdef public double xtranslate, ytranslate, ztranslate
+
+    """ A domain which is periodic in some coordinate directions
+
+    Data Attributes:
+    ----------------
+
+    xmin, xmax, ymin, ymax, zmin, zmax -- The limits of the domain
+
+    xtranslate, ytranslate, ztranslate -- The period in each direction,
+    0 if the domain is not periodic in that direction
+
+    Notes:
+    ------
+
+    A direction is not periodic if its limits are left at the defaults.
+    The period in a periodic direction must be at least twice the
+    largest interaction radius so that a particle interacts with at most
+    one image of another particle.
+
+    """
+
     def __init__(self, double xmin=-1000, double xmax=1000, double ymin=-1000,
                  double ymax=1000, double zmin=-1000, double zmax=1000):
         self.xmin = xmin
@@ -1593,7 +1991,116 @@ cdef class PeriodicDomain:
         else:            
             self.ztranslate = zmax - zmin
 
+    cdef void wrap(self, cPoint* pnt) nogil:
+        """ Move a point outside the domain to its image in the domain """
+        pnt.x = _wrap(pnt.x, self.xmin, self.xmax, self.xtranslate)
+        pnt.y = _wrap(pnt.y, self.ymin, self.ymax, self.ytranslate)
+        pnt.z = _wrap(pnt.z, self.zmin, self.zmax, self.ztranslate)
 
+    cdef void nearest_image(self, cPoint* pnt, cPoint ref) nogil:
+        """ Move a point to its image nearest to the point `ref`
 
-        
-                 
+        Notes:
+        ------
+        The point is left unchanged if it is within half a period of
+        `ref` in every periodic direction.
+
+        """
+        pnt.x = _nearest(pnt.x, ref.x, self.xtranslate)
+        pnt.y = _nearest(pnt.y, ref.y, self.ytranslate)
+        pnt.z = _nearest(pnt.z, ref.z, self.ztranslate)
+
+    cdef int get_image_shifts(self, cPoint pnt, double radius,
+                              cPoint* shifts) nogil:
+        """ Find the images of the domain which may hold particles within
+        `radius` of a point
+
+        Parameters:
+        -----------
+
+        pnt -- the query point, within the domain
+        radius -- the search radius
+        shifts -- output parameter for at most 27 shifts
+
+        Returns the number of shifts. The first is always (0, 0, 0).
+
+        Notes:
+        ------
+        A particle at x is seen at x + s in the image with the shift s.
+        Its image is within the radius of the point if the particle
+        itself is within the radius of pnt - s, so the neighbors in all
+        images are found by searching the domain around the points
+        pnt - s.
+
+        """
+        cdef double sx[3], sy[3], sz[3]
+        cdef int nx, ny, nz, i, j, k
+        cdef int n = 0
+
+        nx = _image_offsets(pnt.x, radius, self.xmin, self.xmax,
+                            self.xtranslate, sx)
+        ny = _image_offsets(pnt.y, radius, self.ymin, self.ymax,
+                            self.ytranslate, sy)
+        nz = _image_offsets(pnt.z, radius, self.zmin, self.zmax,
+                            self.ztranslate, sz)
+
+        for k in range(nz):
+            for j in range(ny):
+                for i in range(nx):
+                    shifts[n].x = sx[i]
+                    shifts[n].y = sy[j]
+                    shifts[n].z = sz[k]
+                    n += 1
+
+        return n
+
+    ######################################################################
+    # python wrappers.
+    ######################################################################
+    def py_wrap(self, Point pnt):
+        self.wrap(&pnt.data)
+
+    def py_nearest_image(self, Point pnt, Point ref):
+        self.nearest_image(&pnt.data, ref.data)
+
+    def py_get_image_shifts(self, Point pnt, double radius):
+        cdef cPoint shifts[27]
+        cdef int i, n = self.get_image_shifts(pnt.data, radius, shifts)
+        return [Point(shifts[i].x, shifts[i].y, shifts[i].z)
+                for i in range(n)]
+
+cdef inline double _wrap(double x, double xmin, double xmax,
+                         double translate) nogil:
+    """ Return the image of x in [xmin, xmax) if translate is positive """
+    if translate > 0 and (x < xmin or x >= xmax):
+        x -= translate * floor((x - xmin)/translate)
+    return x
+
+cdef inline double _nearest(double x, double ref, double translate) nogil:
+    """ Return the image of x nearest to ref if translate is positive """
+    if translate > 0:
+        if x - ref > 0.5*translate:
+            x -= translate
+        elif x - ref < -0.5*translate:
+            x += translate
+    return x
+
+cdef inline int _image_offsets(double x, double radius, double xmin,
+                               double xmax, double translate,
+                               double* offsets) nogil:
+    """ Store the shifts of the images along one direction which may
+    hold neighbors of x in offsets and return their number """
+    cdef int n = 1
+
+    offsets[0] = 0.0
+
+    if translate > 0:
+        # particles near xmin are seen beyond xmax and vice versa
+        if x + radius > xmax:
+            offsets[n] = translate
+            n += 1
+        if x - radius < xmin:
+            offsets[n] = -translate
+            n += 1
+
+    return n
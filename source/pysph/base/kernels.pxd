@@ -10,6 +10,117 @@ from pysph.base.carray cimport DoubleArray
 
 cimport numpy
 
+cdef extern from "math.h":
+    double sqrt(double) nogil
+    double exp(double) nogil
+
+# The kernel types returned by `KernelBase.get_type`. The same numbers
+# are used in the OpenCL code.
+cdef enum:
+    CUBIC_SPLINE = 1
+    GAUSSIAN = 2
+    QUINTIC_SPLINE = 3
+    WENDLAND_QUINTIC_SPLINE = 4
+    HARMONIC = 5
+    M6_SPLINE = 6
+    W8 = 7
+    W10 = 8
+    REPULSIVE = 9
+    POLY6 = 10
+
+cdef inline double h_dim(double h, int dim) nogil:
+    if dim == 1:
+        return 1/h
+    elif dim == 2:
+        return 1/(h*h)
+    else:
+        return 1/(h*h*h)
+
+##############################################################################
+# Inlinable kernels.
+#
+# w(q) is the kernel for h = 1 without the normalizing factor and dw(q)
+# is (dw/dq)/q, so that for a kernel with the factor `fac`
+#
+#     W = fac * h_dim(h) * w(q)
+#     grad W = fac * h_dim(h)/h**2 * dw(q) * (pa - pb)
+#
+##############################################################################
+cdef inline double cubic_spline_w(double q) nogil:
+    if q > 2.0:
+        return 0.0
+    elif q > 1.0:
+        return 0.25 * (2 - q) * (2 - q) * (2 - q)
+    else:
+        return 1 - 1.5 * (q*q) * (1 - 0.5 * q)
+
+cdef inline double cubic_spline_dw(double q) nogil:
+    if q > 2.0:
+        return 0.0
+    elif q >= 1.0:
+        return -0.75 * (2 - q) * (2 - q)/q
+    elif q > 1e-14:
+        return 3.0*(0.75*q - 1)
+    return 0.0
+
+cdef inline double quintic_spline_w(double q) nogil:
+    cdef double tmp1 = (3-q)
+    cdef double tmp2 = (2-q)
+    cdef double tmp3 = (1-q)
+    cdef double val
+
+    if q > 3.0:
+        return 0.0
+
+    tmp1 *= (tmp1 * tmp1 * tmp1 * tmp1)
+    val = tmp1
+    if q <= 2.0:
+        tmp2 *= (tmp2 * tmp2 * tmp2 * tmp2)
+        val -= 6 * tmp2
+        if q <= 1.0:
+            tmp3 *= (tmp3 * tmp3 * tmp3 * tmp3)
+            val += tmp3
+    return val
+
+cdef inline double quintic_spline_dw(double q) nogil:
+    cdef double tmp1 = (3-q)
+    cdef double tmp2 = (2-q)
+    cdef double tmp3 = (1-q)
+    cdef double val
+
+    if q > 3.0 or q < 1e-14:
+        return 0.0
+
+    tmp1 *= (tmp1 * tmp1 * tmp1)
+    val = 5*tmp1
+    if q <= 2.0:
+        tmp2 *= (tmp2 * tmp2 * tmp2)
+        val -= 30 * tmp2
+        if q <= 1.0:
+            tmp3 *= (tmp3 * tmp3 * tmp3)
+            val += 75*tmp3
+    return val/q
+
+cdef inline double wendland_quintic_w(double q) nogil:
+    cdef double tmp = (1-0.5*q)
+    if q > 2.0:
+        return 0.0
+    return tmp * tmp * tmp * tmp * (2*q + 1)
+
+cdef inline double wendland_quintic_dw(double q) nogil:
+    cdef double tmp = (1-0.5*q)
+    if q > 2.0 or q < 1e-14:
+        return 0.0
+    return -5 * tmp * tmp * tmp
+
+cdef inline double gaussian_w(double q) nogil:
+    return exp(-q*q)
+
+cdef inline double gaussian_dw(double q) nogil:
+    if q > 1e-14:
+        return -2*exp(-q*q)
+    return 0.0
+
 ##############################################################################
 #`KernelBase`
 ##############################################################################
@@ -17,6 +128,9 @@ cdef class KernelBase:
     cdef readonly int dim
     cdef readonly double fac
 
+    # the type of the inlined kernel (see evaluate_function) or 0
+    cdef readonly int inline_type
+
     cdef public DoubleArray smoothing
     cdef public DoubleArray distances
     cdef public DoubleArray function_cache
@@ -26,15 +140,85 @@ cdef class KernelBase:
     cdef public double constant_h
     cdef public double distances_dx
 
-    cdef double function(self, cPoint pa, cPoint pb, double h)
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h)
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil
     cdef double _fac(self, double h)
     cpdef double radius(self)
     cpdef int dimension(self)
     cpdef double __gradient(self, Point pa, Point pb, double h)
 
-    cdef interpolate_function(self, double rab)
-    cdef interpolate_gradients(self, double rab)
+    cdef double interpolate_function(self, double rab) nogil
+    cdef double interpolate_gradients(self, double rab) nogil
+
+    # normalized lookup tables of the kernel for any h (see set_table)
+    cdef readonly bint use_table
+    cdef readonly int table_order
+    cdef readonly double table_dq, table_radius
+    cdef readonly DoubleArray table_w, table_dw
+
+    cdef double table_function(self, cPoint pa, cPoint pb, double h) nogil
+    cdef cPoint table_gradient(self, cPoint pa, cPoint pb, double h) nogil
+
+##############################################################################
+# Kernel evaluation without virtual calls for the inlinable kernels.
+##############################################################################
+cdef inline double evaluate_function(KernelBase kernel, cPoint pa, cPoint pb,
+                                     double h) nogil:
+    """ Return kernel.function(pa, pb, h)
+
+    The cubic spline, quintic spline, Wendland quintic and Gaussian
+    kernels are evaluated inline. Other kernels and kernels evaluated
+    from tables are called through `function`.
+
+    """
+    cdef int t = kernel.inline_type
+    cdef double q, fac
+
+    if t == 0 or kernel.use_table or kernel.has_constant_h:
+        return kernel.function(pa, pb, h)
+
+    q = sqrt((pa.x-pb.x)*(pa.x-pb.x) + (pa.y-pb.y)*(pa.y-pb.y) +
+             (pa.z-pb.z)*(pa.z-pb.z))/h
+    fac = kernel.fac * h_dim(h, kernel.dim)
+
+    if t == CUBIC_SPLINE:
+        return fac * cubic_spline_w(q)
+    elif t == QUINTIC_SPLINE:
+        return fac * quintic_spline_w(q)
+    elif t == WENDLAND_QUINTIC_SPLINE:
+        return fac * wendland_quintic_w(q)
+    else:
+        return fac * gaussian_w(q)
+
+cdef inline cPoint evaluate_gradient(KernelBase kernel, cPoint pa, cPoint pb,
+                                     double h) nogil:
+    """ Return kernel.gradient(pa, pb, h), inline for the kernels of
+    `evaluate_function` """
+    cdef int t = kernel.inline_type
+    cdef double rx, ry, rz, q, val
+    cdef cPoint grad
+
+    if t == 0 or kernel.use_table or kernel.has_constant_h:
+        return kernel.gradient(pa, pb, h)
+
+    rx = pa.x - pb.x; ry = pa.y - pb.y; rz = pa.z - pb.z
+    q = sqrt(rx*rx + ry*ry + rz*rz)/h
+
+    if t == CUBIC_SPLINE:
+        val = cubic_spline_dw(q)
+    elif t == QUINTIC_SPLINE:
+        val = quintic_spline_dw(q)
+    elif t == WENDLAND_QUINTIC_SPLINE:
+        val = wendland_quintic_dw(q)
+    else:
+        val = gaussian_dw(q)
+
+    val *= kernel.fac * h_dim(h, kernel.dim)/(h*h)
+
+    grad.x = rx * val
+    grad.y = ry * val
+    grad.z = rz * val
+    return grad
 
 ##############################################################################
 # `Poly6Kernel` class.
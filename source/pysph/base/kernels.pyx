@@ -6,14 +6,12 @@ Module to implement various SPH kernels in multiple dimensions
 #Copyright (c) 2010, Prabhu Ramachandran
 
 cdef extern from "math.h":
-    double sqrt(double)
-    double exp(double)
-    double fabs(double)
-    double sin(double)
-    double cos(double)
-    double pow(double x, double y)
-    int floor(double)
-    double fmod(double, double)
+    double fabs(double) nogil
+    double sin(double) nogil
+    double cos(double) nogil
+    double pow(double x, double y) nogil
+    int floor(double) nogil
+    double fmod(double, double) nogil
 
 cimport numpy 
 import numpy
@@ -26,31 +24,33 @@ cdef:
     double infty = numpy.inf
 
 
-##############################################################################
-# These are simple ints to define the different types of kernels.  This
-# is what is returned by the `KernelBase.get_type` method. The only
-# reason we do this is to unify the numbers used between Cython and
-# OpenCL.
-cdef:
-    int CUBIC_SPLINE = 1
-    int GAUSSIAN = 2
-    int QUINTIC_SPLINE = 3
-    int WENDLAND_QUINTIC_SPLINE = 4
-    int HARMONIC = 5
-    int M6_SPLINE = 6
-    int W8 = 7
-    int W10 = 8
-    int REPULSIVE = 9
-    int POLY6 = 10
-
-
-cdef inline double h_dim(double h, int dim):
-    if dim == 1:
-        return 1/h
-    elif dim == 2:
-        return 1/(h*h)
-    else:
-        return 1/(h*h*h)
+def _broadcast_kernel_args(x, y, z, h):
+    """ Return the broadcast shape and contiguous double copies of the
+    arguments of the array kernel evaluations """
+    args = numpy.broadcast_arrays(numpy.asarray(x, dtype=numpy.float64),
+                                  numpy.asarray(y, dtype=numpy.float64),
+                                  numpy.asarray(z, dtype=numpy.float64),
+                                  numpy.asarray(h, dtype=numpy.float64))
+    shape = args[0].shape
+    return [shape] + [numpy.ascontiguousarray(a).ravel() for a in args]
+
+cdef inline double _table_lookup(double* table, double x, int order) nogil:
+    """ Interpolate a uniform table at the (fractional) index x >= 1
+
+    The interpolation is linear for order 1 and cubic (through the four
+    nearest entries) for order 3.
+
+    """
+    cdef int i = <int>x
+    cdef double s = x - i
+
+    if order == 1:
+        return table[i] + s*(table[i+1] - table[i])
+
+    return (-s*(s - 1)*(s - 2)/6.0 * table[i-1] +
+            (s + 1)*(s - 1)*(s - 2)/2.0 * table[i] -
+            (s + 1)*s*(s - 2)/2.0 * table[i+1] +
+            (s + 1)*s*(s - 1)/6.0 * table[i+2])
 
 ##############################################################################
 #`KernelBase`
@@ -87,15 +87,17 @@ cdef class KernelBase:
         if constant_h > 0:
             self.init_cache(n)
 
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         """        
         """
-        raise NotImplementedError, 'KernelBase::function'
+        with gil:
+            raise NotImplementedError, 'KernelBase::function'
 
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         """
         """
-        raise NotImplementedError, 'KernelBase::gradient'
+        with gil:
+            raise NotImplementedError, 'KernelBase::gradient'
 
     cpdef double radius(self):
         """
@@ -116,6 +118,77 @@ cdef class KernelBase:
     def py_gradient(self, Point pa, Point pb, double h, Point grad):
         grad.set_from_cPoint(self.gradient(pa.data, pb.data, h))
 
+    def py_evaluate_function(self, Point pa, Point pb, double h):
+        return evaluate_function(self, pa.data, pb.data, h)
+
+    def py_evaluate_gradient(self, Point pa, Point pb, double h, Point grad):
+        grad.set_from_cPoint(evaluate_gradient(self, pa.data, pb.data, h))
+
+    def py_function_array(self, x, y=0.0, z=0.0, h=1.0):
+        """ Evaluate the kernel for arrays of displacements
+
+        Parameters:
+        -----------
+
+        x, y, z -- the components of the displacements pa - pb
+        h -- the smoothing lengths
+
+        The arguments are broadcast against each other and the kernel
+        values are returned as an array of the broadcast shape. The
+        loop runs without the GIL.
+
+        """
+        cdef numpy.ndarray xa, ya, za, ha, wa
+        shape, xa, ya, za, ha = _broadcast_kernel_args(x, y, z, h)
+        wa = numpy.empty(xa.size)
+
+        cdef double* xd = <double*>xa.data
+        cdef double* yd = <double*>ya.data
+        cdef double* zd = <double*>za.data
+        cdef double* hd = <double*>ha.data
+        cdef double* wd = <double*>wa.data
+        cdef cPoint pa, pb = cPoint(0, 0, 0)
+        cdef long i, n = xa.size
+
+        with nogil:
+            for i in range(n):
+                pa.x = xd[i]; pa.y = yd[i]; pa.z = zd[i]
+                wd[i] = evaluate_function(self, pa, pb, hd[i])
+
+        return wa.reshape(shape)
+
+    def py_gradient_array(self, x, y=0.0, z=0.0, h=1.0):
+        """ Evaluate the kernel gradient for arrays of displacements
+
+        The arguments are those of `py_function_array`. The components
+        (gx, gy, gz) of the gradients are returned as arrays of the
+        broadcast shape.
+
+        """
+        cdef numpy.ndarray xa, ya, za, ha, gxa, gya, gza
+        shape, xa, ya, za, ha = _broadcast_kernel_args(x, y, z, h)
+        gxa = numpy.empty(xa.size)
+        gya = numpy.empty(xa.size)
+        gza = numpy.empty(xa.size)
+
+        cdef double* xd = <double*>xa.data
+        cdef double* yd = <double*>ya.data
+        cdef double* zd = <double*>za.data
+        cdef double* hd = <double*>ha.data
+        cdef double* gx = <double*>gxa.data
+        cdef double* gy = <double*>gya.data
+        cdef double* gz = <double*>gza.data
+        cdef cPoint pa, grad, pb = cPoint(0, 0, 0)
+        cdef long i, n = xa.size
+
+        with nogil:
+            for i in range(n):
+                pa.x = xd[i]; pa.y = yd[i]; pa.z = zd[i]
+                grad = evaluate_gradient(self, pa, pb, hd[i])
+                gx[i] = grad.x; gy[i] = grad.y; gz[i] = grad.z
+
+        return gxa.reshape(shape), gya.reshape(shape), gza.reshape(shape)
+
     cpdef double __gradient(self, Point pa, Point pb, double h):
         raise NotImplementedError, 'KernelBase::__gradient'
 
@@ -153,12 +226,13 @@ cdef class KernelBase:
 
         self.has_constant_h = True
 
-    cdef interpolate_function(self, double rab):
+    cdef double interpolate_function(self, double rab) nogil:
 
         cdef double dx = self.distances_dx
         cdef int index_low, index_high
+        cdef double slope
 
-        cdef double* fc = self.function_cache.get_data_ptr()
+        cdef double* fc = self.function_cache.data
 
         if rab > 2*self.constant_h:
             return 0.0
@@ -178,12 +252,13 @@ cdef class KernelBase:
             
             #print "This interpolation ", slope*fmod(rab,dx) + fc[index_low]
 
-    cdef interpolate_gradients(self, double rab):
+    cdef double interpolate_gradients(self, double rab) nogil:
 
         cdef double dx = self.distances_dx
         cdef int index_low, index_high
+        cdef double slope
 
-        cdef double* gc = self.gradient_cache.get_data_ptr()
+        cdef double* gc = self.gradient_cache.data
 
         if rab > 2 * self.constant_h:
             return 0.0
@@ -201,6 +276,114 @@ cdef class KernelBase:
             #                                           self.gradient_cache)
             #print "This interpolation ", slope*fmod(rab,dx) + gc[index_low]
 
+    def set_table(self, int order=1, long size=1000):
+        """ Evaluate the kernel from lookup tables for any h
+
+        Parameters:
+        -----------
+        order -- 1 for linear and 3 for cubic interpolation. 0 switches
+        back to the exact kernel.
+        size -- number of table intervals over the support of the kernel.
+
+        Notes:
+        ------
+        The kernel and its gradient are tabulated once in the normalized
+        distance q = r/h, for h = 1, with
+
+            W(r, h) = h_dim(h) * w(q)
+            grad W(r, h) = h_dim(h)/h**2 * dw(q) * (pa - pb)
+
+        where dw(q) = w'(q)/q. `function` and `gradient` then interpolate
+        the tables instead of evaluating the kernel, which makes all
+        kernels about as cheap as the cubic spline. The kernel is zero
+        beyond `radius`.
+
+        The read only `use_table` flag is set here once the tables are
+        built, and cleared by `set_table(0)`.
+
+        The relative error of linear interpolation falls as 1/size**2,
+        about 1e-6 of the peak for the default size. Cubic interpolation
+        is more accurate by a few orders of magnitude at the same size.
+
+        """
+        cdef cPoint origin = cPoint_new(0, 0, 0)
+        cdef cPoint pnt = cPoint_new(0, 0, 0)
+        cdef double dq, q
+        cdef long i
+
+        if order == 0:
+            self.use_table = False
+            return
+
+        if order != 1 and order != 3:
+            raise ValueError, 'The table order must be 0, 1 or 3'
+
+        if size < 2:
+            raise ValueError, 'The table needs at least 2 intervals'
+
+        # exact evaluation while tabulating
+        cdef bint has_constant_h = self.has_constant_h
+        self.use_table = False
+        self.has_constant_h = False
+
+        self.table_radius = self.radius()
+        dq = self.table_radius/size
+
+        # entry k is at q = (k-1)*dq. The entry before q = 0 and the two
+        # past the support are there for the cubic interpolation.
+
+        w = numpy.empty(size + 4)
+        dw = numpy.empty(size + 4)
+
+        for i in range(1, size + 4):
+            q = (i - 1)*dq
+            pnt.x = q
+            w[i] = self.function(origin, pnt, 1.0)
+            if i > 1:
+                dw[i] = self.gradient(pnt, origin, 1.0).x/q
+
+        # w and dw are even in q. dw at q = 0 is extrapolated as the
+        # kernels special-case the gradient at the origin.
+
+        w[0] = w[2]
+        dw[1] = (4*dw[2] - dw[3])/3.0
+        dw[0] = dw[2]
+
+        self.table_w = DoubleArray(size + 4)
+        self.table_w.set_data(w)
+        self.table_dw = DoubleArray(size + 4)
+        self.table_dw.set_data(dw)
+
+        self.has_constant_h = has_constant_h
+
+        self.table_dq = dq
+        self.table_order = order
+        self.use_table = True
+
+    cdef double table_function(self, cPoint pa, cPoint pb, double h) nogil:
+        """ Interpolate the kernel from the lookup table """
+        cdef double q = sqrt((pa.x-pb.x)*(pa.x-pb.x)+
+                             (pa.y-pb.y)*(pa.y-pb.y) +
+                             (pa.z-pb.z)*(pa.z-pb.z))/h
+
+        if q >= self.table_radius:
+            return 0.0
+
+        return h_dim(h, self.dim) * _table_lookup(
+            self.table_w.data, q/self.table_dq + 1, self.table_order)
+
+    cdef cPoint table_gradient(self, cPoint pa, cPoint pb, double h) nogil:
+        """ Interpolate the kernel gradient from the lookup table """
+        cdef cPoint r = cPoint_sub(pa, pb)
+        cdef double q = sqrt(cPoint_norm(r))/h
+        cdef double val = 0.0
+
+        if q < self.table_radius:
+            val = h_dim(h, self.dim)/(h*h) * _table_lookup(
+                self.table_dw.data, q/self.table_dq + 1, self.table_order)
+
+        return cPoint_scale(r, val)
+
     ##########################################################################
     # Functions used for testing.
     ##########################################################################
@@ -281,10 +464,13 @@ cdef class Poly6Kernel(KernelBase):
     This class represents a polynomial kernel with support 1.0
     from mueller et. al 2003
     """
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         """ Evaluate the strength of the kernel centered at `pa` at
         the point `pb`.
         """
+        if self.use_table:
+            return self.table_function(pa, pb, h)
+
         cdef double mag_sqr_r = cPoint_distance2(pa, pb)
         cdef double ret = 0.0
         if mag_sqr_r > h*h:
@@ -293,10 +479,13 @@ cdef class Poly6Kernel(KernelBase):
         ret /= h**6
         return ret * h_dim(h, self.dim) * self.fac
 
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         """Evaluate the gradient of the kernel centered at `pa`, at the
         point `pb`.
         """
+        if self.use_table:
+            return self.table_gradient(pa, pb, h)
+
         cdef cPoint grad
         cdef cPoint r = cPoint_sub(pa, pb)
         cdef double part = 0.0
@@ -326,10 +515,10 @@ cdef class Poly6Kernel(KernelBase):
 # DummyKernel` class.
 ##############################################################################
 cdef class DummyKernel(KernelBase):
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         return 1.0
 
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         cdef cPoint grad
         return grad
 
@@ -348,69 +537,38 @@ cdef class CubicSplineKernel(KernelBase):
     Astronomy and Astrophysics, 1992, Vol 30, pp 543-574.
 
     """
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    def __cinit__(self, *args, **kwargs):
+        self.inline_type = CUBIC_SPLINE
+
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         """ Evaluate the strength of the kernel centered at `pa` at
         the point `pb`.
         
         """
-        cdef double rab = sqrt((pa.x-pb.x)*(pa.x-pb.x)+
-                              (pa.y-pb.y)*(pa.y-pb.y) + 
-                              (pa.z-pb.z)*(pa.z-pb.z))
+        if self.use_table:
+            return self.table_function(pa, pb, h)
 
         if self.has_constant_h:
-            return self.interpolate_function(rab)
-
-        cdef double q = rab/h
-        cdef double val
-        cdef double fac = h_dim(h, self.dim) * self.fac
-        
-        if q > 2.0:
-            val = 0.0
-        elif q > 1.0:
-            val = 0.25 * (2 - q) * (2 - q) * (2 - q)
-        else:
-            val = 1 - 1.5 * (q*q) * (1 - 0.5 * q)
+            return self.interpolate_function(sqrt(cPoint_distance2(pa, pb)))
 
-        return val * fac
+        cdef double q = sqrt(cPoint_distance2(pa, pb))/h
+        return cubic_spline_w(q) * self.fac * h_dim(h, self.dim)
 
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         """Evaluate the gradient of the kernel centered at `pa`, at the
         point `pb`.
         """
-        cdef cPoint grad
-        cdef double rab = sqrt((pa.x-pb.x)*(pa.x-pb.x)+
-                               (pa.y-pb.y)*(pa.y-pb.y) + 
-                               (pa.z-pb.z)*(pa.z-pb.z))
+        if self.use_table:
+            return self.table_gradient(pa, pb, h)
 
-        cdef double rx, ry, rz
-        cdef double q = rab/h
-        cdef double val = 0.0
         cdef double wgrad
-        
-        fac = h_dim(h, self.dim)*self.fac
-        
-        rx = pa.x - pb.x; ry = pa.y - pb.y; rz = pa.z - pb.z
-
         if self.has_constant_h:
-            wgrad = self.interpolate_gradients(rab)
+            wgrad = self.interpolate_gradients(sqrt(cPoint_distance2(pa, pb)))
+            return cPoint_scale(cPoint_sub(pa, pb), wgrad)
 
-            grad.x = wgrad*rx
-            grad.y = wgrad*ry
-            grad.z = wgrad*rz
-            
-        else:
-        
-            if q > 2.0:
-                pass
-            elif q >= 1.0:
-                val = -0.75 * (2-q) * (2-q)/(h * rab)
-            elif q > 1e-14:
-                val = 3.0*(0.75*q - 1)/(h*h)
-
-            grad.x = rx * (val * fac)
-            grad.y = ry * (val * fac)
-            grad.z = rz * (val * fac)
-        return grad
+        cdef cPoint r = cPoint_sub(pa, pb)
+        cdef double q = sqrt(cPoint_norm(r))/h
+        return cPoint_scale(r, cubic_spline_dw(q) * self.fac * h_dim(h, self.dim)/(h*h))
 
     cpdef double __gradient(self, Point pa, Point pb, double h):
         """Evaluate the gradient of the kernel centered at `pa`, at the
@@ -462,77 +620,30 @@ cdef class QuinticSplineKernel(KernelBase):
     Physics, 136, 214-226
 
     """
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    def __cinit__(self, *args, **kwargs):
+        self.inline_type = QUINTIC_SPLINE
+
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         """ Evaluate the strength of the kernel centered at `pa` at
-        the point `pb`.         
+        the point `pb`.
+        
         """
-        cdef double fac = self.fac * h_dim(h, self.dim)
-        cdef double rab = cPoint_distance(pa, pb)
-        cdef double q = rab/h
-        cdef double val
-
-        cdef double tmp1 = (3-q)
-        cdef double tmp2 = (2-q)
-        cdef double tmp3 = (1-q)
-      
-        if q > 3.0:
-            val = 0.0
-        else:
-            tmp1 *= (tmp1 * tmp1 * tmp1 * tmp1)
-            
-            if q > 2.0:
-                val = tmp1
-            else:
-                tmp2 *= (tmp2 * tmp2 * tmp2 * tmp2)
-                val = tmp1 - 6 * tmp2
-                if q > 1.0:
-                    pass    
-                else:
-                    tmp3 *= (tmp3 * tmp3 * tmp3 * tmp3)
-                    val += tmp3
+        if self.use_table:
+            return self.table_function(pa, pb, h)
 
-        return val * fac
+        cdef double q = sqrt(cPoint_distance2(pa, pb))/h
+        return quintic_spline_w(q) * self.fac * h_dim(h, self.dim)
 
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         """Evaluate the gradient of the kernel centered at `pa`, at the
         point `pb`.
         """
-        cdef cPoint grad
-        cdef double fac = self.fac * h_dim(h, self.dim)
-        cdef cPoint r = cPoint_sub(pa, pb)
-        cdef double rab = cPoint_length(r)
-        cdef double q = rab/h
-        cdef double val
-        cdef double power
+        if self.use_table:
+            return self.table_gradient(pa, pb, h)
 
-        cdef double tmp1 = (3-q)
-        cdef double tmp2 = (2-q)
-        cdef double tmp3 = (1-q)
-
-        if rab < 1e-16:
-            val = 0.0
-        else:
-            fac *= 1./(h*rab)
-            if q > 3.0:
-                val = 0.0
-            else:
-                tmp1 *= (tmp1 * tmp1 * tmp1)
-            
-                if q > 2.0:
-                    val = 5*tmp1
-                else:
-                    tmp2 *= (tmp2 * tmp2 * tmp2)
-                    val = 5*tmp1 - 30 * tmp2
-                    if q > 1.0:
-                        pass    
-                    else:
-                        tmp3 *= (tmp3 * tmp3 * tmp3)
-                        val += 75*tmp3
-
-        grad.x = r.x * (val * fac)
-        grad.y = r.y * (val * fac)
-        grad.z = r.z * (val * fac)
-        return grad
+        cdef cPoint r = cPoint_sub(pa, pb)
+        cdef double q = sqrt(cPoint_norm(r))/h
+        return cPoint_scale(r, quintic_spline_dw(q) * self.fac * h_dim(h, self.dim)/(h*h))
 
     cdef double _fac(self, double h):
         """ Return the normalizing factor given the smoothing length. """
@@ -563,56 +674,30 @@ cdef class WendlandQuinticSplineKernel(KernelBase):
     Physics, 136, 214-226
 
     """
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    def __cinit__(self, *args, **kwargs):
+        self.inline_type = WENDLAND_QUINTIC_SPLINE
+
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         """ Evaluate the strength of the kernel centered at `pa` at
-        the point `pb`.         
+        the point `pb`.
+        
         """
-        cdef double fac = self.fac * h_dim(h, self.dim)
-        cdef double rab = cPoint_distance(pa, pb)
-        cdef double q = rab/h
-        cdef double val
-
-        cdef double tmp = (1-0.5*q)
-      
-        if q > 2.0:
-            val = 0.0
-        else:
-            tmp *= (tmp * tmp * tmp)
-            tmp *= (2*q + 1)
-            
-            val = tmp
+        if self.use_table:
+            return self.table_function(pa, pb, h)
 
-        return val * fac
+        cdef double q = sqrt(cPoint_distance2(pa, pb))/h
+        return wendland_quintic_w(q) * self.fac * h_dim(h, self.dim)
 
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         """Evaluate the gradient of the kernel centered at `pa`, at the
         point `pb`.
         """
-        cdef cPoint grad
-        cdef double fac = self.fac * h_dim(h, self.dim)
-        cdef cPoint r = cPoint_sub(pa, pb)
-        cdef double rab = cPoint_length(r)
-        cdef double q = rab/h
-        cdef double val
-        cdef double power
-
-        cdef double tmp = (1-0.5*q)
-
-        if rab < 1e-16:
-            val = 0.0
-        else:
-            fac *= 1./(h*rab)
-
-            if q > 2.0:
-                val = 0
-            else:
-                tmp *= (tmp * tmp)
-                val = tmp * -5*q
+        if self.use_table:
+            return self.table_gradient(pa, pb, h)
 
-        grad.x = r.x * (val * fac)
-        grad.y = r.y * (val * fac)
-        grad.z = r.z * (val * fac)
-        return grad
+        cdef cPoint r = cPoint_sub(pa, pb)
+        cdef double q = sqrt(cPoint_norm(r))/h
+        return cPoint_scale(r, wendland_quintic_dw(q) * self.fac * h_dim(h, self.dim)/(h*h))
 
     cdef double _fac(self, double h):
         """ Return the normalizing factor given the smoothing length. """
@@ -659,11 +744,14 @@ cdef class HarmonicKernel(KernelBase):
                         0.617013, 0.790450, 0.977949, 1.178511,
                         1.391322, 1.615708]
 
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         """ Evaluate the strength of the kernel centered at `pa` at
         the point `pb`.
         
         """
+        if self.use_table:
+            return self.table_function(pa, pb, h)
+
         cdef double fac = self.facs[self.n -1]*(h**(-self.dim))
         #cdef cPoint r = cPoint_sub(pa, pb)
         cdef double rab = sqrt((pa.x - pb.x)**2 + (pa.y - pb.y)**2 + (pa.z - pb.z)**2)
@@ -682,11 +770,14 @@ cdef class HarmonicKernel(KernelBase):
 
         return val * fac
 
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         """Evaluate the gradient of the kernel centered at `pa`, at the
         point `pb`.
 
         """
+        if self.use_table:
+            return self.table_gradient(pa, pb, h)
+
         cdef cPoint grad
         cdef double fac = self.facs[self.n -1]*(h**(-self.dim))
         cdef cPoint r = cPoint_sub(pa, pb)
@@ -741,11 +832,14 @@ cdef class M6SplineKernel(KernelBase):
     hydrodynamics studies.” Journal of Computational Physics 227, no. 19
     (October 1, 2008): 8523-8540
     """
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         """ Evaluate the strength of the kernel centered at `pa` at
         the point `pb`.
         
         """
+        if self.use_table:
+            return self.table_function(pa, pb, h)
+
         cdef double fac = self.fac * h_dim(h, self.dim)
         cdef double rab = cPoint_distance(pa, pb)
         cdef double q = rab/h
@@ -765,11 +859,14 @@ cdef class M6SplineKernel(KernelBase):
 
         return val*fac
 
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         """Evaluate the gradient of the kernel centered at `pa`, at the
         point `pb`.
 
         """
+        if self.use_table:
+            return self.table_gradient(pa, pb, h)
+
         cdef double fac = self.fac * h_dim(h, self.dim)
         cdef cPoint r = cPoint_sub(pa, pb)
         cdef double rab = cPoint_length(r)
@@ -788,6 +885,12 @@ cdef class M6SplineKernel(KernelBase):
         else:
             val = 0
 
+        # dW/dq to the gradient with respect to pa
+        if rab > 1e-16:
+            val /= (h*rab)
+        else:
+            val = 0
+
         return cPoint_scale(r, val * fac)
 
     cdef double _fac(self, double h):
@@ -814,43 +917,31 @@ cdef class GaussianKernel(KernelBase):
     """ Gaussian  Kernel
 
     """
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    def __cinit__(self, *args, **kwargs):
+        self.inline_type = GAUSSIAN
+
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         """ Evaluate the strength of the kernel centered at `pa` at
         the point `pb`.
         
         """
-        cdef double fac = self.fac * h_dim(h, self.dim)
-        cdef double rab = cPoint_distance(pa, pb)
-        cdef double q = rab/h
-        cdef double val
+        if self.use_table:
+            return self.table_function(pa, pb, h)
 
-        val = fac*exp(-q*q)
+        cdef double q = sqrt(cPoint_distance2(pa, pb))/h
+        return gaussian_w(q) * self.fac * h_dim(h, self.dim)
 
-        return val
-
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         """Evaluate the gradient of the kernel centered at `pa`, at the
         point `pb`.
-
         """
-        cdef cPoint grad
-        cdef double rab = sqrt((pa.x-pb.x)*(pa.x-pb.x)+
-                              (pa.y-pb.y)*(pa.y-pb.y) + 
-                              (pa.z-pb.z)*(pa.z-pb.z))
+        if self.use_table:
+            return self.table_gradient(pa, pb, h)
 
-        cdef double fac = self.fac * h_dim(h, self.dim)
         cdef cPoint r = cPoint_sub(pa, pb)
-        cdef double q = rab/h
-        cdef double val = 0.0
+        cdef double q = sqrt(cPoint_norm(r))/h
+        return cPoint_scale(r, gaussian_dw(q) * self.fac * h_dim(h, self.dim)/(h*h))
 
-        if q > 1e-14:
-            val = -2*q*exp(-q*q)/(rab*h)
-        
-        grad.x = r.x * (val * fac)
-        grad.y = r.y * (val * fac)
-        grad.z = r.z * (val * fac)
-        return grad
-    
     cdef double _fac(self, double h):
         """ Return the normalizing factor given the smoothing length. """
         cdef int dim = self.dim
@@ -876,15 +967,18 @@ cdef class W8Kernel(KernelBase):
     Methods in Engineering: "Truncation error in mesh-free particle methods", 
     N. J. Quinlan, M. Basa and M. Lastiwka
     """
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         """ Evaluate the strength of the kernel centered at `pa` at
         the point `pb`.
         
         """
+        if self.use_table:
+            return self.table_function(pa, pb, h)
+
         cdef double fac = self.fac * h_dim(h, self.dim)
         cdef double rab = cPoint_distance(pa, pb)
         cdef double q = rab/h
-        cdef double val
+        cdef double val = 0.0
         cdef double *a = [0.603764, -0.580823, 0.209206, -0.0334338, 0.002]
         cdef int i
 
@@ -900,27 +994,28 @@ cdef class W8Kernel(KernelBase):
 
         return val * fac
 
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         """Evaluate the gradient of the kernel centered at `pa`, at the
         point `pb`.
 
         """
+        if self.use_table:
+            return self.table_gradient(pa, pb, h)
+
         cdef cPoint grad
         cdef double fac = self.fac * h_dim(h, self.dim)
         cdef cPoint r = cPoint_sub(pa, pb)
         cdef double rab = cPoint_length(r)
         cdef double q = rab/h
-        cdef double val
-        cdef double *a = [-0.580823, 0.209206, -0.0334338, 0.002]
+        cdef double val = 0.0
+        cdef double *a = [0.603764, -0.580823, 0.209206, -0.0334338, 0.002]
         cdef int i
         
-        if q > 2.0 or q == 0.0:
-            val = 0.0
-
-        else:
-            for i in range(4):
-                val += 2*(i)*a[i]*(q)**(2*(i)-1)
-     
+        # (dW/dq)/q over h**2, which is finite at q = 0
+        if q <= 2.0:
+            for i in range(1, 5):
+                val += 2*i*a[i]*q**(2*i - 2)
+            val /= (h*h)
 
         grad.x = r.x * (val * fac)
         grad.y = r.y * (val * fac)
@@ -955,10 +1050,13 @@ cdef class W10Kernel(KernelBase):
     """W10 Kernel
 
     """
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         """ Evaluate the strength of the kernel centered at `pa` at
         the point `pb`.         
         """
+        if self.use_table:
+            return self.table_function(pa, pb, h)
+
         cdef double fac = self.fac * h_dim(h, self.dim)
         cdef double rab = cPoint_distance(pa, pb)
         cdef double q = rab/h
@@ -977,10 +1075,13 @@ cdef class W10Kernel(KernelBase):
 
         return val * fac
 
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         """Evaluate the gradient of the kernel centered at `pa`, at the
         point `pb`.
         """
+        if self.use_table:
+            return self.table_gradient(pa, pb, h)
+
         cdef cPoint grad
         cdef double fac = self.fac * h_dim(h, self.dim)
         cdef cPoint r = cPoint_sub(pa, pb)
@@ -991,14 +1092,16 @@ cdef class W10Kernel(KernelBase):
         cdef int i
         cdef double * coeffs=[0.676758,-0.845947,0.422974,
                           -0.105743,0.0132179,-0.000660896]
+        # (dW/dq)/q over h**2, which is finite at q = 0
         if q > 2.0:
             val = 0.0
         else:
             val=0
             power=2
             for i in range(1,6):
-                val+=coeffs[i]*power*(q**(power-1))
+                val+=coeffs[i]*power*(q**(power-2))
                 power+=2.0
+            val /= (h*h)
 
         grad.x = r.x * (val * fac)
         grad.y = r.y * (val * fac)
@@ -1052,7 +1155,7 @@ cdef class RepulsiveBoundaryKernel(KernelBase):
     1. [becker07] Weakly Compressible SPH for free surface flows.
 
     """
-    cdef double function(self, cPoint pa, cPoint pb, double h):
+    cdef double function(self, cPoint pa, cPoint pb, double h) nogil:
         """
         """
         cdef double dist = cPoint_distance(pa, pb)
@@ -1068,7 +1171,7 @@ cdef class RepulsiveBoundaryKernel(KernelBase):
 
         return temp
 
-    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h):
+    cdef cPoint gradient(self, cPoint pa, cPoint pb, double h) nogil:
         """
         """
         cdef cPoint grad
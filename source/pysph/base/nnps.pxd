@@ -2,9 +2,45 @@
 from pysph.base.carray cimport LongArray, DoubleArray
 from pysph.base.particle_array cimport ParticleArray
 from pysph.base.polygon_array cimport PolygonArray
-from pysph.base.cell cimport CellManager
+from pysph.base.cell cimport CellManager, PeriodicDomain
 from pysph.base.point cimport Point, cPoint, cPoint_distance2
 from pysph.base.kernels cimport KernelBase
+from pysph.base.tree cimport KDTree
+
+##############################################################################
+# `LongArrayView` class.
+##############################################################################
+cdef class LongArrayView(LongArray):
+    """A read-only LongArray referring to a block of another LongArray. """
+    cdef long* _own_data
+    cdef public LongArray base
+
+    cdef void set_view(self, LongArray base, long start, long length)
+
+    cpdef reserve(self, long size)
+    cpdef squeeze(self)
+
+##############################################################################
+# `PairCache` class.
+##############################################################################
+cdef class PairCache:
+    """Kernel data of the neighbor pairs of a locator. """
+    cdef public KernelBase kernel
+
+    # the pairs of dest particle i are indices[offsets[i]:offsets[i+1]]
+    cdef public LongArray offsets, indices
+
+    # distance, kernel value and kernel gradient of each pair
+    cdef public DoubleArray r, w, gx, gy, gz
+
+    cdef public bint valid
+
+    # generations and copies of the smoothing lengths of the source and
+    # dest the data was computed with
+    cdef tuple _h_generations
+    cdef DoubleArray _src_h, _dst_h
+
+    cdef void release(self)
 
 ##############################################################################
 # `Classes for nearest particle location`.
@@ -38,6 +74,14 @@ cdef class NbrParticleLocatorBase:
         self, cPoint pnt, double radius, list cell_list,
         LongArray output_array, long exclude_index=*) except -1
 
+    cdef int _get_nearest_particles_from_flat_index(
+        self, cPoint pnt, double radius, LongArray output_array,
+        long exclude_index=*) except -1
+
+    cdef PeriodicDomain _get_periodic_domain(self)
+    cdef int _get_image_shifts(self, cPoint pnt, double radius,
+                               cPoint* shifts)
+
     cpdef set_locator_type(self, int locator_type)
     
 cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
@@ -52,17 +96,70 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
     cdef public int dest_index
     cdef readonly str h
     cdef public DoubleArray d_h, d_x, d_y, d_z
+    cdef public DoubleArray s_h, s_x, s_y, s_z
     
-    # caching support
-    cdef public list particle_cache
+    # caching support. The neighbors of destination particle i are
+    # nbr_indices[nbr_offsets[i]:nbr_offsets[i+1]]
+    cdef public LongArray nbr_offsets
+    cdef public LongArray nbr_indices
+    cdef LongArrayView _nbrs_view
+    cdef LongArray _nsquare_nbrs
+
+    # half neighbor lists for the pairwise evaluation of symmetric
+    # interactions. The neighbors j > i of dest particle i are
+    # half_indices[half_offsets[i]:half_offsets[i+1]]
+    cdef public LongArray half_offsets
+    cdef public LongArray half_indices
+    cdef bint _half_dirty
+
     cdef public bint is_dirty
     cdef void update_status(self)
     cdef int update(self) except -1
     cdef int _update_cache(self) except -1
+    cpdef int update_half_list(self) except -1
+    cpdef bint has_symmetric_lists(self)
+    cpdef int remap_indices(self, ParticleArray pa, LongArray permutation,
+                            LongArray new_index) except -1
+
+    # Verlet skin support
+    cdef public double skin
+    cdef public long num_builds, num_skipped
+    cdef LongArray _skin_nbrs
+    cdef list _src_ref, _dst_ref
+
+    cdef _save_reference_positions(self)
+
+    # threaded cache construction
+    cdef public int num_threads
+
+    cdef bint _use_parallel_build(self)
+    cdef int _update_cache_parallel(self) except -1
+
+    # pair data cache support
+    cdef public long pair_cache_budget
+    cdef public long num_pair_builds, num_pair_fallbacks
+    cdef public PairCache pair_cache
+    cdef bint _pair_dirty
+
+    cpdef tuple get_neighbor_lists(self)
+    cdef PairCache get_pair_cache(self, KernelBase kernel)
+    cdef int _update_pair_cache(self, KernelBase kernel) except -1
+    cdef bint _pair_h_changed(self)
+    cdef LongArray _get_neighbor_block(self, long dest_p_index, long* start,
+                                       long* length)
+    cdef int _filter_neighbors(self, long dest_p_index, long start, long end,
+                               LongArray output_array) except -1
     
     cdef LongArray get_nearest_particles(self, long dest_p_index,
                                    bint exclude_self=*)
 
+    cdef long* get_nearest_particles_ptr(self, long dest_p_index,
+                                         long* nnbrs,
+                                         bint exclude_self=*) except NULL
+
+    cdef LongArray _get_cached_copy(self, long dest_p_index,
+                                    bint exclude_self)
+
     cdef int get_nearest_particles_nocache(self, long dest_p_index,
                                    LongArray output_array,
                                    bint exclude_self=*) except -1
@@ -74,6 +171,14 @@ cdef class VarHNbrParticleLocator(FixedDestNbrParticleLocator):
     """
     cdef FixedDestNbrParticleLocator _rev_locator
 
+cdef class TreeNbrParticleLocator(FixedDestNbrParticleLocator):
+    """
+    Particle locator searching the neighbors in a k-d tree of the source
+    with a per-particle interaction radius.
+    """
+    cdef public KDTree tree
+    cdef public int query_type
+
 ##############################################################################
 # `Classes for nearest polygon location`.
 ##############################################################################
@@ -99,6 +204,9 @@ cdef class NNPSManager:
     cdef public bint variable_h
     cdef public str h
     cdef public dict particle_locator_cache
+    cdef public double neighbor_skin
+    cdef public long pair_cache_budget
+    cdef public int num_threads
 
     # The type of the NeighborLocator
     cdef public int locator_type
@@ -50,7 +50,8 @@ cdef extern from 'math.h':
     cdef double fabs(double)
     cdef double sqrt(double)
 
-from pysph.base.point cimport cPoint_new, cPoint_distance2, cPoint_distance
+from pysph.base.point cimport cPoint_new, cPoint_distance2, cPoint_distance, \
+     cPoint_distance2_dim, cPoint_sub, cIntPoint
 
 # logger imports
 import logging
@@ -60,8 +61,13 @@ logger = logging.getLogger()
 from pysph.base.carray cimport LongArray, DoubleArray
 from pysph.base.point cimport Point
 from pysph.base.particle_array cimport ParticleArray
-from pysph.base.cell cimport CellManager, Cell, find_cell_id
+from pysph.base.cell cimport CellManager, Cell, PeriodicDomain, \
+     find_cell_id, clip_cell_row
+from pysph.base.kernels cimport evaluate_function, evaluate_gradient
 from pysph.base.polygon_array cimport PolygonArray
+from pysph.base.tree cimport KDTree
+
+from pysph.base.tree import TreeQueryType
 
 cimport numpy
 import numpy as np
@@ -69,9 +75,189 @@ import numpy as np
 from cpython.list cimport *
 from cpython.dict cimport *
 
+cdef extern from "numpy/arrayobject.h":
+    ctypedef struct PyArrayObject:
+        char  *data
+        numpy.npy_intp *dimensions
+
+cdef extern from "string.h":
+    void *memcpy(void *dst, void *src, size_t n)
+    int memcmp(void *a, void *b, size_t n)
+
+cdef extern from "stdlib.h":
+    void *malloc(size_t size) nogil
+    void *realloc(void *ptr, size_t size) nogil
+    void free(void *ptr) nogil
+
+from cython.parallel cimport prange
+
 cdef inline double square(double dx, double dy, double dz):
     return dx*dx + dy*dy + dz*dz
 
+cdef inline void _save_values(DoubleArray arr, DoubleArray copy):
+    """ Copy the values of `arr` to `copy` """
+    copy.resize(arr.length)
+    if arr.length > 0:
+        memcpy(copy.data, arr.data, arr.length*sizeof(double))
+
+cdef inline bint _same_values(DoubleArray arr, DoubleArray copy):
+    """ Check if `arr` holds the values saved by `_save_values` """
+    if arr.length != copy.length:
+        return False
+    return memcmp(arr.data, copy.data, arr.length*sizeof(double)) == 0
+
+###############################################################################
+# Neighbor queries without the GIL.
+###############################################################################
+
+# the flat cell index of a source array (see CellManager.set_use_flat_index)
+cdef struct FlatIndexData:
+    long* cell_start
+    long* cell_count
+    long* sorted_index
+    double* x
+    double* y
+    double* z
+    double cell_size
+    cIntPoint origin
+    cIntPoint dims
+    int dim
+
+# a growable array of neighbor indices, filled by a single thread
+cdef struct NbrBuffer:
+    long* data
+    long length
+    long alloc
+
+cdef int _nbr_buffer_append(NbrBuffer* buf, long value) nogil:
+    """ Append a value to the buffer. Returns -1 if the buffer could not
+    be grown """
+    cdef long alloc
+    cdef long* data
+
+    if buf.length == buf.alloc:
+        alloc = 2*buf.alloc + 64
+        data = <long*>realloc(buf.data, alloc*sizeof(long))
+        if data == NULL:
+            return -1
+        buf.data = data
+        buf.alloc = alloc
+
+    buf.data[buf.length] = value
+    buf.length += 1
+    return 0
+
+cdef int _flat_index_query(FlatIndexData* index, double px, double py,
+                           double pz, double radius, NbrBuffer* buf) nogil:
+    """ Append the particles within `radius` of the point to buf
+
+    Notes:
+    ------
+    This is `_get_nearest_particles_from_flat_index` without the GIL and
+    returns the particles in the same order.
+
+    """
+    cdef cPoint tmp_pt
+    cdef cIntPoint lo, hi
+    cdef cIntPoint origin = index.origin
+    cdef cIntPoint dims = index.dims
+    cdef cPoint pnt = cPoint_new(px, py, pz)
+    cdef long idx, key, m, mend
+    cdef int i, j, k, ilo, ihi
+    cdef double dx, dy, dz, dist2
+    cdef double radius2 = radius*radius
+    cdef double ry = radius if index.dim > 1 else 0.0
+    cdef double rz = radius if index.dim > 2 else 0.0
+
+    tmp_pt.x = px - radius
+    tmp_pt.y = py - ry
+    tmp_pt.z = pz - rz
+    lo = find_cell_id(tmp_pt, index.cell_size)
+
+    tmp_pt.x = px + radius
+    tmp_pt.y = py + ry
+    tmp_pt.z = pz + rz
+    hi = find_cell_id(tmp_pt, index.cell_size)
+
+    if lo.x < origin.x: lo.x = origin.x
+    if lo.y < origin.y: lo.y = origin.y
+    if lo.z < origin.z: lo.z = origin.z
+    if hi.x > origin.x + dims.x - 1: hi.x = origin.x + dims.x - 1
+    if hi.y > origin.y + dims.y - 1: hi.y = origin.y + dims.y - 1
+    if hi.z > origin.z + dims.z - 1: hi.z = origin.z + dims.z - 1
+
+    for k in range(lo.z, hi.z + 1):
+        for j in range(lo.y, hi.y + 1):
+
+            if not clip_cell_row(pnt, radius, j, k, index.cell_size,
+                                 index.dim, &ilo, &ihi):
+                continue
+
+            if ilo < lo.x: ilo = lo.x
+            if ihi > hi.x: ihi = hi.x
+
+            # as CellManager.get_flat_cell_key(ilo, j, k)
+            key = (ilo - origin.x) + (<long>dims.x) * (
+                (j - origin.y) + (<long>dims.y) * (k - origin.z))
+
+            for i in range(ihi - ilo + 1):
+                m = index.cell_start[key + i]
+                mend = m + index.cell_count[key + i]
+
+                while m < mend:
+                    idx = index.sorted_index[m]
+                    m += 1
+
+                    dx = index.x[idx] - px
+                    dist2 = dx*dx
+                    if index.dim > 1:
+                        dy = index.y[idx] - py
+                        dist2 += dy*dy
+                    if index.dim > 2:
+                        dz = index.z[idx] - pz
+                        dist2 += dz*dz
+
+                    if dist2 < radius2:
+                        if _nbr_buffer_append(buf, idx) == -1:
+                            return -1
+
+    return 0
+
+cdef int _build_nbr_chunk(FlatIndexData* index, double* x, double* y,
+                          double* z, double* h, double radius_scale,
+                          double skin, long start, long end, bint move_self,
+                          long* counts, NbrBuffer* buf) nogil:
+    """ Append the neighbors of the dest particles start to end-1 to buf
+    and store their numbers in counts. Returns -1 on a failed allocation
+
+    Notes:
+    ------
+    With `move_self`, each particle is moved to the end of its own
+    neighbors as in `FixedDestNbrParticleLocator._update_cache`.
+
+    """
+    cdef long i, k, first, last
+
+    for i in range(start, end):
+        first = buf.length
+
+        if _flat_index_query(index, x[i], y[i], z[i],
+                             h[i]*radius_scale + skin, buf) == -1:
+            return -1
+
+        last = buf.length - 1
+
+        if move_self:
+            for k in range(first, last):
+                if buf.data[k] == i:
+                    buf.data[k] = buf.data[last]
+                    buf.data[last] = i
+                    break
+
+        counts[i] = buf.length - first
+
+    return 0
+
 ###############################################################################
 # `get_nearest_particles_brute_force` function.
 ###############################################################################
@@ -139,12 +325,124 @@ class NeighborLocatorType:
     SPHNeighborLocator = 0
     NSquareNeighborLocator = 1
     DSMCNeighborLocator = 2
+    TreeNeighborLocator = 3
 
     def __init__(self):
         raise SystemError, 'Do not instantiate the EntityTypes class'
 
 
 
+###############################################################################
+# `LongArrayView` class.
+###############################################################################
+cdef class LongArrayView(LongArray):
+
+    # Defined in the .pxd file
+    # cdef long* _own_data
+    # cdef public LongArray base
+
+    """ A LongArray referring to a contiguous block of another LongArray
+
+    The view does not own its data and may not be grown. It remains
+    valid until the `base` array is resized. Do **NOT** modify it.
+
+    """
+    def __cinit__(self, *args, **kwargs):
+        # LongArray.__cinit__ has allocated a buffer which we must free
+        self._own_data = self.data
+        self.base = None
+
+    def __dealloc__(self):
+        # hand back the owned buffer to LongArray.__dealloc__
+        self.data = self._own_data
+
+    cdef void set_view(self, LongArray base, long start, long length):
+        """ Point the view to base[start:start+length] """
+        cdef PyArrayObject* arr = <PyArrayObject*>self._npy_array
+
+        self.base = base
+        self.data = base.data + start
+        self.length = length
+        self.alloc = length
+
+        arr.data = <char*>self.data
+        arr.dimensions[0] = length
+
+    cpdef reserve(self, long size):
+        """ A view can not be grown """
+        if size > self.alloc:
+            raise RuntimeError, 'LongArrayView::reserve'
+
+    cpdef squeeze(self):
+        """ Nothing to release for a view """
+        pass
+
+###############################################################################
+# `PairCache` class.
+###############################################################################
+cdef class PairCache:
+
+    # Defined in the .pxd file
+    # cdef public KernelBase kernel
+    # cdef public LongArray offsets, indices
+    # cdef public DoubleArray r, w, gx, gy, gz
+    # cdef public bint valid
+
+    """ The distance, kernel value and kernel gradient of the neighbor
+    pairs of a FixedDestNbrParticleLocator
+
+    Data Members:
+    -------------
+    kernel -- the kernel the data was computed with
+    offsets, indices -- the pairs in compressed sparse row form. The
+    pairs of dest particle i are indices[offsets[i]:offsets[i+1]], in
+    the order of the neighbors returned by the locator
+    r -- the distance |x_a - x_b| of each pair
+    w -- the kernel value W(x_a - x_b, h_ab)
+    gx, gy, gz -- the kernel gradient at x_a
+    valid -- flag indicating that the data may be used
+
+    Notes:
+    ------
+    The data is computed with the mean smoothing length
+    h_ab = 0.5*(h_a + h_b) of the pair.
+
+    """
+    def __init__(self):
+        self.kernel = None
+        self.offsets = None
+        self.indices = None
+        self.r = DoubleArray()
+        self.w = DoubleArray()
+        self.gx = DoubleArray()
+        self.gy = DoubleArray()
+        self.gz = DoubleArray()
+        self.valid = False
+        self._h_generations = None
+        self._src_h = DoubleArray()
+        self._dst_h = DoubleArray()
+
+    cdef void release(self):
+        """ Invalidate the cache and free the memory of the pair data """
+        cdef DoubleArray arr
+
+        for arr in (self.r, self.w, self.gx, self.gy, self.gz,
+                    self._src_h, self._dst_h):
+            arr.resize(0)
+            arr.squeeze()
+
+        self.offsets = None
+        self.indices = None
+        self.kernel = None
+        self.valid = False
+        self._h_generations = None
+
+    def get_number_of_pairs(self):
+        """ Return the number of pairs in the cache """
+        if self.indices is None:
+            return 0
+        return self.indices.length
+
 ###############################################################################
 # `NbrParticleLocatorBase` class.
 ###############################################################################
@@ -196,7 +494,9 @@ cdef class NbrParticleLocatorBase:
         self, cPoint pnt, double radius, LongArray output_array, 
         long exclude_index=-1) except -1:
         
-        if self.locator_type == NeighborLocatorType.SPHNeighborLocator:
+        # point queries of a base locator of the tree type use the cells
+        if self.locator_type == NeighborLocatorType.SPHNeighborLocator or \
+                self.locator_type == NeighborLocatorType.TreeNeighborLocator:
             return self.get_nearest_particles_to_point_sph(pnt, radius,
                                                            output_array,
                                                            exclude_index)
@@ -223,42 +523,90 @@ cdef class NbrParticleLocatorBase:
         -----------------
         
          _get_nearest_particles_from_cell_list
+         _get_nearest_particles_from_flat_index
+
+        Notes:
+        ------
+        In a periodic domain the images of the domain near the point are
+        searched as well, the shifted positions of the neighbors are not
+        stored.
 
         """
-        cdef list cell_list = list()
+        cdef list cell_list
+        cdef cPoint shifts[27]
+        cdef cPoint query
+        cdef int s, nshifts
 
         # make sure cell manager is updated. That is, perform the binning
 
         self.cell_manager.update()
-        
-        # get the potential cell_list from the cell manager
 
-        self.cell_manager.get_potential_cells(pnt, radius, cell_list)
-        
-        # now extract the exact points from the cell_list
+        nshifts = self._get_image_shifts(pnt, radius, shifts)
+
+        for s in range(nshifts):
+            query = cPoint_sub(pnt, shifts[s])
+
+            if self.cell_manager.flat_index_active:
+                self._get_nearest_particles_from_flat_index(
+                    query, radius, output_array, exclude_index)
+                continue
+
+            # get the potential cell_list from the cell manager
+
+            cell_list = list()
+            self.cell_manager.get_potential_cells(query, radius, cell_list)
+
+            # now extract the exact points from the cell_list
+
+            self._get_nearest_particles_from_cell_list(
+                query, radius, cell_list, output_array, exclude_index)
 
-        self._get_nearest_particles_from_cell_list(pnt, radius, cell_list,
-                                                   output_array, exclude_index)
         return 0
 
+    cdef PeriodicDomain _get_periodic_domain(self):
+        """ Return the periodic domain of the cell manager or None """
+        if self.cell_manager is None:
+            return None
+        return self.cell_manager.periodic_domain
+
+    cdef int _get_image_shifts(self, cPoint pnt, double radius,
+                               cPoint* shifts):
+        """ Store the shifts of the periodic images to search for the
+        neighbors of a point in shifts and return their number
+
+        Notes:
+        ------
+        Without a periodic domain the only shift is (0, 0, 0). See
+        `PeriodicDomain.get_image_shifts`.
+
+        """
+        cdef PeriodicDomain domain = self._get_periodic_domain()
+
+        if domain is None:
+            shifts[0].x = shifts[0].y = shifts[0].z = 0.0
+            return 1
+
+        return domain.get_image_shifts(pnt, radius, shifts)
+
     cdef int get_nearest_particles_to_point_all(
         self, cPoint pnt, LongArray output_array, 
         long exclude_index=-1) except -1:
 
         cdef long nnbrs = self.source.get_number_of_particles()
+        cdef long start = output_array.length
         cdef long i
 
-        output_array.resize(nnbrs)
+        output_array.resize(start + nnbrs)
 
         for i in range(nnbrs):
-            output_array.data[i] = i
+            output_array.data[start + i] = i
 
         if exclude_index >= 0:
-            output_array.data[exclude_index], output_array.data[nnbrs-1] = \
-                                              output_array.data[nnbrs-1], \
-                                              output_array.data[exclude_index]
+            output_array.data[start + exclude_index] = \
+                                   output_array.data[start + nnbrs - 1]
+            output_array.data[start + nnbrs - 1] = exclude_index
             
-            output_array.resize(nnbrs - 1)
+            output_array.resize(start + nnbrs - 1)
 
         return 0
 
@@ -285,7 +633,7 @@ cdef class NbrParticleLocatorBase:
         ----------
         for each cell in the cell list
             find cell indices of `source` particle array in that cell
-            compute the norm of distance
+            compute the norm of distance in `dimension` dimensions
             append to output_array if norm <= radius
 
         Notes:
@@ -311,6 +659,7 @@ cdef class NbrParticleLocatorBase:
         cdef double radius2 = radius*radius
 
         cdef int ncells = PyList_Size( cell_list )
+        cdef int dim = self.cell_manager.dimension
         
         xc = self.cell_manager.coord_x
         yc = self.cell_manager.coord_y
@@ -334,7 +683,7 @@ cdef class NbrParticleLocatorBase:
                     src.y = ya.data[idx]
                     src.z = za.data[idx]
 
-                    if cPoint_distance2(src, dst) < radius2:
+                    if cPoint_distance2_dim(src, dst, dim) < radius2:
                         if idx != exclude_index:
                             output_array.append(idx)
     
@@ -350,14 +699,177 @@ cdef class NbrParticleLocatorBase:
                     src.y = ya.data[idx]
                     src.z = za.data[idx]
 
-                    if cPoint_distance2(src, dst) < radius2:
+                    if cPoint_distance2_dim(src, dst, dim) < radius2:
                         output_array.append(idx)
                     
         return 0
 
+    cdef int _get_nearest_particles_from_flat_index(
+        self, cPoint pnt, double radius, LongArray output_array,
+        long exclude_index=-1) except -1:
+        """ Extract nearest neighbors from the cell manager's flat index
+
+        Parameters:
+        -----------
+        pnt -- query point for searching
+        radius -- radius of search
+        output_array -- output parameter. indices are appended to it.
+        exclude_index -- an index that should be excluded from the neighbors.
+
+        Algorithm:
+        ----------
+        find the range of cells within the radius of the point
+        for each row of cells along x in the range
+            clip the row to the cells that intersect the sphere
+            for each cell in the clipped row
+                loop over the contiguous block of `source` indices
+                append to output_array if norm <= radius
+
+        """
+        cdef CellManager cell_manager = self.cell_manager
+        cdef LongArray start = cell_manager.cell_start[self.source_index]
+        cdef LongArray count = cell_manager.cell_count[self.source_index]
+        cdef LongArray sorted_index = \
+            cell_manager.sorted_index[self.source_index]
+
+        cdef DoubleArray xa, ya, za
+        cdef cIntPoint lo, hi
+        cdef cPoint src, dst
+        cdef long idx, key, m, mend
+        cdef int i, j, k, ilo, ihi
+
+        cdef double radius2 = radius*radius
+        cdef int dim = cell_manager.dimension
+
+        if not cell_manager.get_flat_cell_range(pnt, radius, &lo, &hi):
+            return 0
+
+        xa = self.source.get_carray(cell_manager.coord_x)
+        ya = self.source.get_carray(cell_manager.coord_y)
+        za = self.source.get_carray(cell_manager.coord_z)
+
+        dst.x = pnt.x; dst.y = pnt.y; dst.z = pnt.z
+
+        for k in range(lo.z, hi.z + 1):
+            for j in range(lo.y, hi.y + 1):
+
+                # the cells of the row that intersect the sphere
+
+                if not clip_cell_row(pnt, radius, j, k,
+                                     cell_manager.cell_size, dim,
+                                     &ilo, &ihi):
+                    continue
+
+                ilo = max(ilo, lo.x); ihi = min(ihi, hi.x)
+
+                # cells along x are contiguous in the flat index
+
+                key = cell_manager.get_flat_cell_key(ilo, j, k)
+                for i in range(ihi - ilo + 1):
+                    m = start.data[key + i]
+                    mend = m + count.data[key + i]
+
+                    while m < mend:
+                        idx = sorted_index.data[m]
+                        m += 1
+
+                        src.x = xa.data[idx]
+                        src.y = ya.data[idx]
+                        src.z = za.data[idx]
+
+                        if cPoint_distance2_dim(src, dst, dim) < radius2:
+                            if idx != exclude_index:
+                                output_array.append(idx)
+
+        return 0
+
     cpdef set_locator_type(self, int locator_type):
         self.locator_type = locator_type
-    
+
+    def get_nearest_particles_to_points(self, x, y, z, radius,
+                                        bint return_distances=False):
+        """ Return the source particles near each of a batch of points
+
+        Parameters:
+        -----------
+        x, y, z -- arrays with the coordinates of the query points.
+        radius -- the search radius, a number or an array with a radius
+        for each point.
+        return_distances -- also return the distance of each neighbor.
+
+        Returns (offsets, indices) or (offsets, indices, distances) with
+        the neighbors of point i in indices[offsets[i]:offsets[i+1]], as a
+        LongArray (DoubleArray for the distances).
+
+        Notes:
+        ------
+        The whole batch is searched in a single call against the current
+        binning, with the neighbors in the order of
+        `py_get_nearest_particles_to_point`. In a periodic domain the
+        distances are taken to the nearest image of the neighbor.
+
+        """
+        cdef numpy.ndarray[numpy.float64_t, ndim=1] xa, ya, za, ra
+        cdef LongArray offsets, indices
+        cdef DoubleArray distances, sx, sy, sz
+        cdef PeriodicDomain domain = self._get_periodic_domain()
+        cdef cPoint pnt, src
+        cdef long i, k, n
+        cdef int dim = 3
+        cdef str xc = 'x', yc = 'y', zc = 'z'
+
+        xa = np.ascontiguousarray(x, dtype=np.float64).ravel()
+        ya = np.ascontiguousarray(y, dtype=np.float64).ravel()
+        za = np.ascontiguousarray(z, dtype=np.float64).ravel()
+        n = len(xa)
+
+        if len(ya) != n or len(za) != n:
+            raise ValueError, 'x, y and z must have the same length'
+
+        ra = np.ascontiguousarray(radius, dtype=np.float64).ravel()
+        if len(ra) == 1:
+            ra = np.ones(n) * ra[0]
+        elif len(ra) != n:
+            raise ValueError, 'radius must be a number or one per point'
+
+        if self.cell_manager is not None:
+            dim = self.cell_manager.dimension
+            xc = self.cell_manager.coord_x
+            yc = self.cell_manager.coord_y
+            zc = self.cell_manager.coord_z
+
+        offsets = LongArray(n + 1)
+        indices = LongArray()
+        offsets.data[0] = 0
+
+        for i in range(n):
+            pnt.x = xa[i]; pnt.y = ya[i]; pnt.z = za[i]
+            self.get_nearest_particles_to_point(pnt, ra[i], indices)
+            offsets.data[i+1] = indices.length
+
+        if not return_distances:
+            return offsets, indices
+
+        distances = DoubleArray(indices.length)
+
+        sx = self.source.get_carray(xc)
+        sy = self.source.get_carray(yc)
+        sz = self.source.get_carray(zc)
+
+        for i in range(n):
+            pnt.x = xa[i]; pnt.y = ya[i]; pnt.z = za[i]
+            for k in range(offsets.data[i], offsets.data[i+1]):
+                src.x = sx.data[indices.data[k]]
+                src.y = sy.data[indices.data[k]]
+                src.z = sz.data[indices.data[k]]
+
+                if domain is not None:
+                    domain.nearest_image(&src, pnt)
+
+                distances.data[k] = sqrt(cPoint_distance2_dim(src, pnt, dim))
+
+        return offsets, indices, distances
+
     ######################################################################
     # python wrappers.
     ######################################################################
@@ -403,14 +915,45 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
     dest_index - destination index in the cell manager
 
     d_h, d_x,d_y,d_z -- destination particles properties
-    particle_cache -- a cache object. one LongArray for each particle in dest
+    s_h, s_x,s_y,s_z -- source particles properties
+    nbr_offsets, nbr_indices -- the neighbor cache in compressed sparse
+    row form. The neighbors of dest particle i are stored in
+    nbr_indices[nbr_offsets[i]:nbr_offsets[i+1]]
+    half_offsets, half_indices -- the half neighbor lists in the same
+    form, holding only the neighbors j > i of dest particle i
     is_dirty -- flag to recompute the cache
+    skin -- Verlet skin added to the search radius when building the cache
+    num_builds, num_skipped -- number of cache builds and of updates of
+    the particles for which a build was skipped due to the skin
+    pair_cache_budget -- the memory in bytes available for the pair data
+    cache. Defaults to 0 (no pair data cache)
+    pair_cache -- the PairCache holding the kernel data of the neighbors
+    num_pair_builds, num_pair_fallbacks -- number of builds of the pair
+    data cache and of builds refused for exceeding the budget
+    num_threads -- the number of threads building the cache. Defaults to 1
+
+    Notes:
+    ------
+    With a positive `skin`, the cache holds all particles within
+    `radius_scale*h + skin` and is reused until the particles may have
+    moved out of the skin. The neighbors returned are filtered by the
+    actual radius `radius_scale*h`.
+
+    With a positive `pair_cache_budget`, the distance, kernel value and
+    kernel gradient of every neighbor pair are computed once after the
+    particles have moved and shared by all functions evaluated with the
+    locator (see `get_pair_cache`).
+
+    With `num_threads` > 1 and the flat index of the cell manager, the
+    cache is built by several threads without the GIL (see
+    `_update_cache_parallel`).
 
     """
 
     def __init__(self, ParticleArray source, ParticleArray dest,
                  double radius_scale, CellManager cell_manager=None,
-                 str h='h'):
+                 str h='h', double skin=0.0, long pair_cache_budget=0,
+                 int num_threads=1):
         """ Constructor
         
         Parameters:
@@ -418,6 +961,11 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
         source -- the source particle array
         dest -- the destination particle array
         radius_scale -- the kernel radius support `kfac`
+        skin -- the Verlet skin. Defaults to 0 (no skin)
+        pair_cache_budget -- the memory in bytes available for the pair
+        data cache. Defaults to 0 (no pair data cache)
+        num_threads -- the number of threads building the cache.
+        Defaults to 1
         
         Notes:
         ------
@@ -431,9 +979,30 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
         self.radius_scale = radius_scale
         self.h = h
 
+        self.skin = skin
+        self.num_builds = 0
+        self.num_skipped = 0
+        self._skin_nbrs = LongArray()
+        self._src_ref = None
+        self._dst_ref = None
+
+        self.pair_cache_budget = pair_cache_budget
+        self.num_pair_builds = 0
+        self.num_pair_fallbacks = 0
+        self.pair_cache = PairCache()
+        self._pair_dirty = True
+
+        self.num_threads = num_threads
+
         self.dest_index = -1
                 
-        self.particle_cache = list()
+        self.nbr_offsets = LongArray()
+        self.nbr_indices = LongArray()
+        self._nbrs_view = LongArrayView()
+        self._nsquare_nbrs = None
+        self.half_offsets = LongArray()
+        self.half_indices = LongArray()
+        self._half_dirty = True
         self.is_dirty = True
 
         self.d_h = None
@@ -455,6 +1024,12 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
             self.d_y = self.dest.get_carray(self.cell_manager.coord_y)
             self.d_z = self.dest.get_carray(self.cell_manager.coord_z)
 
+        if self.source is not None:
+            self.s_h = self.source.get_carray(self.h)
+            self.s_x = self.source.get_carray(self.cell_manager.coord_x)
+            self.s_y = self.source.get_carray(self.cell_manager.coord_y)
+            self.s_z = self.source.get_carray(self.cell_manager.coord_z)
+
     cdef LongArray get_nearest_particles(self, long dest_p_index, 
                                    bint exclude_self=False):
         """
@@ -474,36 +1049,32 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
         Note:
         -----
         
-        If exclude_self is True then a copy of the internal cached array is
-        returned after removing last element, else the cached array is returned.
+        The returned array is a view into the neighbor cache, shared by
+        all calls to this function. It is valid until the next call.
         Do **NOT** modify the returned array
-        exclude_self argument is deprecated (lot slower)
         The last index in returned array is guaranteed to be self particle if
         src and dest arrays are same. This can be used to exclude it.
         
         """
-        cdef LongArray index_array, output_array
-        cdef int i
-        cdef long *data
+        cdef LongArray output_array, block
+        cdef long start, length
         cdef cPoint pnt
 
         if not self.locator_type == NeighborLocatorType.NSquareNeighborLocator:
         
-            # update internal data. Calculate the particle cache
-        
-            self.update()
+            # update internal data and get the block of neighbors
         
-            # return data from cache.
-
-            output_array = index_array = self.particle_cache[dest_p_index]
+            block = self._get_neighbor_block(dest_p_index, &start, &length)
 
             if self.dest is self.source:
                 if exclude_self:
-                    # cached array has self index as last value
-                    output_array = LongArray(index_array.length-1)
-                    # TODO: can use memcpy
-                    for i in range(index_array.length-1):
-                        output_array[i] = index_array.data[i]
+                    # cached neighbors have self index as last value
+                    length -= 1
+
+            # return a view of the block.
+
+            self._nbrs_view.set_view(block, start, length)
+            output_array = self._nbrs_view
 
         if self.locator_type == NeighborLocatorType.NSquareNeighborLocator:
             output_array = LongArray()
@@ -521,6 +1092,103 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
                     pnt, output_array, -1)
         
         return output_array
+
+    cdef long* get_nearest_particles_ptr(self, long dest_p_index,
+                                         long* nnbrs,
+                                         bint exclude_self=False) except NULL:
+        """ Get a pointer to the cached neighbors of `dest_p_index`
+
+        Parameters:
+        -----------
+
+        dest_p_index -- index of query destination particle
+        nnbrs -- output parameter for the number of neighbors
+        exclude_self -- indicates if dest_p_index be excluded
+
+        Notes:
+        ------
+        This is the accessor for the inner loops of the SPH functions.
+        The pointer is valid until the cache is next updated.
+
+        """
+        cdef LongArray block
+        cdef long start
+
+        if self.locator_type == NeighborLocatorType.NSquareNeighborLocator:
+            self._nsquare_nbrs = self.get_nearest_particles(dest_p_index,
+                                                            exclude_self)
+            nnbrs[0] = self._nsquare_nbrs.length
+            return self._nsquare_nbrs.data
+
+        block = self._get_neighbor_block(dest_p_index, &start, nnbrs)
+
+        if exclude_self and (self.dest is self.source):
+            nnbrs[0] -= 1
+
+        return block.data + start
+
+    cdef LongArray _get_neighbor_block(self, long dest_p_index, long* start,
+                                       long* length):
+        """ Update the cache and locate the neighbors of `dest_p_index`
+
+        Parameters:
+        -----------
+
+        dest_p_index -- index of query destination particle
+        start, length -- output parameters for the position of the
+        neighbors in the returned array
+
+        Notes:
+        ------
+        Without a skin the returned array is `nbr_indices`. With a skin
+        the cached neighbors are filtered into an internal array which
+        is overwritten by the next call.
+
+        """
+        self.update()
+
+        start[0] = self.nbr_offsets.data[dest_p_index]
+        length[0] = self.nbr_offsets.data[dest_p_index+1] - start[0]
+
+        if self.skin > 0:
+            self._skin_nbrs.reset()
+            self._filter_neighbors(dest_p_index, start[0],
+                                   start[0] + length[0], self._skin_nbrs)
+            start[0] = 0
+            length[0] = self._skin_nbrs.length
+            return self._skin_nbrs
+
+        return self.nbr_indices
+
+    cdef int _filter_neighbors(self, long dest_p_index, long start, long end,
+                               LongArray output_array) except -1:
+        """ Append the cached neighbors in nbr_indices[start:end] that are
+        within the interaction radius of `dest_p_index` to output_array.
+        The order of the neighbors is retained. """
+        cdef long k, idx
+        cdef cPoint src, dst
+        cdef double radius = self.radius_scale * self.d_h.data[dest_p_index]
+        cdef double radius2 = radius * radius
+        cdef PeriodicDomain domain = self._get_periodic_domain()
+
+        dst.x = self.d_x.data[dest_p_index]
+        dst.y = self.d_y.data[dest_p_index]
+        dst.z = self.d_z.data[dest_p_index]
+
+        for k in range(start, end):
+            idx = self.nbr_indices.data[k]
+
+            src.x = self.s_x.data[idx]
+            src.y = self.s_y.data[idx]
+            src.z = self.s_z.data[idx]
+
+            if domain is not None:
+                domain.nearest_image(&src, dst)
+
+            if cPoint_distance2(src, dst) < radius2:
+                output_array.append(idx)
+
+        return 0
     
     cdef int get_nearest_particles_nocache(self, long dest_p_index,
                                    LongArray output_array,
@@ -550,6 +1218,7 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
         pnt.z = self.d_z.data[dest_p_index]
         
         cdef double eff_radius = self.d_h.data[dest_p_index] * self.radius_scale
+        eff_radius += self.skin
         
         if self.source is self.dest:
             if exclude_self:
@@ -559,9 +1228,76 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
             self, pnt, eff_radius, output_array, exclude_index)
 
     cdef void update_status(self):
-        """ Set to dirty if either source or destination is dirty."""
+        """ Set to dirty if either source or destination is dirty.
+
+        With a skin, the cache is set to dirty only if the particles may
+        have moved out of the skin since the cache was built.
+
+        """
+        if self.source.is_dirty or self.dest.is_dirty:
+            self._pair_dirty = True
+
         if not self.is_dirty:
-            self.is_dirty = self.source.is_dirty or self.dest.is_dirty
+            if self.source.is_dirty or self.dest.is_dirty:
+                if self.skin > 0 and not self.skin_exceeded():
+                    self.num_skipped += 1
+                else:
+                    self.is_dirty = True
+
+    def skin_exceeded(self):
+        """ Return True if the cache built with the skin may be invalid.
+
+        Algorithm:
+        ----------
+        find the maximum displacement of the source and dest particles
+        find the maximum increase of the smoothing length
+        the cache is invalid if the sum of the displacements and the
+        increase of the interaction radius exceeds the skin
+
+        Notes:
+        ------
+        If source and dest are the same array, the maximum displacement
+        is counted twice, that is, the cache is invalid once a particle
+        has moved by more than half the skin.
+
+        """
+        cdef double disp = 0.0, dh = 0.0
+        cdef list ref
+
+        for pa, ref in ((self.source, self._src_ref),
+                        (self.dest, self._dst_ref)):
+            if ref is None:
+                return True
+
+            x, y, z, h = self._get_reference_props(pa)
+            x0, y0, z0, h0 = ref
+
+            if len(x) != len(x0):
+                return True
+
+            if len(x) == 0:
+                continue
+
+            disp += np.sqrt(np.max((x-x0)**2 + (y-y0)**2 + (z-z0)**2))
+            dh = max(dh, np.max(h - h0))
+
+        return disp + self.radius_scale * dh > self.skin
+
+    def _get_reference_props(self, ParticleArray pa):
+        """ Return the positions and smoothing lengths of `pa` """
+        cm = self.cell_manager
+        return [pa.get_carray(prop).get_npy_array() for prop in
+                (cm.coord_x, cm.coord_y, cm.coord_z, self.h)]
+
+    cdef _save_reference_positions(self):
+        """ Store the positions and smoothing lengths at a cache build """
+        self._src_ref = [arr.copy() for arr in
+                         self._get_reference_props(self.source)]
+        if self.dest is self.source:
+            self._dst_ref = self._src_ref
+        else:
+            self._dst_ref = [arr.copy() for arr in
+                             self._get_reference_props(self.dest)]
 
     cdef int update(self) except -1:
         """ Computes contents of the cache 
@@ -569,56 +1305,577 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
         Algorithm:
         ----------
         if cache is to be recomputed
-            if caching is enabled
-                resize particle cache if required
-                call _update_cache to populate the cache contents
+            call _update_cache to populate the cache contents
 
         """
-        cdef long num_particles, i
         cdef int ret = 0
 
         if self.is_dirty:
 
-            # resize the cache if necessary
-            
-            num_particles = self.dest.get_number_of_particles()
-            if len(self.particle_cache) != num_particles:
-                self.particle_cache = []
-                for i in range(num_particles):
-                    PyList_Append( self.particle_cache, LongArray() )
-
             ret = self._update_cache()
+            self.num_builds += 1
+
+            if self.skin > 0:
+                self._save_reference_positions()
             
             self.is_dirty = False
+            self._half_dirty = True
+            self._pair_dirty = True
 
         return ret
 
     cdef int _update_cache(self) except -1:
-        """Update `particle_cache` by appending to each LongArray """
+        """Rebuild the CSR cache `nbr_offsets`, `nbr_indices`
 
-        cdef long num_particles, i, j
-        cdef LongArray index_cache
+        Algorithm:
+        ----------
+        for each particle in dest
+            append its neighbors to nbr_indices
+            move the particle itself to the end of its block
+            record the end of its block in nbr_offsets
+
+        """
+        cdef long num_particles, i, j, end
+        cdef LongArray offsets = self.nbr_offsets
+        cdef LongArray indices = self.nbr_indices
+
+        if self._use_parallel_build():
+            return self._update_cache_parallel()
 
         num_particles = self.dest.get_number_of_particles()
 
+        offsets.resize(num_particles + 1)
+        offsets.data[0] = 0
+        indices.reset()
+
         for i in range(num_particles):
-            index_cache = self.particle_cache[i]
-            index_cache.reset()
 
-            self.get_nearest_particles_nocache(
-                i, index_cache, False)
+            self.get_nearest_particles_nocache(i, indices, False)
+            end = indices.length
             
             # keep particle at the last index for faster exclude_self
-            if self.source == self.dest:
-                for j in range(index_cache.length-1):
-                    if i == index_cache[j]:
+            if self.source is self.dest:
+                for j in range(offsets.data[i], end-1):
+                    if i == indices.data[j]:
                         # swap last index with i
-                        index_cache[j] = index_cache[index_cache.length-1]
-                        index_cache[index_cache.length-1] = i
+                        indices.data[j] = indices.data[end-1]
+                        indices.data[end-1] = i
                         break
+
+            offsets.data[i+1] = end
             
         return 0
 
+    cdef bint _use_parallel_build(self):
+        """ Return True if the cache is to be built by several threads.
+        This needs the flat index of the cell manager and a domain that
+        is not periodic. """
+        return (self.num_threads > 1 and self.cell_manager is not None and
+                self.cell_manager.flat_index_active and
+                self.cell_manager.periodic_domain is None and
+                self.locator_type == NeighborLocatorType.SPHNeighborLocator)
+
+    cdef int _update_cache_parallel(self) except -1:
+        """Rebuild the CSR cache with `num_threads` threads
+
+        Algorithm:
+        ----------
+        split the dest particles into contiguous chunks
+        for each chunk, in parallel and without the GIL
+            append the neighbors of its particles to a buffer of the chunk
+            record the number of neighbors of each particle
+        compute nbr_offsets from the numbers of neighbors
+        copy the buffers of the chunks to nbr_indices in order
+
+        Notes:
+        ------
+        There are several chunks per thread, scheduled dynamically, to
+        balance the load when the particle density is not uniform.
+
+        The cache is the same as the one built by a single thread.
+
+        """
+        cdef CellManager cell_manager = self.cell_manager
+        cdef LongArray offsets = self.nbr_offsets
+        cdef LongArray indices = self.nbr_indices
+        cdef DoubleArray xa, ya, za
+        cdef FlatIndexData index
+        cdef NbrBuffer* buffers
+        cdef long* counts
+        cdef double* d_x
+        cdef double* d_y
+        cdef double* d_z
+        cdef double* d_h
+        cdef double radius_scale = self.radius_scale
+        cdef double skin = self.skin
+        cdef bint move_self = self.source is self.dest
+        cdef long num_particles, num_chunks, chunk_size, c, start, end, i
+        cdef int num_threads = self.num_threads
+        cdef int failed = 0
+
+        # make sure the particles are binned
+
+        cell_manager.update()
+
+        num_particles = self.dest.get_number_of_particles()
+
+        offsets.resize(num_particles + 1)
+        offsets.data[0] = 0
+        indices.reset()
+
+        if num_particles == 0:
+            return 0
+
+        num_chunks = 4*num_threads
+        if num_chunks > num_particles:
+            num_chunks = num_particles
+        chunk_size = (num_particles + num_chunks - 1)/num_chunks
+        num_chunks = (num_particles + chunk_size - 1)/chunk_size
+
+        xa = self.source.get_carray(cell_manager.coord_x)
+        ya = self.source.get_carray(cell_manager.coord_y)
+        za = self.source.get_carray(cell_manager.coord_z)
+
+        index.cell_start = (<LongArray>cell_manager.cell_start[
+                self.source_index]).data
+        index.cell_count = (<LongArray>cell_manager.cell_count[
+                self.source_index]).data
+        index.sorted_index = (<LongArray>cell_manager.sorted_index[
+                self.source_index]).data
+        index.x = xa.data
+        index.y = ya.data
+        index.z = za.data
+        index.cell_size = cell_manager.cell_size
+        index.origin = cell_manager.flat_origin
+        index.dims = cell_manager.flat_dims
+        index.dim = cell_manager.dimension
+
+        d_x = self.d_x.data
+        d_y = self.d_y.data
+        d_z = self.d_z.data
+        d_h = self.d_h.data
+        counts = offsets.data + 1
+
+        buffers = <NbrBuffer*>malloc(num_chunks*sizeof(NbrBuffer))
+        if buffers == NULL:
+            raise MemoryError, 'Could not allocate the neighbor buffers'
+
+        for c in range(num_chunks):
+            buffers[c].data = NULL
+            buffers[c].length = 0
+            buffers[c].alloc = 0
+
+        try:
+            with nogil:
+                for c in prange(num_chunks, num_threads=num_threads,
+                                schedule='dynamic'):
+                    start = c*chunk_size
+                    end = start + chunk_size
+                    if end > num_particles:
+                        end = num_particles
+
+                    if _build_nbr_chunk(&index, d_x, d_y, d_z, d_h,
+                                        radius_scale, skin, start, end,
+                                        move_self, counts,
+                                        &buffers[c]) == -1:
+                        failed += 1
+
+            if failed > 0:
+                raise MemoryError, 'Could not allocate the neighbor buffers'
+
+            # merge the buffers into the cache
+
+            for i in range(num_particles):
+                offsets.data[i+1] += offsets.data[i]
+
+            indices.resize(offsets.data[num_particles])
+
+            for c in range(num_chunks):
+                if buffers[c].length > 0:
+                    memcpy(indices.data + offsets.data[c*chunk_size],
+                           buffers[c].data, buffers[c].length*sizeof(long))
+        finally:
+            for c in range(num_chunks):
+                free(buffers[c].data)
+            free(buffers)
+
+        return 0
+
+    cpdef int update_half_list(self) except -1:
+        """ Compute the half neighbor lists `half_offsets`, `half_indices`
+
+        Algorithm:
+        ----------
+        update the cache if needed
+        for each particle i in dest
+            append the cached neighbors j > i of i to half_indices
+            record the end of its block in half_offsets
+
+        Notes:
+        ------
+        The half lists are defined only if source and dest are the same
+        array. Every pair of neighbors is then listed once, which is used
+        for the pairwise evaluation of symmetric interactions.
+
+        The lists are rebuilt after each rebuild of the cache. With a
+        skin they are rebuilt at every call, since the cached neighbors
+        are filtered by the actual interaction radius.
+
+        A pair is kept only from the list of its lower index, so the
+        neighbor lists must be symmetric (see `has_symmetric_lists`).
+
+        """
+        cdef long num_particles, i, j, k, start, length
+        cdef LongArray block
+        cdef LongArray offsets = self.half_offsets
+        cdef LongArray indices = self.half_indices
+
+        if self.source is not self.dest:
+            msg = 'Half neighbor lists need the same source and dest'
+            raise ValueError, msg
+
+        if self.locator_type == NeighborLocatorType.NSquareNeighborLocator:
+            msg = 'Half neighbor lists are not supported for all-pair search'
+            raise ValueError, msg
+
+        self.update()
+
+        if not self.has_symmetric_lists():
+            msg = 'Half neighbor lists need symmetric neighbor lists'
+            raise ValueError, msg
+
+        if not (self._half_dirty or self.skin > 0):
+            return 0
+
+        num_particles = self.dest.get_number_of_particles()
+
+        offsets.resize(num_particles + 1)
+        offsets.data[0] = 0
+        indices.reset()
+        indices.reserve(self.nbr_indices.length/2 + 1)
+
+        for i in range(num_particles):
+            block = self._get_neighbor_block(i, &start, &length)
+
+            for k in range(start, start + length):
+                j = block.data[k]
+                if j > i:
+                    indices.append(j)
+
+            offsets.data[i+1] = indices.length
+
+        self._half_dirty = False
+
+        return 0
+
+    cpdef bint has_symmetric_lists(self):
+        """ Check if j is a neighbor of i whenever i is a neighbor of j
+
+        Notes:
+        ------
+        The neighbors of a dest particle are searched within the radius
+        given by its own smoothing length, so the lists are symmetric
+        only if the source and dest particles all have the same `h`.
+
+        """
+        cdef long i, n
+        cdef double h
+        cdef DoubleArray d_h = self.dest.get_carray(self.h)
+        cdef DoubleArray s_h = self.source.get_carray(self.h)
+
+        n = d_h.length
+        if n == 0:
+            return True
+
+        h = d_h.data[0]
+        for i in range(n):
+            if d_h.data[i] != h:
+                return False
+
+        if s_h is not d_h:
+            for i in range(s_h.length):
+                if s_h.data[i] != h:
+                    return False
+
+        return True
+
+    cpdef int remap_indices(self, ParticleArray pa, LongArray permutation,
+                            LongArray new_index) except -1:
+        """ Renumber the cache after the particles of `pa` were reordered
+
+        Parameters:
+        -----------
+        pa -- the reordered particle array
+        permutation -- the particle at index i is the one that was at
+        index permutation[i]
+        new_index -- the inverse of permutation
+
+        Algorithm:
+        ----------
+        if pa is the dest, permute the blocks of the cache
+        if pa is the source, replace the neighbor indices
+        permute the positions saved for the skin
+
+        """
+        cdef bint src = pa is self.source
+        cdef bint dst = pa is self.dest
+        cdef long num_particles, i, k, row, pos
+        cdef LongArray offsets, indices
+        cdef numpy.ndarray perm
+
+        if not (src or dst):
+            return 0
+
+        # a dirty cache is rebuilt anyway
+        if self.is_dirty or \
+                self.locator_type == NeighborLocatorType.NSquareNeighborLocator:
+            return 0
+
+        num_particles = self.nbr_offsets.length - 1
+        offsets = LongArray(num_particles + 1)
+        indices = LongArray(self.nbr_indices.length)
+
+        offsets.data[0] = 0
+        pos = 0
+        for i in range(num_particles):
+            row = i
+            if dst:
+                row = permutation.data[i]
+
+            for k in range(self.nbr_offsets.data[row],
+                           self.nbr_offsets.data[row+1]):
+                if src:
+                    indices.data[pos] = new_index.data[
+                        self.nbr_indices.data[k]]
+                else:
+                    indices.data[pos] = self.nbr_indices.data[k]
+                pos += 1
+
+            offsets.data[i+1] = pos
+
+        self.nbr_offsets = offsets
+        self.nbr_indices = indices
+        self._half_dirty = True
+        self._pair_dirty = True
+
+        perm = permutation.get_npy_array()
+        if src and self._src_ref is not None:
+            self._src_ref = [arr[perm] for arr in self._src_ref]
+        if dst and self._dst_ref is not None:
+            if self.dest is self.source:
+                self._dst_ref = self._src_ref
+            else:
+                self._dst_ref = [arr[perm] for arr in self._dst_ref]
+
+        return 0
+
+    cpdef tuple get_neighbor_lists(self):
+        """ Return the neighbor lists of all dest particles
+
+        Algorithm:
+        ----------
+        update the cache
+        return (nbr_offsets, nbr_indices) without a skin
+        return copies filtered by the radius with a skin
+
+        Notes:
+        ------
+        The neighbors of dest particle i are indices[offsets[i]:
+        offsets[i+1]], with the self particle last. The lists are valid
+        until the cache is next updated and may be read by several
+        threads, unlike the blocks of `get_nearest_particles_ptr`.
+
+        """
+        cdef LongArray offsets, indices, block
+        cdef long num_particles, i, k, start, length
+
+        if self.locator_type == NeighborLocatorType.NSquareNeighborLocator:
+            msg = 'No neighbor lists for an all-pair search'
+            raise RuntimeError, msg
+
+        self.update()
+
+        if self.skin <= 0:
+            return self.nbr_offsets, self.nbr_indices
+
+        num_particles = self.dest.get_number_of_particles()
+
+        offsets = LongArray(num_particles + 1)
+        indices = LongArray()
+
+        offsets.data[0] = 0
+        for i in range(num_particles):
+            block = self._get_neighbor_block(i, &start, &length)
+            for k in range(start, start + length):
+                indices.append(block.data[k])
+            offsets.data[i+1] = indices.length
+
+        return offsets, indices
+
+    cdef PairCache get_pair_cache(self, KernelBase kernel):
+        """ Return the pair data cache for `kernel` or None
+
+        Algorithm:
+        ----------
+        return None if there is no budget or for an all-pair search
+        rebuild the cache if
+            the particles have moved since it was built or
+            the smoothing lengths have changed or
+            it was built for another kernel
+        return None if the cache exceeds the budget
+
+        Notes:
+        ------
+        The particles are taken to have moved when the source or dest
+        was dirty at the last update of the NNPSManager. When None is
+        returned the kernel data must be computed on the fly.
+
+        """
+        cdef PairCache cache = self.pair_cache
+
+        if self.pair_cache_budget <= 0 or \
+                self.locator_type == NeighborLocatorType.NSquareNeighborLocator:
+            return None
+
+        self.update()
+
+        if self._pair_dirty or cache.kernel is not kernel or \
+                (cache.valid and self._pair_h_changed()):
+            self._update_pair_cache(kernel)
+
+        if cache.valid:
+            return cache
+
+        return None
+
+    cdef int _update_pair_cache(self, KernelBase kernel) except -1:
+        """ Compute the kernel data of all neighbor pairs
+
+        Algorithm:
+        ----------
+        get the neighbor lists, filtered by the radius with a skin
+        release the cache if the pairs exceed the budget
+        for each particle a in dest and each neighbor b of a
+            store the distance, kernel value and gradient of the pair
+
+        """
+        cdef PairCache cache = self.pair_cache
+        cdef LongArray offsets, indices
+        cdef long num_particles, npairs, nbytes, i, j, k
+        cdef double hab
+        cdef cPoint src, dst, grad
+        cdef PeriodicDomain domain = self._get_periodic_domain()
+
+        num_particles = self.dest.get_number_of_particles()
+
+        self._pair_dirty = False
+        self.num_pair_builds += 1
+
+        # the neighbor lists of a skin are filtered by the actual radius
+        offsets, indices = self.get_neighbor_lists()
+
+        npairs = indices.length
+
+        nbytes = 5 * npairs * sizeof(double)
+        if self.skin > 0:
+            nbytes += (npairs + num_particles + 1) * sizeof(long)
+
+        if nbytes > self.pair_cache_budget:
+            self.num_pair_fallbacks += 1
+            cache.release()
+
+            # do not retry until the particles have moved
+            cache.kernel = kernel
+            return 0
+
+        cache.r.resize(npairs)
+        cache.w.resize(npairs)
+        cache.gx.resize(npairs)
+        cache.gy.resize(npairs)
+        cache.gz.resize(npairs)
+
+        for i in range(num_particles):
+            dst.x = self.d_x.data[i]
+            dst.y = self.d_y.data[i]
+            dst.z = self.d_z.data[i]
+
+            for k in range(offsets.data[i], offsets.data[i+1]):
+                j = indices.data[k]
+
+                src.x = self.s_x.data[j]
+                src.y = self.s_y.data[j]
+                src.z = self.s_z.data[j]
+
+                if domain is not None:
+                    domain.nearest_image(&src, dst)
+
+                hab = 0.5 * (self.d_h.data[i] + self.s_h.data[j])
+
+                grad = evaluate_gradient(kernel, dst, src, hab)
+
+                cache.r.data[k] = cPoint_distance(dst, src)
+                cache.w.data[k] = evaluate_function(kernel, dst, src, hab)
+                cache.gx.data[k] = grad.x
+                cache.gy.data[k] = grad.y
+                cache.gz.data[k] = grad.z
+
+        cache.offsets = offsets
+        cache.indices = indices
+        cache.kernel = kernel
+        cache.valid = True
+        cache._h_generations = (self.source.get_generation(self.h),
+                                self.dest.get_generation(self.h))
+        _save_values(self.s_h, cache._src_h)
+        _save_values(self.d_h, cache._dst_h)
+
+        return 0
+
+    cdef bint _pair_h_changed(self):
+        """ Check if the smoothing lengths differ from the ones the pair
+        data was computed with
+
+        Notes:
+        ------
+        Updates of the smoothing length do not set the particle arrays
+        dirty. The modifications recorded by the particle arrays (see
+        `ParticleArray.mark_modified`) are checked first. Writes that
+        are not recorded, such as through `ParticleArray.view`, are found
+        by comparing the values with the copies saved at the build.
+
+        """
+        cdef PairCache cache = self.pair_cache
+
+        if cache._h_generations != (self.source.get_generation(self.h),
+                                    self.dest.get_generation(self.h)):
+            return True
+
+        return not (_same_values(self.s_h, cache._src_h) and
+                    _same_values(self.d_h, cache._dst_h))
+
+    property particle_cache:
+        """ List of copies of the cached neighbors for each dest particle """
+        def __get__(self):
+            cdef long i
+            cdef list cache = []
+            for i in range(self.nbr_offsets.length - 1):
+                cache.append(self._get_cached_copy(i, False))
+            return cache
+
+    cdef LongArray _get_cached_copy(self, long dest_p_index,
+                                    bint exclude_self):
+        """ Return a copy of the cached neighbors of `dest_p_index` """
+        cdef long start, length
+        cdef LongArray output_array
+        cdef LongArray block = self._get_neighbor_block(dest_p_index, &start,
+                                                        &length)
+
+        if exclude_self and (self.dest is self.source):
+            length -= 1
+
+        output_array = LongArray(length)
+        memcpy(output_array.data, block.data + start, length*sizeof(long))
+        return output_array
+
     ######################################################################
     # python wrappers.
     ######################################################################
@@ -626,6 +1883,10 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
         """Computes contents of the cache if needed."""
         self.update()
 
+    def py_get_pair_cache(self, KernelBase kernel):
+        """ Return the pair data cache for `kernel` or None """
+        return self.get_pair_cache(kernel)
+
     def py_update_status(self):
         """Updates the dirty flag."""
         self.update_status()
@@ -643,9 +1904,18 @@ cdef class FixedDestNbrParticleLocator(NbrParticleLocatorBase):
 
         exclude_self -- indicates if dest_p_index be excluded from
         output_array.
+
+        Notes:
+        ------
+        Unlike get_nearest_particles a copy of the cached neighbors is
+        returned, which remains valid after the cache is updated.
         
         """
-        return self.get_nearest_particles(dest_p_index, exclude_self)
+        if self.locator_type == NeighborLocatorType.NSquareNeighborLocator:
+            return self.get_nearest_particles(dest_p_index, exclude_self)
+
+        self.update()
+        return self._get_cached_copy(dest_p_index, exclude_self)
 
 
 ###############################################################################
@@ -664,7 +1934,8 @@ cdef class VarHNbrParticleLocator(FixedDestNbrParticleLocator):
     """
     def __init__(self, ParticleArray source, ParticleArray dest,
                  double radius_scale, CellManager cell_manager=None,
-                 str h='h'):
+                 str h='h', double skin=0.0, long pair_cache_budget=0,
+                 int num_threads=1):
         """ Constructor:
         
         Parameters:
@@ -672,6 +1943,11 @@ cdef class VarHNbrParticleLocator(FixedDestNbrParticleLocator):
         source -- the source particle array 
         dest -- the destination particle array
         radius_scale -- kernel support radius `kfac`
+        skin -- the Verlet skin. Defaults to 0 (no skin)
+        pair_cache_budget -- the memory in bytes available for the pair
+        data cache. Defaults to 0 (no pair data cache)
+        num_threads -- the number of threads building the caches.
+        Defaults to 1
 
         Notes:
         ------
@@ -684,10 +1960,12 @@ cdef class VarHNbrParticleLocator(FixedDestNbrParticleLocator):
 
         """
         FixedDestNbrParticleLocator.__init__(
-            self, source, dest, radius_scale, cell_manager, h)
+            self, source, dest, radius_scale, cell_manager, h, skin,
+            pair_cache_budget, num_threads)
         
         self._rev_locator = FixedDestNbrParticleLocator(
-            dest, source, radius_scale, cell_manager, h)
+            dest, source, radius_scale, cell_manager, h, skin,
+            num_threads=num_threads)
         
         self.update()
 
@@ -700,52 +1978,369 @@ cdef class VarHNbrParticleLocator(FixedDestNbrParticleLocator):
         The magic happens because _update_cache is different now.
 
         """
+        self._rev_locator.num_threads = self.num_threads
         self._rev_locator.update()
         return FixedDestNbrParticleLocator.update(self)
+
+    cpdef bint has_symmetric_lists(self):
+        """ The larger of the two smoothing lengths is used for every
+        pair, so the neighbor lists are always symmetric. """
+        return True
+
+    cpdef int remap_indices(self, ParticleArray pa, LongArray permutation,
+                            LongArray new_index) except -1:
+        """ Renumber the caches of both NeighborLocators """
+        self._rev_locator.remap_indices(pa, permutation, new_index)
+        return FixedDestNbrParticleLocator.remap_indices(
+            self, pa, permutation, new_index)
     
     cdef int _update_cache(self) except -1:
         """Update the particle cache without using the cell cache.
 
         Algorithm:
         ----------
-        update index_cache as before finding source particle ids
-        for each source particle
-            get nearest particles from rev_loc -> rev_cache
-            for each index in rev_cache
-                retrieve from the cache the destination index_cache
-                add source to index_cache if not present
-
+        build the forward cache as before finding source particle ids
+        build the reverse cache (dest neighbors of source particles)
+        transpose the reverse cache (source particles per dest particle)
+        for each dest particle
+            merge the forward and transposed neighbors, without duplicates
+            move the particle itself to the end of its block
         
         Notes:
         ------
-        index_cache refers to the cache to be used
-        rev_cache is used only internally like _rev_loc                    
+        The transposed reverse cache is in the same CSR form as the
+        forward cache.
+
+        The forward and reverse caches are built by `num_threads`
+        threads where possible, the merge is serial.
         
         """
         
-        cdef long num_d_particles, num_s_particles, i, j, k
-        cdef LongArray index_cache
-        cdef LongArray rev_cache = LongArray()
+        cdef long num_d_particles, num_s_particles, i, j, k, idx, end
+        cdef FixedDestNbrParticleLocator rev = self._rev_locator
+
+        cdef LongArray fwd_offsets, fwd_indices
+        cdef LongArray offsets = LongArray()
+        cdef LongArray indices = LongArray()
+        cdef LongArray t_offsets, t_indices, t_fill
+        cdef LongArray marker
         
         num_d_particles = self.dest.get_number_of_particles()
         num_s_particles = self.source.get_number_of_particles()
+
+        FixedDestNbrParticleLocator._update_cache(self)
+        fwd_offsets = self.nbr_offsets
+        fwd_indices = self.nbr_indices
         
+        rev._update_cache()
+
+        # transpose the reverse cache with a counting sort
+
+        t_offsets = LongArray(num_d_particles + 1)
+        t_fill = LongArray(num_d_particles)
+        t_indices = LongArray(rev.nbr_indices.length)
+
+        for i in range(num_d_particles + 1):
+            t_offsets.data[i] = 0
+
+        for k in range(rev.nbr_indices.length):
+            t_offsets.data[rev.nbr_indices.data[k] + 1] += 1
+
         for i in range(num_d_particles):
-            index_cache = self.particle_cache[i]
-            index_cache.reset()
-            
-            FixedDestNbrParticleLocator.get_nearest_particles_nocache(self,
-                i, index_cache, False)
-        
-        self._rev_locator._update_cache()
-        
+            t_offsets.data[i+1] += t_offsets.data[i]
+            t_fill.data[i] = t_offsets.data[i]
+
         for j in range(num_s_particles):
-            rev_cache = self._rev_locator.particle_cache[j]
+            for k in range(rev.nbr_offsets.data[j], rev.nbr_offsets.data[j+1]):
+                i = rev.nbr_indices.data[k]
+                t_indices.data[t_fill.data[i]] = j
+                t_fill.data[i] += 1
+
+        # merge the forward and transposed caches
+
+        marker = LongArray(num_s_particles)
+        for j in range(num_s_particles):
+            marker.data[j] = -1
+
+        offsets.resize(num_d_particles + 1)
+        offsets.data[0] = 0
+        indices.reserve(fwd_indices.length + t_indices.length)
+
+        for i in range(num_d_particles):
+            for k in range(fwd_offsets.data[i], fwd_offsets.data[i+1]):
+                idx = fwd_indices.data[k]
+                marker.data[idx] = i
+                indices.append(idx)
+
+            for k in range(t_offsets.data[i], t_offsets.data[i+1]):
+                idx = t_indices.data[k]
+                if marker.data[idx] != i:
+                    marker.data[idx] = i
+                    indices.append(idx)
+
+            end = indices.length
+
+            # keep particle at the last index for faster exclude_self
+            if self.source is self.dest:
+                for k in range(offsets.data[i], end-1):
+                    if i == indices.data[k]:
+                        indices.data[k] = indices.data[end-1]
+                        indices.data[end-1] = i
+                        break
+
+            offsets.data[i+1] = end
+
+        self.nbr_offsets = offsets
+        self.nbr_indices = indices
+
+        return 0
+
+    cdef int _filter_neighbors(self, long dest_p_index, long start, long end,
+                               LongArray output_array) except -1:
+        """ Append the cached neighbors in nbr_indices[start:end] that are
+        within the interaction radius of `dest_p_index` to output_array.
+        The larger of the source and dest smoothing lengths is used. """
+        cdef long k, idx
+        cdef cPoint src, dst
+        cdef double h, radius
+        cdef double d_h = self.d_h.data[dest_p_index]
+        cdef PeriodicDomain domain = self._get_periodic_domain()
+
+        dst.x = self.d_x.data[dest_p_index]
+        dst.y = self.d_y.data[dest_p_index]
+        dst.z = self.d_z.data[dest_p_index]
+
+        for k in range(start, end):
+            idx = self.nbr_indices.data[k]
+
+            src.x = self.s_x.data[idx]
+            src.y = self.s_y.data[idx]
+            src.z = self.s_z.data[idx]
+
+            if domain is not None:
+                domain.nearest_image(&src, dst)
+
+            h = self.s_h.data[idx]
+            if d_h > h:
+                h = d_h
+            radius = self.radius_scale * h
+
+            if cPoint_distance2(src, dst) < radius * radius:
+                output_array.append(idx)
+
+        return 0
+
+###############################################################################
+# `TreeNbrParticleLocator` class.
+###############################################################################
+cdef class TreeNbrParticleLocator(FixedDestNbrParticleLocator):
+
+    # Defined in the .pxd file
+    # cdef public KDTree tree
+    # cdef public int query_type
+
+    """ A particle locator searching the neighbors in a k-d tree of the
+    source particles, for smoothing lengths varying by large factors.
+
+    Data Members:
+    -------------
+    tree -- the KDTree of the source particles
+    query_type -- the interaction radius as in TreeQueryType. With
+    `Symmetric` the neighbors are the same as for the
+    VarHNbrParticleLocator, with `Gather` as for the
+    FixedDestNbrParticleLocator
+
+    Notes:
+    ------
+    The leaves of the tree adapt to the particle distribution and each
+    node knows the largest smoothing length in it. A query thus visits
+    only the particles that may be within the interaction radius,
+    whereas the cells are sized for the largest smoothing length.
+
+    The tree is rebuilt with the neighbor cache.
+
+    """
+    def __init__(self, ParticleArray source, ParticleArray dest,
+                 double radius_scale, CellManager cell_manager=None,
+                 str h='h', double skin=0.0, long pair_cache_budget=0,
+                 int query_type=TreeQueryType.Symmetric, int leaf_size=16,
+                 int num_threads=1):
+        """ Constructor
+
+        Parameters:
+        -----------
+        source -- the source particle array
+        dest -- the destination particle array
+        radius_scale -- kernel support radius `kfac`
+        skin -- the Verlet skin. Defaults to 0 (no skin)
+        pair_cache_budget -- the memory in bytes available for the pair
+        data cache. Defaults to 0 (no pair data cache)
+        query_type -- the interaction radius as in TreeQueryType.
+        Defaults to Symmetric
+        leaf_size -- the largest number of particles in a leaf
+        num_threads -- unused, the tree queries are serial
+
+        """
+        FixedDestNbrParticleLocator.__init__(
+            self, source, dest, radius_scale, cell_manager, h, skin,
+            pair_cache_budget, num_threads)
+
+        self.query_type = query_type
+        self.tree = KDTree(leaf_size)
+
+    cdef int _update_cache(self) except -1:
+        """ Rebuild the tree and the neighbor cache """
+        self.tree.build(self.s_x, self.s_y, self.s_z, self.s_h,
+                        self.source.get_number_of_particles())
+
+        return FixedDestNbrParticleLocator._update_cache(self)
+
+    cdef bint _use_parallel_build(self):
+        """ The tree is not searched without the GIL """
+        return False
+
+    cdef int get_nearest_particles_nocache(self, long dest_p_index,
+                                   LongArray output_array,
+                                   bint exclude_self=False) except -1:
+        """ Query the tree for the neighbors of `dest_p_index` """
+        cdef long exclude_index = -1
+        cdef double d_h = self.d_h.data[dest_p_index]
+        cdef double radius
+        cdef cPoint pnt
+        cdef cPoint shifts[27]
+        cdef int s, nshifts
+
+        pnt.x = self.d_x.data[dest_p_index]
+        pnt.y = self.d_y.data[dest_p_index]
+        pnt.z = self.d_z.data[dest_p_index]
+
+        if self.source is self.dest:
+            if exclude_self:
+                exclude_index = dest_p_index
+
+        # the largest interaction radius of any query type
+        radius = d_h
+        if self.tree.num_nodes > 0 and self.tree.node_hmax.data[0] > radius:
+            radius = self.tree.node_hmax.data[0]
+        radius = self.radius_scale * radius + self.skin
+
+        nshifts = self._get_image_shifts(pnt, radius, shifts)
+
+        for s in range(nshifts):
+            self.tree.query(cPoint_sub(pnt, shifts[s]), d_h,
+                            self.radius_scale, self.skin, self.query_type,
+                            output_array, exclude_index)
+
+        return 0
+
+    cdef int get_nearest_particles_to_point(
+        self, cPoint pnt, double radius, LongArray output_array,
+        long exclude_index=-1) except -1:
+        """ Append the source particles within `radius` of `pnt`
+
+        Notes:
+        ------
+        The tree of the last cache build is used. With a skin, the
+        particles may have moved since, so the tree is searched with the
+        radius increased by the skin and the particles are filtered by
+        their current positions.
+
+        """
+        cdef LongArray candidates
+        cdef long k, idx
+        cdef cPoint src
+        cdef PeriodicDomain domain = self._get_periodic_domain()
+        cdef cPoint shifts[27]
+        cdef int s, nshifts
+
+        self.update()
+
+        nshifts = self._get_image_shifts(pnt, radius + self.skin, shifts)
+
+        if self.skin == 0:
+            for s in range(nshifts):
+                self.tree.query(cPoint_sub(pnt, shifts[s]), radius, 1.0, 0.0,
+                                TreeQueryType.Gather, output_array,
+                                exclude_index)
+            return 0
+
+        candidates = LongArray()
+        for s in range(nshifts):
+            self.tree.query(cPoint_sub(pnt, shifts[s]), radius, 1.0,
+                            self.skin, TreeQueryType.Gather, candidates,
+                            exclude_index)
+
+        for k in range(candidates.length):
+            idx = candidates.data[k]
+
+            src.x = self.s_x.data[idx]
+            src.y = self.s_y.data[idx]
+            src.z = self.s_z.data[idx]
+
+            if domain is not None:
+                domain.nearest_image(&src, pnt)
+
+            if cPoint_distance2(src, pnt) < radius * radius:
+                output_array.append(idx)
+
+        return 0
+
+    cpdef bint has_symmetric_lists(self):
+        """ The lists are symmetric for the `Symmetric` query, otherwise
+        only if all particles have the same `h`. """
+        if self.query_type == TreeQueryType.Symmetric:
+            return True
+
+        return FixedDestNbrParticleLocator.has_symmetric_lists(self)
+
+    cpdef int remap_indices(self, ParticleArray pa, LongArray permutation,
+                            LongArray new_index) except -1:
+        """ Renumber the tree and the neighbor cache """
+        if pa is self.source and not self.is_dirty:
+            self.tree.remap(new_index)
+
+        return FixedDestNbrParticleLocator.remap_indices(
+            self, pa, permutation, new_index)
+
+    cdef int _filter_neighbors(self, long dest_p_index, long start, long end,
+                               LongArray output_array) except -1:
+        """ Append the cached neighbors in nbr_indices[start:end] that are
+        within the interaction radius of `dest_p_index` given by the
+        query type to output_array. """
+        cdef long k, idx
+        cdef cPoint src, dst
+        cdef double h, radius
+        cdef double d_h = self.d_h.data[dest_p_index]
+        cdef PeriodicDomain domain = self._get_periodic_domain()
+        cdef int query_type = self.query_type
+        cdef int scatter = TreeQueryType.Scatter
+        cdef int symmetric = TreeQueryType.Symmetric
+
+        dst.x = self.d_x.data[dest_p_index]
+        dst.y = self.d_y.data[dest_p_index]
+        dst.z = self.d_z.data[dest_p_index]
+
+        for k in range(start, end):
+            idx = self.nbr_indices.data[k]
+
+            src.x = self.s_x.data[idx]
+            src.y = self.s_y.data[idx]
+            src.z = self.s_z.data[idx]
+
+            if domain is not None:
+                domain.nearest_image(&src, dst)
+
+            h = d_h
+            if query_type == scatter:
+                h = self.s_h.data[idx]
+            elif query_type == symmetric:
+                if self.s_h.data[idx] > h:
+                    h = self.s_h.data[idx]
+            radius = self.radius_scale * h
+
+            if cPoint_distance2(src, dst) < radius * radius:
+                output_array.append(idx)
 
-            for k in range(rev_cache.length):
-                index_cache = self.particle_cache[rev_cache.data[k]]
-                if index_cache.index(j) < 0:
-                    index_cache.append(j)
         return 0
 
 ###############################################################################
@@ -771,15 +2366,51 @@ cdef class NNPSManager:
     variable_h -- indicates if variable-h computations are needed.
     particle_locator_cache -- cache object for source destination interactions
 
+    neighbor_skin -- Verlet skin for the neighbor locators. Defaults to 0
+    pair_cache_budget -- memory in bytes available to the pair data
+    cache of each neighbor locator. Defaults to 0 (no pair data cache)
+    num_threads -- the number of threads building the neighbor caches.
+    Defaults to 1
+
+    Notes:
+    ------
+    Passing `use_flat_index=True` switches the cell manager to the flat
+    (counting sort) binning engine.
+
+    With a positive `neighbor_skin` the locators reuse their caches
+    until the particles may have moved out of the skin. The particles
+    are still binned at every update.
+
+    With the locator type `TreeNeighborLocator`, the neighbors are
+    searched in a k-d tree of each source (see TreeNbrParticleLocator),
+    which suits smoothing lengths varying by large factors.
+
+    With a positive `pair_cache_budget` the locators keep the kernel
+    data of their neighbor pairs, computed once per update of the
+    particles. A locator whose pairs exceed the budget falls back to
+    evaluating the kernel on the fly.
+
+    With `num_threads` > 1 the caches are built by several threads if
+    the cell manager uses the flat index. The caches of the tree
+    locators are built serially.
+
     """
 
     def __init__(self, CellManager cell_manager=None,
                  bint variable_h=False, str h='h',
-                 int locator_type=NeighborLocatorType.SPHNeighborLocator):
+                 int locator_type=NeighborLocatorType.SPHNeighborLocator,
+                 bint use_flat_index=False, double neighbor_skin=0.0,
+                 long pair_cache_budget=0, int num_threads=1):
         self.cell_manager = cell_manager
         self.variable_h = variable_h
         self.h = h
         self.locator_type = locator_type
+        self.neighbor_skin = neighbor_skin
+        self.pair_cache_budget = pair_cache_budget
+        self.num_threads = num_threads
+
+        if use_flat_index and cell_manager is not None:
+            cell_manager.set_use_flat_index(True)
         
         self.particle_locator_cache = dict()
         
@@ -842,6 +2473,14 @@ cdef class NNPSManager:
         
         self.cell_manager.update_status()
 
+        # with a skin, the binning is not triggered by the neighbor
+        # queries of the locators that were not rebuilt.
+
+        if self.neighbor_skin > 0:
+            self.cell_manager.update()
+
+        return 0
+
     cpdef add_interaction(self, ParticleArray source, ParticleArray dest,
                           double radius_scale):
         """ Add an interaction between a source and desti particle array
@@ -860,15 +2499,36 @@ cdef class NNPSManager:
         
         loc = self.particle_locator_cache.get(t)
         if loc is None:
-            if not self.variable_h:
+            if self.locator_type == NeighborLocatorType.TreeNeighborLocator:
+                if self.variable_h:
+                    query_type = TreeQueryType.Symmetric
+                else:
+                    query_type = TreeQueryType.Gather
+
+                loc = TreeNbrParticleLocator(source, dest, radius_scale,
+                                 cell_manager=self.cell_manager, h=self.h,
+                                 skin=self.neighbor_skin,
+                                 pair_cache_budget=self.pair_cache_budget,
+                                 query_type=query_type,
+                                 num_threads=self.num_threads)
+
+                loc.set_locator_type(self.locator_type)
+
+            elif not self.variable_h:
                 loc = FixedDestNbrParticleLocator(source, dest, radius_scale,
-                                   cell_manager=self.cell_manager, h=self.h)
+                                   cell_manager=self.cell_manager, h=self.h,
+                                   skin=self.neighbor_skin,
+                                   pair_cache_budget=self.pair_cache_budget,
+                                   num_threads=self.num_threads)
 
                 loc.set_locator_type(self.locator_type)
                 
             else:
                 loc = VarHNbrParticleLocator(source, dest, radius_scale,
-                                 cell_manager=self.cell_manager, h=self.h)
+                                 cell_manager=self.cell_manager, h=self.h,
+                                 skin=self.neighbor_skin,
+                                 pair_cache_budget=self.pair_cache_budget,
+                                 num_threads=self.num_threads)
 
                 loc.set_locator_type(self.locator_type)
                 
@@ -887,6 +2547,59 @@ cdef class NNPSManager:
         msg = 'NNPSManager::get_neighbor_polygon_locator'
         raise NotImplementedError, msg
 
+    def remap_particle_indices(self, ParticleArray pa, LongArray permutation,
+                               LongArray new_index):
+        """ Renumber the cell and neighbor caches after the particles of
+        `pa` were reordered with `ParticleArray.reorder`
+
+        Parameters:
+        -----------
+        pa -- the reordered particle array
+        permutation -- the permutation passed to `reorder`
+        new_index -- the inverse of permutation
+
+        """
+        cdef FixedDestNbrParticleLocator loc
+        cdef int array_index = self.cell_manager.array_indices[pa.name]
+
+        self.cell_manager.remap_particle_indices(array_index, new_index)
+
+        for loc in self.particle_locator_cache.values():
+            loc.remap_indices(pa, permutation, new_index)
+
+    def set_pair_cache_budget(self, long budget):
+        """ Set the memory in bytes available to the pair data cache of
+        each neighbor locator. A budget of 0 disables the cache. """
+        cdef FixedDestNbrParticleLocator loc
+
+        self.pair_cache_budget = budget
+
+        for loc in self.particle_locator_cache.values():
+            loc.pair_cache_budget = budget
+            loc.pair_cache.release()
+            loc._pair_dirty = True
+
+    def set_num_threads(self, int num_threads):
+        """ Set the number of threads building the neighbor caches """
+        cdef FixedDestNbrParticleLocator loc
+
+        self.num_threads = num_threads
+
+        for loc in self.particle_locator_cache.values():
+            loc.num_threads = num_threads
+
+    def get_rebuild_stats(self):
+        """ Return the total number of cache builds and skipped builds of
+        the neighbor locators as a tuple (num_builds, num_skipped) """
+        cdef FixedDestNbrParticleLocator loc
+        cdef long num_builds = 0, num_skipped = 0
+
+        for loc in self.particle_locator_cache.values():
+            num_builds += loc.num_builds
+            num_skipped += loc.num_skipped
+
+        return num_builds, num_skipped
+
     ######################################################################
     # python wrappers.
     ######################################################################
@@ -62,6 +62,9 @@ cdef class ParticleArray:
 
     # indicates if coordinates of particles has changed.
     cdef public bint is_dirty
+
+    # number of modifications of each property (see mark_modified)
+    cdef public dict generations
     
     # indicate if the particle configuration has changed.
     cdef public bint indices_invalid
@@ -69,6 +72,11 @@ cdef class ParticleArray:
     # the number of real particles.
     cdef public long num_real_particles
 
+    # the storage of the property arrays {'memory', 'mmap'} and the
+    # directory of the mapped files.
+    cdef readonly str storage
+    cdef readonly object storage_path
+
     ########################################
     # OpenCL related attributes.
 
@@ -95,12 +103,15 @@ cdef class ParticleArray:
 
     cdef object _create_c_array_from_npy_array(self, np.ndarray arr)
     cdef _check_property(self, str)
+    cdef _map_properties(self)
 
     cdef np.ndarray _get_real_particle_prop(self, str prop)
 
     cpdef set_name(self, str name)
     cpdef set_particle_type(self, int particle_type)
     cpdef set_dirty(self, bint val)
+    cpdef mark_modified(self, str prop)
+    cpdef long get_generation(self, str prop)
     cpdef set_indices_invalid(self, bint val)
 
     cpdef BaseArray get_carray(self, str prop)
@@ -151,4 +162,7 @@ cdef class ParticleArray:
     cpdef copy_properties(self, ParticleArray source, long start_index=*, long
                           end_index=*)
 
+    # reorder the particles in place
+    cpdef reorder(self, LongArray permutation)
+
 
@@ -28,6 +28,8 @@ cdef extern from "string.h":
 import logging
 logger = logging.getLogger()
 
+import os
+
 # numpy imports
 cimport numpy
 import numpy
@@ -121,6 +123,7 @@ cdef class ParticleArray:
     def __cinit__(self, str name='', default_particle_tag=LocalReal,
                   particle_type = ParticleType.Fluid,
                   cl_precision = 'double', constants={},
+                  str storage='memory', storage_path=None,
                   *args, **props):
         """ Constructor
 
@@ -136,15 +139,34 @@ cdef class ParticleArray:
         cl_precision : {'single', 'double'}
             Set the precision to use for OpenCL.
 
+        storage : {'memory', 'mmap'}
+            With 'mmap', every property array is backed by a file mapped
+            into memory, in the directory `storage_path`.
+
+        storage_path : str
+            The directory of the mapped files, which is created if needed.
+
         props : dict 
             dictionary of properties for every particle in this array
 
         """
+        if storage not in ('memory', 'mmap'):
+            raise ValueError, 'unknown storage %s'%(storage)
+        if storage == 'mmap':
+            if storage_path is None:
+                raise ValueError, 'storage_path is needed for mmap storage'
+            if not os.path.isdir(storage_path):
+                os.makedirs(storage_path)
+
+        self.storage = storage
+        self.storage_path = storage_path
+
         self.properties = {'tag':LongArray(0), 'group':LongArray(0),
                            'local':IntArray(0)}
         self.default_values = {'tag':default_particle_tag, 'group':0, 'local':1}
         
         self.temporary_arrays = {}
+        self.generations = {}
         
         self.constants = {}
         self.constants.update(constants)
@@ -171,6 +193,8 @@ cdef class ParticleArray:
 
         if props:
             self.initialize(**props)
+        else:
+            self._map_properties()
 
     def __getattr__(self, name):
         """ Convenience, to access particle property arrays as an attribute
@@ -205,6 +229,8 @@ cdef class ParticleArray:
         d['particle_type'] = self.particle_type
         d['temporary_arrays'] = self.temporary_arrays.keys()
         d['constants'] = self.constants
+        d['storage'] = self.storage
+        d['storage_path'] = self.storage_path
         props = {}
         default_values = {}
 
@@ -226,12 +252,17 @@ cdef class ParticleArray:
         self.property_arrays = []
         self.default_values = {}
         self.temporary_arrays = {}
+        self.generations = {}
         self.is_dirty = True
         self.indices_invalid = True
         self.num_real_particles = 0
 
         self.name = d['name']
         self.particle_type = d['particle_type']
+        self.storage = d.get('storage', 'memory')
+        self.storage_path = d.get('storage_path')
+        if self.storage == 'mmap' and not os.path.isdir(self.storage_path):
+            os.makedirs(self.storage_path)
         props = d['properties']
         self.constants = d['constants']
         for prop in props:
@@ -245,6 +276,25 @@ cdef class ParticleArray:
         """ Set the is_dirty variable to given value """
         self.is_dirty = value
 
+    cpdef mark_modified(self, str prop):
+        """ Record a modification of the values of a property
+
+        Notes:
+        ------
+        `set` and the SPH calcs writing to a property call this. Code
+        writing to the data of a carray directly should call it, so that
+        the caches depending on the property are refreshed without
+        comparing the values. The pair data cache of the neighbor
+        locators also compares the values of 'h', which catches writes
+        through `view` or the buffer of the carray.
+
+        """
+        self.generations[prop] = self.generations.get(prop, 0) + 1
+
+    cpdef long get_generation(self, str prop):
+        """ Return the number of recorded modifications of a property """
+        return self.generations.get(prop, 0)
+
     cpdef set_indices_invalid(self, bint value):
         """ Set the indices_invalid to the given value """
         self.indices_invalid = value
@@ -263,6 +313,7 @@ cdef class ParticleArray:
         self.temporary_arrays.clear()
         self.is_dirty = True
         self.indices_invalid = True
+        self._map_properties()
 
     cpdef set_name(self, str name):
         self.name = name
@@ -359,6 +410,7 @@ cdef class ParticleArray:
         if not self.temporary_arrays.has_key(arr_name):
             carr = DoubleArray(np)
             self.temporary_arrays[arr_name] = carr            
+            self._map_properties()
         
     cpdef remove_particles(self, LongArray index_list):
         """ Remove particles whose indices are given in index_list.
@@ -672,6 +724,38 @@ cdef class ParticleArray:
         else:
             return tuple(result)
 
+    def view(self, str prop, bint real_only=True):
+        """ Return a writable numpy array sharing the data of a property
+
+        **Parameters**
+
+         - prop - the property or temporary array.
+         - real_only - if True, only the LocalReal particles are viewed.
+
+        **Notes**
+
+         Unlike the arrays returned by `get`, the view is made through
+         the buffer protocol of the carray and keeps it alive. Values
+         written to the view go to the property without a copy. The
+         view is valid until the property is resized, which changes the
+         `generation` of its carray::
+
+             x = pa.view('x')
+             gen = pa.get_carray('x').generation
+             ...
+             if pa.get_carray('x').generation != gen:
+                 x = pa.view('x')
+
+        """
+        cdef BaseArray arr = self.get_carray(prop)
+
+        if arr is None:
+            raise AttributeError, 'property %s not present'%(prop)
+
+        if real_only:
+            return numpy.asarray(arr)[:self.num_real_particles]
+        return numpy.asarray(arr)
+
     def set(self, **props):
         """ Set properties from numpy arrays like objects
 
@@ -704,6 +788,7 @@ cdef class ParticleArray:
             self._check_property(prop)
             
         for prop in props.keys():
+            self.mark_modified(prop)
             proparr = numpy.asarray(props[prop])
             if self.properties.has_key(prop):
                 prop_array = self.properties[prop]
@@ -725,7 +810,7 @@ cdef class ParticleArray:
             return <BaseArray>PyDict_GetItem(self.temporary_arrays, prop)
         else:
             return None
-        
+
     cpdef add_property(self, dict prop_info):
         """ Add a new property based on information in prop_info
 
@@ -882,6 +967,7 @@ cdef class ParticleArray:
                         arr.get_npy_array()[:] = numpy.asarray(data)
                         self.properties[prop_name] = arr
 
+        self._map_properties()
 
     ######################################################################
     # Non-public interface
@@ -925,6 +1011,28 @@ cdef class ParticleArray:
             return
         else:
             raise AttributeError, 'property %s not present'%(prop)
+
+    cdef _map_properties(self):
+        """ Map the property arrays not yet mapped to files
+
+        Nothing is done unless the storage is 'mmap'. Each array gets a
+        new file '<name>_<property>_XXXXXX.dat' in the storage_path, so
+        that arrays with the same name or a cleared array never share a
+        file. The path is the `mmap_path` of the carray, and the file is
+        removed when the carray is freed.
+
+        """
+        cdef BaseArray arr
+        cdef str prop
+
+        if self.storage != 'mmap':
+            return
+
+        for arrays in (self.properties, self.temporary_arrays):
+            for prop, arr in arrays.iteritems():
+                if not arr.mapped:
+                    arr.use_mmap(self.storage_path,
+                                 '%s_%s_'%(self.name, prop))
         
     cdef object _create_c_array_from_npy_array(self, numpy.ndarray np_array):
         """ Create and return  a carray array from the given numpy array
@@ -1148,6 +1256,68 @@ cdef class ParticleArray:
         for prop_array in self.properties.values():
             prop_array.update_min_max()
 
+    cpdef reorder(self, LongArray permutation):
+        """ Reorder the particles in place
+
+        **Parameters**
+
+         - permutation - the new order of the particles. The particle at
+           index i after the call is the one at index permutation[i]
+           before the call.
+
+        **Algorithm**::
+
+         if permutation is not a permutation of the particle indices
+             raise ValueError
+
+         add the property 'idx' holding the particle indices, if absent
+
+         for every array in properties and temporary_arrays
+             array <- array[permutation]
+
+        **Notes**
+
+         - The property 'idx' is carried along with the particles and may
+           be used as a persistent particle id.
+         - Indices held by a CellManager or a neighbor locator become
+           invalid. The array is marked dirty so that they are rebuilt,
+           use `Particles.sort_spatially` to remap them instead.
+
+        """
+        cdef numpy.ndarray perm, seen, nparr
+        cdef BaseArray arr
+        cdef long n = self.get_number_of_particles()
+        cdef str msg
+
+        if permutation.length != n:
+            msg = 'Permutation of length %d for %d particles'%(
+                permutation.length, n)
+            raise ValueError, msg
+
+        if n == 0:
+            return
+
+        perm = permutation.get_npy_array()
+
+        seen = numpy.zeros(n, dtype=numpy.bool)
+        if perm.min() >= 0 and perm.max() < n:
+            seen[perm] = True
+
+        if not numpy.all(seen):
+            msg = 'The indices given are not a permutation of the particles'
+            raise ValueError, msg
+
+        if not self.properties.has_key('idx'):
+            self.add_property({'name':'idx', 'type':'long',
+                               'data':numpy.arange(n)})
+
+        for arr in self.properties.values() + self.temporary_arrays.values():
+            nparr = arr.get_npy_array()
+            nparr[:] = nparr[perm]
+
+        self.is_dirty = True
+        self.indices_invalid = True
+
     ######################################################################
     # OpenCL interface
     ######################################################################
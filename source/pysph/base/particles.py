@@ -1,7 +1,10 @@
 from cell import CellManager
 from nnps import NNPSManager, NeighborLocatorType
-from particle_array import ParticleArray
+from particle_array import ParticleArray, get_local_real_tag
 from particle_types import ParticleType
+from carray import LongArray
+
+from pysph.parallel.space_filling_curves import sfc_keys_dict
 
 Fluid = ParticleType.Fluid
 Solid = ParticleType.Solid
@@ -91,7 +94,10 @@ class Particles(object):
     def __init__(self, arrays=[], in_parallel=False, variable_h=False,
                  load_balancing=True, update_particles=True,
                  locator_type = SPHNeighborLocator,
-                 periodic_domain=None, min_cell_size=-1):
+                 periodic_domain=None, min_cell_size=-1,
+                 use_flat_index=False, neighbor_skin=0.0,
+                 pair_cache_budget=0, num_threads=1, dimension=3,
+                 cell_subdivisions=1):
         
         """ Constructor
 
@@ -108,6 +114,28 @@ class Particles(object):
 
         periodic_domain -- the periodic domain for periodicity
 
+        use_flat_index -- bin particles with the flat (counting sort)
+        index of the CellManager instead of the dict of cells. Serial
+        runs only.
+
+        neighbor_skin -- Verlet skin for the neighbor lists. The lists
+        are rebuilt only when particles may have moved by more than
+        half the skin. Defaults to 0 (rebuild whenever particles move)
+
+        pair_cache_budget -- memory in bytes for caching the kernel
+        values and gradients of the neighbor pairs of each neighbor
+        locator. Defaults to 0 (evaluate the kernel for each function)
+
+        num_threads -- number of threads building the neighbor lists.
+        Needs the flat index. Defaults to 1
+
+        dimension -- the dimension of the problem, which sets the number
+        of cells searched for neighbors. Defaults to 3
+
+        cell_subdivisions -- number of cells per interaction radius. The
+        neighbor queries visit fewer candidates with smaller cells, at
+        the cost of more cells. Serial runs only. Defaults to 1
+
         """
 
         # set the flags
@@ -116,6 +144,9 @@ class Particles(object):
         self.in_parallel = in_parallel
         self.load_balancing = load_balancing
         self.locator_type = locator_type
+        self.neighbor_skin = neighbor_skin
+        self.pair_cache_budget = pair_cache_budget
+        self.num_threads = num_threads
 
         # Some sanity checks on the input arrays.
         assert len(arrays) > 0, "Particles must be given some arrays!"
@@ -133,10 +164,22 @@ class Particles(object):
         if not in_parallel:
             self.cell_manager = CellManager(arrays_to_bin=arrays,
                                             min_cell_size=min_cell_size,
-                                            periodic_domain=periodic_domain)
+                                            periodic_domain=periodic_domain,
+                                            use_flat_index=use_flat_index,
+                                            dimension=dimension,
+                                            cell_subdivisions=cell_subdivisions)
         else:
+            if use_flat_index:
+                msg = 'The flat index is not supported in parallel'
+                raise NotImplementedError, msg
+
+            if cell_subdivisions != 1:
+                msg = 'Cell subdivisions are not supported in parallel'
+                raise NotImplementedError, msg
+
             self.cell_manager = ParallelCellManager(
-                arrays_to_bin=arrays, load_balancing=load_balancing)
+                arrays_to_bin=arrays, load_balancing=load_balancing,
+                dimension=dimension)
 
             self.pid = self.cell_manager.pid
 
@@ -144,13 +187,22 @@ class Particles(object):
 
         self.nnps_manager = NNPSManager(cell_manager=self.cell_manager,
                                         variable_h=variable_h,
-                                        locator_type=self.locator_type)
+                                        locator_type=self.locator_type,
+                                        neighbor_skin=neighbor_skin,
+                                        pair_cache_budget=pair_cache_budget,
+                                        num_threads=num_threads)
 
         # set defaults
         
         self.correction_manager = None        
         self.misc_prop_update_functions = []
 
+        # spatial sorting of the particles (see sort_spatially)
+
+        self.sort_curve = 'hilbert'
+        self.sort_every = 0
+        self.num_updates = 0
+
         # call an update on the particles (i.e index)
         
         if update_particles:
@@ -185,6 +237,12 @@ class Particles(object):
         
         """
 
+        # reorder the particles along the space filling curve
+
+        self.num_updates += 1
+        if self.sort_every > 0 and self.num_updates % self.sort_every == 0:
+            self._sort_arrays()
+
         # update the cell structure
 
         err = self.nnps_manager.py_update()
@@ -226,6 +284,110 @@ class Particles(object):
         calcs = operation.get_calcs(self, kernel)
         self.misc_prop_update_functions.append(func(calcs))
 
+    def sort_spatially(self, curve='hilbert', every=0):
+        """ Reorder the particles along a space filling curve.
+
+        Parameters:
+        -----------
+
+        curve -- the space filling curve, 'hilbert' or 'morton'
+
+        every -- if positive, the particles are sorted again at every
+        `every` calls to update. Defaults to 0 (sort once)
+
+        Notes:
+        ------
+
+        Particles close in space are stored close in memory which
+        improves the cache locality of the neighbor loops. The local
+        real particles of each array are ordered by the key of their
+        cell and the other particles are left in place. The 'idx'
+        property is carried along with the particles and may be used
+        as a persistent particle id.
+
+        The cell and neighbor caches are renumbered, not rebuilt.
+
+        """
+        if self.in_parallel:
+            msg = 'Spatial sorting is not supported in parallel'
+            raise NotImplementedError, msg
+
+        if not sfc_keys_dict.has_key(curve):
+            msg = 'Unknown space filling curve %s'%(curve)
+            raise ValueError, msg
+
+        self.sort_curve = curve
+        self.sort_every = every
+
+        self._sort_arrays()
+
+    def _sort_arrays(self):
+        """ Reorder all arrays and renumber the caches """
+
+        for pa in self.arrays:
+            permutation = self._get_sfc_permutation(pa)
+            if permutation is None:
+                continue
+
+            np = len(permutation)
+            new_index = numpy.empty(np, dtype=permutation.dtype)
+            new_index[permutation] = numpy.arange(np)
+
+            perm_arr = LongArray(np)
+            perm_arr.set_data(permutation)
+            new_index_arr = LongArray(np)
+            new_index_arr.set_data(new_index)
+
+            # the particles have not moved, keep the dirty flag
+            is_dirty = pa.is_dirty
+            pa.reorder(perm_arr)
+            pa.set_dirty(is_dirty)
+
+            self.nnps_manager.remap_particle_indices(pa, perm_arr,
+                                                     new_index_arr)
+
+    def _get_sfc_permutation(self, pa):
+        """ Return the permutation ordering the particles of `pa` along
+        the space filling curve or None if there is nothing to sort """
+
+        cm = self.cell_manager
+        np = pa.get_number_of_particles()
+
+        tag = pa.get_carray('tag').get_npy_array()
+        nreal = numpy.sum(tag == get_local_real_tag())
+        if nreal < 2:
+            return None
+
+        x, y, z = [pa.get_carray(prop).get_npy_array()[:nreal] for prop in
+                   (cm.coord_x, cm.coord_y, cm.coord_z)]
+
+        # cell indices along the dimensions spanned by the particles
+        ids = []
+        for coord in (x, y, z):
+            cid = numpy.floor(coord/cm.cell_size).astype(numpy.int64)
+            cid -= cid.min()
+            if cid.max() > 0:
+                ids.append(cid)
+
+        if not ids:
+            return None
+
+        ids = numpy.array(ids).T
+
+        # coarsen the cells if the keys do not fit in 64 bits
+        maxlen = 64 // ids.shape[1]
+        nbits = len(numpy.binary_repr(int(ids.max())))
+        if nbits > maxlen:
+            ids >>= (nbits - maxlen)
+            nbits = maxlen
+
+        keys = sfc_keys_dict[self.sort_curve](ids, nbits)
+
+        permutation = numpy.arange(np)
+        permutation[:nreal] = numpy.argsort(keys, kind='mergesort')
+
+        return permutation
+
     def get_named_particle_array(self, name):
         """ Return the named particle array if it exists """
         has_array = False
@@ -279,7 +441,17 @@ class Particles(object):
         return self.arrays[0].cl_precision
 
 ###############################################################################
-def get_particle_array(cl_precision="double", **props):
+# the properties stored in single precision by get_particle_array
+SINGLE_PRECISION_PROPS = ['u', 'v', 'w', 'm', 'rho', 'p', 'e', 'cs']
+
+def _get_prop_type(prop, precision):
+    """ Return the carray type of a property for the precision """
+    if precision == 'single' and prop in SINGLE_PRECISION_PROPS:
+        return 'float'
+    return 'double'
+
+def get_particle_array(cl_precision="double", storage="memory", path=None,
+                       precision="double", **props):
     """ Create and return a particle array with default properties 
     
     Parameters
@@ -288,6 +460,18 @@ def get_particle_array(cl_precision="double", **props):
     cl_precision : {'single', 'double'}
         Precision to use in OpenCL (default: 'double').
 
+    storage : {'memory', 'mmap'}
+        With 'mmap' the properties are stored in files mapped into
+        memory, for runs that do not fit in RAM (default: 'memory').
+
+    path : str
+        The directory of the mapped files for the 'mmap' storage.
+
+    precision : {'single', 'double'}
+        With 'single' the bulk properties (u, v, w, m, rho, p, e, cs)
+        are stored in single precision. The positions and h stay in
+        double precision (default: 'double').
+
     props : dict
         A dictionary of properties requested.
 
@@ -305,6 +489,9 @@ def get_particle_array(cl_precision="double", **props):
     """ 
         
     nprops = len(props)
+
+    if precision not in ('single', 'double'):
+        raise ValueError, 'unknown precision %s'%(precision)
     
     prop_dict = {}
     name = ""
@@ -328,12 +515,14 @@ def get_particle_array(cl_precision="double", **props):
                                    'type':'int'}
             else:
                 data = numpy.asarray(props[prop])
-                prop_dict[prop] = {'data':data, 'type':'double'}
+                prop_dict[prop] = {'data':data,
+                                   'type':_get_prop_type(prop, precision)}
             
     # Add the default props
     for prop in default_props:
         if prop not in props.keys():
-            prop_dict[prop] = {'name':prop, 'type':'double',
+            prop_dict[prop] = {'name':prop,
+                               'type':_get_prop_type(prop, precision),
                                'default':default_props[prop]}
 
     # Add the property idx
@@ -351,7 +540,8 @@ def get_particle_array(cl_precision="double", **props):
         assert particle_type in [Fluid, Solid, Probe], 'Type not understood!'
 
     pa = ParticleArray(name=name, particle_type=particle_type,
-                       cl_precision=cl_precision, **prop_dict)
+                       cl_precision=cl_precision, storage=storage,
+                       storage_path=path, **prop_dict)
 
     return pa
 
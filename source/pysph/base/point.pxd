@@ -1,8 +1,8 @@
 cimport numpy
 
 cdef extern from "math.h":
-    double sqrt(double)
-    double ceil(double)
+    double sqrt(double) nogil
+    double ceil(double) nogil
 
 cdef extern from 'limits.h':
     cdef int INT_MAX
@@ -10,39 +10,49 @@ cdef extern from 'limits.h':
 cdef struct cPoint:
     double x, y, z
 
-cdef inline cPoint cPoint_new(double x, double y, double z):
-    cdef cPoint p = cPoint(x,y,z)
+cdef inline cPoint cPoint_new(double x, double y, double z) nogil:
+    cdef cPoint p
+    p.x = x; p.y = y; p.z = z
     return p
 
-cdef inline cPoint cPoint_sub(cPoint pa, cPoint pb):
+cdef inline cPoint cPoint_sub(cPoint pa, cPoint pb) nogil:
     return cPoint_new(pa.x-pb.x, pa.y-pb.y, pa.z-pb.z)
 
-cdef inline cPoint cPoint_add(cPoint pa, cPoint pb):
+cdef inline cPoint cPoint_add(cPoint pa, cPoint pb) nogil:
     return cPoint_new(pa.x+pb.x, pa.y+pb.y, pa.z+pb.z)
 
-cdef inline double cPoint_dot(cPoint pa, cPoint pb):
+cdef inline double cPoint_dot(cPoint pa, cPoint pb) nogil:
     return pa.x*pb.x + pa.y*pb.y + pa.z*pb.z
 
-cdef inline double cPoint_norm(cPoint p):
+cdef inline double cPoint_norm(cPoint p) nogil:
     return p.x*p.x + p.y*p.y + p.z*p.z
 
-cdef inline double cPoint_distance(cPoint pa, cPoint pb):
+cdef inline double cPoint_distance(cPoint pa, cPoint pb) nogil:
     return sqrt((pa.x-pb.x)*(pa.x-pb.x) +
                 (pa.y-pb.y)*(pa.y-pb.y) + 
                 (pa.z-pb.z)*(pa.z-pb.z)
                 )
 
-cdef inline double cPoint_distance2(cPoint pa, cPoint pb):
+cdef inline double cPoint_distance2(cPoint pa, cPoint pb) nogil:
     return ((pa.x-pb.x)*(pa.x-pb.x) + (pa.y-pb.y)*(pa.y-pb.y) + 
                     (pa.z-pb.z)*(pa.z-pb.z))
 
-cdef inline double cPoint_length(cPoint pa):
+cdef inline double cPoint_distance2_dim(cPoint pa, cPoint pb, int dim) nogil:
+    """ Square of the distance along the first `dim` coordinates """
+    cdef double d2 = (pa.x-pb.x)*(pa.x-pb.x)
+    if dim > 1:
+        d2 += (pa.y-pb.y)*(pa.y-pb.y)
+    if dim > 2:
+        d2 += (pa.z-pb.z)*(pa.z-pb.z)
+    return d2
+
+cdef inline double cPoint_length(cPoint pa) nogil:
     return sqrt(cPoint_norm(pa))
 
-cdef inline cPoint cPoint_scale(cPoint p, double k):
+cdef inline cPoint cPoint_scale(cPoint p, double k) nogil:
     return cPoint_new(p.x*k, p.y*k, p.z*k)
 
-cdef inline cPoint normalized(cPoint p):
+cdef inline cPoint normalized(cPoint p) nogil:
     cdef double norm = cPoint_length(p)
     return cPoint_new(p.x/norm, p.y/norm, p.z/norm)
 
@@ -97,37 +107,38 @@ cdef inline Point Point_from_cPoint(cPoint p):
 cdef struct cIntPoint:
     int x, y, z
 
-cdef inline cIntPoint cIntPoint_new(int x, int y, int z):
-    cdef cIntPoint p = cIntPoint(x,y,z)
+cdef inline cIntPoint cIntPoint_new(int x, int y, int z) nogil:
+    cdef cIntPoint p
+    p.x = x; p.y = y; p.z = z
     return p
 
-cdef inline cIntPoint cIntPoint_sub(cIntPoint pa, cIntPoint pb):
+cdef inline cIntPoint cIntPoint_sub(cIntPoint pa, cIntPoint pb) nogil:
     return cIntPoint_new(pa.x-pb.x, pa.y-pb.y, pa.z-pb.z)
 
-cdef inline cIntPoint cIntPoint_add(cIntPoint pa, cIntPoint pb):
+cdef inline cIntPoint cIntPoint_add(cIntPoint pa, cIntPoint pb) nogil:
     return cIntPoint_new(pa.x+pb.x, pa.y+pb.y, pa.z+pb.z)
 
-cdef inline long cIntPoint_dot(cIntPoint pa, cIntPoint pb):
+cdef inline long cIntPoint_dot(cIntPoint pa, cIntPoint pb) nogil:
     return pa.x*pb.x + pa.y*pb.y + pa.z*pb.z
 
-cdef inline long cIntPoint_norm(cIntPoint p):
+cdef inline long cIntPoint_norm(cIntPoint p) nogil:
     return p.x*p.x + p.y*p.y + p.z*p.z
 
-cdef inline double cIntPoint_length(cIntPoint pa):
+cdef inline double cIntPoint_length(cIntPoint pa) nogil:
     return sqrt(cIntPoint_norm(pa))
 
-cdef inline long cIntPoint_distance2(cIntPoint pa, cIntPoint pb):
+cdef inline long cIntPoint_distance2(cIntPoint pa, cIntPoint pb) nogil:
     return ((pa.x-pb.x)*(pa.x-pb.x) +
             (pa.y-pb.y)*(pa.y-pb.y) + 
             (pa.z-pb.z)*(pa.z-pb.z))
 
-cdef inline double cIntPoint_distance(cIntPoint pa, cIntPoint pb):
+cdef inline double cIntPoint_distance(cIntPoint pa, cIntPoint pb) nogil:
     return sqrt(cIntPoint_distance2(pa, pb))
 
-cdef inline cIntPoint cIntPoint_scale(cIntPoint p, int k):
+cdef inline cIntPoint cIntPoint_scale(cIntPoint p, int k) nogil:
     return cIntPoint_new(p.x*k, p.y*k, p.z*k)
 
-cdef inline bint cIntPoint_is_equal(cIntPoint pa, cIntPoint pb):
+cdef inline bint cIntPoint_is_equal(cIntPoint pa, cIntPoint pb) nogil:
     return (pa.x == pb.x and pa.y == pb.y and pa.z == pb.z)
 
 cdef class IntPoint:
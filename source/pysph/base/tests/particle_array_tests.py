@@ -562,6 +562,34 @@ class ParticleArrayTest(unittest.TestCase):
                          True)
         self.assertEqual(check_array(p1.s, [0, 0, 0, 0, 0, 2, 3, 4, 5, 0]), True)
     
+    def test_reorder(self):
+        """
+        Tests the reorder function.
+        """
+        p = particle_array.ParticleArray()
+        p.add_property({'name':'x', 'data':[1., 2., 3., 4.]})
+        p.add_property({'name':'t', 'type':'int', 'data':[5, 6, 7, 8]})
+        p.add_temporary_array('tmp')
+        p.align_particles()
+        p.is_dirty = False
+
+        permutation = LongArray(4)
+        permutation.set_data(numpy.array([2, 0, 3, 1]))
+
+        p.reorder(permutation)
+
+        self.assertEqual(check_array(p.x, [3., 1., 4., 2.]), True)
+        self.assertEqual(check_array(p.t, [7, 5, 8, 6]), True)
+
+        # the persistent id follows the particles
+        self.assertEqual(check_array(p.idx, [2, 0, 3, 1]), True)
+        self.assertEqual(p.is_dirty, True)
+
+        # not a permutation
+        permutation.set_data(numpy.array([0, 0, 1, 2]))
+        self.assertRaises(ValueError, p.reorder, permutation)
+        self.assertRaises(ValueError, p.reorder, LongArray(3))
+
     def test_pickle(self):
         """
         Tests the pickle and unpicle functions
@@ -579,6 +607,108 @@ class ParticleArrayTest(unittest.TestCase):
         self.assertEqual(len(p1.x), len(p2.x))
         check_array(p1.x, p2.x)
 
+    def test_view(self):
+        """ Tests the views of the properties """
+        p = particle_array.ParticleArray(x={'data':[1., 2., 3.]},
+                                         tag={'data':[0, 0, 1]})
+        p.align_particles()
+
+        x = p.view('x')
+        self.assertEqual(len(x), 2)
+        self.assertEqual(len(p.view('x', real_only=False)), 3)
+
+        x[:] = [10., 20.]
+        self.assertEqual(check_array(p.get('x'), [10., 20.]), True)
+
+        self.assertRaises(AttributeError, p.view, 'y')
+
+        gen = p.get_carray('x').generation
+        p.extend(10)
+        self.assertEqual(p.get_carray('x').generation != gen, True)
+
+    def test_single_precision(self):
+        """ Tests the single precision storage of the bulk properties """
+        from pysph.base.particles import get_particle_array
+        x = numpy.arange(10.0)
+        p = get_particle_array(x=x, rho=x + 0.1, precision='single')
+
+        for prop in ['u', 'v', 'w', 'm', 'rho', 'p', 'e', 'cs']:
+            self.assertEqual(p.get_carray(prop).get_c_type(), 'float')
+        for prop in ['x', 'y', 'z', 'h']:
+            self.assertEqual(p.get_carray(prop).get_c_type(), 'double')
+
+        rho32 = numpy.asarray(x + 0.1, dtype=numpy.float32)
+        self.assertEqual(check_array(p.get('rho'), rho32), True)
+
+        p = get_particle_array(x=x, rho=x + 0.1)
+        self.assertEqual(p.get_carray('rho').get_c_type(), 'double')
+
+        self.assertRaises(ValueError, get_particle_array, x=x,
+                          precision='half')
+
+    def test_mmap_storage(self):
+        """ Tests the file-mapped storage of the properties """
+        import os, shutil, tempfile
+        from pysph.base.particles import get_particle_array
+        dirname = tempfile.mkdtemp()
+        try:
+            self.assertRaises(ValueError, particle_array.ParticleArray,
+                              storage='mmap')
+            self.assertRaises(ValueError, particle_array.ParticleArray,
+                              storage='disk')
+
+            x = numpy.arange(10.0)
+            p = get_particle_array(name='fluid', x=x, storage='mmap',
+                                   path=dirname)
+            self.assertEqual(p.storage, 'mmap')
+            self.assertEqual(check_array(p.x, x), True)
+
+            paths = []
+            for prop in p.properties:
+                arr = p.get_carray(prop)
+                self.assertEqual(arr.mapped, True)
+                self.assertEqual(os.path.dirname(arr.mmap_path), dirname)
+                self.assertEqual(os.path.exists(arr.mmap_path), True)
+                paths.append(arr.mmap_path)
+            self.assertEqual(len(set(paths)), len(paths))
+
+            # an array of the same name does not overwrite the files
+            p2 = get_particle_array(name='fluid', x=2*x, storage='mmap',
+                                    path=dirname)
+            self.assertEqual(check_array(p.x, x), True)
+            self.assertEqual(check_array(p2.x, 2*x), True)
+            self.assertEqual(p2.get_carray('x').mmap_path in paths, False)
+
+            # clearing leaves the old carrays intact
+            xarr = p2.get_carray('x')
+            p2.clear()
+            self.assertEqual(check_array(xarr.get_npy_array(), 2*x), True)
+            self.assertEqual(p2.get_carray('tag').mapped, True)
+            del p2, xarr
+
+            # the storage is pickled
+            p3 = pickle.loads(pickle.dumps(p))
+            self.assertEqual(p3.storage, 'mmap')
+            self.assertEqual(p3.storage_path, dirname)
+            self.assertEqual(p3.get_carray('x').mapped, True)
+            self.assertEqual(check_array(p3.x, x), True)
+            del p3
+
+            # properties added later are mapped as well
+            p.add_property({'name':'_k1_x'})
+            p.add_temporary_array('tmp')
+            self.assertEqual(p.get_carray('_k1_x').mapped, True)
+            self.assertEqual(p.temporary_arrays['tmp'].mapped, True)
+
+            # growth
+            p.extend(90)
+            self.assertEqual(p.get_number_of_particles(), 100)
+            xall = p.get('x', only_real_particles=False)
+            self.assertEqual(check_array(xall[:10], x), True)
+            del p
+        finally:
+            shutil.rmtree(dirname)
+
 if __name__ == '__main__':
     import logging
     logger = logging.getLogger()
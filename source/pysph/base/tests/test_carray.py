@@ -272,6 +272,89 @@ class TestLongArray(unittest.TestCase):
         l1_load = pickle.loads(l1_dump)
         self.assertEqual((l1_load.get_npy_array() == l1.get_npy_array()).all(), True)
 
+    def test_buffer(self):
+        """
+        Tests the buffer protocol and the generation.
+        """
+        l1 = LongArray(10)
+        l1.set_data(numpy.arange(10))
+
+        a = numpy.asarray(l1)
+        self.assertEqual(a.dtype, l1.get_npy_array().dtype)
+        self.assertEqual(a.shape, (10,))
+        self.assertEqual((a == numpy.arange(10)).all(), True)
+
+        # writes go to the array
+        a[3] = 30
+        self.assertEqual(l1[3], 30)
+
+        m = memoryview(l1)
+        self.assertEqual(len(m), 10)
+        self.assertEqual(m.readonly, False)
+
+        # the generation changes with the length or the buffer
+        gen = l1.generation
+        l1[2] = 20
+        self.assertEqual(l1.generation, gen)
+        l1.append(10)
+        self.assertEqual(l1.generation > gen, True)
+
+        gen = l1.generation
+        l1.resize(11)
+        self.assertEqual(l1.generation, gen)
+        l1.resize(5)
+        self.assertEqual(l1.generation > gen, True)
+
+    def test_use_mmap(self):
+        """
+        Tests the file-mapped storage.
+        """
+        import os, shutil, tempfile
+        dirname = tempfile.mkdtemp()
+        try:
+            l1 = LongArray(10)
+            l1.set_data(numpy.arange(10))
+            self.assertEqual(l1.mapped, False)
+
+            l1.use_mmap(dirname)
+            self.assertEqual(l1.mapped, True)
+            path = l1.mmap_path
+            self.assertEqual(os.path.dirname(path), dirname)
+            self.assertEqual(os.path.exists(path), True)
+            self.assertEqual(numpy.allclose(l1.get_npy_array(),
+                                            numpy.arange(10)), True)
+
+            self.assertRaises(ValueError, l1.use_mmap, dirname)
+
+            # another array in the directory gets its own file
+            l2 = LongArray(5)
+            l2.set_data(numpy.ones(5))
+            l2.use_mmap(dirname)
+            self.assertNotEqual(l2.mmap_path, path)
+            self.assertEqual(numpy.allclose(l1.get_npy_array(),
+                                            numpy.arange(10)), True)
+            self.assertEqual(numpy.allclose(l2.get_npy_array(),
+                                            numpy.ones(5)), True)
+
+            # growing remaps the file
+            for i in range(10, 100):
+                l1.append(i)
+            self.assertEqual(l1.length, 100)
+            self.assertEqual(numpy.allclose(l1.get_npy_array(),
+                                            numpy.arange(100)), True)
+
+            l1.remove(numpy.array([0, 1]))
+            l1.squeeze()
+            self.assertEqual(l1.length, 98)
+            self.assertEqual(l1[0], 99)
+
+            # the file is removed with the array
+            del l1
+            self.assertEqual(os.path.exists(path), False)
+            del l2
+        finally:
+            shutil.rmtree(dirname)
+
 if __name__ == '__main__':
     unittest.main()
         
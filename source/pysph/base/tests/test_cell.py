@@ -60,6 +60,46 @@ class TestModuleFunctions(unittest.TestCase):
         self.assertEqual(out.y, -2)
         self.assertEqual(out.z, 1)
 
+    def test_construct_immediate_neighbor_list(self):
+        """Tests the stencils in one, two and three dimensions."""
+        cid = IntPoint(1, 2, 3)
+        for dim, num_cells in ((1, 3), (2, 9), (3, 27)):
+            nbrs = []
+            py_construct_immediate_neighbor_list(cid, nbrs, dim=dim)
+            self.assertEqual(len(nbrs), num_cells)
+            self.assertEqual(nbrs.count(cid), 1)
+
+            for nid in nbrs:
+                if dim < 3:
+                    self.assertEqual(nid.z, 3)
+                if dim < 2:
+                    self.assertEqual(nid.y, 2)
+
+            # without the cell itself
+            nbrs = []
+            py_construct_immediate_neighbor_list(cid, nbrs, False, dim=dim)
+            self.assertEqual(len(nbrs), num_cells - 1)
+            self.assertEqual(nbrs.count(cid), 0)
+            self.assertEqual(len(set([(n.x, n.y, n.z) for n in nbrs])),
+                             num_cells - 1)
+
+    def test_clip_cell_row(self):
+        """Tests the clipping of a row of cells to a sphere."""
+        pnt = Point(0.25, 0.25, 0.25)
+
+        # the row through the point spans the diameter
+        self.assertEqual(py_clip_cell_row(pnt, 1.0, 0, 0, 0.5), (-2, 2))
+
+        # a row near the rim is shorter
+        self.assertEqual(py_clip_cell_row(pnt, 1.0, 2, 0, 0.5), (-1, 1))
+
+        # a corner row misses the sphere
+        self.assertEqual(py_clip_cell_row(pnt, 1.0, 2, 2, 0.5), None)
+
+        # the z index is ignored in 2D
+        self.assertEqual(py_clip_cell_row(pnt, 1.0, 0, 5, 0.5, 2),
+                         (-2, 2))
+
 
 class TestCell(unittest.TestCase):
     """Tests for the Cell base class."""
@@ -404,21 +444,71 @@ class CellTestCase(unittest.TestCase):
         for i in range(original_length2, original_length2+2):
             self.assertEqual(tag2[i], GhostParticle)
 
-    def test_create_ghost_cells(self):
+    def test_periodic_domain(self):
         cm = CellManager(arrays_to_bin=[self.pa1, self.pa2],
                          periodic_domain=self.periodic_domain)
 
-        cells = cm.cells_dict
-
-        self.assertEqual(len(cells), 28)
+        # no ghost particles are created for the periodic images
 
-        # test deletion of ghost particles
-
-        cm.remove_ghost_particles()
+        self.assertEqual(self.pa1.num_real_particles, 25)
+        self.assertEqual(self.pa2.num_real_particles, 25)
 
         self.assertEqual(self.pa1.get_number_of_particles(), 25)
         self.assertEqual(self.pa2.get_number_of_particles(), 25)
 
+        # particles leaving the domain are moved to their image
+
+        x = self.pa1.get('x')
+        x[4] = 1.125
+        x[5] = -0.375
+        self.pa1.set(x=x)
+        self.pa1.set_dirty(True)
+
+        cm.update()
+
+        x = self.pa1.get('x')
+        self.assertAlmostEqual(x[4], -0.075, 10)
+        self.assertAlmostEqual(x[5], 0.825, 10)
+
+        for cell in cm.cells_dict.values():
+            self.assertEqual(cell.index_lists[0].length +
+                             cell.index_lists[1].length,
+                             cell.get_number_of_particles())
+
+        num_particles = sum([cell.get_number_of_particles() for cell in
+                             cm.cells_dict.values()])
+        self.assertEqual(num_particles, 50)
+
+    def test_periodic_images(self):
+        domain = PeriodicDomain(xmin=0.0, xmax=1.0, ymin=0.0, ymax=2.0)
+
+        # positions outside the domain are wrapped
+
+        pnt = Point(1.25, -0.5, 3.0)
+        domain.py_wrap(pnt)
+        self.assertAlmostEqual(pnt.x, 0.25, 10)
+        self.assertAlmostEqual(pnt.y, 1.5, 10)
+        self.assertAlmostEqual(pnt.z, 3.0, 10)
+
+        # the nearest image is within half a period of the reference
+
+        pnt = Point(0.9, 0.1, 0.0)
+        domain.py_nearest_image(pnt, Point(0.1, 1.9, 0.0))
+        self.assertAlmostEqual(pnt.x, -0.1, 10)
+        self.assertAlmostEqual(pnt.y, 2.1, 10)
+
+        # a point in the interior needs no images
+
+        shifts = domain.py_get_image_shifts(Point(0.5, 1.0, 0.0), 0.1)
+        self.assertEqual(len(shifts), 1)
+
+        # a point near a corner sees the images across both boundaries
+
+        shifts = domain.py_get_image_shifts(Point(0.95, 0.05, 0.0), 0.1)
+        self.assertEqual(len(shifts), 4)
+        self.assertEqual((shifts[0].x, shifts[0].y, shifts[0].z),
+                         (0.0, 0.0, 0.0))
+
 ###############################################################################
 # `TestCellManager` class.
 ###############################################################################
@@ -569,6 +659,86 @@ class TestCellManager(unittest.TestCase):
         # further checking is not needed, the update test of the RootCell
         # would have handled that.
 
+    def test_flat_index(self):
+        """Tests binning with the flat index."""
+        p_arrs = generate_sample_dataset_2()
+        cm = CellManager(arrays_to_bin=p_arrs, min_cell_size=1.,
+                         max_cell_size=2., use_flat_index=True)
+
+        # the cells dict is not used
+        self.assertEqual(len(cm.cells_dict), 0)
+
+        # box of cells from (-1, -1, 0) to (2, 2, 0)
+        self.assertEqual(cm.num_flat_cells, 16)
+
+        count = cm.cell_count[0].get_npy_array()
+        self.assertEqual(numpy.sum(count), 7)
+        self.assertEqual(numpy.sum(count > 0), 7)
+
+        sorted_index = cm.sorted_index[0].get_npy_array()
+        self.assertEqual(sorted(sorted_index), range(7))
+
+        cids = [IntPoint(-1, 2, 0), IntPoint(-1, -1, 0), IntPoint(0, 1, 0),
+                IntPoint(0, 0, 0), IntPoint(1, 0, 0), IntPoint(2, 0, 0),
+                IntPoint(2, -1, 0)]
+
+        for i, cid in enumerate(cids):
+            self.assertEqual(list(cm.get_flat_cell_particles(cid)), [i])
+
+        self.assertEqual(len(cm.get_flat_cell_particles(IntPoint(5,5,5))), 0)
+
+        # move a particle and rebin
+        x = p_arrs[0].get('x')
+        x[3] = -0.5
+        p_arrs[0].set(x=x)
+
+        cm.py_update_status()
+        cm.py_update()
+
+        self.assertEqual(list(cm.get_flat_cell_particles(cids[3])), [])
+        self.assertEqual(list(cm.get_flat_cell_particles(
+            IntPoint(-1, 0, 0))), [3])
+
+        # switch back to the cells dict
+        cm.set_use_flat_index(False)
+        self.assertEqual(len(cm.cells_dict), 7)
+
+    def test_flat_index_fallback(self):
+        """Tests the cells dict binning for a too large flat index box."""
+        p_arrs = generate_sample_dataset_2()
+        cm = CellManager(arrays_to_bin=p_arrs, min_cell_size=1.,
+                         max_cell_size=2., use_flat_index=True)
+        cm.max_flat_cells = 100
+        self.assertTrue(cm.flat_index_active)
+
+        # a stray particle far from the others
+
+        x = p_arrs[0].get('x')
+        x[3] = 1e6
+        p_arrs[0].set(x=x)
+
+        cm.py_update_status()
+        cm.py_update()
+
+        self.assertFalse(cm.flat_index_active)
+        self.assertEqual(cm.num_flat_cells, 16)
+        self.assertEqual(len(cm.cells_dict), 7)
+        self.assertEqual(list(cm.cells_dict[IntPoint(1000000, 0, 0)].
+                              index_lists[0].get_npy_array()), [3])
+
+        # back to the flat index once the particle has returned
+
+        x[3] = 0.5
+        p_arrs[0].set(x=x)
+
+        cm.py_update_status()
+        cm.py_update()
+
+        self.assertTrue(cm.flat_index_active)
+        self.assertEqual(len(cm.cells_dict), 0)
+        self.assertEqual(list(cm.get_flat_cell_particles(
+            IntPoint(0, 0, 0))), [3])
+
     def test_update(self):
         """Tests the update function.
 
@@ -833,6 +1003,99 @@ class TestCellManager(unittest.TestCase):
         # we should get all the cells
         self.assertEqual(len(cell_list), len(cm.cells_dict))
 
+    def test_get_potential_cells_dimension(self):
+        """Tests the potential cells of a 2D problem. """
+        p_arrs = generate_sample_dataset_2()
+        cm = CellManager(arrays_to_bin=p_arrs, min_cell_size=1.,
+                         max_cell_size=1.)
+        cm2 = CellManager(arrays_to_bin=p_arrs, min_cell_size=1.,
+                          max_cell_size=1., dimension=2)
+
+        self.assertEqual(cm.dimension, 3)
+        self.assertEqual(cm2.dimension, 2)
+        self.assertRaises(ValueError, CellManager, p_arrs, dimension=4)
+
+        cm.set_dimension(1)
+        self.assertEqual(cm.dimension, 1)
+        self.assertRaises(ValueError, cm.set_dimension, 0)
+        self.assertEqual(cm.dimension, 1)
+        cm.set_dimension(3)
+
+        # the particles of the data set are in the plane z = 0
+
+        for pnt in (Point(0.5, 0.5, 0.0), Point(1.5, -0.5, 0.0)):
+            cell_list = []
+            cm.py_get_potential_cells(pnt, 1.0, cell_list)
+            cell_list2 = []
+            cm2.py_get_potential_cells(pnt, 1.0, cell_list2)
+
+            ids = sorted([(c.id.x, c.id.y, c.id.z) for c in cell_list])
+            ids2 = sorted([(c.id.x, c.id.y, c.id.z) for c in cell_list2])
+            self.assertEqual(ids, ids2)
+
+    def test_get_potential_cells_subdivisions(self):
+        """Tests the potential cells of subdivided cells. """
+        x, y, z = numpy.random.random((3, 200))
+        h = numpy.ones_like(x) * 0.1
+        parr = ParticleArray(name='parr', **{'x':{'data':x}, 'y':{'data':y},
+                                             'z':{'data':z}, 'h':{'data':h}})
+
+        cm = CellManager(arrays_to_bin=[parr])
+        cm3 = CellManager(arrays_to_bin=[parr], cell_subdivisions=3)
+
+        self.assertAlmostEqual(cm3.cell_size, cm.cell_size/3)
+        self.assertRaises(ValueError, CellManager, [parr],
+                          cell_subdivisions=0)
+
+        # the cells of the box in the corners are skipped
+
+        pnt = Point(0.5, 0.5, 0.5)
+        radius = cm.cell_size
+
+        cell_list = []
+        cm3.py_get_potential_cells(pnt, radius, cell_list)
+        self.assertTrue(len(cell_list) < 7**3)
+
+        for cell in cell_list:
+            centroid = Point()
+            cell.py_get_centroid(centroid)
+            self.assertTrue((centroid - pnt).length() <
+                            radius + cm3.cell_size*numpy.sqrt(3)/2)
+
+    def test_subdivisions_jump_tolerance(self):
+        """Tests a move by more than a cell and less than a radius. """
+        x = numpy.linspace(0, 1, 11)
+        y = numpy.zeros_like(x)
+        z = numpy.zeros_like(x)
+        h = numpy.ones_like(x) * 0.1
+        parr = ParticleArray(name='parr', **{'x':{'data':x}, 'y':{'data':y},
+                                             'z':{'data':z}, 'h':{'data':h}})
+
+        cm = CellManager(arrays_to_bin=[parr], cell_subdivisions=3)
+        self.assertEqual(cm.jump_tolerance, 3)
+
+        # an explicit cell size is subdivided as well
+
+        cm2 = CellManager(arrays_to_bin=[parr], min_cell_size=0.3,
+                          cell_subdivisions=3)
+        self.assertAlmostEqual(cm2.cell_size, 0.1)
+
+        # move a particle by two cells, less than the radius of 3 cells
+
+        x[5] += 2.5*cm.cell_size
+        parr.set(x=x)
+
+        cm.py_update_status()
+        cm.py_update()
+
+        cid = int(numpy.floor(x[5]/cm.cell_size))
+        for cell in cm.cells_dict.values():
+            if 5 in cell.index_lists[0].get_npy_array():
+                self.assertEqual(cell.id.x, cid)
+                break
+        else:
+            self.fail('particle 5 is not binned')
+
     def test_cells_update(self):
         """Tests the update function."""
         p_arrs = generate_sample_dataset_2()
@@ -1038,5 +1038,193 @@ class TestW10Kernel2D(KernelTestCase2D):
 
 ###############################################################################
 
+###############################################################################
+#`TestKernelTables`
+###############################################################################
+class TestKernelTables(unittest.TestCase):
+    """ Tests the tabulated kernels against the exact kernels.
+
+    The error is relative to the largest value of the kernel (gradient)
+    at the sampled points. With the default table size, linear
+    interpolation is within 1e-4 and cubic interpolation within 1e-6.
+
+    """
+
+    kernel_dims = [(kernels.CubicSplineKernel, (1, 2, 3)),
+                   (kernels.QuinticSplineKernel, (2,)),
+                   (kernels.WendlandQuinticSplineKernel, (2,)),
+                   (kernels.HarmonicKernel, (1, 2, 3)),
+                   (kernels.M6SplineKernel, (1, 2, 3)),
+                   (kernels.GaussianKernel, (1, 2, 3)),
+                   (kernels.W8Kernel, (1, 2, 3)),
+                   (kernels.W10Kernel, (1, 2, 3)),
+                   (kernels.Poly6Kernel, (3,))]
+
+    def check_table(self, order, tolerance):
+        numpy.random.seed(0)
+        pnt = Point()
+        grad = Point()
+        tgrad = Point()
+
+        for kernel_class, dims in self.kernel_dims:
+            for dim in dims:
+                kernel = kernel_class(dim=dim)
+                tkernel = kernel_class(dim=dim)
+                tkernel.set_table(order)
+
+                self.assertTrue(tkernel.use_table)
+                self.assertEqual(tkernel.table_order, order)
+
+                for h in (0.01, 0.13, 1.0):
+                    r = numpy.random.random((200, 3)) * kernel.radius()*h
+                    r[:, dim:] = 0
+                    r /= numpy.sqrt(3)
+
+                    w = []; tw = []; g = []; tg = []
+                    for x, y, z in r:
+                        p = Point(x, y, z)
+                        w.append(kernel.py_function(pnt, p, h))
+                        tw.append(tkernel.py_function(pnt, p, h))
+
+                        kernel.py_gradient(pnt, p, h, grad)
+                        tkernel.py_gradient(pnt, p, h, tgrad)
+                        g.append(grad.asarray())
+                        tg.append(tgrad.asarray())
+
+                    w = numpy.array(w); tw = numpy.array(tw)
+                    g = numpy.array(g); tg = numpy.array(tg)
+
+                    msg = '%s in %dD'%(kernel_class.__name__, dim)
+                    self.assertTrue(numpy.abs(tw - w).max() <=
+                                    tolerance*numpy.abs(w).max(), msg)
+                    self.assertTrue(numpy.abs(tg - g).max() <=
+                                    tolerance*numpy.abs(g).max(), msg)
+
+                # back to the exact kernel
+                tkernel.set_table(0)
+                self.assertFalse(tkernel.use_table)
+
+    def test_linear_table(self):
+        """ Tests the linear interpolation of the tables """
+        self.check_table(1, 1e-4)
+
+    def test_cubic_table(self):
+        """ Tests the cubic interpolation of the tables """
+        self.check_table(3, 1e-6)
+
+    def test_set_table(self):
+        """ Tests the table parameters """
+        kernel = kernels.CubicSplineKernel(dim=2)
+        self.assertFalse(kernel.use_table)
+
+        # the tables are only turned on by building them
+        self.assertRaises(AttributeError, setattr, kernel, 'use_table', True)
+        self.assertFalse(kernel.use_table)
+
+        self.assertRaises(ValueError, kernel.set_table, 2)
+        self.assertRaises(ValueError, kernel.set_table, 1, 1)
+
+        kernel.set_table(3, 500)
+        self.assertAlmostEqual(kernel.table_dq, 2.0/500)
+        self.assertEqual(kernel.table_w.length, 504)
+
+        # zero beyond the support
+        self.assertEqual(kernel.py_function(Point(), Point(2.5), 1.0), 0)
+
+###############################################################################
+#`TestInlineKernels`
+###############################################################################
+class TestInlineKernels(unittest.TestCase):
+    """ Tests the inlined kernel evaluation against the kernel methods """
+
+    kernel_dims = [(kernels.CubicSplineKernel, (1, 2, 3), 1),
+                   (kernels.QuinticSplineKernel, (2,), 3),
+                   (kernels.WendlandQuinticSplineKernel, (2,), 4),
+                   (kernels.GaussianKernel, (1, 2, 3), 2),
+                   (kernels.M6SplineKernel, (1, 2, 3), 0),
+                   (kernels.Poly6Kernel, (3,), 0)]
+
+    def test_evaluate(self):
+        numpy.random.seed(0)
+        pnt = Point()
+        grad = Point()
+        igrad = Point()
+
+        for kernel_class, dims, inline_type in self.kernel_dims:
+            for dim in dims:
+                kernel = kernel_class(dim=dim)
+                self.assertEqual(kernel.inline_type, inline_type)
+
+                for h in (0.01, 1.0):
+                    r = numpy.random.random((50, 3)) * kernel.radius()*h
+                    r[:, dim:] = 0
+                    r /= numpy.sqrt(3)
+
+                    for x, y, z in r:
+                        p = Point(x, y, z)
+                        w = kernel.py_function(pnt, p, h)
+                        iw = kernel.py_evaluate_function(pnt, p, h)
+                        self.assertTrue(numpy.allclose(iw, w, 1e-12, 0))
+
+                        kernel.py_gradient(pnt, p, h, grad)
+                        kernel.py_evaluate_gradient(pnt, p, h, igrad)
+                        self.assertTrue(numpy.allclose(
+                            igrad.asarray(), grad.asarray(), 1e-12, 0))
+
+###############################################################################
+#`TestKernelArrays`
+###############################################################################
+class TestKernelArrays(unittest.TestCase):
+    """ Tests the array evaluation of the kernels """
+
+    kernel_classes = [kernels.CubicSplineKernel, kernels.GaussianKernel,
+                      kernels.M6SplineKernel, kernels.W8Kernel]
+
+    def test_arrays(self):
+        numpy.random.seed(0)
+        pnt = Point()
+        grad = Point()
+
+        for kernel_class in self.kernel_classes:
+            kernel = kernel_class(dim=2)
+
+            x = numpy.random.random(100) - 0.5
+            y = numpy.random.random(100) - 0.5
+            h = 0.1 + 0.5 * numpy.random.random(100)
+
+            w = kernel.py_function_array(x, y, h=h)
+            gx, gy, gz = kernel.py_gradient_array(x, y, h=h)
+
+            self.assertEqual(w.shape, (100,))
+            self.assertEqual(gz.shape, (100,))
+
+            for i in range(100):
+                p = Point(x[i], y[i])
+                self.assertAlmostEqual(w[i], kernel.py_function(p, pnt, h[i]),
+                                       10)
+
+                kernel.py_gradient(p, pnt, h[i], grad)
+                self.assertAlmostEqual(gx[i], grad.x, 8)
+                self.assertAlmostEqual(gy[i], grad.y, 8)
+                self.assertEqual(gz[i], 0)
+
+    def test_broadcast(self):
+        kernel = kernels.CubicSplineKernel(dim=1)
+
+        x = numpy.linspace(-2, 2, 41)
+        h = numpy.array([[0.5], [1.0]])
+
+        w = kernel.py_function_array(x, h=h)
+        self.assertEqual(w.shape, (2, 41))
+        for i in range(41):
+            self.assertAlmostEqual(
+                w[1, i], kernel.py_function(Point(x[i]), Point(), 1.0), 10)
+
+        # scalars give 0-d arrays
+        self.assertAlmostEqual(float(kernel.py_function_array(0.0)),
+                               kernel.py_function(Point(), Point(), 1.0), 10)
+
+###############################################################################
+
 if __name__ == '__main__':
     unittest.main()
@@ -9,6 +9,8 @@ from pysph.base.tests.common_data import *
 from pysph.base.cell import *
 from pysph.base.point import Point
 from pysph.base.carray import *
+from pysph.base.tree import TreeQueryType
+from pysph.base.particles import get_particle_array
 
 def generate_sample_dataset_2_nnps_test():
     """
@@ -176,6 +178,143 @@ class TestNbrParticleLocatorBase(unittest.TestCase):
         for i in range(3):
             self.assertEqual(a.count(i), 1)
 
+    def test_flat_index(self):
+        """Tests neighbor queries served from the flat index. """
+        x, y, z = numpy.random.random((3, 500))
+        h = numpy.ones_like(x) * 0.1
+        parr = ParticleArray(name='parr', **{'x':{'data':x}, 'y':{'data':y},
+                                             'z':{'data':z}, 'h':{'data':h}})
+        cm = CellManager(arrays_to_bin=[parr], min_cell_size=0.2,
+                         max_cell_size=0.2)
+        flat_cm = CellManager(arrays_to_bin=[parr], min_cell_size=0.2,
+                              max_cell_size=0.2, use_flat_index=True)
+
+        nbrl = NbrParticleLocatorBase(parr, cm)
+        flat_nbrl = NbrParticleLocatorBase(parr, flat_cm)
+
+        output_array = LongArray()
+        flat_output_array = LongArray()
+        for i in range(0, 500, 7):
+            pnt = Point(x[i], y[i], z[i])
+            for radius in (0.05, 0.2, 0.35):
+                output_array.reset()
+                flat_output_array.reset()
+
+                nbrl.py_get_nearest_particles_to_point(pnt, radius,
+                                                       output_array, i)
+                flat_nbrl.py_get_nearest_particles_to_point(
+                    pnt, radius, flat_output_array, i)
+
+                self.assertEqual(sorted(output_array.get_npy_array()),
+                                 sorted(flat_output_array.get_npy_array()))
+
+    def test_dimension(self):
+        """Tests the queries of a 2D problem. """
+        x, y = numpy.random.random((2, 500))
+        z = numpy.zeros_like(x)
+        h = numpy.ones_like(x) * 0.1
+        parr = ParticleArray(name='parr', **{'x':{'data':x}, 'y':{'data':y},
+                                             'z':{'data':z}, 'h':{'data':h}})
+
+        locators = []
+        for use_flat_index in (False, True):
+            for dimension in (2, 3):
+                cm = CellManager(arrays_to_bin=[parr], min_cell_size=0.2,
+                                 max_cell_size=0.2, dimension=dimension,
+                                 use_flat_index=use_flat_index)
+                locators.append(NbrParticleLocatorBase(parr, cm))
+
+        output_array = LongArray()
+        for i in range(0, 500, 7):
+            pnt = Point(x[i], y[i], z[i])
+            for radius in (0.05, 0.2, 0.35):
+                nbrs = []
+                for nbrl in locators:
+                    output_array.reset()
+                    nbrl.py_get_nearest_particles_to_point(pnt, radius,
+                                                           output_array, i)
+                    nbrs.append(sorted(output_array.get_npy_array()))
+
+                for other in nbrs[1:]:
+                    self.assertEqual(other, nbrs[0])
+
+    def test_get_nearest_particles_to_points(self):
+        """Tests the batched point queries. """
+        x, y, z = numpy.random.random((3, 300))
+        h = numpy.ones_like(x) * 0.1
+        parr = ParticleArray(name='parr', **{'x':{'data':x}, 'y':{'data':y},
+                                             'z':{'data':z}, 'h':{'data':h}})
+
+        px, py, pz = numpy.random.random((3, 50))
+        radius = numpy.random.random(50) * 0.3
+
+        for use_flat_index in (False, True):
+            cm = CellManager(arrays_to_bin=[parr], min_cell_size=0.2,
+                             max_cell_size=0.2,
+                             use_flat_index=use_flat_index)
+            nbrl = NbrParticleLocatorBase(parr, cm)
+
+            offsets, indices, distances = \
+                nbrl.get_nearest_particles_to_points(px, py, pz, radius,
+                                                     return_distances=True)
+            self.assertEqual(offsets.length, 51)
+            self.assertEqual(offsets[50], indices.length)
+            self.assertEqual(distances.length, indices.length)
+
+            output_array = LongArray()
+            for i in range(50):
+                output_array.reset()
+                nbrl.py_get_nearest_particles_to_point(
+                    Point(px[i], py[i], pz[i]), radius[i], output_array)
+
+                nbrs = indices.get_npy_array()[offsets[i]:offsets[i+1]]
+                self.assertEqual(list(nbrs),
+                                 list(output_array.get_npy_array()))
+
+                for k in range(offsets[i], offsets[i+1]):
+                    j = indices[k]
+                    d = numpy.sqrt((x[j] - px[i])**2 + (y[j] - py[i])**2 +
+                                   (z[j] - pz[i])**2)
+                    self.assertAlmostEqual(distances[k], d, 10)
+
+            # a single radius for all points
+            offsets, indices = nbrl.get_nearest_particles_to_points(
+                px, py, pz, 0.2)
+            self.assertEqual(offsets.length, 51)
+
+            self.assertRaises(ValueError,
+                              nbrl.get_nearest_particles_to_points,
+                              px, py[:10], pz, 0.2)
+
+    def test_cell_subdivisions(self):
+        """Tests the queries with cells smaller than the radius. """
+        x, y, z = numpy.random.random((3, 500))
+        h = numpy.ones_like(x) * 0.1
+        parr = ParticleArray(name='parr', **{'x':{'data':x}, 'y':{'data':y},
+                                             'z':{'data':z}, 'h':{'data':h}})
+
+        locators = []
+        for use_flat_index in (False, True):
+            for cell_subdivisions in (1, 2, 3):
+                cm = CellManager(arrays_to_bin=[parr],
+                                 cell_subdivisions=cell_subdivisions,
+                                 use_flat_index=use_flat_index)
+                locators.append(NbrParticleLocatorBase(parr, cm))
+
+        output_array = LongArray()
+        for i in range(0, 500, 7):
+            pnt = Point(x[i], y[i], z[i])
+            for radius in (0.05, 0.2, 0.35):
+                nbrs = []
+                for nbrl in locators:
+                    output_array.reset()
+                    nbrl.py_get_nearest_particles_to_point(pnt, radius,
+                                                           output_array, i)
+                    nbrs.append(sorted(output_array.get_npy_array()))
+
+                for other in nbrs[1:]:
+                    self.assertEqual(other, nbrs[0])
+
 
 ##############################################################################
 # `TestFixedDestNbrParticleLocator` class.
@@ -319,6 +458,300 @@ class TestFixedDestNbrParticleLocator(unittest.TestCase):
         nbrl.py_update()
         self.assertEqual(len(nbrl.particle_cache), 2)
 
+    def test_csr_cache(self):
+        """Tests the compressed sparse row layout of the cache. """
+        parrs = generate_sample_dataset_1()
+        cm = CellManager(arrays_to_bin=parrs, min_cell_size=1.,
+                         max_cell_size=2.0)
+
+        nbrl = FixedDestNbrParticleLocator(parrs[0], parrs[0], 1.0, cm)
+        nbrl.py_update()
+
+        np = parrs[0].get_number_of_particles()
+        offsets = nbrl.nbr_offsets.get_npy_array()
+        indices = nbrl.nbr_indices.get_npy_array()
+
+        self.assertEqual(len(offsets), np + 1)
+        self.assertEqual(offsets[0], 0)
+        self.assertEqual(offsets[-1], len(indices))
+
+        bnpl = NbrParticleLocatorBase(parrs[0], cm)
+        xa, ya, za = parrs[0].get('x'), parrs[0].get('y'), parrs[0].get('z')
+        a2 = LongArray()
+
+        for i in range(np):
+            nbrs = indices[offsets[i]:offsets[i+1]]
+
+            # self particle is last
+            self.assertEqual(nbrs[-1], i)
+
+            a2.reset()
+            bnpl.py_get_nearest_particles_to_point(Point(xa[i], ya[i], za[i]),
+                                                   1.0, a2)
+            self.assertEqual(set(nbrs), set(a2.get_npy_array()))
+
+            a1 = nbrl.py_get_nearest_particles(i, True)
+            self.assertEqual(list(a1.get_npy_array()), list(nbrs[:-1]))
+
+
+    def test_skin(self):
+        """Tests the reuse of the cache with a Verlet skin. """
+        x, y = numpy.mgrid[0:1:0.05, 0:1:0.05]
+        x = x.ravel(); y = y.ravel()
+        z = numpy.zeros_like(x)
+        h = numpy.ones_like(x) * 0.05
+        parr = ParticleArray(name='parr', **{'x':{'data':x}, 'y':{'data':y},
+                                             'z':{'data':z}, 'h':{'data':h}})
+        cm = CellManager(arrays_to_bin=[parr])
+
+        nbrl = FixedDestNbrParticleLocator(parr, parr, 2.0, cm)
+        skin_nbrl = FixedDestNbrParticleLocator(parr, parr, 2.0, cm,
+                                                skin=0.02)
+        nbrl.py_update()
+        skin_nbrl.py_update()
+        self.assertEqual(skin_nbrl.num_builds, 1)
+
+        def check():
+            for i in range(len(x)):
+                a1 = nbrl.py_get_nearest_particles(i, True)
+                a2 = skin_nbrl.py_get_nearest_particles(i, True)
+                self.assertEqual(list(a1.get_npy_array()),
+                                 list(a2.get_npy_array()))
+
+        check()
+
+        # move the particles by less than half the skin
+        numpy.random.seed(0)
+        parr.set(x=x + numpy.random.uniform(-0.005, 0.005, len(x)))
+
+        nbrl.py_update_status()
+        skin_nbrl.py_update_status()
+        cm.py_update_status()
+        self.assertEqual(nbrl.is_dirty, True)
+        self.assertEqual(skin_nbrl.is_dirty, False)
+        self.assertEqual(skin_nbrl.num_skipped, 1)
+
+        check()
+        self.assertEqual(skin_nbrl.num_builds, 1)
+
+        # move the particles by more than half the skin
+        parr.set(x=x + 0.011)
+
+        nbrl.py_update_status()
+        skin_nbrl.py_update_status()
+        cm.py_update_status()
+        self.assertEqual(skin_nbrl.is_dirty, True)
+
+        check()
+        self.assertEqual(skin_nbrl.num_builds, 2)
+
+    def test_sort_spatially(self):
+        """Tests the renumbering of the cache on a spatial sort. """
+        from pysph.base.particles import Particles, get_particle_array
+
+        numpy.random.seed(1)
+        x = numpy.random.random(200)
+        y = numpy.random.random(200)
+        h = numpy.ones_like(x) * 0.05
+        parr = get_particle_array(name='parr', x=x, y=y, h=h)
+
+        particles = Particles(arrays=[parr])
+        nbrl = particles.nnps_manager.get_neighbor_particle_locator(
+            parr, parr, 2.0)
+
+        def get_nbr_ids():
+            idx = parr.get('idx')
+            nbrs = {}
+            for i in range(len(idx)):
+                a = nbrl.py_get_nearest_particles(i, True).get_npy_array()
+                nbrs[idx[i]] = sorted(idx[a])
+            return nbrs
+
+        nbrs = get_nbr_ids()
+        num_builds = nbrl.num_builds
+
+        for curve in ('hilbert', 'morton'):
+            particles.sort_spatially(curve)
+
+            # the properties follow the persistent id
+            idx = parr.get('idx')
+            self.assertEqual(sorted(idx), range(200))
+            self.assertTrue(numpy.allclose(parr.get('x'), x[idx]))
+            self.assertTrue(numpy.allclose(parr.get('y'), y[idx]))
+
+            # the cache is renumbered without a rebuild
+            self.assertEqual(get_nbr_ids(), nbrs)
+            self.assertEqual(nbrl.num_builds, num_builds)
+
+            # and agrees with a new locator
+            cm = CellManager(arrays_to_bin=[parr])
+            new_nbrl = FixedDestNbrParticleLocator(parr, parr, 2.0, cm)
+            for i in range(200):
+                a1 = nbrl.py_get_nearest_particles(i, True)
+                a2 = new_nbrl.py_get_nearest_particles(i, True)
+                self.assertEqual(sorted(a1.get_npy_array()),
+                                 sorted(a2.get_npy_array()))
+
+    def test_pair_cache(self):
+        """Tests the pair data cache. """
+        from pysph.base.particles import Particles, get_particle_array
+        from pysph.base.kernels import CubicSplineKernel
+
+        numpy.random.seed(2)
+        x = numpy.random.random(100)
+        y = numpy.random.random(100)
+        h = numpy.ones_like(x) * 0.05
+        parr = get_particle_array(name='parr', x=x, y=y, h=h)
+
+        kernel = CubicSplineKernel(dim=2)
+        particles = Particles(arrays=[parr], pair_cache_budget=2**20)
+        nbrl = particles.nnps_manager.get_neighbor_particle_locator(
+            parr, parr, kernel.radius())
+
+        def check(cache):
+            x, y, z, h = parr.get('x', 'y', 'z', 'h')
+            offsets = cache.offsets.get_npy_array()
+            indices = cache.indices.get_npy_array()
+            grad = Point()
+            for i in range(100):
+                nbrs = nbrl.py_get_nearest_particles(i).get_npy_array()
+                self.assertEqual(list(indices[offsets[i]:offsets[i+1]]),
+                                 list(nbrs))
+                pa = Point(x[i], y[i], z[i])
+                for k in range(offsets[i], offsets[i+1]):
+                    j = indices[k]
+                    pb = Point(x[j], y[j], z[j])
+                    hab = 0.5 * (h[i] + h[j])
+                    kernel.py_gradient(pa, pb, hab, grad)
+                    self.assertAlmostEqual(cache.r[k], (pa - pb).length())
+                    self.assertAlmostEqual(cache.w[k],
+                                           kernel.py_function(pa, pb, hab))
+                    self.assertAlmostEqual(cache.gx[k], grad.x)
+                    self.assertAlmostEqual(cache.gy[k], grad.y)
+                    self.assertAlmostEqual(cache.gz[k], grad.z)
+
+        cache = nbrl.py_get_pair_cache(kernel)
+        self.assertTrue(cache is not None)
+        self.assertEqual(nbrl.num_pair_builds, 1)
+        check(cache)
+
+        # the cache is reused while the particles do not move
+        nbrl.py_get_pair_cache(kernel)
+        self.assertEqual(nbrl.num_pair_builds, 1)
+
+        # moving the particles invalidates the cache
+        parr.set(x=x + 0.01)
+        particles.update()
+        cache = nbrl.py_get_pair_cache(kernel)
+        self.assertEqual(nbrl.num_pair_builds, 2)
+        check(cache)
+
+        # as does a change of the smoothing length
+        parr.set(h=h * 1.1)
+        cache = nbrl.py_get_pair_cache(kernel)
+        self.assertEqual(nbrl.num_pair_builds, 3)
+        check(cache)
+
+        # as do writes recorded with mark_modified
+        parr.mark_modified('h')
+        cache = nbrl.py_get_pair_cache(kernel)
+        self.assertEqual(nbrl.num_pair_builds, 4)
+        check(cache)
+
+        # and writes through a view, which are not recorded
+        h_view = parr.view('h')
+        h_view[:] *= 1.1
+        cache = nbrl.py_get_pair_cache(kernel)
+        self.assertEqual(nbrl.num_pair_builds, 5)
+        check(cache)
+
+        nbrl.py_get_pair_cache(kernel)
+        self.assertEqual(nbrl.num_pair_builds, 5)
+
+        # the view is kept and written again after the rebuild
+        h_view[:] *= 1.1
+        cache = nbrl.py_get_pair_cache(kernel)
+        self.assertEqual(nbrl.num_pair_builds, 6)
+        check(cache)
+
+        # fall back to the kernel evaluation if the budget is exceeded
+        particles.nnps_manager.set_pair_cache_budget(64)
+        self.assertTrue(nbrl.py_get_pair_cache(kernel) is None)
+        self.assertEqual(nbrl.num_pair_fallbacks, 1)
+        self.assertEqual(nbrl.pair_cache.get_number_of_pairs(), 0)
+
+    def test_parallel_build(self):
+        """Tests the cache built by several threads. """
+        from pysph.base.particles import Particles
+
+        numpy.random.seed(3)
+        x = numpy.random.random(200)
+        y = numpy.random.random(200)
+        h = 0.02 + 0.04*numpy.random.random(200)
+
+        def get_caches(variable_h, num_threads):
+            pa1 = get_particle_array(name='pa1', x=x, y=y, h=h)
+            pa2 = get_particle_array(name='pa2', x=y, y=x, h=h)
+            particles = Particles(arrays=[pa1, pa2], variable_h=variable_h,
+                                  use_flat_index=True,
+                                  num_threads=num_threads)
+            caches = []
+            for src, dst in ((pa1, pa1), (pa1, pa2)):
+                nbrl = particles.nnps_manager.get_neighbor_particle_locator(
+                    src, dst, 2.0)
+                nbrl.py_update()
+                caches.append((list(nbrl.nbr_offsets.get_npy_array()),
+                               list(nbrl.nbr_indices.get_npy_array())))
+            return caches
+
+        for variable_h in (False, True):
+            serial = get_caches(variable_h, 1)
+            for num_threads in (2, 3, 8):
+                self.assertEqual(get_caches(variable_h, num_threads), serial)
+
+    def test_periodic(self):
+        """Tests the neighbors in a domain periodic in x, y and z. """
+        numpy.random.seed(5)
+        x, y, z = numpy.random.random((3, 400))
+        h = numpy.ones_like(x) * 0.05
+        parr = get_particle_array(name='parr', x=x, y=y, z=z, h=h)
+
+        def get_domain():
+            return PeriodicDomain(xmin=0.0, xmax=1.0, ymin=0.0, ymax=1.0,
+                                  zmin=0.0, zmax=1.0)
+
+        cm = CellManager(arrays_to_bin=[parr], min_cell_size=0.2,
+                         max_cell_size=0.2, periodic_domain=get_domain())
+        flat_cm = CellManager(arrays_to_bin=[parr], min_cell_size=0.2,
+                              max_cell_size=0.2, periodic_domain=get_domain(),
+                              use_flat_index=True)
+
+        locators = [FixedDestNbrParticleLocator(parr, parr, 2.0, cm),
+                    FixedDestNbrParticleLocator(parr, parr, 2.0, flat_cm),
+                    FixedDestNbrParticleLocator(parr, parr, 2.0, cm,
+                                                skin=0.02),
+                    TreeNbrParticleLocator(parr, parr, 2.0, cm, leaf_size=4)]
+
+        # distances to the nearest images
+        def get_brute_force_nbrs(i):
+            dx = x - x[i]; dy = y - y[i]; dz = z - z[i]
+            dx -= numpy.round(dx); dy -= numpy.round(dy)
+            dz -= numpy.round(dz)
+            dist2 = dx*dx + dy*dy + dz*dz
+            return sorted(numpy.where(dist2 < 0.1**2)[0])
+
+        num_wrapped = 0
+        for i in range(len(x)):
+            expected = get_brute_force_nbrs(i)
+            if min(x[i], y[i], z[i], 1-x[i], 1-y[i], 1-z[i]) < 0.1:
+                num_wrapped += 1
+
+            for nbrl in locators:
+                nbrs = nbrl.py_get_nearest_particles(i)
+                self.assertEqual(sorted(nbrs.get_npy_array()), expected)
+
+        # particles near the boundaries were tested
+        self.assertTrue(num_wrapped > 100)
 
 ##############################################################################
 # `TestVarHNbrParticleLocator` class.
@@ -429,6 +862,83 @@ class TestVarHNbrParticleLocator(unittest.TestCase):
             self.assertEqual(output_array[0], 5)
         
 
+##############################################################################
+# `TestTreeNbrParticleLocator` class.
+##############################################################################
+class TestTreeNbrParticleLocator(unittest.TestCase):
+    """Tests the TreeNbrParticleLocator. """
+    def setUp(self):
+        numpy.random.seed(3)
+
+        # smoothing lengths varying by a factor of 50
+        x = numpy.random.random(300)
+        y = numpy.random.random(300)
+        h = numpy.exp(numpy.random.uniform(numpy.log(0.002),
+                                           numpy.log(0.1), 300))
+        self.parr = get_particle_array(name='parr', x=x, y=y, h=h)
+
+        x = numpy.random.random(100)
+        y = numpy.random.random(100)
+        h = numpy.exp(numpy.random.uniform(numpy.log(0.002),
+                                           numpy.log(0.1), 100))
+        self.parr2 = get_particle_array(name='parr2', x=x, y=y, h=h)
+
+        self.cm = CellManager(arrays_to_bin=[self.parr, self.parr2])
+
+    def get_brute_force_nbrs(self, source, dest, i, radius_scale,
+                             query_type):
+        """ Return the sorted neighbors of dest particle i """
+        xs, ys, hs = source.get('x', 'y', 'h')
+        xd, yd, hd = dest.get('x', 'y', 'h')
+
+        dist2 = (xs - xd[i])**2 + (ys - yd[i])**2
+
+        if query_type == TreeQueryType.Gather:
+            h = hd[i]
+        elif query_type == TreeQueryType.Scatter:
+            h = hs
+        else:
+            h = numpy.maximum(hs, hd[i])
+
+        return sorted(numpy.where(dist2 < (radius_scale*h)**2)[0])
+
+    def test_get_nearest_particles(self):
+        """Tests the neighbors against a brute force search. """
+        for source, dest in ((self.parr, self.parr),
+                             (self.parr, self.parr2)):
+            for query_type in (TreeQueryType.Gather, TreeQueryType.Scatter,
+                               TreeQueryType.Symmetric):
+                nbrl = TreeNbrParticleLocator(source, dest, 2.0, self.cm,
+                                              query_type=query_type,
+                                              leaf_size=4)
+
+                for i in range(dest.get_number_of_particles()):
+                    nbrs = nbrl.py_get_nearest_particles(i)
+                    self.assertEqual(
+                        sorted(nbrs.get_npy_array()),
+                        self.get_brute_force_nbrs(source, dest, i, 2.0,
+                                                  query_type))
+
+    def test_nnps_manager(self):
+        """Tests the selection of the tree in the NNPSManager. """
+        Tree = NeighborLocatorType.TreeNeighborLocator
+
+        nm = NNPSManager(self.cm, variable_h=True, locator_type=Tree)
+        nbrl = nm.get_neighbor_particle_locator(self.parr, self.parr, 2.0)
+        self.assertTrue(isinstance(nbrl, TreeNbrParticleLocator))
+        self.assertEqual(nbrl.query_type, TreeQueryType.Symmetric)
+
+        # the neighbors agree with the locator for variable h
+        varh = VarHNbrParticleLocator(self.parr, self.parr, 2.0, self.cm)
+        for i in range(300):
+            self.assertEqual(
+                sorted(nbrl.py_get_nearest_particles(i).get_npy_array()),
+                sorted(varh.py_get_nearest_particles(i).get_npy_array()))
+
+        nm = NNPSManager(self.cm, locator_type=Tree)
+        nbrl = nm.get_neighbor_particle_locator(self.parr, self.parr, 2.0)
+        self.assertEqual(nbrl.query_type, TreeQueryType.Gather)
+
 ##############################################################################
 # `TestNNPSManager` class.
 ##############################################################################
@@ -0,0 +1,36 @@
+from pysph.base.carray cimport LongArray, DoubleArray
+from pysph.base.point cimport cPoint
+
+##############################################################################
+# `KDTree` class.
+##############################################################################
+cdef class KDTree:
+    """ A k-d tree over a set of points with smoothing lengths """
+    cdef public int leaf_size
+    cdef public long num_points, num_nodes
+
+    # the points of node n are indices[node_start[n]:node_end[n]]
+    cdef public LongArray indices
+    cdef public LongArray node_start, node_end
+    cdef public LongArray node_left, node_right
+
+    # bounding box (xmin, ymin, zmin, xmax, ymax, zmax) of node n at
+    # node_bounds[6*n:6*n+6] and the largest smoothing length in it
+    cdef public DoubleArray node_bounds
+    cdef public DoubleArray node_hmax
+
+    cdef DoubleArray x, y, z, h
+    cdef LongArray _stack
+
+    cpdef build(self, DoubleArray x, DoubleArray y, DoubleArray z,
+                DoubleArray h, long num_points=*)
+
+    cdef long _build_node(self, long start, long end)
+
+    cdef void _select(self, double* key, long start, long end, long k)
+
+    cdef int query(self, cPoint pnt, double h, double radius_scale,
+                   double skin, int query_type, LongArray output_array,
+                   long exclude_index=*) except -1
+
+    cpdef remap(self, LongArray new_index)
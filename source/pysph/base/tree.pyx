@@ -0,0 +1,383 @@
+"""Module to implement a k-d tree for neighbor searches with strongly
+varying smoothing lengths
+
+** Usage **
+
+::
+
+    tree = KDTree(leaf_size=16)
+    tree.build(x, y, z, h)
+
+    output_array = LongArray()
+    tree.py_query(Point(0.5, 0.5, 0), h=0.1, radius_scale=2.0,
+                  query_type=TreeQueryType.Symmetric,
+                  output_array=output_array)
+
+The tree splits the points at the median of the longest dimension of
+the bounding box of a node until a node holds at most `leaf_size`
+points. The leaves are therefore small where the points are dense and
+large where they are sparse.
+
+"""
+
+from pysph.base.carray cimport LongArray, DoubleArray
+from pysph.base.point cimport Point, cPoint
+
+cdef enum:
+    GATHER = 0
+    SCATTER = 1
+    SYMMETRIC = 2
+
+###############################################################################
+# `TreeQueryType` class.
+###############################################################################
+class TreeQueryType:
+    """ An Empty class to emulate an Enum for the range queries of a tree
+
+    For a query point with smoothing length h, a point j is returned if
+    its distance to the query point is less than radius_scale*H with
+
+    Gather -- H = h
+    Scatter -- H = h_j
+    Symmetric -- H = max(h, h_j)
+
+    """
+    Gather = GATHER
+    Scatter = SCATTER
+    Symmetric = SYMMETRIC
+
+    def __init__(self):
+        raise SystemError, 'Do not instantiate the TreeQueryType class'
+
+cdef inline double _max(double a, double b):
+    if a > b:
+        return a
+    return b
+
+###############################################################################
+# `KDTree` class.
+###############################################################################
+cdef class KDTree:
+
+    # Defined in the .pxd file
+    # cdef public int leaf_size
+    # cdef public long num_points, num_nodes
+    # cdef public LongArray indices
+    # cdef public LongArray node_start, node_end
+    # cdef public LongArray node_left, node_right
+    # cdef public DoubleArray node_bounds
+    # cdef public DoubleArray node_hmax
+
+    """ A k-d tree over a set of points with smoothing lengths
+
+    Data Members:
+    -------------
+    leaf_size -- the largest number of points in a leaf
+    num_points, num_nodes -- the number of points and nodes of the tree
+    indices -- the point indices, ordered such that the points of each
+    node are contiguous
+    node_start, node_end -- the range of a node in `indices`
+    node_left, node_right -- the children of a node, -1 for a leaf
+    node_bounds -- the bounding boxes of the nodes
+    node_hmax -- the largest smoothing length of the points of a node
+
+    Notes:
+    ------
+    The tree refers to the coordinate arrays it was built with. The
+    points may not be moved between a build and the queries.
+
+    """
+    def __init__(self, int leaf_size=16):
+        """ Constructor
+
+        Parameters:
+        -----------
+        leaf_size -- the largest number of points in a leaf
+
+        """
+        if leaf_size < 1:
+            raise ValueError, 'The leaf size must be positive'
+
+        self.leaf_size = leaf_size
+        self.num_points = 0
+        self.num_nodes = 0
+
+        self.indices = LongArray()
+        self.node_start = LongArray()
+        self.node_end = LongArray()
+        self.node_left = LongArray()
+        self.node_right = LongArray()
+        self.node_bounds = DoubleArray()
+        self.node_hmax = DoubleArray()
+
+        self._stack = LongArray()
+
+    cpdef build(self, DoubleArray x, DoubleArray y, DoubleArray z,
+                DoubleArray h, long num_points=-1):
+        """ Build the tree over the points
+
+        Parameters:
+        -----------
+        x, y, z -- the coordinates of the points
+        h -- the smoothing lengths of the points
+        num_points -- the number of points to use. Defaults to all
+
+        """
+        cdef long i
+
+        if num_points < 0:
+            num_points = x.length
+
+        self.x = x
+        self.y = y
+        self.z = z
+        self.h = h
+
+        self.num_points = num_points
+        self.num_nodes = 0
+
+        self.indices.resize(num_points)
+        for i in range(num_points):
+            self.indices.data[i] = i
+
+        self.node_start.reset()
+        self.node_end.reset()
+        self.node_left.reset()
+        self.node_right.reset()
+        self.node_bounds.reset()
+        self.node_hmax.reset()
+
+        if num_points > 0:
+            self._build_node(0, num_points)
+
+    cdef long _build_node(self, long start, long end):
+        """ Create the node holding indices[start:end] and its children
+
+        Algorithm:
+        ----------
+        compute the bounding box and largest smoothing length
+        if there are more than leaf_size points
+            split the points at the median of the longest dimension
+            build the children for both halves
+
+        """
+        cdef long node = self.num_nodes
+        cdef long i, k, mid, left, right
+        cdef double lo[3], hi[3], pos[3]
+        cdef double hmax = 0.0
+        cdef double extent = 0.0
+        cdef int d, dim = 0
+        cdef double* key
+
+        self.num_nodes += 1
+
+        for d in range(3):
+            lo[d] = 1e100
+            hi[d] = -1e100
+
+        for k in range(start, end):
+            i = self.indices.data[k]
+            pos[0] = self.x.data[i]
+            pos[1] = self.y.data[i]
+            pos[2] = self.z.data[i]
+
+            for d in range(3):
+                if pos[d] < lo[d]:
+                    lo[d] = pos[d]
+                if pos[d] > hi[d]:
+                    hi[d] = pos[d]
+
+            if self.h.data[i] > hmax:
+                hmax = self.h.data[i]
+
+        self.node_start.append(start)
+        self.node_end.append(end)
+        self.node_left.append(-1)
+        self.node_right.append(-1)
+        self.node_hmax.append(hmax)
+        for d in range(3):
+            self.node_bounds.append(lo[d])
+        for d in range(3):
+            self.node_bounds.append(hi[d])
+
+        if end - start <= self.leaf_size:
+            return node
+
+        for d in range(3):
+            if hi[d] - lo[d] > extent:
+                extent = hi[d] - lo[d]
+                dim = d
+
+        # coincident points can not be split
+        if extent == 0.0:
+            return node
+
+        if dim == 0:
+            key = self.x.data
+        elif dim == 1:
+            key = self.y.data
+        else:
+            key = self.z.data
+
+        mid = (start + end)/2
+        self._select(key, start, end, mid)
+
+        left = self._build_node(start, mid)
+        right = self._build_node(mid, end)
+
+        self.node_left.data[node] = left
+        self.node_right.data[node] = right
+
+        return node
+
+    cdef void _select(self, double* key, long start, long end, long k):
+        """ Partially sort indices[start:end] by key such that the point
+        at position k is preceded by points with smaller or equal keys
+        and followed by points with larger or equal keys """
+        cdef long* idx = self.indices.data
+        cdef long lo = start, hi = end - 1
+        cdef long i, j, tmp
+        cdef double pivot
+
+        while lo < hi:
+            pivot = key[idx[(lo + hi)/2]]
+            i = lo
+            j = hi
+
+            while i <= j:
+                while key[idx[i]] < pivot:
+                    i += 1
+                while key[idx[j]] > pivot:
+                    j -= 1
+                if i <= j:
+                    tmp = idx[i]
+                    idx[i] = idx[j]
+                    idx[j] = tmp
+                    i += 1
+                    j -= 1
+
+            if k <= j:
+                hi = j
+            elif k >= i:
+                lo = i
+            else:
+                break
+
+    cdef int query(self, cPoint pnt, double h, double radius_scale,
+                   double skin, int query_type, LongArray output_array,
+                   long exclude_index=-1) except -1:
+        """ Append the points within the interaction radius of `pnt`
+        to output_array
+
+        Parameters:
+        -----------
+        pnt -- the query point
+        h -- the smoothing length of the query point
+        radius_scale -- the kernel support radius factor `kfac`
+        skin -- added to the interaction radius
+        query_type -- the interaction radius as in TreeQueryType
+        output_array -- the array the point indices are appended to
+        exclude_index -- a point index to leave out
+
+        Algorithm:
+        ----------
+        push the root
+        while there are nodes on the stack
+            pop a node
+            skip it if its bounding box is out of the largest radius of
+            its points
+            test the points of a leaf or push the children of the node
+
+        """
+        cdef LongArray stack = self._stack
+        cdef long node, k, j
+        cdef double* bounds
+        cdef double radius, d, dist2
+        cdef int dim
+        cdef double pos[3]
+
+        if self.num_nodes == 0:
+            return 0
+
+        pos[0] = pnt.x
+        pos[1] = pnt.y
+        pos[2] = pnt.z
+
+        stack.reset()
+        stack.append(0)
+
+        while stack.length > 0:
+            node = stack.data[stack.length - 1]
+            stack.resize(stack.length - 1)
+
+            if query_type == GATHER:
+                radius = radius_scale * h + skin
+            elif query_type == SCATTER:
+                radius = radius_scale * self.node_hmax.data[node] + skin
+            else:
+                radius = radius_scale * _max(h, self.node_hmax.data[node])
+                radius += skin
+
+            # distance of the point to the bounding box of the node
+            bounds = self.node_bounds.data + 6*node
+            dist2 = 0.0
+            for dim in range(3):
+                if pos[dim] < bounds[dim]:
+                    d = bounds[dim] - pos[dim]
+                    dist2 += d*d
+                elif pos[dim] > bounds[dim+3]:
+                    d = pos[dim] - bounds[dim+3]
+                    dist2 += d*d
+
+            if dist2 >= radius*radius:
+                continue
+
+            if self.node_left.data[node] != -1:
+                stack.append(self.node_left.data[node])
+                stack.append(self.node_right.data[node])
+                continue
+
+            for k in range(self.node_start.data[node],
+                           self.node_end.data[node]):
+                j = self.indices.data[k]
+                if j == exclude_index:
+                    continue
+
+                if query_type == SCATTER:
+                    radius = radius_scale * self.h.data[j] + skin
+                elif query_type == SYMMETRIC:
+                    radius = radius_scale * _max(h, self.h.data[j]) + skin
+
+                d = pos[0] - self.x.data[j]
+                dist2 = d*d
+                d = pos[1] - self.y.data[j]
+                dist2 += d*d
+                d = pos[2] - self.z.data[j]
+                dist2 += d*d
+
+                if dist2 < radius*radius:
+                    output_array.append(j)
+
+        return 0
+
+    cpdef remap(self, LongArray new_index):
+        """ Renumber the points after they were reordered
+
+        Parameters:
+        -----------
+        new_index -- the new index of the point at index i
+
+        """
+        cdef long k
+
+        for k in range(self.num_points):
+            self.indices.data[k] = new_index.data[self.indices.data[k]]
+
+    ######################################################################
+    # python wrappers.
+    ######################################################################
+    def py_query(self, Point pnt, double h, double radius_scale,
+                 int query_type, LongArray output_array, double skin=0.0,
+                 long exclude_index=-1):
+        return self.query(pnt.data, h, radius_scale, skin, query_type,
+                          output_array, exclude_index)
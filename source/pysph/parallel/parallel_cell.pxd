@@ -40,7 +40,6 @@ cdef class ProcessorMap:
 ###############################################################################
 cdef class ParallelCellManager(CellManager):
     cdef public object solver 
-    cdef public int dimension
     cdef public list glb_bounds_min, glb_bounds_max
     cdef public list local_bounds_min, local_bounds_max
     cdef public double glb_min_h, glb_max_h
@@ -44,3 +44,86 @@ def hilbert_sfc(cell_id, maxlen=20, dim=3):
 sfc_func_dict = {'morton':morton_sfc}
 if have_hilbert:
     sfc_func_dict['hilbert'] = hilbert_sfc
+
+###############################################################################
+# Vectorized keys for arrays of cell indices
+###############################################################################
+def morton_keys(cell_ids, maxlen=20):
+    """Returns the Morton keys of an array of cell indices
+
+    Parameters:
+    -----------
+
+    cell_ids -- integer array of shape (n, dim) with entries in
+    [0, 2**maxlen). dim*maxlen must not exceed 64
+
+    maxlen -- number of bits used per dimension
+
+    """
+    ids = numpy.asarray(cell_ids).astype(numpy.uint64)
+    one = numpy.uint64(1)
+    keys = numpy.zeros(ids.shape[0], dtype=numpy.uint64)
+
+    for bit in range(maxlen-1, -1, -1):
+        bit = numpy.uint64(bit)
+        for i in range(ids.shape[1]):
+            keys = (keys << one) | ((ids[:,i] >> bit) & one)
+
+    return keys
+
+def hilbert_keys(cell_ids, maxlen=20):
+    """Returns the Hilbert keys of an array of cell indices
+
+    Parameters:
+    -----------
+
+    cell_ids -- integer array of shape (n, dim) with entries in
+    [0, 2**maxlen). dim*maxlen must not exceed 64
+
+    maxlen -- number of bits used per dimension
+
+    Notes:
+    ------
+
+    The indices are transformed to the transposed Hilbert index with
+    Skilling's algorithm (AIP Conf. Proc. 707, 381 (2004)) for all
+    cells at once, the bits of which are interleaved as for the Morton
+    key.
+
+    """
+    X = numpy.array(cell_ids).astype(numpy.uint64)
+    dim = X.shape[1]
+    one = numpy.uint64(1)
+    M = one << numpy.uint64(maxlen - 1)
+
+    # inverse undo excess work
+    Q = M
+    while Q > one:
+        P = Q - one
+        for i in range(dim):
+            flip = (X[:,i] & Q) != 0
+            X[flip,0] ^= P
+
+            swap = ~flip
+            t = (X[swap,0] ^ X[swap,i]) & P
+            X[swap,0] ^= t
+            X[swap,i] ^= t
+        Q >>= one
+
+    # Gray encode
+    for i in range(1, dim):
+        X[:,i] ^= X[:,i-1]
+
+    t = numpy.zeros(X.shape[0], dtype=numpy.uint64)
+    Q = M
+    while Q > one:
+        flip = (X[:,dim-1] & Q) != 0
+        t[flip] ^= Q - one
+        Q >>= one
+
+    for i in range(dim):
+        X[:,i] ^= t
+
+    return morton_keys(X, maxlen)
+
+sfc_keys_dict = {'morton':morton_keys, 'hilbert':hilbert_keys}
@@ -1,5 +1,7 @@
 from integrator import EulerIntegrator, RK2Integrator, RK4Integrator,\
-    PredictorCorrectorIntegrator, LeapFrogIntegrator
+    PredictorCorrectorIntegrator, LeapFrogIntegrator, BlockTimeStepIntegrator,\
+    LowStorageRK3Integrator, LowStorageRK4Integrator,\
+    VelocityVerletIntegrator
 
 from cl_integrator import CLEulerIntegrator
 
@@ -7,6 +9,8 @@ from sph_equation import SPHIntegration, SPHOperation
 
 from solver import Solver
 
+from time_step import TimeStepController
+
 from shock_tube_solver import ShockTubeSolver
 from fluid_solver import FluidSolver, get_circular_patch
 import shock_tube_solver, fluid_solver
@@ -9,6 +9,7 @@ from utils import mkdir
 # PySPH imports.
 from pysph.base.particles import Particles, ParticleArray
 from pysph.solver.controller import CommandManager
+from pysph.solver.time_step import TimeStepController
 
 # MPI conditional imports
 HAS_MPI = True
@@ -113,6 +114,23 @@ class Application(object):
                           dest="time_step",
                           default=None,
                           help="Time-step to use for the simulation.")
+        # --adaptive-time-step
+        parser.add_option("--adaptive-time-step", action="store_true",
+                          dest="adaptive_time_step", default=False,
+                          help="""Compute the time step from the CFL and
+                          force criteria after each step. The time step
+                          given by --time-step is used for the first
+                          step.""")
+        # --cfl
+        parser.add_option("--cfl", action="store", type="float",
+                          dest="cfl", default=0.3,
+                          help="""CFL number for the adaptive time step.
+                          Defaults to 0.3.""")
+        # --max-time-step-increase
+        parser.add_option("--max-time-step-increase", action="store",
+                          type="float", dest="max_increase", default=1.1,
+                          help="""Maximum ratio between consecutive
+                          adaptive time steps. Defaults to 1.1.""")
         # -q/--quiet.
         parser.add_option("-q", "--quiet", action="store_true",
                          dest="quiet", default=False,
@@ -127,6 +145,12 @@ class Application(object):
         parser.add_option("--freq", action="store",
                           dest="freq", default=20, type="int",
                           help="Printing frequency for the output")
+
+        # --output-interval
+        parser.add_option("--output-interval", action="store",
+                          dest="output_interval", default=None, type="float",
+                          help="""Print the output at fixed intervals of
+                          simulated time instead of every --freq steps""")
         
         # -d/ --detailed-output.
         parser.add_option("-d", "--detailed-output", action="store_true",
@@ -151,6 +175,55 @@ class Application(object):
                           default=None, 
                           help="Use XSPH correction with epsilon value")
 
+        # --neighbor-skin
+        parser.add_option("--neighbor-skin", action="store",
+                          dest="neighbor_skin", type="float", default=0.0,
+                          help="""Verlet skin for the neighbor lists. The
+                          lists are reused until a particle has moved by
+                          more than half the skin.""")
+
+        # --pair-cache-budget
+        parser.add_option("--pair-cache-budget", action="store",
+                          dest="pair_cache_budget", type="float", default=0.0,
+                          help="""Memory in MB for caching the kernel values
+                          and gradients of the neighbor pairs. Defaults to
+                          0 (no cache).""")
+
+        # --flat-index
+        parser.add_option("--flat-index", action="store_true",
+                          dest="flat_index", default=False,
+                          help="""Bin the particles with the flat (counting
+                          sort) index of the cell manager. Serial runs
+                          only.""")
+
+        # --cell-subdivisions
+        parser.add_option("--cell-subdivisions", action="store",
+                          dest="cell_subdivisions", type="int", default=1,
+                          help="""Number of cells per interaction radius.
+                          Smaller cells reduce the candidate neighbors of
+                          kernels with many neighbors. Serial runs only.
+                          Defaults to 1.""")
+
+        # --neighbor-threads
+        parser.add_option("--neighbor-threads", action="store",
+                          dest="neighbor_threads", type="int", default=1,
+                          help="""Number of threads building the neighbor
+                          lists. Needs --flat-index. Defaults to 1.""")
+
+        # --num-threads
+        parser.add_option("--num-threads", action="store",
+                          dest="num_threads", type="int", default=1,
+                          help="""Number of threads evaluating the SPH
+                          functions over the destination particles.
+                          Defaults to 1.""")
+
+        # --fuse-calcs
+        parser.add_option("--fuse-calcs", action="store_true",
+                          dest="fuse_calcs", default=False,
+                          help="""Evaluate the integrating calcs with the
+                          same destination in a single neighbor
+                          traversal.""")
+
         # --cl
         parser.add_option("--cl", action="store_true", dest="with_cl",
                           default=False, help=""" Use OpenCL to run the
@@ -272,7 +345,14 @@ class Application(object):
                                    in_parallel=in_parallel,
                                    load_balancing=self.load_balance,
                                    update_particles=True,
-                                   min_cell_size=min_cell_size)
+                                   min_cell_size=min_cell_size,
+                                   use_flat_index=self.options.flat_index,
+                                   cell_subdivisions=\
+                                       self.options.cell_subdivisions,
+                                   neighbor_skin=self.options.neighbor_skin,
+                                   num_threads=self.options.neighbor_threads,
+                                   pair_cache_budget=int(
+                                       self.options.pair_cache_budget*2**20))
 
         return self.particles
 
@@ -284,6 +364,8 @@ class Application(object):
 
         dt -- the time step for the solver
 
+        adaptive_time_step -- the adaptive time step controller
+
         tf -- the final time for the simulationl
 
         fname -- the file name for output file printing
@@ -309,6 +391,12 @@ class Application(object):
         if tf is not None:
             solver.set_final_time(tf)
 
+        # adaptive time step
+        if self.options.adaptive_time_step:
+            solver.set_time_step_controller(TimeStepController(
+                    cfl=self.options.cfl,
+                    max_increase=self.options.max_increase))
+
         #setup the solver output file name
         fname = self.options.output
 
@@ -324,6 +412,7 @@ class Application(object):
 
         # output print frequency
         solver.set_print_freq(self.options.freq)
+        solver.set_output_interval(self.options.output_interval)
 
         # output printing level (default is not detailed)
         solver.set_output_printing_level(self.options.detailed_output)
@@ -338,6 +427,12 @@ class Application(object):
         if self.options.eps:
             solver.set_xsph(self.options.eps)
 
+        # fused evaluation of the integrating calcs
+        solver.set_fuse_calcs(self.options.fuse_calcs)
+
+        # threads evaluating the functions
+        solver.set_num_threads(self.options.num_threads)
+
         # OpenCL setup for the solver
         solver.set_cl(self.options.with_cl)
 
@@ -195,7 +195,8 @@ class CommandManager(object):
     ''' Class to manage and synchronize commands from various Controllers '''
     
     solver_props = set(('t', 'tf', 'dt', 'count', 'pfreq', 'fname',
-                'detailed_output', 'output_directory', 'command_interval'))
+                'detailed_output', 'output_directory', 'command_interval',
+                'output_interval'))
     
     solver_methods = set(('dump_output',))
     
@@ -13,7 +13,7 @@ from sph_equation import SPHOperation, SPHIntegration
 Fluids = base.ParticleType.Fluid
 Solids = base.ParticleType.Solid
 
-def get_circular_patch(name="", type=0, dx=0.025):
+def get_circular_patch(name="", type=0, dx=0.025, precision="double"):
     
     x,y = numpy.mgrid[-1.05:1.05+1e-4:dx, -1.05:1.05+1e-4:dx]
     x = x.ravel()
@@ -37,7 +37,8 @@ def get_circular_patch(name="", type=0, dx=0.025):
             indices.append(i)
             
     pa = base.get_particle_array(x=x, y=y, m=m, rho=rho, h=h, p=p, u=u, v=v,
-                                 cs=cs,name=name, type=type)
+                                 cs=cs,name=name, type=type,
+                                 precision=precision)
 
     la = base.LongArray(len(indices))
     la.set_data(numpy.array(indices))
@@ -1,8 +1,19 @@
 import logging
-from pysph.sph.sph_calc import SPHCalc
+import numpy
+from pysph.sph.sph_calc import SPHCalc, SPHCalcGroup
 from pysph.sph.funcs.arithmetic_funcs import PropertyGet
+from integrator_utils import linear_combination, axpy, copy_array, \
+     scaled_sum, masked_copy, kick_drift
+from time_step import TimeStepController
 logger = logging.getLogger()
 
+def _set_dirty(pa, prop):
+    """ Record the update of a property of the particle array and mark
+    the array dirty if a coordinate was updated """
+    pa.mark_modified(prop)
+    if prop == 'x' or prop == 'y' or prop == 'z':
+        pa.set_dirty(True)
+
 #############################################################################
 #`Integrator` class
 #############################################################################
@@ -15,6 +26,8 @@ class Integrator(object):
     (c) RK4 Integrator
     (d) Predictor Corrector Integrator
     (e) Leap Frog Integrator
+    (f) Block Time Step (Euler) Integrator
+    (g) Low storage Runge-Kutta Integrators (RK3 and RK4)
 
     The integrator operates on a list of SPHCalc objects which define the 
     interaction between a single destination particle array and a list of 
@@ -64,6 +77,22 @@ class Integrator(object):
     ------
     Current step. Used for storing intermediate step values.
 
+    fuse_calcs:
+    -----------
+    Flag to evaluate consecutive integrating calcs with the same
+    destination in a single neighbor traversal (see SPHCalcGroup).
+    Defaults to False.
+
+    store_initial_arrays:
+    ---------------------
+    Flag to add the initial arrays of the update properties. Defaults
+    to True.
+
+    allocated_props:
+    ----------------
+    The properties added to the particle arrays by the integrator,
+    indexed by the name of the particle array. See `get_memory_usage`.
+
     
     The following example is applicable to the description of
     'initial_props', 'step_props' and 'k_props' to follow:
@@ -191,6 +220,11 @@ class Integrator(object):
     and the step array is retrieved through the k dictionary. Stepping is
     as simple as `updated_array = current_array + step_array*dt`
 
+    The updates are done in place on the carrays of the real particles
+    with the functions in `integrator_utils` (`axpy`, `copy_array` and
+    `linear_combination`), which avoids the temporary arrays of
+    `ParticleArray.get` and `ParticleArray.set`.
+
     The integrate step
     ===================
     This is the function to be called while integrating an SPH system.
@@ -222,6 +256,13 @@ class Integrator(object):
 
         self.rupdate_list = []
 
+        # evaluate independent calcs in a single neighbor traversal
+        self.fuse_calcs = False
+        self.eval_sequences = {}
+
+        self.store_initial_arrays = True
+        self.allocated_props = {}
+
     def set_rupdate_list(self):
         for i in range(len(self.particles.arrays)):
             self.rupdate_list.append([])
@@ -265,6 +306,7 @@ class Integrator(object):
 
         self.initial_props = {}
         self.k_props = {}
+        self.allocated_props = {}
 
         calcs = self.calcs
 
@@ -300,8 +342,8 @@ class Integrator(object):
 
                 prop_initial = '_'+prop+'_0'
 
-                if calc.integrates:             
-                    pa.add_property({'name':prop_initial})
+                if calc.integrates and self.store_initial_arrays:
+                    self.add_property(pa, prop_initial)
                     calc.initial_props.append(prop_initial)
 
                 # set the step array and initial array
@@ -321,7 +363,7 @@ class Integrator(object):
                         # add the k array name 
                         
                         k_name = '_'+k_num + '_' + prop + str(i) + str(j)
-                        pa.add_property({'name':k_name})
+                        self.add_property(pa, k_name)
 
                         dst_writes = calc.dst_writes.get(k_num)
                         if not dst_writes:
@@ -336,6 +378,32 @@ class Integrator(object):
         self.set_rupdate_list()
         self.setup_done = True
 
+    def add_property(self, pa, name, type='double'):
+        """ Add a property used by the integrator to a particle array """
+        pa.add_property({'name':name, 'type':type})
+
+        if not self.allocated_props.has_key(pa.name):
+            self.allocated_props[pa.name] = []
+
+        if name not in self.allocated_props[pa.name]:
+            self.allocated_props[pa.name].append(name)
+
+    def get_memory_usage(self):
+        """ Return the memory in bytes allocated for the properties added
+        by the integrator, as a dictionary indexed by the name of the
+        particle array """
+        usage = {}
+
+        for pa in self.arrays:
+            nbytes = 0
+            for prop in self.allocated_props.get(pa.name, []):
+                arr = pa.get_carray(prop)
+                nbytes += arr.alloc * arr.get_npy_array().itemsize
+
+            usage[pa.name] = nbytes
+
+        return usage
+
     def set_initial_arrays(self):
         """ Set the initial arrays for each calc
 
@@ -363,8 +431,9 @@ class Integrator(object):
                     prop = updates[j]
 
                     prop_initial = self.initial_props[calc.id][j]
-                    
-                    pa.set(**{prop_initial:pa.get(prop)})
+
+                    copy_array(pa.get_carray(prop_initial),
+                               pa.get_carray(prop), pa.num_real_particles)
 
     def reset_current_arrays(self, calcs):
         """ Reset the current arrays """
@@ -389,7 +458,10 @@ class Integrator(object):
                     # reset the current property to the initial array
                     
                     initial_prop = self.initial_props[calc.id][j]
-                    pa.set(**{prop:pa.get(initial_prop)})
+                    copy_array(pa.get_carray(prop),
+                               pa.get_carray(initial_prop),
+                               pa.num_real_particles)
+                    _set_dirty(pa, prop)
 
     def do_step(self, calcs, dt):
         """ Perform one step for the integration
@@ -439,8 +511,15 @@ class Integrator(object):
         particles = self.particles
         
         k_num = 'k' + str(self.cstep)
-        for i in range(ncalcs):
-            calc = calcs[i]
+        for i, calc in enumerate(self.get_eval_sequence(calcs)):
+
+            if isinstance(calc, SPHCalcGroup):
+                if logger.level < 30:
+                    logger.info("Integrator:eval: operating on group %d, %s"%(
+                        i, [c.id for c in calc.calcs]))
+
+                calc.sph([c.dst_writes[k_num] for c in calc.calcs])
+                continue
 
             if logger.level < 30:
                 logger.info("Integrator:eval: operating on calc %d, %s"%(
@@ -469,6 +548,48 @@ class Integrator(object):
             
         particles.barrier()
 
+    def get_eval_sequence(self, calcs):
+        """ Return the calcs to evaluate, grouping calcs if requested
+
+        Notes:
+        ------
+        With `fuse_calcs` set, consecutive integrating calcs with the
+        same destination and kernel are replaced by a SPHCalcGroup,
+        which evaluates them in a single neighbor traversal. The
+        sequence is computed once per list of calcs.
+
+        """
+        if not self.fuse_calcs:
+            return calcs
+
+        key = tuple(calcs)
+        if self.eval_sequences.has_key(key):
+            return self.eval_sequences[key]
+
+        sequence = []
+        group = []
+        for calc in calcs + [None]:
+            if group and (calc is None or not calc.integrates or
+                          not SPHCalcGroup.can_fuse(calc) or
+                          calc.dest is not group[0].dest or
+                          calc.kernel is not group[0].kernel):
+                if len(group) > 1:
+                    sequence.append(SPHCalcGroup(group))
+                else:
+                    sequence.extend(group)
+                group = []
+
+            if calc is None:
+                break
+
+            if calc.integrates and SPHCalcGroup.can_fuse(calc):
+                group.append(calc)
+            else:
+                sequence.append(calc)
+
+        self.eval_sequences[key] = sequence
+        return sequence
+
     def step(self, calcs, dt):
         """ Perform stepping for the integrating calcs """
 
@@ -490,21 +611,15 @@ class Integrator(object):
                 for j in range(nupdates):
                     update_prop = updates[j]
                     k_prop = self.k_props[calc.id][k_num][j]
-                    initial_prop = self.initial_props[calc.id][j]
-
-                    initial_array = pa.get(initial_prop)
-                    current_arr = pa.get(update_prop)
-                    
-                    step_array = pa.get(k_prop)
 
                     if logger.level < 30:
                         k_name = k_num + '_' + update_prop + str(i) + str(j)
                         logger.info("""Integrator:do_step: Updating the k array
                                     %s """%(k_name))
 
-                    updated_array = current_arr + step_array*dt
-                  
-                    pa.set(**{update_prop:updated_array})
+                    axpy(pa.get_carray(update_prop), pa.get_carray(k_prop),
+                         dt, pa.num_real_particles)
+                    _set_dirty(pa, update_prop)
 
                 pass
             pass
@@ -544,13 +659,14 @@ class EulerIntegrator(Integrator):
             k_prop = self.k_props[calc.id]['k1'][i]
             update_prop = updates[i]
 
-            initial_array = pa.get(initial_prop)
-            k1_arr = pa.get(k_prop)
-            
-            updated_array = initial_array + k1_arr * dt
+            initial_array = pa.get_carray(initial_prop)
 
-            pa.set(**{update_prop:updated_array})
-            pa.set(**{initial_prop:updated_array})
+            axpy(initial_array, pa.get_carray(k_prop), dt,
+                 pa.num_real_particles)
+
+            copy_array(pa.get_carray(update_prop), initial_array,
+                       pa.num_real_particles)
+            _set_dirty(pa, update_prop)
 
     def integrate(self, dt):
 
@@ -609,14 +725,16 @@ class RK2Integrator(Integrator):
 
             update_prop = updates[j]
             
-            initial_arr = pa.get(initial_prop)
-            k1_arr = pa.get(k1_prop)
-            k2_arr = pa.get(k2_prop)            
+            initial_arr = pa.get_carray(initial_prop)
+            k1_arr = pa.get_carray(k1_prop)
+            k2_arr = pa.get_carray(k2_prop)
 
-            updated_array = initial_arr + 0.5 * dt * (k1_arr + k2_arr)
+            linear_combination(initial_arr, [initial_arr, k1_arr, k2_arr],
+                               [1.0, 0.5*dt, 0.5*dt], pa.num_real_particles)
 
-            pa.set(**{update_prop:updated_array})
-            pa.set(**{initial_prop:updated_array})
+            copy_array(pa.get_carray(update_prop), initial_arr,
+                       pa.num_real_particles)
+            _set_dirty(pa, update_prop)
 
     def integrate(self, dt):
 
@@ -680,17 +798,20 @@ class RK4Integrator(Integrator):
             k3_prop = self.k_props[calc.id]['k3'][j]
             k4_prop = self.k_props[calc.id]['k4'][j]
 
-            initial_array = pa.get(initial_prop)
-            k1_array = pa.get(k1_prop)
-            k2_array = pa.get(k2_prop)
-            k3_array = pa.get(k3_prop)
-            k4_array = pa.get(k4_prop)
+            initial_array = pa.get_carray(initial_prop)
+            k1_array = pa.get_carray(k1_prop)
+            k2_array = pa.get_carray(k2_prop)
+            k3_array = pa.get_carray(k3_prop)
+            k4_array = pa.get_carray(k4_prop)
 
-            updated_array = initial_array + (dt/6.0) *\
-                (k1_array + 2*k2_array + 2*k3_array + k4_array)
-                    
-            pa.set(**{update_prop:updated_array})
-            pa.set(**{initial_prop:updated_array})
+            linear_combination(initial_array, [initial_array, k1_array,
+                                               k2_array, k3_array, k4_array],
+                               [1.0, dt/6.0, dt/3.0, dt/3.0, dt/6.0],
+                               pa.num_real_particles)
+
+            copy_array(pa.get_carray(update_prop), initial_array,
+                       pa.num_real_particles)
+            _set_dirty(pa, update_prop)
 
     def integrate(self, dt):
 
@@ -763,13 +884,14 @@ class PredictorCorrectorIntegrator(Integrator):
             initial_prop = self.initial_props[calc.id][j]
             update_prop = updates[j]
             
-            initial_array = pa.get(initial_prop)
-            current_array = pa.get(update_prop)
-            
-            updated_array = 2*current_array - initial_array
+            initial_array = pa.get_carray(initial_prop)
+            current_array = pa.get_carray(update_prop)
 
-            pa.set(**{update_prop:updated_array})
-            pa.set(**{initial_prop:updated_array})
+            linear_combination(initial_array, [current_array, initial_array],
+                               [2.0, -1.0], pa.num_real_particles)
+
+            copy_array(current_array, initial_array, pa.num_real_particles)
+            _set_dirty(pa, update_prop)
 
     def integrate(self, dt):
 
@@ -846,14 +968,12 @@ class LeapFrogIntegrator(Integrator):
                     #k1_prop = self.k1_props['k1'][calc.id][j]
                     k1_prop = self.k_props[calc.id]['k1'][j]
 
-                    # the current position
-
-                    current_arr = pos_calc_pa.get(update_prop)
+                    # correct the current position
 
-                    step_array = pa.get(k1_prop)
-
-                    updated_array = current_arr + 0.5*dt*dt*step_array
-                    pos_calc_pa.set(**{update_prop:updated_array})            
+                    axpy(pos_calc_pa.get_carray(update_prop),
+                         pa.get_carray(k1_prop), 0.5*dt*dt,
+                         pos_calc_pa.num_real_particles)
+                    _set_dirty(pos_calc_pa, update_prop)
 
     def final_step(self, calc, dt):
         pa = self.arrays[calc.dnum]
@@ -865,14 +985,15 @@ class LeapFrogIntegrator(Integrator):
             k1_prop = self.k_props[calc.id]['k1'][j]
             k2_prop = self.k_props[calc.id]['k2'][j]
 
-            k1_array = pa.get(k1_prop)
-            k2_array = pa.get(k2_prop)
+            k1_array = pa.get_carray(k1_prop)
+            k2_array = pa.get_carray(k2_prop)
 
-            current_array = pa.get(update_prop)
+            current_array = pa.get_carray(update_prop)
 
-            updated_array = current_array + 0.5*dt*(k2_array - k1_array)
-            
-            pa.set(**{update_prop:updated_array})
+            linear_combination(current_array, [current_array, k2_array,
+                                               k1_array],
+                               [1.0, 0.5*dt, -0.5*dt], pa.num_real_particles)
+            _set_dirty(pa, update_prop)
 
     def integrate(self, dt):
         
@@ -912,3 +1033,555 @@ class LeapFrogIntegrator(Integrator):
         self.cstep = 1
         
 ############################################################################## 
+
+##############################################################################
+#`BlockTimeStepIntegrator` class
+##############################################################################
+class BlockTimeStepIntegrator(Integrator):
+    """ Euler integration with individual (block) time steps
+
+    Each particle of an array stepped by an integrating calc has a
+    level `l` between 0 and `max_level` and the time step dt/2**l,
+    where dt is the time step passed to `integrate`. The step dt is
+    divided into 2**max_level substeps. At a substep, the particles
+    whose step starts there are active:
+
+    (a) the state of all particles is predicted at the substep as
+
+        X = X_0 + (t - t_0) * K1
+
+        where X_0 and K1 are the state and rate at the start t_0 of the
+        particle's step. For the active particles, this is the Euler
+        step and their step starts anew from this state.
+
+    (b) the integrating calcs are evaluated for the active particles
+        only (see SPHCalc.active_prop), the rates of the other
+        particles are kept. Non integrating calcs are evaluated for
+        all particles.
+
+    (c) the new level of the active particles is computed from the CFL,
+        force and viscous criteria of `time_step_controller`. A step
+        may grow by one level at most and must end on a substep at
+        which the particle can be synchronized.
+
+    All particles are synchronized at the end of `integrate`.
+
+    Data Attributes:
+    ================
+
+    max_level -- the number of levels, the smallest step being
+    dt/2**max_level
+
+    time_step_controller -- the TimeStepController giving the time
+    step of each particle
+
+    num_evaluations -- the number of particle evaluations of the last
+    call to `integrate`, to compare with the number of real particles
+    times 2**max_level for a global time step of dt/2**max_level
+
+    Notes:
+    ======
+    The time step of the solver is the largest particle step. The
+    properties '_block_level', '_block_start', '_block_active' and
+    '_block_tau' are added to the stepped arrays.
+
+    """
+
+    def __init__(self, particles, calcs, max_level=3,
+                 time_step_controller=None):
+        Integrator.__init__(self, particles, calcs)
+        self.nsteps = 1
+
+        self.max_level = max_level
+
+        if time_step_controller is None:
+            time_step_controller = TimeStepController()
+        self.time_step_controller = time_step_controller
+
+        self.num_evaluations = 0
+
+        self.block_arrays = []
+        self.block_props = []
+
+    def setup_integrator(self):
+        """ Setup the stepping and the per particle data
+
+        For each array stepped by an integrating calc, the initial
+        property and the k1 properties of the calcs are collected for
+        each update property.
+
+        """
+        Integrator.setup_integrator(self)
+
+        self.block_arrays = []
+        self.block_props = []
+
+        for calc in self.calcs:
+            if not calc.integrates:
+                continue
+
+            pa = self.arrays[calc.dnum]
+
+            for i in range(len(self.block_arrays)):
+                if self.block_arrays[i] is pa:
+                    props = self.block_props[i]
+                    break
+            else:
+                for prop in ('_block_level', '_block_start', '_block_active'):
+                    self.add_property(pa, prop, 'int')
+                self.add_property(pa, '_block_tau')
+
+                props = {}
+                self.block_arrays.append(pa)
+                self.block_props.append(props)
+
+            for j in range(calc.nupdates):
+                prop = calc.updates[j]
+                if not props.has_key(prop):
+                    props[prop] = (self.initial_props[calc.id][j], [])
+
+                props[prop][1].append(self.k_props[calc.id]['k1'][j])
+
+            # evaluate the active particles only
+
+            calc.active_prop = '_block_active'
+
+    def predict(self, substep, dt_substep):
+        """ Predict the state of all particles at the substep """
+        for i in range(len(self.block_arrays)):
+            pa = self.block_arrays[i]
+            np = pa.num_real_particles
+
+            tau, start = pa.get('_block_tau', '_block_start')
+            tau[:] = (substep - start) * dt_substep
+
+            tau = pa.get_carray('_block_tau')
+            for prop, (initial_prop, k_props) in \
+                    self.block_props[i].iteritems():
+                scaled_sum(pa.get_carray(prop), pa.get_carray(initial_prop),
+                           [pa.get_carray(k_prop) for k_prop in k_props],
+                           tau, np)
+                _set_dirty(pa, prop)
+
+    def set_active(self, substep):
+        """ Flag the particles whose step starts at the substep and
+        start their step from the current state """
+        for i in range(len(self.block_arrays)):
+            pa = self.block_arrays[i]
+            np = pa.num_real_particles
+
+            level, start, active = pa.get('_block_level', '_block_start',
+                                          '_block_active')
+
+            active[:] = (substep % 2**(self.max_level - level)) == 0
+            start[active == 1] = substep
+
+            self.num_evaluations += active.sum()
+
+            mask = pa.get_carray('_block_active')
+            for prop, (initial_prop, k_props) in \
+                    self.block_props[i].iteritems():
+                masked_copy(pa.get_carray(initial_prop), pa.get_carray(prop),
+                            mask, np)
+
+    def set_levels(self, substep, dt):
+        """ Set the level of the active particles from their time step
+        criteria """
+        max_level = self.max_level
+
+        # the smallest level whose steps end on a multiple of substep
+
+        min_level = 0
+        if substep > 0:
+            min_level = max_level
+            while substep % 2**(max_level - min_level + 1) == 0:
+                min_level -= 1
+
+        for pa in self.block_arrays:
+            level, active = pa.get('_block_level', '_block_active')
+            mask = active == 1
+
+            dt_cfl, dt_force, dt_viscous = \
+                self.time_step_controller.get_particle_criteria(self, pa)
+            dt_particle = numpy.minimum(numpy.minimum(dt_cfl, dt_force),
+                                        dt_viscous)[mask]
+
+            new_level = numpy.zeros(len(dt_particle), int)
+            finite = dt_particle < numpy.inf
+            new_level[finite] = numpy.ceil(
+                numpy.log2(dt/dt_particle[finite]))
+
+            if (new_level > max_level).any():
+                logger.warn("BlockTimeStepIntegrator: %d particles of %s "
+                            "need a step smaller than dt/2**%d"%(
+                        (new_level > max_level).sum(), pa.name, max_level))
+
+            new_level = numpy.clip(new_level, 0, max_level)
+            new_level = numpy.maximum(new_level, level[mask] - 1)
+            new_level = numpy.maximum(new_level, min_level)
+
+            level[mask] = new_level
+
+    def integrate(self, dt):
+
+        nsubsteps = 2**self.max_level
+        dt_substep = dt/nsubsteps
+
+        self.num_evaluations = 0
+
+        for substep in range(nsubsteps):
+
+            # predict the state of all particles at the substep and
+            # start the step of the active particles. All particles are
+            # active at the first substep.
+
+            if substep > 0:
+                self.predict(substep, dt_substep)
+
+            self.set_active(substep)
+
+            if substep > 0:
+                self.particles.update()
+
+            # evaluate the rates of the active particles
+
+            self.eval(self.calcs)
+
+            self.set_levels(substep, dt)
+
+        # synchronize the particles at the end of the step
+
+        self.predict(nsubsteps, dt_substep)
+        self.particles.update()
+
+        if logger.level < 30:
+            logger.info("BlockTimeStepIntegrator: %d particle evaluations"%(
+                    self.num_evaluations))
+
+##############################################################################
+
+##############################################################################
+#`LowStorageRKIntegrator` class
+##############################################################################
+class LowStorageRKIntegrator(Integrator):
+    """ 2N storage Runge-Kutta integration of the system X' = F(X)
+
+    The stages of a Williamson type scheme read:
+
+    dX = A[i]*dX + h*F(X)
+    X = X + B[i]*dX
+
+    for i = 1 .. s, with A[1] = 0. Only the register dX is kept for
+    each update property, in addition to the result of the RHS
+    evaluation of each calc (the `k1` arrays). No initial arrays are
+    needed.
+
+    Subclasses define the coefficients `A` and `B`.
+
+    Notes:
+    ======
+    The register of a property is shared by the calcs updating the
+    property and is named '_dX_<prop>'.
+
+    """
+
+    A = []
+    B = []
+
+    def __init__(self, particles, calcs):
+        Integrator.__init__(self, particles, calcs)
+        self.nsteps = 1
+        self.store_initial_arrays = False
+
+        self.register_arrays = []
+        self.register_props = []
+
+    def setup_integrator(self):
+        """ Setup the k arrays and the registers
+
+        For each array stepped by an integrating calc, the k1 properties
+        of the calcs are collected for each update property and a
+        register is added for the property.
+
+        """
+        Integrator.setup_integrator(self)
+
+        self.register_arrays = []
+        self.register_props = []
+
+        for calc in self.calcs:
+            if not calc.integrates:
+                continue
+
+            pa = self.arrays[calc.dnum]
+
+            for i in range(len(self.register_arrays)):
+                if self.register_arrays[i] is pa:
+                    props = self.register_props[i]
+                    break
+            else:
+                props = {}
+                self.register_arrays.append(pa)
+                self.register_props.append(props)
+
+            for j in range(calc.nupdates):
+                prop = calc.updates[j]
+                if not props.has_key(prop):
+                    register = '_dX_' + prop
+                    self.add_property(pa, register)
+                    props[prop] = (register, [])
+
+                props[prop][1].append(self.k_props[calc.id]['k1'][j])
+
+    def stage(self, a, b, dt):
+        """ Update the registers and step the properties """
+        for i in range(len(self.register_arrays)):
+            pa = self.register_arrays[i]
+            np = pa.num_real_particles
+
+            for prop, (register, k_props) in \
+                    self.register_props[i].iteritems():
+                dX = pa.get_carray(register)
+
+                arrays = [pa.get_carray(k_prop) for k_prop in k_props]
+                coeffs = [dt]*len(k_props)
+
+                # the register is not read at the first stage (a = 0)
+
+                if a != 0.0:
+                    arrays.append(dX)
+                    coeffs.append(a)
+
+                linear_combination(dX, arrays, coeffs, np)
+
+                axpy(pa.get_carray(prop), dX, b, np)
+                _set_dirty(pa, prop)
+
+    def integrate(self, dt):
+
+        nstages = len(self.A)
+
+        for i in range(nstages):
+
+            # evaluate the RHS at the current state
+
+            self.eval(self.calcs)
+
+            # step the registers and the properties
+
+            self.stage(self.A[i], self.B[i], dt)
+
+            self.particles.update()
+
+##############################################################################
+#`LowStorageRK3Integrator` class
+##############################################################################
+class LowStorageRK3Integrator(LowStorageRKIntegrator):
+    """ Three stage, third order 2N storage Runge-Kutta scheme of
+    Williamson (J. Comput. Phys. 35, 1980) """
+
+    A = [0.0, -5.0/9.0, -153.0/128.0]
+    B = [1.0/3.0, 15.0/16.0, 8.0/15.0]
+
+##############################################################################
+#`LowStorageRK4Integrator` class
+##############################################################################
+class LowStorageRK4Integrator(LowStorageRKIntegrator):
+    """ Five stage, fourth order 2N storage Runge-Kutta scheme of
+    Carpenter and Kennedy (NASA TM 109112, 1994) """
+
+    A = [0.0,
+         -567301805773.0/1357537059087.0,
+         -2404267990393.0/2016746695238.0,
+         -3550918686646.0/2091501179385.0,
+         -1275806237668.0/842570457699.0]
+
+    B = [1432997174477.0/9575080441755.0,
+         5161836677717.0/13612068292357.0,
+         1720146321549.0/2090206949498.0,
+         3134564353537.0/4481467310338.0,
+         2277821191437.0/14882151754819.0]
+
+##############################################################################
+
+##############################################################################
+#`VelocityVerletIntegrator` class
+##############################################################################
+class VelocityVerletIntegrator(Integrator):
+    """ Kick-drift-kick (velocity Verlet) integration of the system:
+
+    \frac{Dv}{Dt} = F
+    \frac{Dr}{Dt} = v
+    \frac{D\rho}{Dt} = D
+
+    with a single RHS evaluation per step:
+
+    kick:  v = v_0 + 0.5*h*F_0,  rho = rho_0 + 0.5*h*D_0
+    drift: r = r_0 + h*v
+    evaluate F and D at the new positions
+    kick:  v = v + 0.5*h*F,  rho = rho + 0.5*h*D
+
+    The rates F_0 and D_0 are the ones evaluated at the end of the
+    previous step, so that the particles are rebinned and the non
+    position calcs are evaluated once per step. The rates are evaluated
+    at the start of the first step only.
+
+    Notes:
+    ======
+    The drift uses the rate of the position calcs, evaluated after the
+    second kick of the previous step, and the position and velocity of
+    each particle are updated in a single pass:
+
+    r = r_0 + h*R_0 + 0.5*h*h*F_0
+
+    where R_0 is v_0 for plain position stepping, or includes the XSPH
+    correction. The velocity of the position 'x', 'y' and 'z' is 'u',
+    'v' and 'w' respectively.
+
+    The integrator keeps the rates between steps. Call
+    `setup_integrator` again if the particles are changed outside the
+    integrator.
+
+    """
+
+    velocities = {'x':'u', 'y':'v', 'z':'w'}
+
+    def __init__(self, particles, calcs):
+        Integrator.__init__(self, particles, calcs)
+        self.nsteps = 1
+        self.store_initial_arrays = False
+
+        self.rates_set = False
+
+        self.step_arrays = []
+        self.kick_props = []
+        self.drift_props = []
+
+    def _get_props(self, pa, props_list):
+        """ Return the dictionary of `props_list` for the array `pa` """
+        for i in range(len(self.step_arrays)):
+            if self.step_arrays[i] is pa:
+                return props_list[i]
+
+        self.step_arrays.append(pa)
+        self.kick_props.append({})
+        self.drift_props.append({})
+
+        return props_list[-1]
+
+    def setup_integrator(self):
+        """ Setup the k arrays and collect the rates of each property
+
+        For each array stepped by an integrating calc, the k1 properties
+        of the non position calcs are collected for each kicked property
+        and the k1 properties of the position calcs for each drifted
+        property.
+
+        """
+        Integrator.setup_integrator(self)
+
+        self.rates_set = False
+
+        self.step_arrays = []
+        self.kick_props = []
+        self.drift_props = []
+
+        for calcs, props_list in [(self.icalcs, self.kick_props),
+                                  (self.pcalcs, self.drift_props)]:
+            for calc in calcs:
+                if not calc.integrates:
+                    continue
+
+                props = self._get_props(self.arrays[calc.dnum], props_list)
+
+                for j in range(calc.nupdates):
+                    prop = calc.updates[j]
+                    if not props.has_key(prop):
+                        props[prop] = []
+
+                    props[prop].append(self.k_props[calc.id]['k1'][j])
+
+    def eval_rates(self):
+        """ Evaluate the non position and the position calcs """
+        self.eval(self.ncalcs)
+        self.eval(self.pcalcs)
+
+        self.rates_set = True
+
+    def kick(self, dt, skip=[]):
+        """ Kick the properties by half a step, except those in `skip`
+        for each array """
+        for i in range(len(self.step_arrays)):
+            pa = self.step_arrays[i]
+            np = pa.num_real_particles
+
+            for prop, k_props in self.kick_props[i].iteritems():
+                if skip and prop in skip[i]:
+                    continue
+
+                current = pa.get_carray(prop)
+                arrays = [current] + [pa.get_carray(k) for k in k_props]
+                coeffs = [1.0] + [0.5*dt]*len(k_props)
+
+                linear_combination(current, arrays, coeffs, np)
+                _set_dirty(pa, prop)
+
+    def drift(self, dt):
+        """ Kick the properties by half a step and drift the positions
+
+        A position is updated together with its velocity in a single
+        pass. The remaining properties are kicked separately.
+
+        """
+        fused = []
+
+        for i in range(len(self.step_arrays)):
+            pa = self.step_arrays[i]
+            np = pa.num_real_particles
+
+            kick_props = self.kick_props[i]
+            fused.append([])
+
+            for prop, x_rates in self.drift_props[i].iteritems():
+                x = pa.get_carray(prop)
+                x_rates = [pa.get_carray(k) for k in x_rates]
+
+                vel = self.velocities.get(prop)
+                if kick_props.has_key(vel):
+                    v_rates = [pa.get_carray(k) for k in kick_props[vel]]
+                    kick_drift(x, x_rates, pa.get_carray(vel), v_rates,
+                               dt, np)
+                    fused[i].append(vel)
+                else:
+                    linear_combination(x, [x] + x_rates,
+                                       [1.0] + [dt]*len(x_rates), np)
+
+                _set_dirty(pa, prop)
+
+        self.kick(dt, skip=fused)
+
+    def integrate(self, dt):
+
+        if not self.rates_set:
+            self.eval_rates()
+
+        # first kick and drift with the rates of the previous step
+
+        self.drift(dt)
+
+        # rebin and evaluate the rates at the new positions
+
+        self.particles.barrier()
+        self.particles.update()
+
+        self.eval(self.ncalcs)
+
+        # second kick
+
+        self.kick(dt)
+
+        # rates of the position calcs with the new velocities
+
+        self.eval(self.pcalcs)
+
+##############################################################################
@@ -0,0 +1,10 @@
+from pysph.base.carray cimport BaseArray, DoubleArray, IntArray
+
+cpdef linear_combination(BaseArray dst, list arrays, list coeffs, long n)
+cpdef axpy(BaseArray y, BaseArray x, double a, long n)
+cpdef copy_array(BaseArray dst, BaseArray src, long n)
+cpdef scaled_sum(BaseArray dst, BaseArray x0, list arrays, DoubleArray scale,
+                 long n)
+cpdef masked_copy(BaseArray dst, BaseArray src, IntArray mask, long n)
+cpdef kick_drift(BaseArray x, list x_rates, BaseArray v, list v_rates,
+                 double dt, long n)
@@ -0,0 +1,300 @@
+"""
+In-place array operations used by the integrators.
+
+The functions operate directly on the data of the carrays of a particle
+array, without the temporary numpy arrays created by `ParticleArray.get`
+and `ParticleArray.set`. Only the first `n` entries are used, which is
+the number of real particles when called from the integrators.
+
+Double (DoubleArray) and single precision (FloatArray) arrays may be
+mixed. The combination is always accumulated in double precision and
+rounded once when it is written to a single precision array.
+
+"""
+from libc.stdlib cimport *
+
+from pysph.base.carray cimport BaseArray, DoubleArray, FloatArray, IntArray
+
+cdef void* _get_data(BaseArray arr, bint *is_double, long n) except NULL:
+    """ Return the data pointer of `arr` and whether it holds doubles """
+    if arr.length < n:
+        raise ValueError, 'array of length %d, %d values required'%(
+            arr.length, n)
+
+    if isinstance(arr, DoubleArray):
+        is_double[0] = True
+        return (<DoubleArray>arr).data
+    elif isinstance(arr, FloatArray):
+        is_double[0] = False
+        return (<FloatArray>arr).data
+    else:
+        raise TypeError, 'only DoubleArray and FloatArray are supported'
+
+cpdef linear_combination(BaseArray dst, list arrays, list coeffs, long n):
+    """ Set dst = sum_j coeffs[j]*arrays[j] for the first n entries
+
+    Parameters:
+    -----------
+
+    dst -- the array to write. It may be one of `arrays`.
+    arrays -- the arrays to combine.
+    coeffs -- the coefficient of each array.
+    n -- the number of entries to update.
+
+    Notes:
+    ------
+    The combination is evaluated in a single pass over the data. Each
+    entry of `dst` is written only after all the arrays have been
+    read for it, so that updates such as `x = x + dt*k` are in-place.
+
+    """
+    cdef int narrays = len(arrays)
+    cdef int j
+    cdef long i
+    cdef double s
+    cdef bint dst_double
+    cdef void *dst_data
+    cdef void **data
+    cdef bint *is_double
+    cdef double *c
+
+    if len(coeffs) != narrays:
+        raise ValueError, 'got %d arrays and %d coefficients'%(
+            narrays, len(coeffs))
+
+    if n <= 0:
+        return
+
+    dst_data = _get_data(dst, &dst_double, n)
+
+    data = <void**>malloc(narrays*sizeof(void*))
+    is_double = <bint*>malloc(narrays*sizeof(bint))
+    c = <double*>malloc(narrays*sizeof(double))
+
+    try:
+        for j in range(narrays):
+            data[j] = _get_data(arrays[j], &is_double[j], n)
+            c[j] = coeffs[j]
+
+        with nogil:
+            for i in range(n):
+                s = 0.0
+                for j in range(narrays):
+                    if is_double[j]:
+                        s += c[j]*(<double*>data[j])[i]
+                    else:
+                        s += c[j]*(<float*>data[j])[i]
+
+                if dst_double:
+                    (<double*>dst_data)[i] = s
+                else:
+                    (<float*>dst_data)[i] = <float>s
+    finally:
+        free(data)
+        free(is_double)
+        free(c)
+
+cpdef axpy(BaseArray y, BaseArray x, double a, long n):
+    """ Set y = y + a*x for the first n entries """
+    linear_combination(y, [y, x], [1.0, a], n)
+
+cpdef copy_array(BaseArray dst, BaseArray src, long n):
+    """ Copy the first n entries of src to dst """
+    linear_combination(dst, [src], [1.0], n)
+
+cpdef scaled_sum(BaseArray dst, BaseArray x0, list arrays, DoubleArray scale,
+                 long n):
+    """ Set dst = x0 + scale*sum_j arrays[j] for the first n entries
+
+    Parameters:
+    -----------
+
+    dst -- the array to write. It may be `x0`.
+    x0 -- the array to start from.
+    arrays -- the arrays to sum.
+    scale -- the factor of the sum for each entry.
+    n -- the number of entries to update.
+
+    Notes:
+    ------
+    This is `linear_combination` with a coefficient per entry, as
+    needed when the particles are stepped with individual time steps.
+
+    """
+    cdef int narrays = len(arrays)
+    cdef int j
+    cdef long i
+    cdef double s
+    cdef bint dst_double, x0_double
+    cdef void *dst_data
+    cdef void *x0_data
+    cdef void **data
+    cdef bint *is_double
+    cdef bint scale_double
+    cdef double *scale_data
+
+    if n <= 0:
+        return
+
+    dst_data = _get_data(dst, &dst_double, n)
+    x0_data = _get_data(x0, &x0_double, n)
+    scale_data = <double*>_get_data(scale, &scale_double, n)
+
+    data = <void**>malloc(narrays*sizeof(void*))
+    is_double = <bint*>malloc(narrays*sizeof(bint))
+
+    try:
+        for j in range(narrays):
+            data[j] = _get_data(arrays[j], &is_double[j], n)
+
+        with nogil:
+            for i in range(n):
+                s = 0.0
+                for j in range(narrays):
+                    if is_double[j]:
+                        s += (<double*>data[j])[i]
+                    else:
+                        s += (<float*>data[j])[i]
+
+                s *= scale_data[i]
+                if x0_double:
+                    s += (<double*>x0_data)[i]
+                else:
+                    s += (<float*>x0_data)[i]
+
+                if dst_double:
+                    (<double*>dst_data)[i] = s
+                else:
+                    (<float*>dst_data)[i] = <float>s
+    finally:
+        free(data)
+        free(is_double)
+
+cpdef masked_copy(BaseArray dst, BaseArray src, IntArray mask, long n):
+    """ Copy the entries of src with a non zero mask to dst, for the
+    first n entries """
+    cdef long i
+    cdef bint dst_double, src_double
+    cdef void *dst_data
+    cdef void *src_data
+    cdef int *mask_data = mask.data
+    cdef double value
+
+    if mask.length < n:
+        raise ValueError, 'mask of length %d, %d values required'%(
+            mask.length, n)
+
+    if n <= 0:
+        return
+
+    dst_data = _get_data(dst, &dst_double, n)
+    src_data = _get_data(src, &src_double, n)
+
+    with nogil:
+        for i in range(n):
+            if mask_data[i] == 0:
+                continue
+
+            if src_double:
+                value = (<double*>src_data)[i]
+            else:
+                value = (<float*>src_data)[i]
+
+            if dst_double:
+                (<double*>dst_data)[i] = value
+            else:
+                (<float*>dst_data)[i] = <float>value
+
+cpdef kick_drift(BaseArray x, list x_rates, BaseArray v, list v_rates,
+                 double dt, long n):
+    """ Kick v and drift x in a single pass over the first n entries
+
+    Parameters:
+    -----------
+
+    x -- the position to drift.
+    x_rates -- the arrays whose sum is the rate of x.
+    v -- the velocity to kick.
+    v_rates -- the arrays whose sum is the rate of v.
+    dt -- the time step.
+    n -- the number of entries to update.
+
+    Notes:
+    ------
+    With a = sum(v_rates), the update reads
+
+        x = x + dt*sum(x_rates) + 0.5*dt*dt*a
+        v = v + 0.5*dt*a
+
+    which is the first kick and the drift of a kick-drift-kick step when
+    sum(x_rates) is the velocity at the start of the step.
+
+    """
+    cdef int nx = len(x_rates)
+    cdef int nv = len(v_rates)
+    cdef int j
+    cdef long i
+    cdef double a, rate, xi, vi
+    cdef double half_dt = 0.5*dt
+    cdef bint x_double, v_double
+    cdef void *x_data
+    cdef void *v_data
+    cdef void **data
+    cdef bint *is_double
+
+    if n <= 0:
+        return
+
+    x_data = _get_data(x, &x_double, n)
+    v_data = _get_data(v, &v_double, n)
+
+    data = <void**>malloc((nx + nv)*sizeof(void*))
+    is_double = <bint*>malloc((nx + nv)*sizeof(bint))
+
+    try:
+        for j in range(nx):
+            data[j] = _get_data(x_rates[j], &is_double[j], n)
+        for j in range(nv):
+            data[nx + j] = _get_data(v_rates[j], &is_double[nx + j], n)
+
+        with nogil:
+            for i in range(n):
+                rate = 0.0
+                for j in range(nx):
+                    if is_double[j]:
+                        rate += (<double*>data[j])[i]
+                    else:
+                        rate += (<float*>data[j])[i]
+
+                a = 0.0
+                for j in range(nx, nx + nv):
+                    if is_double[j]:
+                        a += (<double*>data[j])[i]
+                    else:
+                        a += (<float*>data[j])[i]
+
+                if x_double:
+                    xi = (<double*>x_data)[i]
+                else:
+                    xi = (<float*>x_data)[i]
+
+                if v_double:
+                    vi = (<double*>v_data)[i]
+                else:
+                    vi = (<float*>v_data)[i]
+
+                xi += dt*(rate + half_dt*a)
+                vi += half_dt*a
+
+                if x_double:
+                    (<double*>x_data)[i] = xi
+                else:
+                    (<float*>x_data)[i] = <float>xi
+
+                if v_double:
+                    (<double*>v_data)[i] = vi
+                else:
+                    (<float*>v_data)[i] = <float>vi
+    finally:
+        free(data)
+        free(is_double)
@@ -1,6 +1,7 @@
 """ An implementation of a general solver base class """
 
 import os
+import time
 from utils import PBar, savez_compressed, savez
 from cl_utils import get_cl_devices, HAS_CL
 
@@ -49,6 +50,14 @@ class Solver(object):
 
     - pfreq -- the output print frequency
 
+    - output_interval -- the simulated time between outputs. When set,
+      it replaces `pfreq` and the steps are shortened to end at the
+      output times.
+
+    - time_step_controller -- computes an adaptive time step after each
+      step (see solver/time_step.py). Defaults to None for a fixed
+      time step.
+
     - dim -- the dimension of the problem
 
     - kernel_correction -- flag to indicate type of kernel correction.
@@ -91,9 +100,22 @@ class Solver(object):
         self.pre_step_functions = []
         self.post_step_functions = []
         self.pfreq = 100
+        self.output_interval = None
+
+        self.dt = None
+        self.time_step_controller = None
 
         self.kernel_correction = -1
 
+        self.fuse_calcs = False
+
+        self.num_threads = 1
+
+        # steps with a rebuild and reusing the neighbor lists
+
+        self.num_rebuild_steps = 0
+        self.num_skipped_steps = 0
+
         self.pid = None
         self.eps = -1
 
@@ -337,10 +359,18 @@ class Solver(object):
 
             self.particles.kernel = self.default_kernel
 
+            # search the neighbors in the dimension of the problem. The
+            # stencils of the parallel cell manager are set when the
+            # particles are created
+
+            if not particles.in_parallel:
+                particles.cell_manager.set_dimension(self.dim)
+
             if particles.in_parallel:
                 self.pid = particles.cell_manager.pid
 
             self.integrator = self.integrator_type(particles, calcs=[])
+            self.integrator.fuse_calcs = self.fuse_calcs
 
             # set the calcs for the integrator
 
@@ -354,11 +384,19 @@ class Solver(object):
 
                 self.integrator.calcs.extend(calcs)
 
+            self._set_calc_threads()
+
             if self.with_cl:
                 self.integrator.setup_integrator(self.cl_context)
             else:
                 self.integrator.setup_integrator()
 
+            # memory used by the integrator properties
+
+            for name, nbytes in self.integrator.get_memory_usage().items():
+                logger.info("%s: %d bytes of integrator properties for %s"%(
+                        self.integrator.__class__.__name__, nbytes, name))
+
             # Setup the kernel correction manager for each calc
 
             calcs = self.integrator.calcs
@@ -388,10 +426,33 @@ class Solver(object):
         """ Set the time step to use """
         self.dt = dt
 
+    def set_time_step_controller(self, controller):
+        """ Set the controller for adaptive time steps
+
+        The controller (a TimeStepController) computes the time step
+        used for the next step from the state of the particles. A time
+        step set with `set_time_step` is used for the first step, and
+        is computed by the controller otherwise.
+
+        """
+        self.time_step_controller = controller
+
     def set_print_freq(self, n):
         """ Set the output print frequency """
         self.pfreq = n
 
+    def set_output_interval(self, interval):
+        """ Dump output at fixed intervals of simulated time
+
+        This replaces the output print frequency. Use None to go back to
+        the print frequency.
+
+        """
+        if interval is not None and interval <= 0:
+            raise ValueError, 'The output interval must be positive'
+
+        self.output_interval = interval
+
     def set_output_fname(self, fname):
         """ Set the output file name """
         self.fname = fname    
@@ -417,6 +478,31 @@ class Solver(object):
         for id in self.operation_dict:
             self.operation_dict[id].kernel_correction=kernel_correction
 
+    def set_fuse_calcs(self, fuse_calcs):
+        """ Set the flag to evaluate the integrating calcs with the same
+        destination in a single neighbor traversal """
+        self.fuse_calcs = fuse_calcs
+
+        if self.particles is not None:
+            self.integrator.fuse_calcs = fuse_calcs
+
+    def set_num_threads(self, num_threads):
+        """ Set the number of threads evaluating the functions of the
+        calcs over the destination particles """
+        if num_threads < 1:
+            raise ValueError, 'The number of threads must be positive'
+
+        self.num_threads = num_threads
+
+        if self.particles is not None:
+            self._set_calc_threads()
+
+    def _set_calc_threads(self):
+        """ Set the number of threads for the functions of all calcs """
+        for calc in self.integrator.calcs:
+            for func in calc.funcs:
+                func.num_threads = self.num_threads
+
     def set_cl(self, with_cl=False):
         """ Set the flag to use OpenCL
 
@@ -467,12 +553,49 @@ class Solver(object):
 
         """
         self.count = 0
-        maxval = int((self.tf - self.t)/self.dt +1)
+
+        self.num_rebuild_steps = 0
+        self.num_skipped_steps = 0
+        self._last_rebuild_stats = (0, 0)
+
+        nnps_manager = getattr(self.particles, 'nnps_manager', None)
+        if nnps_manager is not None:
+            self._last_rebuild_stats = nnps_manager.get_rebuild_stats()
+
+        controller = self.time_step_controller
+        if controller is not None and self.dt is None:
+            self.dt = controller.get_time_step(self)
+
+        # with a variable time step, the progress is in 0.1% of the run
+
+        variable_dt = controller is not None or \
+                      self.output_interval is not None
+
+        t0 = self.t
+        if variable_dt:
+            maxval = 1000
+        else:
+            maxval = int((self.tf - self.t)/self.dt +1)
         bar = PBar(maxval, show=show_progress)
 
+        if self.output_interval is not None:
+            next_output = self.t + self.output_interval
+
         while self.t < self.tf:
-            self.t += self.dt
+            dt = self.dt
+
+            # end the step at the next output time or the final time
+
+            if self.output_interval is not None:
+                dt = min(dt, next_output - self.t)
+
+            if variable_dt:
+                dt = min(dt, self.tf - self.t)
+
+            self.t += dt
             self.count += 1
+
+            step_start = time.time()
             
             #update the particles explicitly
 
@@ -485,21 +608,45 @@ class Solver(object):
 
             # perform the integration 
 
-            logger.info("Time %f, time step %f "%(self.t, self.dt))
+            logger.info("Time %f, time step %f "%(self.t, dt))
 
-            self.integrator.integrate(self.dt)
+            self.integrator.integrate(dt)
 
             # perform any post step functions
             
             for func in self.post_step_functions:
                 func.eval(self, self.count)
 
+            # step timing and the (cumulative) reuse of neighbor lists
+
+            self.update_rebuild_stats()
+
+            if logger.level < 30:
+                logger.info("Step %d took %f s, steps with neighbor list "
+                            "builds %d, skipped builds %d"%(
+                        self.count, time.time() - step_start,
+                        self.num_rebuild_steps, self.num_skipped_steps))
+
+            # compute the time step for the next step
+
+            if controller is not None:
+                self.dt = controller.get_time_step(self)
+
             # dump output
 
-            if self.count % self.pfreq == 0:
+            if self.output_interval is not None:
+                if self.t >= next_output - 1e-12*self.output_interval:
+                    self.dump_output(*self.print_properties)
+                    next_output += self.output_interval
+
+            elif self.count % self.pfreq == 0:
                 self.dump_output(*self.print_properties)
 
-            bar.update()
+            if variable_dt:
+                progress = int(maxval*(self.t - t0)/(self.tf - t0))
+                bar.update(min(maxval, progress))
+            else:
+                bar.update()
         
             if self.execute_commands is not None:
                 if self.count % self.command_interval == 0:
@@ -507,6 +654,36 @@ class Solver(object):
 
         bar.finish()
 
+        logger.info("Steps with neighbor list builds %d, skipped builds %d"%(
+                self.num_rebuild_steps, self.num_skipped_steps))
+
+    def update_rebuild_stats(self):
+        """ Count the last step as a step with a neighbor list build or
+        as a step reusing the neighbor lists
+
+        Notes
+        -----
+        The neighbor locators count the updates of the particles, of
+        which there are several per step for multi-stage integrators.
+        A step is counted once: as a build if any locator was rebuilt
+        during the step, as skipped if a build was skipped due to the
+        skin. Nothing is counted if the particles have no NNPS manager.
+
+        """
+        nnps_manager = getattr(self.particles, 'nnps_manager', None)
+        if nnps_manager is None:
+            return
+
+        num_builds, num_skipped = nnps_manager.get_rebuild_stats()
+
+        last_builds, last_skipped = self._last_rebuild_stats
+        if num_builds > last_builds:
+            self.num_rebuild_steps += 1
+        elif num_skipped > last_skipped:
+            self.num_skipped_steps += 1
+
+        self._last_rebuild_stats = (num_builds, num_skipped)
+
     def dump_output(self, *print_properties):
         """ Print output based on level of detail required
         
@@ -386,5 +386,237 @@ class TestLeapFrogIntegrator(IntegratorTestCase):
 
 ##############################################################################
 
+class TestBlockTimeStepIntegrator(IntegratorTestCase):
+    """ Test for the block time step integrator
+
+    For the test, the particles (defined in the setUp of the base class)
+    are constrained to move on a circle of radius 2./pi.
+
+    The sound speed of the first particle is set so that its CFL
+    time step is a quarter of the time step of the integrator.
+
+    """
+    def setup(self):
+        self.integrator = solver.BlockTimeStepIntegrator(
+            particles=self.particles, calcs = self.calcs, max_level=2)
+
+        cs = numpy.zeros(4)
+        cs[0] = 1000.0
+        self.pa.set(cs=cs)
+
+    def test_levels(self):
+        """ Test the levels and the active particles of a step """
+
+        self.integrator.setup_integrator()
+
+        integrator = self.integrator
+        pa = self.pa
+
+        self.particles.update()
+        integrator.integrate(1e-3)
+
+        # the first particle takes four steps and the others one
+
+        self.assertEqual(list(pa.get('_block_level')), [2, 0, 0, 0])
+        self.assertEqual(integrator.num_evaluations, 7)
+
+        # the last step of the first particle starts at the last substep
+
+        self.assertEqual(list(pa.get('_block_start')), [3, 0, 0, 0])
+
+    def test_motion(self):
+        """ Perform the integration of the particle positons
+
+        The scheme is first order accurate in time. The largest time
+        step used for the integration is 1e-3 and thus we expect the
+        positions of the particles to be exact to within two decimal
+        places.
+
+        """
+
+        #setup the integrator
+
+        self.integrator.setup_integrator()
+
+        #set the time constants
+
+        t = 0; tf = 1.0; dt = 1e-3
+
+        integrator = self.integrator
+        particles = integrator.particles
+        pa = particles.arrays[0]
+
+        exact = (0.0, self.r), (-self.r, 0.0), (0.0, -self.r), (self.r, 0.0)
+
+        while t <= tf:
+            t += dt
+            particles.update()
+            integrator.integrate(dt)
+
+        new_pos = [(pa.x[i] ,pa.y[i]) for i in range(len(pa.x))]
+
+        for i in range(4):
+            self.assertAlmostEqual(new_pos[i][0], exact[i][0], 2)
+            self.assertAlmostEqual(new_pos[i][1], exact[i][1], 2)
+
+##############################################################################
+
+class TestLowStorageRKIntegrators(IntegratorTestCase):
+    """ Test for the low storage Runge-Kutta integrators
+
+    For the test, the particles (defined in the setUp of the base class)
+    are constrained to move on a circle of radius 2./pi.
+
+    Four particles start the motion from the points ENWS and after one
+    second, the positions should be NWSE respectively.
+
+    """
+    def test_motion(self):
+        """ Perform the integration of the particle positons
+
+        The schemes are third and fourth order accurate in time. The
+        time step used for the integration is 1e-2 and we expect the
+        positions of the particles to be exact to within four decimal
+        places.
+
+        """
+        exact = (0.0, self.r), (-self.r, 0.0), (0.0, -self.r), (self.r, 0.0)
+
+        for integrator_type in (solver.LowStorageRK3Integrator,
+                                solver.LowStorageRK4Integrator):
+
+            self.setUp()
+
+            integrator = integrator_type(particles=self.particles,
+                                         calcs=self.calcs)
+            integrator.setup_integrator()
+
+            particles = integrator.particles
+            pa = particles.arrays[0]
+
+            t = 0.0; dt = 1e-2
+            for i in range(100):
+                t += dt
+                particles.update()
+                integrator.integrate(dt)
+
+            for i in range(4):
+                self.assertAlmostEqual(pa.x[i], exact[i][0], 4)
+                self.assertAlmostEqual(pa.y[i], exact[i][1], 4)
+
+    def test_memory_usage(self):
+        """ Compare the memory of the integrator properties with RK4 """
+
+        rk4 = solver.RK4Integrator(particles=self.particles, calcs=self.calcs)
+        rk4.setup_integrator()
+        rk4_bytes = rk4.get_memory_usage()['tmp']
+
+        self.setUp()
+
+        lsrk4 = solver.LowStorageRK4Integrator(particles=self.particles,
+                                               calcs=self.calcs)
+        lsrk4.setup_integrator()
+        lsrk4_bytes = lsrk4.get_memory_usage()['tmp']
+
+        # two calcs updating x and y: 4 k arrays per calc and update
+        # and 2 initial arrays for RK4, 1 k array per calc and update
+        # and 2 registers for the low storage scheme
+
+        self.assertEqual(len(rk4.allocated_props['tmp']), 18)
+        self.assertEqual(len(lsrk4.allocated_props['tmp']), 6)
+        self.assertTrue(lsrk4_bytes < rk4_bytes)
+
+        self.assertTrue(self.pa.properties.has_key('_dX_x'))
+        self.assertFalse(self.pa.properties.has_key('_x_0'))
+
+##############################################################################
+
+class TestVelocityVerletIntegrator(unittest.TestCase):
+    """ Test for the velocity Verlet integrator
+
+    For the test, two particles are thrown with an initial velocity
+    under a constant gravity, for which the scheme is exact.
+
+    """
+    def setUp(self):
+        x = numpy.array([0.0, 1.0])
+        y = numpy.array([0.0, 0.0])
+        u = numpy.array([1.0, -1.0])
+        v = numpy.array([2.0, 3.0])
+
+        self.pa = pa = base.get_particle_array(x=x, y=y, u=u, v=v,
+                                               name='tmp')
+        self.particles = particles = base.Particles(arrays=[pa])
+        kernel = base.CubicSplineKernel(dim=2)
+
+        gravity = solver.SPHIntegration(
+            sph.GravityForce.withargs(gy=-10.0), on_types=[Fluids],
+            updates=['u','v'], id='gravity')
+
+        position = solver.SPHIntegration(
+            sph.PositionStepping.withargs(dim=2), on_types=[Fluids],
+            updates=['x','y'], id='step')
+
+        self.calcs = calcs = []
+        calcs.extend(gravity.get_calcs(particles, kernel))
+        calcs.extend(position.get_calcs(particles, kernel))
+
+        self.integrator = solver.VelocityVerletIntegrator(
+            particles=particles, calcs=calcs)
+
+    def test_motion(self):
+        """ Compare with the exact trajectory after 100 steps """
+
+        integrator = self.integrator
+        integrator.setup_integrator()
+
+        particles = self.particles
+        pa = self.pa
+
+        x0, y0, u0, v0 = [a.copy() for a in pa.get('x', 'y', 'u', 'v')]
+
+        t = 0.0; dt = 1e-2
+        for i in range(100):
+            t += dt
+            particles.update()
+            integrator.integrate(dt)
+
+        x, y, u, v = pa.get('x', 'y', 'u', 'v')
+
+        self.assertTrue(numpy.allclose(x, x0 + u0*t))
+        self.assertTrue(numpy.allclose(y, y0 + v0*t - 5.0*t*t))
+        self.assertTrue(numpy.allclose(u, u0))
+        self.assertTrue(numpy.allclose(v, v0 - 10.0*t))
+
+    def test_evaluations(self):
+        """ The non position calcs are evaluated once per step """
+
+        integrator = self.integrator
+        integrator.setup_integrator()
+
+        evaluated = []
+        eval = integrator.eval
+
+        def counting_eval(calcs):
+            evaluated.extend([calc.id for calc in calcs])
+            eval(calcs)
+
+        integrator.eval = counting_eval
+
+        for i in range(3):
+            self.particles.update()
+            integrator.integrate(1e-2)
+
+        # one evaluation before the first step and one per step
+
+        gravity = integrator.ncalcs[0].id
+        self.assertEqual(evaluated.count(gravity), 4)
+
+        # no initial arrays are needed
+
+        self.assertFalse(self.pa.properties.has_key('_u_0'))
+
+##############################################################################
+
 if __name__ == '__main__':
     unittest.main()
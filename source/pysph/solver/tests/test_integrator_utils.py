@@ -0,0 +1,104 @@
+""" Tests for the in-place integrator operations """
+import numpy
+import unittest
+
+from pysph.base.carray import DoubleArray, FloatArray, LongArray, IntArray
+from pysph.solver.integrator_utils import linear_combination, axpy, \
+     copy_array, scaled_sum, masked_copy, kick_drift
+
+def make_array(cls, data):
+    arr = cls(len(data))
+    arr.set_data(numpy.asarray(data))
+    return arr
+
+class IntegratorUtilsTestCase(unittest.TestCase):
+    """ Tests for the in-place array operations """
+
+    def setUp(self):
+        self.a = numpy.linspace(0, 1, 10)
+        self.b = numpy.linspace(1, 3, 10)
+        self.c = numpy.cos(self.a)
+
+    def test_linear_combination(self):
+        x = make_array(DoubleArray, self.a)
+        k1 = make_array(DoubleArray, self.b)
+        k2 = make_array(DoubleArray, self.c)
+
+        linear_combination(x, [x, k1, k2], [1.0, 0.5, -2.0], 10)
+
+        expected = self.a + 0.5*self.b - 2.0*self.c
+        self.assertTrue(numpy.allclose(x.get_npy_array(), expected))
+
+        # only the first n entries are updated
+        y = make_array(DoubleArray, self.a)
+        linear_combination(y, [k1], [1.0], 4)
+
+        expected = self.a.copy()
+        expected[:4] = self.b[:4]
+        self.assertTrue(numpy.allclose(y.get_npy_array(), expected))
+
+        self.assertRaises(ValueError, linear_combination, x, [k1], [], 10)
+        self.assertRaises(ValueError, linear_combination, x, [k1], [1.0], 11)
+        self.assertRaises(TypeError, linear_combination, x,
+                          [LongArray(10)], [1.0], 10)
+
+    def test_axpy(self):
+        y = make_array(DoubleArray, self.a)
+        x = make_array(DoubleArray, self.b)
+
+        axpy(y, x, 0.1, 10)
+        self.assertTrue(numpy.allclose(y.get_npy_array(),
+                                       self.a + 0.1*self.b))
+        self.assertTrue(numpy.allclose(x.get_npy_array(), self.b))
+
+    def test_mixed_precision(self):
+        f = make_array(FloatArray, self.a)
+        d = make_array(DoubleArray, self.b)
+
+        axpy(f, d, 2.0, 10)
+        self.assertTrue(numpy.allclose(f.get_npy_array(), self.a + 2*self.b,
+                                       rtol=1e-6))
+
+        copy_array(d, f, 10)
+        self.assertTrue(numpy.allclose(d.get_npy_array(),
+                                       f.get_npy_array()))
+
+    def test_scaled_sum(self):
+        x = make_array(DoubleArray, self.a)
+        x0 = make_array(DoubleArray, self.b)
+        k1 = make_array(DoubleArray, self.c)
+        k2 = make_array(FloatArray, self.a)
+        scale = make_array(DoubleArray, numpy.arange(10.0))
+
+        scaled_sum(x, x0, [k1, k2], scale, 10)
+
+        expected = self.b + numpy.arange(10.0)*(self.c + self.a)
+        self.assertTrue(numpy.allclose(x.get_npy_array(), expected))
+
+    def test_masked_copy(self):
+        dst = make_array(DoubleArray, self.a)
+        src = make_array(DoubleArray, self.b)
+        mask = make_array(IntArray, [1, 0]*5)
+
+        masked_copy(dst, src, mask, 10)
+
+        expected = numpy.where(numpy.arange(10) % 2 == 0, self.b, self.a)
+        self.assertTrue(numpy.allclose(dst.get_npy_array(), expected))
+
+    def test_kick_drift(self):
+        x = make_array(DoubleArray, self.a)
+        v = make_array(FloatArray, self.b)
+        kx = make_array(DoubleArray, self.b)
+        kv1 = make_array(DoubleArray, self.c)
+        kv2 = make_array(DoubleArray, self.a)
+
+        kick_drift(x, [kx], v, [kv1, kv2], 0.1, 10)
+
+        acc = self.c + self.a
+        self.assertTrue(numpy.allclose(x.get_npy_array(),
+                                       self.a + 0.1*self.b + 0.005*acc))
+        self.assertTrue(numpy.allclose(v.get_npy_array(),
+                                       self.b + 0.05*acc, rtol=1e-6))
+
+if __name__ == '__main__':
+    unittest.main()
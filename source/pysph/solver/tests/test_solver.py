@@ -272,5 +272,113 @@ class SolverTestCase(unittest.TestCase):
 
         self.assertEqual(len(pcalcs), 2)
 
+    def test_rebuild_stats(self):
+        """ Test the counting of the steps reusing the neighbor lists """
+
+        class DummyNNPSManager(object):
+            stats = (0, 0)
+            def get_rebuild_stats(self):
+                return self.stats
+
+        class DummyParticles(object):
+            pass
+
+        s = self.solver
+        s._last_rebuild_stats = (0, 0)
+
+        # no NNPS manager, nothing is counted
+
+        s.particles = DummyParticles()
+        s.update_rebuild_stats()
+        self.assertEqual((s.num_rebuild_steps, s.num_skipped_steps), (0, 0))
+
+        s.particles.nnps_manager = manager = DummyNNPSManager()
+
+        # several skipped builds in one step are counted once
+
+        manager.stats = (0, 4)
+        s.update_rebuild_stats()
+        self.assertEqual((s.num_rebuild_steps, s.num_skipped_steps), (0, 1))
+
+        # a step with a build and skipped builds counts as a build
+
+        manager.stats = (1, 6)
+        s.update_rebuild_stats()
+        self.assertEqual((s.num_rebuild_steps, s.num_skipped_steps), (1, 1))
+
+class TimeStepControllerTestCase(unittest.TestCase):
+    """ Tests for the adaptive time step criteria """
+
+    def setUp(self):
+        x = numpy.array([0.0, 1.0, 2.0])
+        h = numpy.array([0.1, 0.2, 0.1])
+        u = numpy.array([1.0, 0.0, 0.0])
+        cs = numpy.array([10.0, 10.0, 10.0])
+
+        self.pa = pa = base.get_particle_array(name='fluid', x=x, h=h, u=u,
+                                               cs=cs)
+        self.particles = base.Particles(arrays=[pa])
+
+        self.solver = s = solver.Solver(dim=2,
+                                        integrator_type=solver.EulerIntegrator)
+
+        s.add_operation(solver.SPHIntegration(
+                sph.SPHPressureGradient.withargs(dim=2), on_types=[Fluids],
+                from_types=[Fluids], updates=['u','v'], id='pgrad'))
+
+        s.add_operation(solver.SPHIntegration(
+                sph.MonaghanArtificialVsicosity, on_types=[Fluids],
+                from_types=[Fluids], updates=['u','v'], id='avisc'))
+
+        s.setup_integrator(self.particles)
+
+    def set_accelerations(self, ax, ay):
+        """ Split the accelerations between the two integrating calcs """
+        integrator = self.solver.integrator
+        for calc in integrator.calcs:
+            k1_props = integrator.k_props[calc.id]['k1']
+            self.pa.set(**{k1_props[0]:0.5*ax, k1_props[1]:0.5*ay})
+
+    def test_criteria(self):
+        s = self.solver
+        controller = solver.TimeStepController(cfl=0.3, force_factor=0.25,
+                                               viscous_factor=0.125, nu=0.01)
+
+        self.set_accelerations(numpy.array([0.0, 3.0, 0.0]),
+                               numpy.array([0.0, 4.0, 0.0]))
+
+        dt = controller.get_time_step(s)
+
+        dt_cfl = 0.3*0.1/11.0
+        dt_force = 0.25*numpy.sqrt(0.2/5.0)
+        dt_viscous = 0.125*0.01/0.01
+
+        self.assertAlmostEqual(controller.criteria['cfl'], dt_cfl)
+        self.assertAlmostEqual(controller.criteria['force'], dt_force)
+        self.assertAlmostEqual(controller.criteria['viscous'], dt_viscous)
+
+        self.assertAlmostEqual(dt, dt_cfl)
+
+    def test_limits(self):
+        s = self.solver
+        controller = solver.TimeStepController(max_increase=1.5,
+                                               dt_max=1e-3)
+
+        s.set_time_step(1e-4)
+        self.assertAlmostEqual(controller.get_time_step(s), 1.5e-4)
+
+        s.set_time_step(1e-3)
+        self.assertAlmostEqual(controller.get_time_step(s), 1e-3)
+
+        controller = solver.TimeStepController(dt_min=1.0)
+        self.assertRaises(RuntimeError, controller.get_time_step, s)
+
+    def test_output_interval(self):
+        s = self.solver
+        self.assertRaises(ValueError, s.set_output_interval, 0.0)
+
+        s.set_output_interval(0.1)
+        self.assertEqual(s.output_interval, 0.1)
+
 if __name__ == '__main__':
     unittest.main()
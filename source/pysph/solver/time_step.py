@@ -0,0 +1,177 @@
+""" Adaptive time step control for the solver """
+
+import numpy
+
+import pysph.base.api as base
+
+import logging
+logger = logging.getLogger()
+
+Fluids = base.ParticleType.Fluid
+
+class TimeStepController(object):
+    """ Compute a global time step from the state of the particles
+
+    The time step is the minimum of the following criteria, each
+    evaluated over the real particles of the arrays with a type in
+    `on_types`:
+
+    CFL:      dt_cfl = cfl * min(h/(cs + |v|))
+
+    Force:    dt_force = force_factor * min(sqrt(h/|a|))
+
+    Viscous:  dt_viscous = viscous_factor * min(h*h)/nu
+
+    The accelerations `a` are the sum of the `k1` arrays of the
+    integrating calcs updating the velocities ('u', 'v' or 'w'), that
+    is, the result of the RHS evaluation at the start of the last
+    step. The viscous criterion is used only if a kinematic viscosity
+    `nu` is given.
+
+    In parallel, the three criteria are reduced across the processors
+    in a single allreduce.
+
+    The new time step is at most `max_increase` times the previous one
+    and is clipped to `dt_max`. An error is raised if it falls below
+    `dt_min`.
+
+    **Attributes**
+
+    - criteria -- a dictionary with the value of each criterion
+      ('cfl', 'force' and 'viscous') for the last computed time step
+
+    """
+
+    def __init__(self, cfl=0.3, force_factor=0.25, viscous_factor=0.125,
+                 nu=None, max_increase=1.1, dt_min=0.0, dt_max=None,
+                 on_types=[Fluids]):
+
+        if max_increase < 1.0:
+            raise ValueError, 'max_increase must not be smaller than 1'
+
+        self.cfl = cfl
+        self.force_factor = force_factor
+        self.viscous_factor = viscous_factor
+        self.nu = nu
+
+        self.max_increase = max_increase
+        self.dt_min = dt_min
+        self.dt_max = dt_max
+
+        self.on_types = on_types
+
+        self.criteria = {}
+
+    def get_accelerations(self, integrator, pa):
+        """ Return the accelerations of the real particles of `pa` """
+        np = pa.num_real_particles
+
+        # several calcs may update the same velocity component
+
+        components = {}
+
+        for calc in integrator.calcs:
+            if not calc.integrates or calc.dest is not pa:
+                continue
+
+            for j, prop in enumerate(calc.updates):
+                if prop not in ('u', 'v', 'w'):
+                    continue
+
+                k1_prop = integrator.k_props[calc.id]['k1'][j]
+                if not components.has_key(prop):
+                    components[prop] = numpy.zeros(np)
+
+                components[prop] += pa.get(k1_prop)
+
+        if not components:
+            return None
+
+        acc = numpy.zeros(np)
+        for a in components.values():
+            acc += a*a
+
+        return numpy.sqrt(acc)
+
+    def get_particle_criteria(self, integrator, pa):
+        """ Return the CFL, force and viscous time steps of each real
+        particle of `pa`, infinite where a criterion does not apply """
+        np = pa.num_real_particles
+
+        h, u, v, w, cs = pa.get('h', 'u', 'v', 'w', 'cs')
+
+        dt_cfl = numpy.ones(np) * numpy.inf
+        dt_force = numpy.ones(np) * numpy.inf
+        dt_viscous = numpy.ones(np) * numpy.inf
+
+        signal = cs + numpy.sqrt(u*u + v*v + w*w)
+        mask = signal > 0
+        dt_cfl[mask] = self.cfl * h[mask]/signal[mask]
+
+        acc = self.get_accelerations(integrator, pa)
+        if acc is not None:
+            mask = acc > 0
+            dt_force[mask] = self.force_factor * numpy.sqrt(h[mask]/acc[mask])
+
+        if self.nu:
+            dt_viscous[:] = self.viscous_factor * h*h/self.nu
+
+        return dt_cfl, dt_force, dt_viscous
+
+    def get_local_criteria(self, solver):
+        """ Return the CFL, force and viscous time steps on this processor
+        """
+        criteria = numpy.ones(3) * numpy.inf
+
+        for pa in solver.particles.arrays:
+            if pa.particle_type not in self.on_types:
+                continue
+
+            if pa.num_real_particles == 0:
+                continue
+
+            particle_criteria = self.get_particle_criteria(solver.integrator,
+                                                           pa)
+            for i in range(3):
+                criteria[i] = min(criteria[i], particle_criteria[i].min())
+
+        return criteria
+
+    def get_time_step(self, solver):
+        """ Return the time step for the next step of the solver """
+        criteria = self.get_local_criteria(solver)
+
+        particles = solver.particles
+        if particles.in_parallel:
+            from mpi4py import MPI
+            comm = particles.cell_manager.parallel_controller.comm
+
+            local_criteria = criteria
+            criteria = numpy.empty_like(local_criteria)
+            comm.Allreduce(local_criteria, criteria, op=MPI.MIN)
+
+        self.criteria = {'cfl':criteria[0], 'force':criteria[1],
+                         'viscous':criteria[2]}
+
+        dt = criteria.min()
+
+        # limit the growth with respect to the previous time step
+
+        if solver.dt is not None:
+            dt = min(dt, self.max_increase * solver.dt)
+
+        if self.dt_max is not None:
+            dt = min(dt, self.dt_max)
+
+        if dt == numpy.inf:
+            raise RuntimeError, 'Could not compute a time step'
+
+        if dt < self.dt_min:
+            msg = 'Time step %g is smaller than the minimum %g'%(dt,
+                                                                self.dt_min)
+            raise RuntimeError, msg
+
+        logger.info("TimeStepController: dt %g, cfl %g, force %g, "
+                    "viscous %g"%(dt, criteria[0], criteria[1], criteria[2]))
+
+        return dt
@@ -220,8 +220,11 @@ class PBar(object):
                                           maxval=maxval).start()
         self.bar = bar
 
-    def update(self):
-        self.count += 1
+    def update(self, count=None):
+        if count is None:
+            self.count += 1
+        else:
+            self.count = count
         if self.bar is not None:
             self.bar.update(self.count)
         elif self.show:
@@ -2,13 +2,13 @@
 
 #sph imports
 from pysph.sph.sph_func cimport SPHFunctionParticle, CSPHFunctionParticle,\
-     SPHFunction
+     SPHFunction, RealData, real_data, get_real, set_real
 
 #base imports 
 from pysph.base.particle_array cimport ParticleArray
 from pysph.base.point cimport cPoint
 from pysph.base.kernels cimport KernelBase
-from pysph.base.carray cimport DoubleArray, LongArray
+from pysph.base.carray cimport BaseArray, DoubleArray, LongArray
 
 
 ###############################################################################
@@ -7,7 +7,7 @@ from pysph.base.point cimport cPoint, cPoint_new, cPoint_sub, cPoint_dot
 from pysph.base.particle_array cimport LocalReal
 
 cdef extern from "math.h":
-    double fabs (double)
+    double fabs (double) nogil
 
 ###############################################################################
 # `PilotRho` class.
@@ -38,7 +38,7 @@ cdef class ADKEPilotRho(CSPHFunctionParticle):
         self.dst_reads.extend( ['x','y','z','tag'] )
 
     cdef void eval_nbr_csph(self, size_t source_pid, size_t dest_pid, 
-                            KernelBase kernel, double *nr, double* dnr):
+                            KernelBase kernel, double *nr, double* dnr) nogil:
         """ Compute the contribution from source_pid on dest_pid.
 
         The expression used is:
@@ -52,19 +52,14 @@ cdef class ADKEPilotRho(CSPHFunctionParticle):
         """
         cdef double h = self.h0
 
-        cdef double mb = self.s_m.data[source_pid]
-        cdef double rhob = self.s_rho.data[source_pid]
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double rhob = get_real(self._s_rho, source_pid)
         cdef double w
+        cdef cPoint src, dst
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-            
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-        w = kernel.function(self._dst, self._src, h)
+        w = kernel.function(dst, src, h)
 
         if self.rkpm_first_order_correction:
             pass
@@ -72,7 +67,7 @@ cdef class ADKEPilotRho(CSPHFunctionParticle):
         if self.bonnet_and_lok_correction:
             dnr[0] += w*mb/rhob
 
-        nr[0] += w*self.s_m.data[source_pid]
+        nr[0] += w*get_real(self._s_m, source_pid)
 
 ###############################################################################
 # `ADKESmoothingUpdate` class.
@@ -109,12 +104,13 @@ cdef class ADKESmoothingUpdate(SPHFunction):
         self.src_reads = []
         self.dst_reads = ['rhop']
 
-    cpdef eval(self, KernelBase kernel, DoubleArray output1,
-               DoubleArray output2, DoubleArray output3):
+    cpdef eval(self, KernelBase kernel, BaseArray output1,
+               BaseArray output2, BaseArray output3):
         """ Evaluate the store the results in the output arrays """
 
         cdef LongArray tag_arr = self.dest.get_carray('tag')
         cdef DoubleArray rhop = self.d_rhop
+        cdef RealData output = real_data(output1)
 
         cdef double result, g, log_g
         cdef int i
@@ -133,7 +129,8 @@ cdef class ADKESmoothingUpdate(SPHFunction):
         
         for i in range(np):
             if tag_arr.data[i] == LocalReal:
-                output1.data[i] = self.h0 * self.k * (g/rhop.data[i])**self.eps
+                set_real(output, i,
+                         self.h0 * self.k * (g/rhop.data[i])**self.eps)
 
         # set the destination's dirty bit since new neighbors are needed
         
@@ -165,7 +162,7 @@ cdef class SPHVelocityDivergence(SPHFunctionParticle):
         self.dst_reads.extend( ['x','y','z','h','u','v','w','rho','tag'] )
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid,
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
         """ Compute the contribution from source_pid on dest_pid.
 
         The expression used is:
@@ -182,34 +179,21 @@ cdef class SPHVelocityDivergence(SPHFunctionParticle):
 
         cdef double h = 0.5 * (ha + hb)
 
-        cdef double mb = self.s_m.data[source_pid]
-        cdef double rhob = self.s_rho.data[source_pid]
-        cdef double rhoa = self.d_rho.data[dest_pid]
-
-        cdef cPoint grad, grada, gradb, vba
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double rhob = get_real(self._s_rho, source_pid)
+        cdef double rhoa = get_real(self._d_rho, dest_pid)
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-            
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        cdef cPoint grad, vba
+        cdef cPoint src, dst
 
-        vba = cPoint(self.s_u.data[source_pid] - self.d_u.data[dest_pid],
-                     self.s_v.data[source_pid] - self.d_v.data[dest_pid],
-                     self.s_w.data[source_pid] - self.d_w.data[dest_pid])
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
-            
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
+        vba = cPoint_new(
+            get_real(self._s_u, source_pid) - get_real(self._d_u, dest_pid),
+            get_real(self._s_v, source_pid) - get_real(self._d_v, dest_pid),
+            get_real(self._s_w, source_pid) - get_real(self._d_w, dest_pid))
 
-        else:            
-            grad = kernel.gradient(self._dst, self._src, h)
+        grad = self.kernel_gradient(source_pid, dest_pid, kernel)
 
         if self.rkpm_first_order_correction:
             pass
@@ -255,8 +239,8 @@ cdef class ADKEConductionCoeffUpdate(SPHFunction):
 
         self.d_div = self.dest.get_carray('div')
         
-    cpdef eval(self, KernelBase kernel, DoubleArray output1,
-               DoubleArray output2, DoubleArray output3):
+    cpdef eval(self, KernelBase kernel, BaseArray output1,
+               BaseArray output2, BaseArray output3):
         """ Evaluate the store the results in the output arrays Note
         that this function will not work if two or more particle
         arrays contribute as a source. This is because the divergence
@@ -274,18 +258,19 @@ cdef class ADKEConductionCoeffUpdate(SPHFunction):
 
         cdef LongArray tag_arr = self.dest.get_carray('tag')
         cdef DoubleArray div = self.d_div
+        cdef RealData output = real_data(output1)
 
         g1 = self.g1
         g2 = self.g2                
 
         for i in range(np):
             if tag_arr.data[i] == LocalReal:
-                ca = self.d_cs.data[i]
+                ca = get_real(self._d_cs, i)
                 ha = self.d_h.data[i]
 
                 abs_div = fabs( div.data[i] )
                 
                 # set q_a = g1 h_a c_a + g2 h_a^2 [abs(div_a) - div_a]
             
-                output1.data[i] = g1*ca + ( g2 * ha * (abs_div - div.data[i]) )
-                output1.data[i] *= ha
+                set_real(output, i,
+                         (g1*ca + ( g2 * ha * (abs_div - div.data[i]) )) * ha)
@@ -1,6 +1,7 @@
-from pysph.sph.sph_func cimport SPHFunction
+from pysph.sph.sph_func cimport SPHFunction, RealData, real_data, get_real,\
+     set_real, add_real
 from pysph.base.particle_array cimport ParticleArray
-from pysph.base.carray cimport DoubleArray
+from pysph.base.carray cimport DoubleArray, BaseArray
 from pysph.base.kernels cimport KernelBase
 
 cdef class PropertyGet(SPHFunction):
@@ -23,16 +23,19 @@ cdef class PropertyGet(SPHFunction):
         SPHFunction.setup_arrays(self)
         self.d_props = [self.dest.get_carray(i) for i in self.prop_names]
     
-    cpdef eval(self, KernelBase kernel, DoubleArray output1,
-               DoubleArray output2, DoubleArray output3):
-        cdef double** output = [output1.data, output2.data, output3.data]
+    cpdef eval(self, KernelBase kernel, BaseArray output1,
+               BaseArray output2, BaseArray output3):
+        cdef RealData output[3]
         cdef long i, np=self.dest.get_number_of_particles()
         cdef int n
-        cdef DoubleArray arr
+        cdef RealData arr
+        output[0] = real_data(output1)
+        output[1] = real_data(output2)
+        output[2] = real_data(output3)
         for n in range(self.num_outputs):
-            arr = self.d_props[n]
+            arr = real_data(self.d_props[n])
             for i in range(np):
-                output[n][i] = arr.data[i]
+                set_real(output[n], i, get_real(arr, i))
 
 cdef class PropertyAdd(SPHFunction):
     """ function to add property arrays (any number of arrays) """
@@ -59,17 +62,18 @@ cdef class PropertyAdd(SPHFunction):
         self.d_props = [self.dest.get_carray(i) for i in self.prop_names]
         self.num_props = len(self.d_props)
     
-    cpdef eval(self, KernelBase kernel, DoubleArray output1,
-               DoubleArray output2, DoubleArray output3):
+    cpdef eval(self, KernelBase kernel, BaseArray output1,
+               BaseArray output2, BaseArray output3):
         cdef long i, np=self.dest.get_number_of_particles()
         cdef int n
-        cdef DoubleArray arr=self.d_props[0]
+        cdef RealData output = real_data(output1)
+        cdef RealData arr = real_data(self.d_props[0])
         for i in range(np):
-            output1.data[i] = arr.data[i]
+            set_real(output, i, get_real(arr, i))
         for n in range(1, self.num_props):
-            arr = self.d_props[n]
+            arr = real_data(self.d_props[n])
             for i in range(np):
-                output1.data[i] += arr.data[i] + self.constant
+                add_real(output, i, get_real(arr, i) + self.constant)
 
 cdef class PropertyNeg(SPHFunction):
     """ function to return the negative of upto 3 particle arrays """
@@ -93,16 +97,19 @@ cdef class PropertyNeg(SPHFunction):
         SPHFunction.setup_arrays(self)
         self.d_props = [self.dest.get_carray(i) for i in self.prop_names]
     
-    cpdef eval(self, KernelBase kernel, DoubleArray output1,
-               DoubleArray output2, DoubleArray output3):
-        cdef double** output = [output1.data, output2.data, output3.data]
+    cpdef eval(self, KernelBase kernel, BaseArray output1,
+               BaseArray output2, BaseArray output3):
+        cdef RealData output[3]
         cdef long i, np=self.dest.get_number_of_particles()
         cdef int n
-        cdef DoubleArray arr
+        cdef RealData arr
+        output[0] = real_data(output1)
+        output[1] = real_data(output2)
+        output[2] = real_data(output3)
         for n in range(self.num_outputs):
-            arr = self.d_props[n]
+            arr = real_data(self.d_props[n])
             for i in range(np):
-                output[n][i] = -arr.data[i]
+                set_real(output[n], i, -get_real(arr, i))
 
 cdef class PropertyMul(SPHFunction):
     """ function to get product of property arrays (any number of arrays) """
@@ -129,17 +136,19 @@ cdef class PropertyMul(SPHFunction):
         self.d_props = [self.dest.get_carray(i) for i in self.prop_names]
         self.num_props = len(self.d_props)
     
-    cpdef eval(self, KernelBase kernel, DoubleArray output1,
-               DoubleArray output2, DoubleArray output3):
+    cpdef eval(self, KernelBase kernel, BaseArray output1,
+               BaseArray output2, BaseArray output3):
         cdef long i, np=self.dest.get_number_of_particles()
         cdef int n
-        cdef DoubleArray arr=self.d_props[0]
+        cdef RealData output = real_data(output1)
+        cdef RealData arr = real_data(self.d_props[0])
         for i in range(np):
-            output1.data[i] = arr.data[i]
+            set_real(output, i, get_real(arr, i))
         for n in range(1, self.num_props):
-            arr = self.d_props[n]
+            arr = real_data(self.d_props[n])
             for i in range(np):
-                output1.data[i] *= arr.data[i] * self.constant
+                set_real(output, i, get_real(output, i) * get_real(arr, i) *
+                         self.constant)
 
 cdef class PropertyInv(SPHFunction):
     """ function to return the inverse of upto 3 particle arrays """
@@ -163,13 +172,16 @@ cdef class PropertyInv(SPHFunction):
         SPHFunction.setup_arrays(self)
         self.d_props = [self.dest.get_carray(i) for i in self.prop_names]
     
-    cpdef eval(self, KernelBase kernel, DoubleArray output1,
-               DoubleArray output2, DoubleArray output3):
-        cdef double** output = [output1.data, output2.data, output3.data]
+    cpdef eval(self, KernelBase kernel, BaseArray output1,
+               BaseArray output2, BaseArray output3):
+        cdef RealData output[3]
         cdef long i, np=self.dest.get_number_of_particles()
         cdef int n
-        cdef DoubleArray arr
+        cdef RealData arr
+        output[0] = real_data(output1)
+        output[1] = real_data(output2)
+        output[2] = real_data(output3)
         for n in range(self.num_outputs):
-            arr = self.d_props[n]
+            arr = real_data(self.d_props[n])
             for i in range(np):
-                output[n][i] = 1/arr.data[i]
+                set_real(output[n], i, 1/get_real(arr, i))
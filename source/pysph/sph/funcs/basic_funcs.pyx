@@ -4,7 +4,7 @@
 from pysph.base.point cimport cPoint_new, cPoint_sub
 
 cdef extern from "math.h":
-    double sqrt(double)
+    double sqrt(double) nogil
 
 ################################################################################
 # `SPH` class.
@@ -14,7 +14,7 @@ cdef class SPH(CSPHFunctionParticle):
 
     #Defined in the .pxd file
     #cdef str prop_name
-    #cdef DoubleArray s_prop, d_prop
+    #cdef BaseArray s_prop, d_prop
 
     def __init__(self, ParticleArray source, ParticleArray dest, 
                  str prop_name='rho', **kwargs):
@@ -49,12 +49,14 @@ cdef class SPH(CSPHFunctionParticle):
 
         self.d_prop = self.dest.get_carray(self.prop_name)
         self.s_prop = self.source.get_carray(self.prop_name)
+        self._d_prop = real_data(self.d_prop)
+        self._s_prop = real_data(self.s_prop)
 
         self.src_reads.append(self.prop_name)
         self.dst_reads.append(self.prop_name)
 
     cdef void eval_nbr_csph(self, size_t source_pid, size_t dest_pid,
-                            KernelBase kernel, double *nr, double *dnr):
+                            KernelBase kernel, double *nr, double *dnr) nogil:
 
         """ 
         Perform an SPH interpolation of the property `prop_name` 
@@ -66,37 +68,25 @@ cdef class SPH(CSPHFunctionParticle):
             
         """
         
-        cdef double w, wa, wb,  temp
+        cdef double w, temp
         cdef double rhob, mb, fb
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
 
         cdef double hab = 0.5 * (ha + hb)
+        cdef cPoint src, dst
 
-        rhob = self.s_rho.data[source_pid]
-        fb = self.s_prop.data[source_pid]
-        mb = self.s_m.data[source_pid]
+        rhob = get_real(self._s_rho, source_pid)
+        fb = get_real(self._s_prop, source_pid)
+        mb = get_real(self._s_m, source_pid)
 
         h = 0.5*(self.s_h.data[source_pid] + 
                  self.d_h.data[dest_pid])
             
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
-
-        if self.hks:
-            wa = kernel.function(self._dst, self._src, ha)
-            wb = kernel.function(self._dst, self._src, hb)
-
-            w = 0.5 * (wa + wb)
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-        else:
-            w = kernel.function(self._dst, self._src, hab)
+        w = self.kernel_function(source_pid, dest_pid, kernel)
         
         if self.rkpm_first_order_correction:
             pass
@@ -117,7 +107,7 @@ cdef class SPHSimpleGradient(SPHFunctionParticle):
 
     #Defined in the .pxd file
     #cdef str prop_name
-    #cdef DoubleArray s_prop, d_prop
+    #cdef BaseArray s_prop, d_prop
 
     def __init__(self, ParticleArray source, ParticleArray dest,
                  str prop_name='rho',  *args, **kwargs):
@@ -152,9 +142,11 @@ cdef class SPHSimpleGradient(SPHFunctionParticle):
 
         self.d_prop = self.dest.get_carray(self.prop_name)
         self.s_prop = self.source.get_carray(self.prop_name)
+        self._d_prop = real_data(self.d_prop)
+        self._s_prop = real_data(self.s_prop)
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid,
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
         """ 
         Perform an SPH interpolation of the property `prop_name` 
 
@@ -162,37 +154,24 @@ cdef class SPHSimpleGradient(SPHFunctionParticle):
         
         """
         cdef double temp
-        cdef cPoint grad, grada, gradb
+        cdef cPoint grad
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
 
         cdef double hab = 0.5 * (ha + hb)
+        cdef cPoint src, dst
 
         h=0.5*(self.s_h.data[source_pid] + 
                self.d_h.data[dest_pid])
             
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
-
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
-
-        else:            
-            grad = kernel.gradient(self._dst, self._src, hab)
+        grad = self.kernel_gradient(source_pid, dest_pid, kernel)
         
-        temp = self.s_prop[source_pid]
-        temp *= self.s_m.data[source_pid]/self.s_rho.data[source_pid]
+        temp = get_real(self._s_prop, source_pid)
+        temp *= get_real(self._s_m, source_pid)/get_real(self._s_rho,
+                                                          source_pid)
 
         if self.rkpm_first_order_correction:
             pass
@@ -214,7 +193,7 @@ cdef class SPHGradient(SPHFunctionParticle):
 
     #Defined in the .pxd file
     #cdef str prop_name
-    #cdef DoubleArray s_prop, d_prop
+    #cdef BaseArray s_prop, d_prop
 
     def __init__(self, ParticleArray source, ParticleArray dest,
                  str prop_name='rho',  *args, **kwargs):
@@ -254,41 +233,29 @@ cdef class SPHGradient(SPHFunctionParticle):
 
         self.d_prop = self.dest.get_carray(self.prop_name)
         self.s_prop = self.source.get_carray(self.prop_name)
+        self._d_prop = real_data(self.d_prop)
+        self._s_prop = real_data(self.s_prop)
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
         """ Perform an SPH interpolation of the property `prop_name` 
 
         """
         cdef double temp
-        cdef cPoint grad, grada, gradb
+        cdef cPoint grad
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
 
         cdef double hab = 0.5 * (ha + hb)
+        cdef cPoint src, dst
 
         h=0.5*(self.s_h.data[source_pid] + 
                self.d_h.data[dest_pid])
     
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
-
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
-
-        else:            
-            grad = kernel.gradient(self._dst, self._src, hab)
+        grad = self.kernel_gradient(source_pid, dest_pid, kernel)
 
         if self.rkpm_first_order_correction:
             pass
@@ -296,9 +263,11 @@ cdef class SPHGradient(SPHFunctionParticle):
         if self.bonnet_and_lok_correction:
             self.bonnet_and_lok_gradient_correction(dest_pid, &grad)
             
-        temp = (self.s_prop[source_pid] -  self.d_prop[dest_pid])
+        temp = (get_real(self._s_prop, source_pid) -
+                get_real(self._d_prop, dest_pid))
         
-        temp *= self.s_m.data[source_pid]/self.s_rho.data[source_pid]
+        temp *= get_real(self._s_m, source_pid)/get_real(self._s_rho,
+                                                          source_pid)
             
         nr[0] += temp*grad.x
         nr[1] += temp*grad.y
@@ -319,7 +288,7 @@ cdef class SPHLaplacian(SPHFunctionParticle):
      """
     #Defined in the .pxd file
     #cdef str prop_name
-    #cdef DoubleArray s_prop
+    #cdef BaseArray s_prop
 
     def __init__(self, ParticleArray source, ParticleArray dest, 
                  str prop_name='rho',  *args, **kwargs):
@@ -354,9 +323,11 @@ cdef class SPHLaplacian(SPHFunctionParticle):
         SPHFunctionParticle.setup_arrays(self)
         self.s_prop = self.source.get_carray(self.prop_name)
         self.d_prop = self.dest.get_carray(self.prop_name)
+        self._d_prop = real_data(self.d_prop)
+        self._s_prop = real_data(self.s_prop)
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
         """ 
         Perform an SPH interpolation of the property `prop_name` 
 
@@ -367,43 +338,29 @@ cdef class SPHLaplacian(SPHFunctionParticle):
         
         """
         cdef double mb, rhob, fb, fa, tmp, dot
-        cdef cPoint grad, grada, gradb, rab
+        cdef cPoint grad, rab
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
 
         cdef double hab = 0.5 * (ha + hb)
+        cdef cPoint src, dst
 
         h = 0.5*(self.s_h.data[source_pid] +
                  self.d_h.data[dest_pid])
         
-        mb = self.s_m.data[source_pid]
-        rhob = self.s_rho.data[source_pid]
-        fb = self.s_prop[source_pid]
-        fa = self.d_prop[dest_pid]
-        
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
+        mb = get_real(self._s_m, source_pid)
+        rhob = get_real(self._s_rho, source_pid)
+        fb = get_real(self._s_prop, source_pid)
+        fa = get_real(self._d_prop, dest_pid)
         
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
             
-        rab.x = self._dst.x-self._src.x
-        rab.y = self._dst.y-self._src.y
-        rab.z = self._dst.z-self._src.z
+        rab.x = dst.x-src.x
+        rab.y = dst.y-src.y
+        rab.z = dst.z-src.z
         
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
-
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
-
-        else:            
-            grad = kernel.gradient(self._dst, self._src, hab)
+        grad = self.kernel_gradient(source_pid, dest_pid, kernel)
 
         if self.rkpm_first_order_correction:
             pass
@@ -431,13 +388,17 @@ cdef class CountNeighbors(SPHFunctionParticle):
 
         SPHFunctionParticle.__init__(self, source, dest, setup_arrays = True)
         self.id = 'nbrs'
+        self.fusable = False
 
     def set_src_dst_reads(self):
         pass
 
     cdef void eval_single(self, size_t dest_pid,
-                          KernelBase kernel, double *result):
-        result[0] += self.nbr_locator.get_nearest_particles(dest_pid).length
+                          KernelBase kernel, double *result) nogil:
+        # not fusable, the function is evaluated with a single thread
+        with gil:
+            result[0] += self.nbr_locator.get_nearest_particles(
+                dest_pid).length
 
 ###########################################################################
 
@@ -463,37 +424,23 @@ cdef class BonnetAndLokKernelGradientCorrectionTerms(CSPHFunctionParticle):
         self.id = 'kgc'
 
     cdef void eval_nbr_csph(self, size_t source_pid, size_t dest_pid, 
-                            KernelBase kernel, double *nr, double *dnr):
-        cdef cPoint grada, gradb, grad
-        cdef double mb = self.s_m.data[source_pid]
-        cdef double rhob = self.s_rho.data[source_pid]
+                            KernelBase kernel, double *nr, double *dnr) nogil:
+        cdef cPoint grad
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double rhob = get_real(self._s_rho, source_pid)
         cdef double Vb = mb/rhob
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
 
         cdef double hab = 0.5 * (ha + hb)    
+        cdef cPoint src, dst
         
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
-
-        cdef cPoint rba = cPoint_sub(self._src, self._dst)
-
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
+        cdef cPoint rba = cPoint_sub(src, dst)
 
-        else:            
-            grad = kernel.gradient(self._dst, self._src, hab)
+        grad = self.kernel_gradient(source_pid, dest_pid, kernel)
 
         #m11
         nr[0] += Vb * grad.x * rba.x
@@ -536,27 +483,22 @@ cdef class FirstOrderCorrectionMatrix(CSPHFunctionParticle):
         self.id = 'liu-correction'
 
     cdef void eval_nbr_csph(self, size_t source_pid, size_t dest_pid, 
-                            KernelBase kernel, double *nr, double *dnr):
+                            KernelBase kernel, double *nr, double *dnr) nogil:
 
-        cdef double mb = self.s_m.data[source_pid]
-        cdef double rhob = self.s_rho.data[source_pid]
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double rhob = get_real(self._s_rho, source_pid)
         cdef double tmp = mb/rhob
         cdef double w
+        cdef cPoint src, dst
         
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-        cdef cPoint rab = cPoint_sub(self._dst, self._src)
+        cdef cPoint rab = cPoint_sub(dst, src)
 
         h = 0.5*(self.s_h.data[source_pid] +
                  self.d_h.data[dest_pid])
 
-        w = kernel.function(self._dst, self._src, h)
+        w = kernel.function(dst, src, h)
         tmp *= w
 
         nr[0] += tmp * rab.x * rab.x 
@@ -605,43 +547,40 @@ cdef class FirstOrderCorrectionTermAlpha(SPHFunctionParticle):
         self.rkpm_d_dbeta2dy = self.dest.get_carray("rkpm_dbeta2dy")
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
 
-        cdef double mb = self.s_m.data[source_pid]
-        cdef double rhob = self.s_rho.data[source_pid]
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double rhob = get_real(self._s_rho, source_pid)
         cdef double tmp = mb/rhob
         cdef double w, beta, tmp1, tmp2, tmp3, Vb
+        cdef double beta1, beta2, alpha, h
+        cdef double dbeta1dx, dbeta1dy, dbeta2dx, dbeta2dy
         
         cdef cPoint rab, grad
+        cdef cPoint src, dst
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
         beta1 = self.rkpm_d_beta1.data[dest_pid]
         beta2 = self.rkpm_d_beta2.data[dest_pid]
 
-        dbeta1dx = self.rkpm_d_dbeta1dx[dest_pid]
-        dbeta1dy = self.rkpm_d_dbeta1dy[dest_pid]
+        dbeta1dx = self.rkpm_d_dbeta1dx.data[dest_pid]
+        dbeta1dy = self.rkpm_d_dbeta1dy.data[dest_pid]
 
-        dbeta2dx = self.rkpm_d_dbeta2dx[dest_pid]
-        dbeta2dy = self.rkpm_d_dbeta2dy[dest_pid]
+        dbeta2dx = self.rkpm_d_dbeta2dx.data[dest_pid]
+        dbeta2dy = self.rkpm_d_dbeta2dy.data[dest_pid]
 
-        alpha = self.rkpm_d_alpha[dest_pid]
+        alpha = self.rkpm_d_alpha.data[dest_pid]
 
-        rab = cPoint_sub(self._dst, self._src)
+        rab = cPoint_sub(dst, src)
 
         h = 0.5*(self.s_h.data[source_pid] +
                  self.d_h.data[dest_pid])
 
-        w = kernel.function(self._dst, self._src, h)
+        w = kernel.function(dst, src, h)
         Vb = mb/rhob
         
-        grad = kernel.gradient(self._dst, self._src, h)
+        grad = kernel.gradient(dst, src, h)
 
         tmp3 = Vb*(1.0 + (beta1*rab.x + beta2*rab.y))
         
@@ -670,32 +609,27 @@ cdef class FirstOrderCorrectionMatrixGradient(CSPHFunctionParticle):
     """
 
     cdef void eval_nbr_csph(self, size_t source_pid, size_t dest_pid,
-                            KernelBase kernel, double *nr, double *dnr):
+                            KernelBase kernel, double *nr, double *dnr) nogil:
 
-        cdef double mb = self.s_m.data[source_pid]
-        cdef double rhob = self.s_rho.data[source_pid]
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double rhob = get_real(self._s_rho, source_pid)
         cdef double tmp = mb/rhob
         cdef double w, beta, Vb
         
         cdef cPoint rab, grad
+        cdef cPoint src, dst
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-        rab = cPoint_sub(self._dst, self._src)
+        rab = cPoint_sub(dst, src)
 
         h = 0.5*(self.s_h.data[source_pid] +
                  self.d_h.data[dest_pid])
 
-        w = kernel.function(self._dst, self._src, h)
+        w = kernel.function(dst, src, h)
         Vb = mb/rhob
 
-        grad = kernel.gradient(self._dst, self._src, h)
+        grad = kernel.gradient(dst, src, h)
         
         nr[0] += 2*Vb*w*rab.x + Vb*rab.x*rab.x*grad.x
 
@@ -724,32 +658,27 @@ cdef class FirstOrderCorrectionVectorGradient(CSPHFunctionParticle):
 
     #Defined in the .pxd file
     cdef void eval_nbr_csph(self, size_t source_pid, size_t dest_pid,
-                            KernelBase kernel, double *nr, double *dnr):
+                            KernelBase kernel, double *nr, double *dnr) nogil:
 
-        cdef double mb = self.s_m.data[source_pid]
-        cdef double rhob = self.s_rho.data[source_pid]
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double rhob = get_real(self._s_rho, source_pid)
         cdef double tmp = mb/rhob
         cdef double w, Vb
         
         cdef cPoint rab, grad
+        cdef cPoint src, dst
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-        rab = cPoint_sub(self._dst, self._src)
+        rab = cPoint_sub(dst, src)
 
         h = 0.5*(self.s_h.data[source_pid] +
                  self.d_h.data[dest_pid])
 
-        w = kernel.function(self._dst, self._src, h)
+        w = kernel.function(dst, src, h)
         Vb = mb/rhob        
         
-        grad = kernel.gradient(self._dst, self._src, h)
+        grad = kernel.gradient(dst, src, h)
         
         nr[0] += -Vb*rab.x*grad.x - Vb*w
 
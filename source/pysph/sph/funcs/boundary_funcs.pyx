@@ -1,6 +1,6 @@
 #cython: cdivision=True
 cdef extern from "math.h":
-    double fabs(double)
+    double fabs(double) nogil
 
 from pysph.base.point cimport cPoint_new, cPoint, cPoint_dot, cPoint_scale
 
@@ -52,35 +52,30 @@ cdef class MonaghanBoundaryForce(SPHFunctionParticle):
         self.dst_reads.extend( ['x','y','z','h','m','cs','tag'] )
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
         """ Perform the boundary force computation """
 
         cdef double x, y, nforce, tforce, force
         cdef double beta, q, cs
 
         cdef double h = self.d_h.data[dest_pid]
-        cdef double ma = self.d_m.data[dest_pid]
-        cdef double mb = self.s_m.data[source_pid]
+        cdef double ma = get_real(self._d_m, dest_pid)
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef cPoint src, dst
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
             
-        cdef cPoint norm = cPoint(self.s_nx.data[source_pid],
-                                  self.s_ny.data[source_pid],
-                                  self.s_nz.data[source_pid])
+        cdef cPoint norm = cPoint_new(self.s_nx.data[source_pid],
+                                      self.s_ny.data[source_pid],
+                                      self.s_nz.data[source_pid])
         
-        cdef cPoint tang = cPoint(self.s_tx.data[source_pid],
-                                  self.s_ty.data[source_pid],
-                                  self.s_tz.data[source_pid])
+        cdef cPoint tang = cPoint_new(self.s_tx.data[source_pid],
+                                      self.s_ty.data[source_pid],
+                                      self.s_tz.data[source_pid])
 
-        cs = self.d_cs.data[dest_pid]
+        cs = get_real(self._d_cs, dest_pid)
         
-        cdef cPoint rab = cPoint_sub(self._dst, self._src)
+        cdef cPoint rab = cPoint_sub(dst, src)
         x = cPoint_dot(rab, tang)
         y = cPoint_dot(rab, norm)
         force = 0.0
@@ -140,7 +135,7 @@ cdef class BeckerBoundaryForce(SPHFunctionParticle):
         pass
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
         """
         Compute the contribution of particle at source_pid on particle at
         dest_pid. 
@@ -162,18 +157,13 @@ cdef class BeckerBoundaryForce(SPHFunctionParticle):
         cdef cPoint rab, rabn
 
         cdef double h = self.d_h.data[dest_pid]
-        cdef double ma = self.d_m.data[dest_pid]
-        cdef double mb = self.s_m.data[source_pid]
-
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
+        cdef double ma = get_real(self._d_m, dest_pid)
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef cPoint src, dst
 
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
         
-        rab = cPoint_sub(self._dst, self._src)
+        rab = cPoint_sub(dst, src)
         norm = cPoint_length(rab)
         rabn = cPoint_scale(rab, 1/norm)
 
@@ -231,7 +221,7 @@ cdef class LennardJonesForce(SPHFunctionParticle):
         pass
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
         """
         Compute the contribution of particle at source_pid on particle at
         dest_pid. 
@@ -246,16 +236,11 @@ cdef class LennardJonesForce(SPHFunctionParticle):
 
         cdef double ro = self.ro
         cdef double D = self.D
+        cdef cPoint src, dst
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-        rab = cPoint_sub(self._dst, self._src)
+        rab = cPoint_sub(dst, src)
         norm = cPoint_length(rab)
         rabn = cPoint_scale(rab, 1/norm)
 
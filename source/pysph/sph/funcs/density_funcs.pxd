@@ -6,7 +6,8 @@
 # Copyright (c) 2009, Prabhu Ramachandran
 
 #sph imports
-from pysph.sph.sph_func cimport SPHFunctionParticle, CSPHFunctionParticle
+from pysph.sph.sph_func cimport SPHFunctionParticle, CSPHFunctionParticle, NbrPair
+from pysph.sph.sph_func cimport get_real
 
 #base imports 
 from pysph.base.particle_array cimport ParticleArray
@@ -36,34 +36,12 @@ cdef class SPHRho(CSPHFunctionParticle):
         self.dst_reads.extend( ['x','y','z','h','tag'] )
 
     cdef void eval_nbr_csph(self, size_t source_pid, size_t dest_pid,
-                            KernelBase kernel, double *nr, double *dnr):
+                            KernelBase kernel, double *nr, double *dnr) nogil:
         """ Compute the contribution from source_pid on dest_pid. """
 
-        cdef double ha = self.d_h.data[dest_pid]
-        cdef double hb = self.s_h.data[source_pid]
-
-        cdef double hab = 0.5 * (ha + hb)
-
-        cdef double mb = self.s_m.data[source_pid]
-        cdef double rhob = self.s_rho.data[source_pid]
-        cdef double w, wa, wb
-
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-            
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
-
-        if self.hks:
-            wa = kernel.function(self._dst, self._src, ha)
-            wb = kernel.function(self._dst, self._src, hb)
-
-            w = 0.5 * (wa + wb)
-
-        else:
-            w = kernel.function(self._dst, self._src, hab)        
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double rhob = get_real(self._s_rho, source_pid)
+        cdef double w = self.kernel_function(source_pid, dest_pid, kernel)
 
         if self.rkpm_first_order_correction:
             pass
@@ -71,7 +49,7 @@ cdef class SPHRho(CSPHFunctionParticle):
         if self.bonnet_and_lok_correction:
             dnr[0] += w*mb/rhob
 
-        nr[0] += w*self.s_m.data[source_pid]
+        nr[0] += w*get_real(self._s_m, source_pid)
 
     def _set_extra_cl_args(self):
         pass
@@ -112,49 +90,44 @@ cdef class SPHDensityRate(SPHFunctionParticle):
         self.dst_reads.extend( ['u','v','w'] )
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
         """ Compute the contribution of particle at source_pid on particle at
         dest_pid.
         """
 
-        cdef cPoint vel, grad, grada, gradb
+        cdef cPoint vel
+        cdef cPoint grad = self.kernel_gradient(source_pid, dest_pid, kernel)
 
-        cdef double ha = self.d_h.data[dest_pid]
-        cdef double hb = self.s_h.data[source_pid]
+        vel.x = get_real(self._d_u, dest_pid) - get_real(self._s_u, source_pid)
+        vel.y = get_real(self._d_v, dest_pid) - get_real(self._s_v, source_pid)
+        vel.z = get_real(self._d_w, dest_pid) - get_real(self._s_w, source_pid)
 
-        cdef double hab = 0.5 * (ha + hb)
+        if self.rkpm_first_order_correction:
+            pass
 
-        cdef DoubleArray xgc, ygc, zgc
+        if self.bonnet_and_lok_correction:
+            self.bonnet_and_lok_gradient_correction(dest_pid, &grad)
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
-            
-        vel.x = self.d_u.data[dest_pid] - self.s_u.data[source_pid]
-        vel.y = self.d_v.data[dest_pid] - self.s_v.data[source_pid]
-        vel.z = self.d_w.data[dest_pid] - self.s_w.data[source_pid]
+        nr[0] += cPoint_dot(vel, grad)*get_real(self._s_m, source_pid)
 
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
+    cdef void eval_nbr_fused(self, size_t source_pid, size_t dest_pid,
+                             KernelBase kernel, NbrPair* pair, double* nr,
+                             double* dnr):
+        """ Use the kernel gradient shared in a fused neighbor loop """
 
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
+        cdef cPoint vel
 
-        else:            
-            grad = kernel.gradient(self._dst, self._src, hab)
+        if self.hks or self.bonnet_and_lok_correction:
+            self.eval_nbr(source_pid, dest_pid, kernel, nr)
+            return
 
-        if self.rkpm_first_order_correction:
-            pass
+        vel.x = get_real(self._d_u, dest_pid) - get_real(self._s_u, source_pid)
+        vel.y = get_real(self._d_v, dest_pid) - get_real(self._s_v, source_pid)
+        vel.z = get_real(self._d_w, dest_pid) - get_real(self._s_w, source_pid)
 
-        if self.bonnet_and_lok_correction:
-            self.bonnet_and_lok_gradient_correction(dest_pid, &grad)
+        nr[0] += cPoint_dot(vel, pair.grad)*get_real(self._s_m, source_pid)
 
-        nr[0] += cPoint_dot(vel, grad)*self.s_m.data[source_pid]
+    cpdef bint uses_pair_gradient(self):
+        return not (self.hks or self.bonnet_and_lok_correction)
 
 #############################################################################
@@ -5,8 +5,8 @@ from pysph.base.point cimport cPoint, cPoint_dot, cPoint_new, cPoint_sub,\
 from pysph.solver.cl_utils import get_real
 
 cdef extern from "math.h":
-    double sqrt(double)
-    double fabs(double)
+    double sqrt(double) nogil
+    double fabs(double) nogil
 
 ##############################################################################
 cdef class EnergyEquationNoVisc(SPHFunctionParticle):
@@ -39,7 +39,7 @@ cdef class EnergyEquationNoVisc(SPHFunctionParticle):
         pass
     
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
         """
         Compute the contribution of particle at source_pid on particle at
         dest_pid. 
@@ -49,41 +49,27 @@ cdef class EnergyEquationNoVisc(SPHFunctionParticle):
         """
         cdef double dot, tmp, h
         cdef cPoint vab
-        cdef cPoint grad, grada, gradb
+        cdef cPoint grad
 
-        cdef double pa = self.d_p.data[dest_pid]
-        cdef double pb = self.s_p.data[source_pid]
-        cdef double rhoa = self.d_rho.data[dest_pid]
-        cdef double rhob = self.s_rho.data[source_pid]
-        cdef double mb = self.s_m.data[source_pid]
+        cdef double pa = get_real(self._d_p, dest_pid)
+        cdef double pb = get_real(self._s_p, source_pid)
+        cdef double rhoa = get_real(self._d_rho, dest_pid)
+        cdef double rhob = get_real(self._s_rho, source_pid)
+        cdef double mb = get_real(self._s_m, source_pid)
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
 
         cdef double hab = 0.5 * (ha + hb)
+        cdef cPoint src, dst
 
-        vab.x = self.d_u.data[dest_pid]-self.s_u.data[source_pid]
-        vab.y = self.d_v.data[dest_pid]-self.s_v.data[source_pid]
-        vab.z = self.d_w.data[dest_pid]-self.s_w.data[source_pid]
+        vab.x = get_real(self._d_u, dest_pid)-get_real(self._s_u, source_pid)
+        vab.y = get_real(self._d_v, dest_pid)-get_real(self._s_v, source_pid)
+        vab.z = get_real(self._d_w, dest_pid)-get_real(self._s_w, source_pid)
         
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-        
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
-            
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
-            
-        else:            
-            grad = kernel.gradient(self._dst, self._src, hab)
+        grad = self.kernel_gradient(source_pid, dest_pid, kernel)
 
         if self.rkpm_first_order_correction:
             pass
@@ -142,7 +128,7 @@ cdef class EnergyEquationAVisc(SPHFunctionParticle):
         self.dst_reads.extend( ['u','v','w','p','cs'] )
     
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
         """
         Compute the contribution of particle at source_pid on particle at
         dest_pid. 
@@ -151,65 +137,52 @@ cdef class EnergyEquationAVisc(SPHFunctionParticle):
         
         """
 
-        cdef double test, gamma, alpha, beta, cs
+        cdef double test, gamma, alpha, beta, eta, mb
         cdef double pa, rhoa, pb, rhob, cab, h, mu, prod, rhoab
         cdef cPoint rab, vab
-        cdef cPoint grad, grada, gradb
+        cdef cPoint grad
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
 
         cdef double hab = 0.5 * (ha + hb)
+        cdef cPoint src, dst
 
-        #rab = Point_sub(self._dst, self._src)
-        rab.x = self._dst.x-self._src.x
-        rab.y = self._dst.y-self._src.y
-        rab.z = self._dst.z-self._src.z
+        self.get_positions(source_pid, dest_pid, &src, &dst)
+
+        #rab = Point_sub(dst, src)
+        rab.x = dst.x-src.x
+        rab.y = dst.y-src.y
+        rab.z = dst.z-src.z
         
         #vab = Point_sub(self.tmpva, self.tmpvb)
-        vab.x = self.d_u.data[dest_pid]-self.s_u.data[source_pid]
-        vab.y = self.d_v.data[dest_pid]-self.s_v.data[source_pid]
-        vab.z = self.d_w.data[dest_pid]-self.s_w.data[source_pid]
+        vab.x = get_real(self._d_u, dest_pid)-get_real(self._s_u, source_pid)
+        vab.y = get_real(self._d_v, dest_pid)-get_real(self._s_v, source_pid)
+        vab.z = get_real(self._d_w, dest_pid)-get_real(self._s_w, source_pid)
         
         test = cPoint_dot(vab, rab)
-    
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
 
         if test < 0.0:
             gamma = self.gamma 
             alpha = self.alpha
             beta = self.beta
-            cs = self.cs
             eta = self.eta
+            h = hab
 
-            pa = self.d_p.data[dest_pid]
-            pb = self.s_p.data[source_pid]
-            rhoa = self.d_rho.data[dest_pid]
-            rhob = self.s_rho.data[source_pid]
-            mb = self.s_m.data[source_pid]
+            pa = get_real(self._d_p, dest_pid)
+            pb = get_real(self._s_p, source_pid)
+            rhoa = get_real(self._d_rho, dest_pid)
+            rhob = get_real(self._s_rho, source_pid)
+            mb = get_real(self._s_m, source_pid)
 
-            cab = 0.5*(self.d_cs.data[dest_pid] + self.s_cs.data[source_pid])
+            cab = 0.5*(get_real(self._d_cs, dest_pid) +
+                       get_real(self._s_cs, source_pid))
 
             rhoab = 0.5 * (rhoa + rhob)
 
             mu = (h * test) / (cPoint_norm(rab) + eta*eta*h*h)
 
-            if self.hks:
-                grada = kernel.gradient(self._dst, self._src, ha)
-                gradb = kernel.gradient(self._dst, self._src, hb)
-            
-                grad.set((grada.x + gradb.x)*0.5,
-                         (grada.y + gradb.y)*0.5,
-                         (grada.z + gradb.z)*0.5)
-            
-            else:            
-                grad = kernel.gradient(self._dst, self._src, hab) 
+            grad = self.kernel_gradient(source_pid, dest_pid, kernel)
 
             if self.rkpm_first_order_correction:
                 pass
@@ -279,46 +252,78 @@ cdef class EnergyEquation(SPHFunctionParticle):
         self.cl_args_name.append( 'REAL const eta' )        
         
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):    
+                       KernelBase kernel, double *nr) nogil:    
     
-        cdef cPoint vab, rab
-        cdef double Pa, Pb, rhoa, rhob, rhoab, mb
-        cdef double dot, tmp
-        cdef double ca, cb, mu, piab, alpha, beta, eta
+        cdef cPoint vab
+        cdef double tmp
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef cPoint grad = self.kernel_gradient(source_pid, dest_pid, kernel)
+
+        if self.rkpm_first_order_correction:
+            pass
+
+        if self.bonnet_and_lok_correction:
+            self.bonnet_and_lok_gradient_correction(dest_pid, &grad)
+
+        vab.x = get_real(self._d_u, dest_pid)-get_real(self._s_u, source_pid)
+        vab.y = get_real(self._d_v, dest_pid)-get_real(self._s_v, source_pid)
+        vab.z = get_real(self._d_w, dest_pid)-get_real(self._s_w, source_pid)
+
+        tmp = cPoint_dot(grad, vab) * self.pair_term(source_pid, dest_pid)
+
+        nr[0] += 0.5*mb*tmp
+
+    cdef void eval_nbr_fused(self, size_t source_pid, size_t dest_pid,
+                             KernelBase kernel, NbrPair* pair, double* nr,
+                             double* dnr):
+        """ Use the kernel gradient shared in a fused neighbor loop """
+
+        cdef cPoint vab
+        cdef double tmp
+
+        if self.hks or self.bonnet_and_lok_correction:
+            self.eval_nbr(source_pid, dest_pid, kernel, nr)
+            return
 
-        cdef cPoint grad, grada, gradb
+        vab.x = get_real(self._d_u, dest_pid)-get_real(self._s_u, source_pid)
+        vab.y = get_real(self._d_v, dest_pid)-get_real(self._s_v, source_pid)
+        vab.z = get_real(self._d_w, dest_pid)-get_real(self._s_w, source_pid)
+
+        tmp = cPoint_dot(pair.grad, vab) * self.pair_term(source_pid,
+                                                           dest_pid)
+
+        nr[0] += 0.5*get_real(self._s_m, source_pid)*tmp
+
+    cpdef bint uses_pair_gradient(self):
+        return not (self.hks or self.bonnet_and_lok_correction)
+
+    cdef double pair_term(self, size_t source_pid, size_t dest_pid) nogil:
+        """ The pressure and artificial viscosity term of the pair """
+
+        cdef cPoint src, dst, vab, rab
+        cdef double Pa, Pb, rhoa, rhob, rhoab
+        cdef double dot, tmp
+        cdef double cab, mu, piab, alpha, beta, eta
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
 
         cdef double hab = 0.5 * (ha + hb)
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
-        
-        #rab = Point_sub(self._dst, self._src)
-        rab.x = self._dst.x-self._src.x
-        rab.y = self._dst.y-self._src.y
-        rab.z = self._dst.z-self._src.z
+        self.get_positions(source_pid, dest_pid, &src, &dst)
+        rab = cPoint_sub(dst, src)
         
-        #vab = Point_sub(self.tmpva, self.tmpvb)
-        vab.x = self.d_u.data[dest_pid]-self.s_u.data[source_pid]
-        vab.y = self.d_v.data[dest_pid]-self.s_v.data[source_pid]
-        vab.z = self.d_w.data[dest_pid]-self.s_w.data[source_pid]
+        vab.x = get_real(self._d_u, dest_pid)-get_real(self._s_u, source_pid)
+        vab.y = get_real(self._d_v, dest_pid)-get_real(self._s_v, source_pid)
+        vab.z = get_real(self._d_w, dest_pid)-get_real(self._s_w, source_pid)
         
         dot = cPoint_dot(vab, rab)
     
-        Pa = self.d_p.data[dest_pid]
-        rhoa = self.d_rho.data[dest_pid]        
+        Pa = get_real(self._d_p, dest_pid)
+        rhoa = get_real(self._d_rho, dest_pid)        
 
-        Pb = self.s_p.data[source_pid]
-        rhob = self.s_rho.data[source_pid]
-        mb = self.s_m.data[source_pid]
+        Pb = get_real(self._s_p, source_pid)
+        rhob = get_real(self._s_rho, source_pid)
 
         tmp = Pa/(rhoa*rhoa) + Pb/(rhob*rhob)
         
@@ -327,9 +332,9 @@ cdef class EnergyEquation(SPHFunctionParticle):
             alpha = self.alpha
             beta = self.beta
             eta = self.eta
-            gamma = self.gamma
 
-            cab = 0.5 * (self.d_cs.data[dest_pid] + self.s_cs.data[source_pid])
+            cab = 0.5 * (get_real(self._d_cs, dest_pid) +
+                         get_real(self._s_cs, source_pid))
 
             rhoab = 0.5 * (rhoa + rhob)
 
@@ -339,28 +344,7 @@ cdef class EnergyEquation(SPHFunctionParticle):
             piab = -alpha*cab*mu + beta*mu*mu
             piab /= rhoab
 
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
-            
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
-            
-        else:            
-            grad = kernel.gradient(self._dst, self._src, hab)
-
-        if self.rkpm_first_order_correction:
-            pass
-
-        if self.bonnet_and_lok_correction:
-            self.bonnet_and_lok_gradient_correction(dest_pid, &grad)
-
-        tmp += piab
-        
-        tmp = cPoint_dot(grad, vab) * tmp
-
-        nr[0] += 0.5*mb*tmp
+        return tmp + piab
 
     def cl_eval(self, object queue, object context):
 
@@ -418,7 +402,7 @@ cdef class ArtificialHeat(SPHFunctionParticle):
         self.d_q = self.dest.get_carray("q")
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
     
     
         cdef cPoint vab, xab
@@ -428,28 +412,23 @@ cdef class ArtificialHeat(SPHFunctionParticle):
         cdef double ea, eb, diva, divb
         cdef double qa, qb
 
-        cdef cPoint grad, grada, gradb
+        cdef cPoint grad
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
 
         cdef double hab = 0.5 * (ha + hb)        
         
-        cdef double mb = self.s_m.data[source_pid]
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef cPoint src, dst
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
-
-        vab.x = self.d_u.data[dest_pid]-self.s_u.data[source_pid]
-        vab.y = self.d_v.data[dest_pid]-self.s_v.data[source_pid]
-        vab.z = self.d_w.data[dest_pid]-self.s_w.data[source_pid]
+        vab.x = get_real(self._d_u, dest_pid)-get_real(self._s_u, source_pid)
+        vab.y = get_real(self._d_v, dest_pid)-get_real(self._s_v, source_pid)
+        vab.z = get_real(self._d_w, dest_pid)-get_real(self._s_w, source_pid)
         
-        xab = cPoint_sub(self._dst, self._src)
+        xab = cPoint_sub(dst, src)
         
         dot = cPoint_dot(xab, vab)
 
@@ -457,15 +436,16 @@ cdef class ArtificialHeat(SPHFunctionParticle):
         if dot < 0:
             eta = self.eta
 
-            ca = self.d_cs.data[dest_pid]
-            cb = self.s_cs.data[source_pid]
+            ca = get_real(self._d_cs, dest_pid)
+            cb = get_real(self._s_cs, source_pid)
 
-            rhoab = 0.5 * (self.d_rho.data[dest_pid] + \
-                           self.s_rho.data[source_pid])
+            rhoab = 0.5 * (get_real(self._d_rho, dest_pid) + \
+                           get_real(self._s_rho, source_pid))
 
-            mb = self.s_m.data[source_pid]
+            mb = get_real(self._s_m, source_pid)
 
-            eab = self.d_e.data[dest_pid] - self.s_e.data[source_pid]
+            eab = (get_real(self._d_e, dest_pid) -
+                   get_real(self._s_e, source_pid))
            
             #qa = ha * (g1 * ca + g2 * ha * (fabs(diva) - diva))
             #qb = hb * (g1 * cb + g2 * hb * (fabs(divb) - divb))
@@ -478,16 +458,7 @@ cdef class ArtificialHeat(SPHFunctionParticle):
             
             tmp /= rhoab
 
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
-            
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
-            
-        else:            
-            grad = kernel.gradient(self._dst, self._src, hab)
+        grad = self.kernel_gradient(source_pid, dest_pid, kernel)
 
         if self.rkpm_first_order_correction:
             pass
@@ -6,7 +6,7 @@
 # Copyright (c) 2009, Prabhu Ramachandran
 
 #sph imports
-from pysph.sph.sph_func cimport SPHFunction
+from pysph.sph.sph_func cimport SPHFunction, get_real
 
 cdef class IdealGasEquation(SPHFunction):
     """ Ideal gas EOS """
@@ -7,8 +7,8 @@ from pysph.base.kernels cimport KernelBase
 from pysph.solver.cl_utils import get_real
 
 cdef extern from "math.h":
-    double pow(double x, double y)
-    double sqrt(double x)
+    double pow(double x, double y) nogil
+    double sqrt(double x) nogil
 
 cdef class IdealGasEquation(SPHFunction):
     """ Ideal gas equation of state """
@@ -37,10 +37,10 @@ cdef class IdealGasEquation(SPHFunction):
         self.cl_args_name.append( 'REAL const gamma' )
 
     cdef void eval_single(self, size_t dest_pid, KernelBase kernel,
-                          double* result):
+                          double* result) nogil:
         
-        cdef double ea = self.d_e.data[dest_pid]
-        cdef double rhoa = self.d_rho.data[dest_pid]
+        cdef double ea = get_real(self._d_e, dest_pid)
+        cdef double rhoa = get_real(self._d_rho, dest_pid)
         cdef double gamma = self.gamma
 
         result[0] = (gamma-1.0)*rhoa*ea
@@ -103,11 +103,11 @@ cdef class TaitEquation(SPHFunction):
         self.dst_reads.extend( ['rho'] )
 
     cdef void eval_single(self, size_t dest_pid, KernelBase kernel,
-                          double* result):
+                          double* result) nogil:
 
         cdef double gamma = self.gamma
 
-        cdef double rhoa = self.d_rho.data[dest_pid]
+        cdef double rhoa = get_real(self._d_rho, dest_pid)
         cdef double ratio = rhoa/self.ro
         cdef double gamma2 = 0.5*(gamma - 1.0)
         cdef double tmp = pow(ratio, gamma)
@@ -6,7 +6,7 @@
 # Copyright (c) 2009, Prabhu Ramachandran
 
 #sph imports
-from pysph.sph.sph_func cimport SPHFunction, SPHFunctionParticle
+from pysph.sph.sph_func cimport SPHFunction, SPHFunctionParticle, get_real
 
 #base imports 
 from pysph.base.particle_array cimport ParticleArray
@@ -5,8 +5,10 @@ from pysph.solver.cl_utils import HAS_CL, get_scalar_buffer, get_real
 if HAS_CL:
     import pyopencl as cl
 
+from libc.math cimport acos, sin, cos
+
 from pysph.base.point cimport Point, cPoint, cPoint_length, cPoint_sub, \
-     cPoint_distance
+     cPoint_distance, cPoint_new
 
 #############################################################################
 # `GravityForce` class.
@@ -37,7 +39,7 @@ cdef class GravityForce(SPHFunction):
         pass
 
     cdef void eval_single(self, size_t dest_pid,
-                          KernelBase kernel, double *result):
+                          KernelBase kernel, double *result) nogil:
         """ Perform the gravity force computation """
 
         result[0] = self.gx
@@ -86,7 +88,7 @@ cdef class VectorForce(SPHFunction):
         pass
 
     cdef void eval_single(self, size_t dest_pid,
-                          KernelBase kernel, double *result):
+                          KernelBase kernel, double *result) nogil:
         """ Perform the force computation """
 
         result[0] = self.force.data.x
@@ -115,12 +117,12 @@ cdef class MoveCircleX(SPHFunction):
         pass        
 
     cdef void eval_single(self, size_t dest_pid,
-                          KernelBase kernel, double *result):
-        cdef cPoint p = cPoint(self.d_x.data[dest_pid],
-                           self.d_y.data[dest_pid], self.d_z.data[dest_pid])
-        angle = numpy.arccos(p.x/cPoint_length(p))
+                          KernelBase kernel, double *result) nogil:
+        cdef cPoint p = cPoint_new(self.d_x.data[dest_pid],
+                               self.d_y.data[dest_pid], self.d_z.data[dest_pid])
+        cdef double angle = acos(p.x/cPoint_length(p))
 
-        fx = -numpy.sin(angle)
+        cdef double fx = -sin(angle)
         
         if p.y < 0:
             fx *= -1
@@ -151,12 +153,12 @@ cdef class MoveCircleY(SPHFunction):
         pass        
 
     cdef void eval_single(self, size_t dest_pid,
-                          KernelBase kernel, double *result):
-        cdef cPoint p = cPoint(self.d_x.data[dest_pid],
-                           self.d_y.data[dest_pid], self.d_z.data[dest_pid])
-        angle = numpy.arccos(p.x/cPoint_length(p))
+                          KernelBase kernel, double *result) nogil:
+        cdef cPoint p = cPoint_new(self.d_x.data[dest_pid],
+                               self.d_y.data[dest_pid], self.d_z.data[dest_pid])
+        cdef double angle = acos(p.x/cPoint_length(p))
 
-        fy = numpy.cos(angle)
+        cdef double fy = cos(angle)
         
         result[0] = 0
         result[1] = fy
@@ -184,6 +186,7 @@ cdef class NBodyForce(SPHFunctionParticle):
                                      exclude_self=True)
 
         self.eps = eps
+        self.fusable = False
 
         self.id = 'nbody_force'
         self.tag = "velocity"
@@ -199,7 +202,7 @@ cdef class NBodyForce(SPHFunctionParticle):
         self.dst_reads.extend( ['x','y','z','m','tag'] )
 
     cdef void eval_single(self, size_t dest_pid, KernelBase kernel,
-                          double * result):
+                          double * result) nogil:
         """ Neighbors for the NBody example are by default all neighbors
         thus we return all indices of source particles.
 
@@ -209,44 +212,32 @@ cdef class NBodyForce(SPHFunctionParticle):
 
         """
 
-        cdef ParticleArray src = self.source
-        cdef ParticleArray dest = self.dest
-
-        cdef list nbrs
-        cdef int nnbrs
+        cdef long nnbrs, j
+        cdef bint same
 
         result[0] = 0.0
         result[1] = 0.0
         result[2] = 0.0
 
-        nnbrs = src.get_number_of_particles()
-        nbrs = range(nnbrs)
-
-        if not (src.name == dest.name):
-            for j in range(nnbrs):
-                self.eval_nbr(nbrs[j], dest_pid, kernel, result)
-        else:
-            for j in range(nnbrs):
-                source_pid = nbrs[j]
-                if not (source_pid == dest_pid):
-                    self.eval_nbr(source_pid, dest_pid, kernel, result)
+        with gil:
+            nnbrs = self.source.get_number_of_particles()
+            same = self.source.name == self.dest.name
+
+        for j in range(nnbrs):
+            if not (same and j == dest_pid):
+                self.eval_nbr(j, dest_pid, kernel, result)
                     
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid,
-                   KernelBase kernel, double *nr):
-
-        cdef double mb = self.s_m.data[source_pid]
+                   KernelBase kernel, double *nr) nogil:
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef cPoint src, dst
 
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-        cdef cPoint rba = cPoint_sub( self._src, self._dst )
+        cdef cPoint rba = cPoint_sub( src, dst )
 
-        cdef double invr = 1.0/(cPoint_distance(self._src,self._dst) + self.eps)
+        cdef double invr = 1.0/(cPoint_distance(src,dst) + self.eps)
         cdef double invr3 = invr*invr*invr
 
         cdef double f = mb * invr3
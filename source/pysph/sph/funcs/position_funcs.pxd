@@ -5,7 +5,8 @@
 # Copyright (c) 2009, Prabhu Ramachandran
 
 #sph imports
-from pysph.sph.sph_func cimport SPHFunction
+from pysph.sph.sph_func cimport SPHFunction, RealData, real_data, get_real,\
+     add_real, set_real
 
 cdef class PositionStepping(SPHFunction):
     pass
@@ -1,7 +1,7 @@
 #cython: cdivision=True
 #base imports 
 from pysph.base.particle_array cimport ParticleArray, LocalReal
-from pysph.base.carray cimport DoubleArray, LongArray
+from pysph.base.carray cimport BaseArray, DoubleArray, LongArray, IntArray
 from pysph.base.kernels cimport KernelBase
 
 ###############################################################################
@@ -29,36 +29,37 @@ cdef class PositionStepping(SPHFunction):
 
         self.dst_reads.extend( ['u','v','w'][:self.num_outputs] )
     
-    cpdef eval(self, KernelBase kernel, DoubleArray output1,
-               DoubleArray output2, DoubleArray output3):
-        
+    cpdef eval(self, KernelBase kernel, BaseArray output1,
+               BaseArray output2, BaseArray output3):
+        """ Add the velocities of the active LocalReal particles to the
+        outputs. The outputs of other than LocalReal particles are set
+        to 0. """
         cdef LongArray tag_arr = self.dest.get_carray('tag')
+        cdef IntArray active = self.active
+        cdef RealData out1 = real_data(output1)
+        cdef RealData out2 = real_data(output2)
+        cdef RealData out3 = real_data(output3)
 
         self.setup_iter_data()
         cdef size_t np = self.dest.get_number_of_particles()
+        cdef size_t i
 
-        if self.num_outputs == 3:
-            for i in range(np):
-                if tag_arr.data[i] == LocalReal:
-                    output1.data[i] += self.d_u.data[i]
-                    output2.data[i] += self.d_v.data[i]
-                    output3.data[i] += self.d_w.data[i]
-                else:
-                    output1.data[i] = output2.data[i] = output3.data[i] = 0
-        elif self.num_outputs == 2:
-            for i in range(np):
-                if tag_arr.data[i] == LocalReal:
-                    output1.data[i] += self.d_u.data[i]
-                    output2.data[i] += self.d_v.data[i]
-                else:
-                    output1.data[i] = output2.data[i] = 0
-        elif self.num_outputs == 1:
-            for i in range(np):
-                if tag_arr.data[i] == LocalReal:
-                    output1.data[i] += self.d_u.data[i]
-                else:
-                    output1.data[i] = 0
+        for i in range(np):
+            if tag_arr.data[i] == LocalReal:
+                if active is not None and active.data[i] == 0:
+                    continue
 
+                add_real(out1, i, get_real(self._d_u, i))
+                if self.num_outputs > 1:
+                    add_real(out2, i, get_real(self._d_v, i))
+                if self.num_outputs > 2:
+                    add_real(out3, i, get_real(self._d_w, i))
+            else:
+                set_real(out1, i, 0.0)
+                if self.num_outputs > 1:
+                    set_real(out2, i, 0.0)
+                if self.num_outputs > 2:
+                    set_real(out3, i, 0.0)
 
     def _set_extra_cl_args(self):
         pass
@@ -4,7 +4,7 @@ from pysph.base.point cimport cPoint_new, cPoint_sub, cPoint_add
 from pysph.solver.cl_utils import get_real
 
 cdef extern from "math.h":
-    double sqrt(double)
+    double sqrt(double) nogil
 
 ################################################################################
 # `SPHPressureGradient` class.
@@ -23,6 +23,8 @@ cdef class SPHPressureGradient(SPHFunctionParticle):
         SPHFunctionParticle.__init__(self, source, dest, setup_arrays,
                                      **kwargs)
 
+        self.symmetric = True
+
         self.id = 'pgrad'
         self.tag = "velocity"
 
@@ -38,46 +40,14 @@ cdef class SPHPressureGradient(SPHFunctionParticle):
         pass
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid,
-                   KernelBase kernel, double *nr):
-        cdef double mb = self.s_m.data[source_pid]
-        cdef double rhoa = self.d_rho.data[dest_pid]
-        cdef double rhob = self.s_rho.data[source_pid]
-        cdef double pa = self.d_p.data[dest_pid]
-        cdef double pb = self.s_p.data[source_pid]
-
-        cdef double ha = self.d_h.data[dest_pid]
-        cdef double hb = self.s_h.data[source_pid]
-        
-        cdef double h = 0.5*(ha + hb)
-
-        cdef double temp = 0.0
-
-        cdef cPoint grad
-        cdef cPoint grada
-        cdef cPoint gradb
+                   KernelBase kernel, double *nr) nogil:
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double temp
+        cdef cPoint grad = self.kernel_gradient(source_pid, dest_pid, kernel)
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
-
-        temp = (pa/(rhoa*rhoa) + pb/(rhob*rhob))
+        temp = self.pair_term(source_pid, dest_pid)
         temp *= -mb
 
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
-
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
-
-        else:            
-            grad = kernel.gradient(self._dst, self._src, h)
-
         if self.rkpm_first_order_correction:
             pass
 
@@ -90,6 +60,14 @@ cdef class SPHPressureGradient(SPHFunctionParticle):
             if self.num_outputs > 2:
                 nr[2] += temp*grad.z
 
+    cdef double pair_term(self, size_t source_pid, size_t dest_pid) nogil:
+        cdef double rhoa = get_real(self._d_rho, dest_pid)
+        cdef double rhob = get_real(self._s_rho, source_pid)
+        cdef double pa = get_real(self._d_p, dest_pid)
+        cdef double pb = get_real(self._s_p, source_pid)
+
+        return pa/(rhoa*rhoa) + pb/(rhob*rhob)
+
     def cl_eval(self, object queue, object context):
 
         self.set_cl_kernel_args()        
@@ -126,6 +104,8 @@ cdef class MomentumEquation(SPHFunctionParticle):
         self.gamma = gamma
         self.eta = eta
 
+        self.symmetric = True
+
         self.id = 'momentumequation'
         self.tag = "velocity"
 
@@ -152,47 +132,55 @@ cdef class MomentumEquation(SPHFunctionParticle):
         self.cl_args_name.append( 'REAL const eta' )
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid,
-                       KernelBase kernel, double *nr):
-        cdef double Pa, Pb, rhoa, rhob, rhoab, mb
+                       KernelBase kernel, double *nr) nogil:
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double tmp
+        cdef cPoint grad = self.kernel_gradient(source_pid, dest_pid, kernel)
+
+        tmp = self.pair_term(source_pid, dest_pid)
+        tmp *= -mb
+        
+        if self.rkpm_first_order_correction:
+            pass
+
+        if self.bonnet_and_lok_correction:
+            self.bonnet_and_lok_gradient_correction(dest_pid, &grad)
+
+        nr[0] += tmp*grad.x
+        if self.num_outputs > 1:
+            nr[1] += tmp*grad.y
+            if self.num_outputs > 2:
+                nr[2] += tmp*grad.z
+
+    cdef double pair_term(self, size_t source_pid, size_t dest_pid) nogil:
+        cdef double Pa, Pb, rhoa, rhob, rhoab
         cdef double dot, tmp
-        cdef double ca, cb, mu, piab, alpha, beta, eta
+        cdef double ca, cb, cab, mu, piab, alpha, beta, eta
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
 
-        cdef DoubleArray xgc, ygc, zgc
-
         cdef double hab = 0.5*(ha + hb)
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
+        cdef cPoint src, dst, rab, vab
 
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
-        
-        ca = self.d_cs.data[dest_pid]
-        cb = self.s_cs.data[source_pid]
+        ca = get_real(self._d_cs, dest_pid)
+        cb = get_real(self._s_cs, source_pid)
         
-        #rab = Point_sub(self._dst, self._src)
-        cdef cPoint rab, vab
-        rab.x = self._dst.x-self._src.x
-        rab.y = self._dst.y-self._src.y
-        rab.z = self._dst.z-self._src.z
+        self.get_positions(source_pid, dest_pid, &src, &dst)
+        rab = cPoint_sub(dst, src)
         
-        vab.x = self.d_u.data[dest_pid]-self.s_u.data[source_pid]
-        vab.y = self.d_v.data[dest_pid]-self.s_v.data[source_pid]
-        vab.z = self.d_w.data[dest_pid]-self.s_w.data[source_pid]
+        vab.x = get_real(self._d_u, dest_pid)-get_real(self._s_u, source_pid)
+        vab.y = get_real(self._d_v, dest_pid)-get_real(self._s_v, source_pid)
+        vab.z = get_real(self._d_w, dest_pid)-get_real(self._s_w, source_pid)
         
         dot = cPoint_dot(vab, rab)
     
-        Pa = self.d_p.data[dest_pid]
-        rhoa = self.d_rho.data[dest_pid]        
+        Pa = get_real(self._d_p, dest_pid)
+        rhoa = get_real(self._d_rho, dest_pid)        
 
-        Pb = self.s_p.data[source_pid]
-        rhob = self.s_rho.data[source_pid]
-        mb = self.s_m.data[source_pid]
+        Pb = get_real(self._s_p, source_pid)
+        rhob = get_real(self._s_rho, source_pid)
 
         tmp = Pa/(rhoa*rhoa) + Pb/(rhob*rhob)
         
@@ -201,7 +189,6 @@ cdef class MomentumEquation(SPHFunctionParticle):
             alpha = self.alpha
             beta = self.beta
             eta = self.eta
-            gamma = self.gamma
 
             cab = 0.5 * (ca + cb)
 
@@ -213,36 +200,7 @@ cdef class MomentumEquation(SPHFunctionParticle):
             piab = -alpha*cab*mu + beta*mu*mu
             piab /= rhoab
     
-        tmp += piab
-        tmp *= -mb
-
-        cdef cPoint grad
-        cdef cPoint grada
-        cdef cPoint gradb
-
-        if self.hks:
-
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
-            
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
-
-        else:
-            grad = kernel.gradient(self._dst, self._src, hab)
-        
-        if self.rkpm_first_order_correction:
-            pass
-
-        if self.bonnet_and_lok_correction:
-            self.bonnet_and_lok_gradient_correction(dest_pid, &grad)
-
-        nr[0] += tmp*grad.x
-        if self.num_outputs > 1:
-            nr[1] += tmp*grad.y
-            if self.num_outputs > 2:
-                nr[2] += tmp*grad.z
+        return tmp + piab
 
     def cl_eval(self, object queue, object context):
 
@@ -5,12 +5,13 @@
 # Copyright (c) 2009, Prabhu Ramachandran
 
 #sph imports
-from pysph.sph.sph_func cimport SPHFunctionParticle
+from pysph.sph.sph_func cimport SPHFunctionParticle, RealData, real_data,\
+     get_real
 
 #base imports 
 from pysph.base.particle_array cimport ParticleArray
 from pysph.base.kernels cimport KernelBase
-from pysph.base.carray cimport DoubleArray
+from pysph.base.carray cimport DoubleArray, BaseArray
 
 cdef class MonaghanArtificialVsicosity(SPHFunctionParticle):
     """ MonaghanArtificialVsicosity """
@@ -26,4 +27,5 @@ cdef class MorrisViscosity(SPHFunctionParticle):
     SPH function to compute pressure gradient.
     """
     cdef str mu
-    cdef DoubleArray d_mu, s_mu
\ No newline at end of file
+    cdef BaseArray d_mu, s_mu
+    cdef RealData _d_mu, _s_mu
\ No newline at end of file
@@ -1,6 +1,6 @@
 #cython: cdivision=True
 cdef extern from "math.h":
-    double sqrt(double)
+    double sqrt(double) nogil
 
 from pysph.base.point cimport cPoint_sub, cPoint_new, cPoint, cPoint_dot, \
         cPoint_norm
@@ -27,6 +27,8 @@ cdef class MonaghanArtificialVsicosity(SPHFunctionParticle):
         self.beta = beta
         self.gamma = gamma
 
+        self.symmetric = True
+
         self.id = 'momavisc'
         self.tag = "velocity"
 
@@ -39,51 +41,55 @@ cdef class MonaghanArtificialVsicosity(SPHFunctionParticle):
                           'u','v','w','cs','rho','tag']
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
-        cdef cPoint va, vb, vab, rab
-        cdef double Pa, Pb, rhoa, rhob, rhoab, mb
-        cdef double dot, tmp
-        cdef double ca, cb, mu, piab, alpha, beta, eta
+                       KernelBase kernel, double *nr) nogil:
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double tmp
+        cdef cPoint grad = self.kernel_gradient(source_pid, dest_pid, kernel)
+
+        tmp = self.pair_term(source_pid, dest_pid)
+        tmp *= -mb
+
+        if self.rkpm_first_order_correction:
+            pass
+
+        if self.bonnet_and_lok_correction:
+            self.bonnet_and_lok_gradient_correction(dest_pid, &grad)
 
-        cdef cPoint grad, grada, gradb
+        nr[0] += tmp*grad.x
+        nr[1] += tmp*grad.y
+        nr[2] += tmp*grad.z
+
+    cdef double pair_term(self, size_t source_pid, size_t dest_pid) nogil:
+        cdef cPoint src, dst, vab, rab
+        cdef double rhoa, rhob, rhoab
+        cdef double dot
+        cdef double ca, cb, cab, mu, piab, alpha, beta, eta
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
         
         cdef double hab = 0.5*(ha + hb)
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
+        rab = cPoint_sub(dst, src)
 
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
-        
-        va = cPoint(self.d_u.data[dest_pid], self.d_v.data[dest_pid],
-                   self.d_w.data[dest_pid])
-
-        vb = cPoint(self.s_u.data[source_pid], self.s_v.data[source_pid],
-                   self.s_w.data[source_pid])
+        vab.x = get_real(self._d_u, dest_pid) - get_real(self._s_u, source_pid)
+        vab.y = get_real(self._d_v, dest_pid) - get_real(self._s_v, source_pid)
+        vab.z = get_real(self._d_w, dest_pid) - get_real(self._s_w, source_pid)
 
-        ca = self.d_cs.data[dest_pid]
-        cb = self.s_cs.data[source_pid]
+        ca = get_real(self._d_cs, dest_pid)
+        cb = get_real(self._s_cs, source_pid)
         
-        rab = cPoint_sub(self._dst, self._src)
-        vab = cPoint_sub(va, vb)
         dot = cPoint_dot(vab, rab)
     
-        rhoa = self.d_rho.data[dest_pid]
-
-        rhob = self.s_rho.data[source_pid]
-        mb = self.s_m.data[source_pid]
+        rhoa = get_real(self._d_rho, dest_pid)
+        rhob = get_real(self._s_rho, source_pid)
 
         piab = 0
         if dot < 0:
             alpha = self.alpha
             beta = self.beta
             eta = self.eta
-            gamma = self.gamma
 
             cab = 0.5 * (ca + cb)
 
@@ -94,34 +100,8 @@ cdef class MonaghanArtificialVsicosity(SPHFunctionParticle):
             
             piab = -alpha*cab*mu + beta*mu*mu
             piab /= rhoab
-    
-        tmp = piab
-        tmp *= -mb
-
-        grad = cPoint(0,0,0)
-        grada = cPoint(0,0,0)
-        gradb = cPoint(0,0,0)
-
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
 
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
-
-        else:            
-            grad = kernel.gradient(self._dst, self._src, hab)
-
-        if self.rkpm_first_order_correction:
-            pass
-
-        if self.bonnet_and_lok_correction:
-            self.bonnet_and_lok_gradient_correction(dest_pid, &grad)
-
-        nr[0] += tmp*grad.x
-        nr[1] += tmp*grad.y
-        nr[2] += tmp*grad.z
+        return piab
 
 ################################################################################
 # `SPHViscosityMomentum` class.
@@ -163,60 +143,48 @@ cdef class MorrisViscosity(SPHFunctionParticle):
 
         self.d_mu = self.dest.get_carray(self.mu)
         self.s_mu = self.source.get_carray(self.mu)
+        self._d_mu = real_data(self.d_mu)
+        self._s_mu = real_data(self.s_mu)
 
         self.src_reads.append(self.mu)
         self.dst_reads.append(self.mu)
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid, 
-                       KernelBase kernel, double *nr):
-        cdef cPoint grad, grada, gradb
+                       KernelBase kernel, double *nr) nogil:
+        cdef cPoint grad
         
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
         
         cdef double hab = 0.5*(ha + hb)
 
-        cdef double mb = self.s_m.data[source_pid]
-        cdef double rhoa = self.d_rho.data[dest_pid]
-        cdef double rhob = self.s_rho.data[source_pid]
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef double rhoa = get_real(self._d_rho, dest_pid)
+        cdef double rhob = get_real(self._s_rho, source_pid)
 
-        cdef double mua = self.d_mu.data[dest_pid]
-        cdef double mub = self.s_mu.data[source_pid]
+        cdef double mua = get_real(self._d_mu, dest_pid)
+        cdef double mub = get_real(self._s_mu, source_pid)
 
         cdef double temp = 0.0
         cdef cPoint rab, va, vb, vab
         cdef double dot
+        cdef cPoint src, dst
 
-        va = cPoint(self.d_u.data[dest_pid], 
-                   self.d_v.data[dest_pid],
-                   self.d_w.data[dest_pid])
+        va = cPoint_new(get_real(self._d_u, dest_pid), 
+                        get_real(self._d_v, dest_pid),
+                        get_real(self._d_w, dest_pid))
         
-        vb = cPoint(self.s_u.data[source_pid],
-                   self.s_v.data[source_pid],
-                   self.s_w.data[source_pid])
+        vb = cPoint_new(get_real(self._s_u, source_pid),
+                        get_real(self._s_v, source_pid),
+                        get_real(self._s_w, source_pid))
         
         vab = cPoint_sub(va,vb)
         
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
         
-        rab = cPoint_sub(self._dst,self._src)
-
-        if self.hks:
-            grada = kernel.gradient(self._dst, self._src, ha)
-            gradb = kernel.gradient(self._dst, self._src, hb)
-            
-            grad.set((grada.x + gradb.x)*0.5,
-                     (grada.y + gradb.y)*0.5,
-                     (grada.z + gradb.z)*0.5)
+        rab = cPoint_sub(dst,src)
 
-        else:            
-            grad = kernel.gradient(self._dst, self._src, hab)
+        grad = self.kernel_gradient(source_pid, dest_pid, kernel)
 
         if self.rkpm_first_order_correction:
             pass
@@ -7,6 +7,7 @@
 
 #sph imports
 from pysph.sph.sph_func cimport SPHFunctionParticle, CSPHFunctionParticle
+from pysph.sph.sph_func cimport get_real
 
 #base imports 
 from pysph.base.particle_array cimport ParticleArray
@@ -29,55 +29,43 @@ cdef class XSPHCorrection(CSPHFunctionParticle):
         self.dst_reads = ['x','y','z','h','rho','u','v','w']
 
     cdef void eval_nbr_csph(self, size_t source_pid, size_t dest_pid,
-                            KernelBase kernel, double *nr, double *dnr):
+                            KernelBase kernel, double *nr, double *dnr) nogil:
         """
         The expression used is:
 
         """
-        cdef double temp, w, wa, wb
+        cdef double temp, w
 
         cdef double ha = self.d_h.data[dest_pid]
         cdef double hb = self.s_h.data[source_pid]
         
         cdef double hab = 0.5*(ha + hb)
 
-        cdef double rhoab = 0.5*(self.s_rho.data[source_pid] + \
-                                     self.d_rho.data[dest_pid])
+        cdef double rhoab = 0.5*(get_real(self._s_rho, source_pid) + \
+                                     get_real(self._d_rho, dest_pid))
 
-        cdef cPoint Va = cPoint(self.d_u.data[dest_pid],
-                                self.d_v.data[dest_pid],
-                                self.d_w.data[dest_pid])
+        cdef cPoint Va = cPoint_new(get_real(self._d_u, dest_pid),
+                                    get_real(self._d_v, dest_pid),
+                                    get_real(self._d_w, dest_pid))
 
-        cdef cPoint Vb = cPoint(self.s_u.data[source_pid],
-                                self.s_v.data[source_pid],
-                                self.s_w.data[source_pid])
+        cdef cPoint Vb = cPoint_new(get_real(self._s_u, source_pid),
+                                    get_real(self._s_v, source_pid),
+                                    get_real(self._s_w, source_pid))
 
         cdef cPoint Vba = cPoint_sub(Vb, Va)
 
-        cdef double mb = self.s_m.data[source_pid]
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef cPoint src, dst
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-            
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
-        if self.hks:
-            wa = kernel.function(self._dst, self._src, ha)
-            wb = kernel.function(self._dst, self._src, hb)
-
-            w = 0.5 * (wa + wb)
-
-        else:
-            w = kernel.function(self._dst, self._src, hab)
+        w = self.kernel_function(source_pid, dest_pid, kernel)
 
         if self.rkpm_first_order_correction:
             pass
 
         if self.bonnet_and_lok_correction:
-            dnr[0] += w*mb/self.s_rho.data[source_pid]
+            dnr[0] += w*mb/get_real(self._s_rho, source_pid)
 
         temp = mb * w/rhoab
 
@@ -123,7 +111,7 @@ cdef class XSPHDensityRate(SPHFunctionParticle):
         self.d_wbar = self.dest.get_carray('wbar')
 
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid,
-                       KernelBase kernel, double *nr):
+                       KernelBase kernel, double *nr) nogil:
         """
         Perform an SPH interpolation of the property `prop_name`
 
@@ -133,38 +121,33 @@ cdef class XSPHDensityRate(SPHFunctionParticle):
         cdef double h=0.5*(self.s_h.data[source_pid] + \
                                self.d_h.data[dest_pid])
 
-        cdef cPoint Va = cPoint(self.d_u.data[dest_pid]+ \
-                                  self.d_ubar.data[dest_pid],
+        cdef cPoint Va = cPoint_new(get_real(self._d_u, dest_pid)+ \
+                                      self.d_ubar.data[dest_pid],
 
-                              self.d_v.data[dest_pid]+ \
-                                  self.d_vbar.data[dest_pid],
+                                    get_real(self._d_v, dest_pid)+ \
+                                      self.d_vbar.data[dest_pid],
 
-                              self.d_w.data[dest_pid]+ \
-                                  self.d_wbar.data[dest_pid])
+                                    get_real(self._d_w, dest_pid)+ \
+                                      self.d_wbar.data[dest_pid])
 
-        cdef cPoint Vb = cPoint(self.s_u.data[source_pid]+ \
-                                  self.s_ubar.data[source_pid],
+        cdef cPoint Vb = cPoint_new(get_real(self._s_u, source_pid)+ \
+                                      self.s_ubar.data[source_pid],
 
-                              self.s_v.data[source_pid]+ \
-                                  self.s_vbar.data[source_pid],
-                              
-                              self.s_w.data[source_pid]+ \
-                                  self.s_wbar.data[source_pid])
+                                    get_real(self._s_v, source_pid)+ \
+                                      self.s_vbar.data[source_pid],
+
+                                    get_real(self._s_w, source_pid)+ \
+                                      self.s_wbar.data[source_pid])
 
         cdef cPoint Vab = cPoint_sub(Va, Vb)
-        cdef double mb = self.s_m.data[source_pid]
+        cdef double mb = get_real(self._s_m, source_pid)
         cdef double temp
+        cdef cPoint src, dst
 
-        self._src.x = self.s_x.data[source_pid]
-        self._src.y = self.s_y.data[source_pid]
-        self._src.z = self.s_z.data[source_pid]
-
-        self._dst.x = self.d_x.data[dest_pid]
-        self._dst.y = self.d_y.data[dest_pid]
-        self._dst.z = self.d_z.data[dest_pid]
+        self.get_positions(source_pid, dest_pid, &src, &dst)
 
         #grad = self.kernel_gradient_evaluation[dest_pid][source_pid]
-        cdef cPoint grad = kernel.gradient(self._dst, self._src, h)
+        cdef cPoint grad = kernel.gradient(dst, src, h)
 
         if self.rkpm_first_order_correction:
             pass
@@ -8,9 +8,9 @@ cimport numpy
 # standard imports
 from pysph.base.nnps cimport NNPSManager, NbrParticleLocatorBase
 from pysph.base.kernels cimport KernelBase
-from pysph.base.carray cimport DoubleArray, LongArray, IntArray
+from pysph.base.carray cimport BaseArray, DoubleArray, LongArray, IntArray
 from pysph.base.particle_array cimport ParticleArray
-from pysph.sph.sph_func cimport SPHFunctionParticle
+from pysph.sph.sph_func cimport SPHFunction, SPHFunctionParticle, NbrPair
 
 from pysph.sph.kernel_correction cimport KernelCorrectionManager
 
@@ -54,6 +54,10 @@ cdef class SPHCalc:
     cdef public object particles
     cdef public bint integrates
     cdef public list updates, update_arrays
+
+    # name of an int property of dest flagging the particles to
+    # evaluate, None to evaluate all particles
+    cdef public str active_prop
     
     cdef public list from_types, on_types
     cdef public int nupdates
@@ -72,11 +76,36 @@ cdef class SPHCalc:
     cpdef sph(self, str output_array1=*, str output_array2=*, 
               str output_array3=*, bint exclude_self=*) 
     
-    cpdef sph_array(self, DoubleArray output1, DoubleArray output2,
-                    DoubleArray output3, bint exclude_self=*)
+    cpdef sph_array(self, BaseArray output1, BaseArray output2,
+                    BaseArray output3, bint exclude_self=*)
+
+    cpdef bint use_pairwise(self, SPHFunction func)
 
     cdef setup_internals(self)
     cpdef check_internals(self)
 
-    cdef reset_output_array(self, DoubleArray output)
+    cpdef IntArray get_active_array(self)
+
+    cdef reset_output_array(self, BaseArray output)
+
+
+cdef class SPHCalcGroup:
+    """ Calcs evaluated in a single neighbor traversal """
+    cdef public list calcs
+    cdef public ParticleArray dest
+    cdef public KernelBase kernel
+    cdef public NNPSManager nnps_manager
+
+    # the functions of all calcs, the index of their calc and source
+    cdef list funcs
+    cdef list func_calcs
+    cdef list sources
+    cdef list source_funcs
+
+    # numerators and denominators of the functions for a particle
+    cdef DoubleArray _nr, _dnr
+
+    # compute the kernel gradient of the pairs
+    cdef public bint use_gradient
 
+    cpdef sph(self, list outputs)
@@ -20,13 +20,18 @@ logger=logging.getLogger()
 from pysph.base.particle_array cimport ParticleArray, LocalReal, Dummy
 from pysph.base.nnps cimport NNPSManager, FixedDestNbrParticleLocator
 from pysph.base.nnps cimport NbrParticleLocatorBase
+from pysph.base.nnps import NeighborLocatorType
 
-from pysph.sph.sph_func cimport SPHFunction
+from pysph.sph.sph_func cimport SPHFunction, SPHFunctionParticle, RealData,\
+     real_data, real_is_set, set_real, add_real
+from pysph.base.point cimport cPoint, cPoint_sub
+from pysph.base.cell cimport PeriodicDomain
+from pysph.base.kernels cimport evaluate_gradient
 from pysph.sph.funcs.basic_funcs cimport BonnetAndLokKernelGradientCorrectionTerms,\
     FirstOrderCorrectionMatrix, FirstOrderCorrectionTermAlpha, \
     FirstOrderCorrectionMatrixGradient, FirstOrderCorrectionVectorGradient
 
-from pysph.base.carray cimport IntArray, DoubleArray
+from pysph.base.carray cimport BaseArray, IntArray, DoubleArray, LongArray
 
 from pysph.solver.cl_utils import (HAS_CL, get_cl_include,
     get_pysph_root, cl_read)
@@ -115,6 +120,8 @@ cdef class SPHCalc:
 
         self.tag = ""
 
+        self.active_prop = None
+
         self.src_reads = []
         self.dst_reads = []
         self.initial_props = []
@@ -222,11 +229,19 @@ cdef class SPHCalc:
 
     cpdef sph(self, str output_array1=None, str output_array2=None, 
               str output_array3=None, bint exclude_self=False): 
+        """ Evaluate the functions into the named dest properties
+
+        Notes:
+        ------
+        The outputs may be stored in double or single precision. The
+        functions accumulate in double precision and the result of a
+        particle is rounded once when it is stored.
+
         """
-        """
-        cdef DoubleArray output1 = self.dest.get_carray(output_array1)
-        cdef DoubleArray output2 = self.dest.get_carray(output_array2)
-        cdef DoubleArray output3 = self.dest.get_carray(output_array3)
+        cdef BaseArray output1 = self.dest.get_carray(output_array1)
+        cdef BaseArray output2 = self.dest.get_carray(output_array2)
+        cdef BaseArray output3 = self.dest.get_carray(output_array3)
+        cdef str name
 
         if output1 is not None:
             self.reset_output_array(output1)
@@ -237,12 +252,16 @@ cdef class SPHCalc:
 
         self.sph_array(output1, output2, output3, exclude_self)
 
+        for name in (output_array1, output_array2, output_array3):
+            if name is not None:
+                self.dest.mark_modified(name)
+
         # call an update on the particles if the destination pa is dirty
 
         if self.dest.is_dirty:
             self.particles.update()
 
-    cpdef sph_array(self, DoubleArray output1, DoubleArray output2, DoubleArray
+    cpdef sph_array(self, BaseArray output1, BaseArray output2, BaseArray
                      output3, bint exclude_self=False):
         """
         Similar to the sph1 function, except that this can handle
@@ -259,6 +278,13 @@ cdef class SPHCalc:
         """
 
         cdef SPHFunction func
+        cdef IntArray active = self.get_active_array()
+
+        # the pairwise evaluation adds to the outputs pair by pair
+        cdef bint double_outputs = True
+        for output in (output1, output2, output3):
+            if output is not None and not isinstance(output, DoubleArray):
+                double_outputs = False
 
         if self.kernel_correction != -1 and self.nbr_info:
             self.correction_manager.set_correction_terms(self)
@@ -267,13 +293,337 @@ cdef class SPHCalc:
             func.nbr_locator = self.nnps_manager.get_neighbor_particle_locator(
                 func.source, self.dest, self.kernel.radius())
 
-            func.eval(self.kernel, output1, output2, output3)
+            func.active = active
+            try:
+                if double_outputs and self.use_pairwise(func):
+                    func.eval_pairwise(self.kernel, <DoubleArray>output1,
+                                       <DoubleArray>output2,
+                                       <DoubleArray>output3)
+                else:
+                    func.eval(self.kernel, output1, output2, output3)
+            finally:
+                func.active = None
+
+    cpdef IntArray get_active_array(self):
+        """ Return the flags of the dest particles to evaluate
+
+        Notes:
+        ------
+        With `active_prop` set, only the dest particles with a non zero
+        value of this property are evaluated. The outputs of the other
+        particles are left as they are. This is used to evaluate the
+        particles with individual time steps (see
+        solver.integrator.BlockTimeStepIntegrator).
+
+        """
+        if self.active_prop is None:
+            return None
+
+        return self.dest.get_carray(self.active_prop)
+
+    cpdef bint use_pairwise(self, SPHFunction func):
+        """ Check if `func` may be evaluated once per pair of particles
+
+        Notes:
+        ------
+        The pairwise evaluation is used for functions with the
+        `symmetric` flag set, when the source is the destination, the
+        neighbor lists of the locator are symmetric and no kernel
+        correction is requested. Otherwise the function is evaluated
+        with `eval`.
+
+        """
+        cdef SPHFunctionParticle pfunc
+
+        if not isinstance(func, SPHFunctionParticle):
+            return False
+
+        pfunc = func
+
+        if not pfunc.symmetric or pfunc.source is not self.dest:
+            return False
+
+        if self.kernel_correction != -1:
+            return False
 
-    cdef reset_output_array(self, DoubleArray output):
+        if pfunc.bonnet_and_lok_correction or \
+                pfunc.rkpm_first_order_correction:
+            return False
 
+        if (pfunc.nbr_locator.locator_type ==
+                NeighborLocatorType.NSquareNeighborLocator):
+            return False
+
+        return pfunc.nbr_locator.has_symmetric_lists()
+
+    cdef reset_output_array(self, BaseArray output):
+        """ Set the output of the particles to evaluate to 0 """
         cdef int i
-        for i in range(output.length):
-            output.data[i] = 0.0
+        cdef IntArray active = self.get_active_array()
+        cdef RealData data = real_data(output)
+
+        if active is None:
+            for i in range(output.length):
+                set_real(data, i, 0.0)
+        else:
+            for i in range(output.length):
+                if active.data[i] != 0:
+                    set_real(data, i, 0.0)
+
+###############################################################################
+# `SPHCalcGroup` class.
+###############################################################################
+cdef class SPHCalcGroup:
+    """ Evaluate several calcs in a single neighbor traversal
+
+    Members:
+    --------
+    calcs -- the calcs of the group
+    dest -- the destination particle array common to the calcs
+    kernel -- the kernel common to the calcs
+    nnps_manager -- the NNPSManager for the neighbor locators
+
+    Notes:
+    ------
+    For each destination particle, the neighbors from each source are
+    visited once. The separation, mean smoothing length and kernel
+    gradient of a pair are computed once and passed to the
+    `eval_nbr_fused` hook of every function of the group that has the
+    same source. The kernel gradient is computed only if a function of
+    the group uses it (see `SPHFunctionParticle.uses_pair_gradient`).
+
+    The calcs must be independent, that is, no calc of the group may
+    read a property written by another calc of the group. The
+    integrating calcs of an integrator step satisfy this since they
+    write to the step arrays only.
+
+    """
+    def __init__(self, list calcs):
+        """ Constructor
+
+        Parameters:
+        -----------
+        calcs -- the calcs to evaluate, accepted by `can_fuse` and with
+        the same destination and kernel
+
+        """
+        cdef SPHCalc calc
+        cdef SPHFunctionParticle func
+        cdef int i, j
+
+        if len(calcs) == 0:
+            raise ValueError, 'SPHCalcGroup needs at least one calc'
+
+        calc = calcs[0]
+        self.calcs = calcs
+        self.dest = calc.dest
+        self.kernel = calc.kernel
+        self.nnps_manager = calc.nnps_manager
+
+        self.funcs = []
+        self.func_calcs = []
+        self.sources = []
+        self.source_funcs = []
+
+        for i in range(len(calcs)):
+            calc = calcs[i]
+
+            if not SPHCalcGroup.can_fuse(calc):
+                msg = 'Calc %s can not be evaluated in a group'%(calc.id)
+                raise ValueError, msg
+
+            if calc.dest is not self.dest or calc.kernel is not self.kernel:
+                msg = 'Calcs of a group need the same dest and kernel'
+                raise ValueError, msg
+
+            for func in calc.funcs:
+                if func.source in self.sources:
+                    j = self.sources.index(func.source)
+                else:
+                    j = len(self.sources)
+                    self.sources.append(func.source)
+                    self.source_funcs.append([])
+
+                self.source_funcs[j].append(len(self.funcs))
+                self.funcs.append(func)
+                self.func_calcs.append(i)
+
+        self._nr = DoubleArray(3*len(self.funcs))
+        self._dnr = DoubleArray(3*len(self.funcs))
+
+        self.use_gradient = False
+        for func in self.funcs:
+            if func.uses_pair_gradient():
+                self.use_gradient = True
+
+    @staticmethod
+    def can_fuse(SPHCalc calc):
+        """ Check if the functions of `calc` support the fused loop """
+        cdef SPHFunctionParticle pfunc
+
+        if calc.kernel_correction != -1:
+            return False
+
+        for func in calc.funcs:
+            if not isinstance(func, SPHFunctionParticle):
+                return False
+
+            pfunc = func
+            if not pfunc.fusable:
+                return False
+
+        return True
+
+    cpdef sph(self, list outputs):
+        """ Evaluate the calcs of the group
+
+        Parameters:
+        -----------
+        outputs -- for each calc, the list of (up to 3) names of the
+        destination properties storing the results
+
+        Algorithm:
+        ----------
+        reset the output arrays
+        for each LocalReal particle a in dest
+            for each source
+                for each neighbor b of a from the source
+                    compute the separation and, if used, the kernel
+                    gradient
+                    call eval_nbr_fused for each function of the source
+            for each function
+                divide by the denominator if non zero
+                add the result to the outputs of its calc
+
+        """
+        cdef SPHCalc calc
+        cdef SPHFunctionParticle func
+        cdef FixedDestNbrParticleLocator loc
+        cdef PeriodicDomain domain
+        cdef ParticleArray src
+        cdef BaseArray output
+        cdef NbrPair pair
+        cdef cPoint pa, pb
+        cdef KernelBase kernel = self.kernel
+        cdef double radius_scale = kernel.radius()
+
+        cdef long a, b, k, nnbrs, np
+        cdef long* nbrs
+        cdef int i, f, m, s, num_outputs
+        cdef int ncalcs = len(self.calcs)
+        cdef int nfuncs = len(self.funcs)
+        cdef int nsources = len(self.sources)
+        cdef bint same
+
+        cdef list locators = []
+        cdef list funcs
+
+        cdef double* nr = self._nr.data
+        cdef double* dnr = self._dnr.data
+        cdef RealData* out
+        cdef LongArray tag_arr = self.dest.get_carray('tag')
+        cdef IntArray active = self.calcs[0].get_active_array()
+
+        if len(outputs) != ncalcs:
+            raise ValueError, 'One list of outputs is needed per calc'
+
+        out = <RealData*>malloc(3*ncalcs*sizeof(RealData))
+
+        for i in range(ncalcs):
+            calc = self.calcs[i]
+            for m in range(3):
+                out[3*i + m] = real_data(None)
+                if m < len(outputs[i]):
+                    output = self.dest.get_carray(outputs[i][m])
+                    calc.reset_output_array(output)
+                    out[3*i + m] = real_data(output)
+
+        for s in range(nsources):
+            locators.append(self.nnps_manager.get_neighbor_particle_locator(
+                    self.sources[s], self.dest, radius_scale))
+
+        for f in range(nfuncs):
+            func = self.funcs[f]
+            func.nbr_locator = locators[self.sources.index(func.source)]
+            func.periodic_domain = func.nbr_locator._get_periodic_domain()
+            func.setup_iter_data()
+
+        np = self.dest.get_number_of_particles()
+
+        pair.grad.x = pair.grad.y = pair.grad.z = 0.0
+
+        for a in range(np):
+            if tag_arr.data[a] != LocalReal:
+                for f in range(nfuncs):
+                    func = self.funcs[f]
+                    i = self.func_calcs[f]
+                    for m in range(func.num_outputs):
+                        if real_is_set(out[3*i + m]):
+                            set_real(out[3*i + m], a, 0.0)
+                continue
+
+            if active is not None and active.data[a] == 0:
+                continue
+
+            for f in range(3*nfuncs):
+                nr[f] = dnr[f] = 0.0
+
+            for s in range(nsources):
+                loc = locators[s]
+                src = self.sources[s]
+                funcs = self.source_funcs[s]
+                same = src is self.dest
+                domain = loc._get_periodic_domain()
+
+                pa.x = loc.d_x.data[a]
+                pa.y = loc.d_y.data[a]
+                pa.z = loc.d_z.data[a]
+
+                nbrs = loc.get_nearest_particles_ptr(a, &nnbrs, False)
+
+                for k in range(nnbrs):
+                    b = nbrs[k]
+
+                    pb.x = loc.s_x.data[b]
+                    pb.y = loc.s_y.data[b]
+                    pb.z = loc.s_z.data[b]
+
+                    if domain is not None:
+                        domain.nearest_image(&pb, pa)
+
+                    pair.rab = cPoint_sub(pa, pb)
+                    pair.hab = 0.5*(loc.d_h.data[a] + loc.s_h.data[b])
+                    if self.use_gradient:
+                        pair.grad = evaluate_gradient(kernel, pa, pb,
+                                                      pair.hab)
+
+                    for f in funcs:
+                        func = self.funcs[f]
+                        if same and b == a and func.exclude_self:
+                            continue
+
+                        func.eval_nbr_fused(b, a, kernel, &pair,
+                                            nr + 3*f, dnr + 3*f)
+
+            for f in range(nfuncs):
+                func = self.funcs[f]
+                i = self.func_calcs[f]
+                for m in range(func.num_outputs):
+                    if dnr[3*f + m] != 0.0:
+                        nr[3*f + m] /= dnr[3*f + m]
+                    if real_is_set(out[3*i + m]):
+                        add_real(out[3*i + m], a, nr[3*f + m])
+
+        free(out)
+
+        for i in range(ncalcs):
+            for m in range(len(outputs[i])):
+                self.dest.mark_modified(outputs[i][m])
+
+        # call an update on the particles if the destination pa is dirty
+
+        if self.dest.is_dirty:
+            self.calcs[0].particles.update()
 
 #############################################################################
 
@@ -3,17 +3,72 @@ cimport numpy
 
 # local imports
 from pysph.base.particle_array cimport ParticleArray, LocalReal
-from pysph.base.carray cimport DoubleArray, IntArray, LongArray, BaseArray
+from pysph.base.carray cimport DoubleArray, FloatArray, IntArray, LongArray,\
+     BaseArray
 from pysph.base.point cimport Point, cPoint, cPoint_sub
 from pysph.base.kernels cimport KernelBase
 
-from pysph.base.kernels cimport KernelBase
-from pysph.base.nnps cimport FixedDestNbrParticleLocator
+from pysph.base.cell cimport PeriodicDomain
+from pysph.base.nnps cimport FixedDestNbrParticleLocator, PairCache
+
+# Access to the data of a property stored in double or single
+# precision. One pointer is set, to the data pointer of the carray, so
+# that the data is found after the carray is resized.
+cdef struct RealData:
+    double** d
+    float** f
+
+cdef inline RealData real_data(BaseArray arr) except *:
+    """ Return the RealData of a DoubleArray or FloatArray
+
+    No pointer is set for None. The carray must be kept alive as long
+    as the RealData is used.
+
+    """
+    cdef RealData data
+    data.d = NULL
+    data.f = NULL
+
+    if isinstance(arr, DoubleArray):
+        data.d = &(<DoubleArray>arr).data
+    elif isinstance(arr, FloatArray):
+        data.f = &(<FloatArray>arr).data
+    elif arr is not None:
+        raise TypeError, 'array of type %s is not real'%(arr.get_c_type())
+
+    return data
+
+cdef inline bint real_is_set(RealData data) nogil:
+    return data.d != NULL or data.f != NULL
+
+cdef inline double get_real(RealData data, size_t i) nogil:
+    if data.f != NULL:
+        return data.f[0][i]
+    return data.d[0][i]
+
+cdef inline void set_real(RealData data, size_t i, double value) nogil:
+    if data.f != NULL:
+        data.f[0][i] = <float>value
+    else:
+        data.d[0][i] = value
+
+cdef inline void add_real(RealData data, size_t i, double value) nogil:
+    if data.f != NULL:
+        data.f[0][i] = <float>(data.f[0][i] + value)
+    else:
+        data.d[0][i] += value
 
 cdef class SPHFunction:
     cdef public ParticleArray source, dest
     cdef public FixedDestNbrParticleLocator nbr_locator
-    cdef public num_outputs
+    cdef public int num_outputs
+
+    # number of threads evaluating the dest particles
+    cdef public int num_threads
+
+    # flags of the dest particles to evaluate (None for all), set by
+    # the calc for the evaluation
+    cdef public IntArray active
 
     cdef public str name, id
     cdef public str tag
@@ -50,26 +105,47 @@ cdef class SPHFunction:
     cdef public list cl_args
     cdef public list cl_args_name
     
-    cdef public DoubleArray s_h, s_m, s_rho
-    cdef public DoubleArray s_x, s_y, s_z
-    cdef public DoubleArray s_u, s_v, s_w
-    cdef public DoubleArray s_p, s_e    
-    cdef public DoubleArray s_cs
-
-    cdef public DoubleArray d_h, d_m, d_rho
-    cdef public DoubleArray d_x, d_y, d_z
-    cdef public DoubleArray d_u, d_v, d_w
-    cdef public DoubleArray d_p, d_e    
-    cdef public DoubleArray d_cs    
+    # the positions and h are stored in double precision
+    cdef public DoubleArray s_h, s_x, s_y, s_z
+    cdef public DoubleArray d_h, d_x, d_y, d_z
+
+    # the other properties may be stored in single precision, their
+    # data is read through the RealData with a leading underscore,
+    # e.g. get_real(self._s_rho, i)
+    cdef public BaseArray s_m, s_rho
+    cdef public BaseArray s_u, s_v, s_w
+    cdef public BaseArray s_p, s_e
+    cdef public BaseArray s_cs
+
+    cdef public BaseArray d_m, d_rho
+    cdef public BaseArray d_u, d_v, d_w
+    cdef public BaseArray d_p, d_e
+    cdef public BaseArray d_cs
+
+    cdef RealData _s_m, _s_rho, _s_u, _s_v, _s_w, _s_p, _s_e, _s_cs
+    cdef RealData _d_m, _d_rho, _d_u, _d_v, _d_w, _d_p, _d_e, _d_cs
 
     cpdef setup_arrays(self)
     cpdef setup_iter_data(self)
 
-    cpdef eval(self, KernelBase kernel, DoubleArray output1,
-               DoubleArray output2, DoubleArray output3)
+    cpdef eval(self, KernelBase kernel, BaseArray output1,
+               BaseArray output2, BaseArray output3)
+
+    cdef int get_eval_threads(self)
+
+    cdef void eval_range(self, long start, long end, KernelBase kernel,
+                         long* tag, int* active, RealData* outputs,
+                         int num_outputs) nogil
 
     cdef void eval_single(self, size_t dest_pid, KernelBase kernel,
-                          double *result)
+                          double *result) nogil
+
+# Interaction data of a pair of particles computed once and shared by
+# the functions of a fused neighbor loop (see sph_calc.SPHCalcGroup)
+cdef struct NbrPair:
+    cPoint rab      # x_a - x_b
+    double hab      # 0.5*(h_a + h_b)
+    cPoint grad     # gradient of W(rab, hab) at x_a
 
 ################################################################################
 # `SPHFunctionParticle` class.
@@ -92,20 +168,64 @@ cdef class SPHFunctionParticle(SPHFunction):
     # type of kernel symmetrization to use
     cdef public bint hks    
 
+    # the interaction may be evaluated once per pair of particles
+    cdef public bint symmetric
+
+    # the function may be evaluated in a fused neighbor loop
+    cdef public bint fusable
+
+    # pair data cache of the neighbor locator and position of the
+    # current pair in it (-1 if the kernel is to be evaluated)
+    cdef PairCache _pairs
+    cdef long _pair_k
+
+    # neighbor lists of all dest particles read by `eval_single`, NULL
+    # if the neighbors are to be requested from the locator
+    cdef long* _nbr_offsets
+    cdef long* _nbr_indices
+
+    # periodic domain of the neighbor locator, None if not periodic
+    cdef PeriodicDomain periodic_domain
+
+    cdef void get_positions(self, size_t source_pid, size_t dest_pid,
+                            cPoint* src, cPoint* dst) nogil
+
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid,
-                       KernelBase kernel, double* result)
+                       KernelBase kernel, double* result) nogil
+
+    cpdef eval_pairwise(self, KernelBase kernel, DoubleArray output1,
+                        DoubleArray output2, DoubleArray output3)
+
+    cdef void eval_pair(self, size_t source_pid, size_t dest_pid,
+                        KernelBase kernel, double* nr_dest,
+                        double* nr_source)
+
+    cdef double pair_term(self, size_t source_pid, size_t dest_pid) nogil
+
+    cdef cPoint kernel_gradient(self, size_t source_pid, size_t dest_pid,
+                                KernelBase kernel) nogil
+
+    cdef double kernel_function(self, size_t source_pid, size_t dest_pid,
+                                KernelBase kernel) nogil
+
+    cdef void eval_nbr_fused(self, size_t source_pid, size_t dest_pid,
+                             KernelBase kernel, NbrPair* pair, double* nr,
+                             double* dnr)
+
+    cpdef bint uses_pair_gradient(self)
 
     cdef double rkpm_first_order_kernel_correction(self, size_t dest_pid)
 
     cdef double rkpm_first_order_gradient_correction(self, size_t dest_pid)
 
     cdef double bonnet_and_lok_gradient_correction(self, size_t dest_pid,
-                                                   cPoint* grad)
+                                                   cPoint* grad) nogil
 
 ################################################################################
 # `CSPHFunctionParticle` class.
 ################################################################################
 cdef class CSPHFunctionParticle(SPHFunctionParticle):
     cdef void eval_nbr_csph(self, size_t source_pid, size_t dest_pid,
-                            KernelBase kernel, double* result, double* dnr)
+                            KernelBase kernel, double* result,
+                            double* dnr) nogil
 
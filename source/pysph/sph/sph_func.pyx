@@ -3,6 +3,12 @@ from libc.stdlib cimport *
 cimport numpy
 import numpy
 
+from cython.parallel cimport prange
+
+from pysph.base.kernels cimport evaluate_function, evaluate_gradient
+
+from pysph.base.nnps import NeighborLocatorType
+
 def get_all_funcs():
     ''' function to gather all implemented funcs in pysph.sph.funcs package '''
     import os
@@ -91,7 +97,9 @@ cdef class SPHFunction:
     This class contains names, and arrays of common properties that will be
     needed for an operation. The data within
     these arrays, can be used as *array.data[pid]*, where pid in the particle
-    index, "data" is the actual c-pointer to the data.
+    index, "data" is the actual c-pointer to the data. The properties other
+    than the positions and h may be stored in single precision and are read
+    as *get_real(self._s_rho, pid)* instead.
 
     All arrays are prefixed with a "s_". Destination arrays prefixed by "d_"
     are an alias for the same array prefixed with "s_". For example the mass
@@ -124,6 +132,8 @@ cdef class SPHFunction:
         self.cs = 'cs'
         
         self.num_outputs = 3
+        self.num_threads = 1
+        self.active = None
 
         self.src_reads = []
         self.dst_reads = []
@@ -169,7 +179,13 @@ cdef class SPHFunction:
         return cls
     
     cpdef setup_arrays(self):
-        """ Gets the various property arrays from the particle arrays. """
+        """ Gets the various property arrays from the particle arrays.
+
+        The properties other than the positions and h may be stored in
+        single precision. Their data is read in double precision with
+        `get_real` from the RealData set here.
+
+        """
         self.s_x = self.source.get_carray(self.x)
         self.s_y = self.source.get_carray(self.y)
         self.s_z = self.source.get_carray(self.z)
@@ -195,52 +211,138 @@ cdef class SPHFunction:
         self.d_p = self.dest.get_carray(self.p)
         self.d_e = self.dest.get_carray(self.e)
         self.d_cs = self.dest.get_carray(self.cs)
+
+        self._s_u = real_data(self.s_u)
+        self._s_v = real_data(self.s_v)
+        self._s_w = real_data(self.s_w)
+        self._s_m = real_data(self.s_m)
+        self._s_rho = real_data(self.s_rho)
+        self._s_p = real_data(self.s_p)
+        self._s_e = real_data(self.s_e)
+        self._s_cs = real_data(self.s_cs)
+
+        self._d_u = real_data(self.d_u)
+        self._d_v = real_data(self.d_v)
+        self._d_w = real_data(self.d_w)
+        self._d_m = real_data(self.d_m)
+        self._d_rho = real_data(self.d_rho)
+        self._d_p = real_data(self.d_p)
+        self._d_e = real_data(self.d_e)
+        self._d_cs = real_data(self.d_cs)
     
-    cpdef eval(self, KernelBase kernel, DoubleArray output1,
-               DoubleArray output2, DoubleArray output3):
-        """ Evaluate the store the results in the output arrays """
-        cdef double result[3]
-        cdef int i
+    cpdef eval(self, KernelBase kernel, BaseArray output1,
+               BaseArray output2, BaseArray output3):
+        """ Evaluate the store the results in the output arrays
+
+        Algorithm:
+        ----------
+        split the dest particles into blocks, several per thread
+        evaluate the blocks with `num_threads` threads
+        
+        Notes:
+        ------
+        The result of a particle is computed by a single thread in the
+        order of its neighbors and only written to its own entry of the
+        outputs. The results do not depend on the number of threads.
+
+        If the `active` flags are set, only the flagged particles are
+        evaluated and the outputs of the others are left as they are.
+
+        The outputs may be stored in double or single precision. The
+        result of a particle is computed in double precision and added
+        to its output once.
+
+        """
+        cdef RealData outputs[3]
+        cdef long np, num_blocks, block_size, b, start, end
+        cdef int num_outputs = self.num_outputs
+        cdef int num_threads
         
         # get the tag array pointer
         cdef LongArray tag_arr = self.dest.get_carray('tag')
+        cdef long* tag = tag_arr.data
+        cdef int* active = NULL
+
+        if self.active is not None:
+            active = self.active.data
+
+        if num_outputs < 1 or num_outputs > 3:
+            return
 
         self.setup_iter_data()
-        cdef size_t np = self.dest.get_number_of_particles()
-        
-        if self.num_outputs == 3:
-            for i in range(np):
-                if tag_arr.data[i] == LocalReal:
-                    self.eval_single(i, kernel, result)
-                    output1.data[i] += result[0]
-                    output2.data[i] += result[1]
-                    output3.data[i] += result[2]
-                else:
-                    output1.data[i] = output2.data[i] = output3.data[i] = 0
-        elif self.num_outputs == 2:
-            for i in range(np):
-                if tag_arr.data[i] == LocalReal:
-                    self.eval_single(i, kernel, result)
-                    output1.data[i] += result[0]
-                    output2.data[i] += result[1]
-                else:
-                    output1.data[i] = output2.data[i] = 0
-        elif self.num_outputs == 1:
-            for i in range(np):
-                if tag_arr.data[i] == LocalReal:
-                    self.eval_single(i, kernel, result)
-                    output1.data[i] += result[0]
-                else:
-                    output1.data[i] = 0
+        np = self.dest.get_number_of_particles()
+
+        outputs[0] = real_data(output1)
+        if num_outputs > 1:
+            outputs[1] = real_data(output2)
+        if num_outputs > 2:
+            outputs[2] = real_data(output3)
+
+        num_threads = self.get_eval_threads()
+
+        if num_threads <= 1:
+            self.eval_range(0, np, kernel, tag, active, outputs,
+                            num_outputs)
+            return
+
+        # blocks are handed out dynamically for an even load
+        num_blocks = 4 * num_threads
+        block_size = (np + num_blocks - 1)/num_blocks
+
+        with nogil:
+            for b in prange(num_blocks, num_threads=num_threads,
+                            schedule='dynamic'):
+                start = b * block_size
+                end = start + block_size
+                if end > np:
+                    end = np
+                if start < end:
+                    self.eval_range(start, end, kernel, tag, active,
+                                    outputs, num_outputs)
+
+    cdef int get_eval_threads(self):
+        """ Return the number of threads to evaluate the function with
+
+        Override this to evaluate with a single thread when the dest
+        particles can not be evaluated independently.
+
+        """
+        return self.num_threads
+
+    cdef void eval_range(self, long start, long end, KernelBase kernel,
+                         long* tag, int* active, RealData* outputs,
+                         int num_outputs) nogil:
+        """ Evaluate the dest particles in [start, end) and add the
+        results to the outputs. The outputs of particles other than
+        LocalReal are set to 0, those of inactive particles are not
+        changed. """
+        cdef double result[3]
+        cdef long i
+        cdef int m
+
+        for i in range(start, end):
+            if tag[i] == LocalReal:
+                if active != NULL and active[i] == 0:
+                    continue
+
+                self.eval_single(i, kernel, result)
+                for m in range(num_outputs):
+                    add_real(outputs[m], i, result[m])
+            else:
+                for m in range(num_outputs):
+                    set_real(outputs[m], i, 0.0)
 
     cdef void eval_single(self, size_t dest_pid, KernelBase kernel,
-                          double * result):
+                          double * result) nogil:
         """ Evaluate the function on a single dest particle
         
-        Implement this in a subclass to do the actual computation
+        Implement this in a subclass to do the actual computation. It
+        may be called from several threads at once and must only write
+        to `result`.
 
         """
-        raise NotImplementedError, 'SPHFunction.eval_single()'
+        with gil:
+            raise NotImplementedError, 'SPHFunction.eval_single()'
     	
     cpdef setup_iter_data(self):
         """ setup operations performed in each iteration
@@ -348,7 +450,9 @@ cdef class SPHFunctionParticle(SPHFunction):
     This class contains names, and arrays of common properties that will be
     needed for any particle-particle interaction computation. The data within
     these arrays, can be used as *array.data[pid]*, where pid in the particle
-    index, "data" is the actual c-pointer to the data.
+    index, "data" is the actual c-pointer to the data. The properties other
+    than the positions and h may be stored in single precision and are read
+    as *get_real(self._s_rho, pid)* instead.
 
     All source arrays are prefixed with a "s_". All destination arrays are
     prefixed by a "d_". For example the mass property of the source will be in
@@ -375,32 +479,372 @@ cdef class SPHFunctionParticle(SPHFunction):
         # type of kernel symmetrization
         self.hks = hks
 
+        # set in subclasses implementing `pair_term`
+        self.symmetric = False
+
+        # unset in subclasses overriding `eval_single`
+        self.fusable = True
+
+        self._pairs = None
+        self._pair_k = -1
+
+        self._nbr_offsets = NULL
+        self._nbr_indices = NULL
+
+        self.periodic_domain = None
+
         if setup_arrays:
             self.setup_arrays()
 
+    cpdef eval(self, KernelBase kernel, BaseArray output1,
+               BaseArray output2, BaseArray output3):
+        """ Evaluate the function using the pair data cache of the
+        neighbor locator if it is available
+
+        Notes:
+        ------
+        The neighbors are then taken from the cache and `kernel_function`
+        and `kernel_gradient` read the cached kernel data of the pair.
+
+        With several threads the neighbor lists of all dest particles
+        are taken from the locator instead. The kernel is evaluated on
+        the fly as the position in the pair cache can not be shared.
+
+        """
+        cdef LongArray offsets = None, indices = None
+        cdef bint has_lists = self.nbr_locator is not None and \
+            self.nbr_locator.locator_type != \
+            NeighborLocatorType.NSquareNeighborLocator
+
+        if self.nbr_locator is not None:
+            self.periodic_domain = self.nbr_locator._get_periodic_domain()
+
+        # functions with their own `eval_single` are not fusable and
+        # do not iterate over the cached pairs
+        if has_lists and self.fusable:
+            if self.num_threads > 1:
+                offsets, indices = self.nbr_locator.get_neighbor_lists()
+            else:
+                self._pairs = self.nbr_locator.get_pair_cache(kernel)
+                if self._pairs is not None:
+                    offsets = self._pairs.offsets
+                    indices = self._pairs.indices
+
+        if offsets is not None:
+            self._nbr_offsets = offsets.data
+            self._nbr_indices = indices.data
+
+        try:
+            SPHFunction.eval(self, kernel, output1, output2, output3)
+        finally:
+            self._pairs = None
+            self._pair_k = -1
+            self._nbr_offsets = NULL
+            self._nbr_indices = NULL
+
+    cdef int get_eval_threads(self):
+        """ Evaluate with a single thread if the neighbors must be
+        requested from the locator, which is not thread safe """
+        if not self.fusable or self._nbr_indices == NULL:
+            return 1
+        return self.num_threads
+
     cdef void eval_single(self, size_t dest_pid, KernelBase kernel,
-                          double * result):
+                          double * result) nogil:
         """ Computes contribution of all neighbors on particle at dest_pid """
-        cdef LongArray nbrs = self.nbr_locator.get_nearest_particles(dest_pid)
-        cdef size_t nnbrs = nbrs.length
+        cdef long nnbrs
+        cdef long j, start
+        cdef long* nbrs
 
-        if self.exclude_self:
-            if self.src is self.dest:
-                # this works because nbrs has self particle in last position
-                nnbrs -= 1
-        
         result[0] = result[1] = result[2] = 0.0
+
+        if self._nbr_indices != NULL:
+            # the lists and pairs are ordered as the neighbors of the
+            # locator with the self particle in last position
+            start = self._nbr_offsets[dest_pid]
+            nnbrs = self._nbr_offsets[dest_pid+1] - start
+            if self.exclude_self and (self.source is self.dest):
+                nnbrs -= 1
+
+            if self._pairs is None:
+                for j in range(start, start + nnbrs):
+                    self.eval_nbr(self._nbr_indices[j], dest_pid, kernel,
+                                  result)
+                return
+
+            for j in range(start, start + nnbrs):
+                self._pair_k = j
+                self.eval_nbr(self._nbr_indices[j], dest_pid, kernel, result)
+
+            self._pair_k = -1
+            return
+
+        # this works because nbrs has self particle in last position
+        with gil:
+            nbrs = self.nbr_locator.get_nearest_particles_ptr(
+                dest_pid, &nnbrs, self.exclude_self)
+
         for j in range(nnbrs):
-            self.eval_nbr(nbrs.data[j], dest_pid, kernel, result)
+            self.eval_nbr(nbrs[j], dest_pid, kernel, result)
     
     cdef void eval_nbr(self, size_t source_pid, size_t dest_pid,
-                   KernelBase kernel, double * result):
+                   KernelBase kernel, double * result) nogil:
         """ Computes contribution of particle at source_pid on dest_pid
         
         Implement this in a subclass to do the actual computation
 
         """
-        raise NotImplementedError, 'SPHFunctionParticle.eval_nbr()'
+        with gil:
+            raise NotImplementedError, 'SPHFunctionParticle.eval_nbr()'
+
+    cpdef eval_pairwise(self, KernelBase kernel, DoubleArray output1,
+                        DoubleArray output2, DoubleArray output3):
+        """ Evaluate the function once per pair of neighbors
+
+        Algorithm:
+        ----------
+        get the half neighbor lists from the neighbor locator
+        for each particle a and each neighbor b > a of a
+            compute the contributions of the pair on a and b
+            add them to the outputs of a and b if they are LocalReal
+        set the outputs of particles other than LocalReal to 0
+
+        Notes:
+        ------
+        This gives the same result as `eval` for functions with the
+        `symmetric` flag set, when the source and dest are the same
+        array, the neighbor lists are symmetric and no kernel correction
+        is used. Every pair is visited once instead of twice.
+
+        The lists of a locator searching with the smoothing length of
+        the dest particle only are not symmetric if `h` varies. A
+        ValueError is raised in that case (see
+        `FixedDestNbrParticleLocator.has_symmetric_lists`).
+
+        The contributions of the pairs are added to the outputs one by
+        one, so that the outputs are double arrays. Single precision
+        outputs are evaluated with `eval`.
+
+        With the `active` flags set, contributions are only added to the
+        active particles and pairs of inactive particles are skipped.
+
+        """
+        cdef double nr_dest[3], nr_source[3]
+        cdef double* outputs[3]
+        cdef long np, a, b, k, m
+        cdef bint a_local, b_local
+        cdef int num_outputs = self.num_outputs
+
+        cdef LongArray tag_arr = self.dest.get_carray('tag')
+        cdef LongArray offsets, indices
+        cdef int* active = NULL
+
+        if self.active is not None:
+            active = self.active.data
+
+        if self.source is not self.dest:
+            msg = 'Pairwise evaluation needs the same source and dest'
+            raise ValueError, msg
+
+        self.setup_iter_data()
+
+        self.periodic_domain = self.nbr_locator._get_periodic_domain()
+
+        self.nbr_locator.update_half_list()
+        offsets = self.nbr_locator.half_offsets
+        indices = self.nbr_locator.half_indices
+
+        outputs[0] = output1.data
+        if num_outputs > 1:
+            outputs[1] = output2.data
+        if num_outputs > 2:
+            outputs[2] = output3.data
+
+        np = self.dest.get_number_of_particles()
+
+        for a in range(np):
+            a_local = tag_arr.data[a] == LocalReal and \
+                      (active == NULL or active[a] != 0)
+
+            for k in range(offsets.data[a], offsets.data[a+1]):
+                b = indices.data[k]
+                b_local = tag_arr.data[b] == LocalReal and \
+                          (active == NULL or active[b] != 0)
+
+                if not (a_local or b_local):
+                    continue
+
+                nr_dest[0] = nr_dest[1] = nr_dest[2] = 0.0
+                nr_source[0] = nr_source[1] = nr_source[2] = 0.0
+
+                self.eval_pair(b, a, kernel, nr_dest, nr_source)
+
+                for m in range(num_outputs):
+                    if a_local:
+                        outputs[m][a] += nr_dest[m]
+                    if b_local:
+                        outputs[m][b] += nr_source[m]
+
+        for a in range(np):
+            if tag_arr.data[a] != LocalReal:
+                for m in range(num_outputs):
+                    outputs[m][a] = 0
+
+    cdef void eval_pair(self, size_t source_pid, size_t dest_pid,
+                        KernelBase kernel, double* nr_dest,
+                        double* nr_source):
+        """ Computes the contributions of a pair on both particles
+
+        Notes:
+        ------
+        The interaction is assumed to be of the form
+
+            f_ab = -m_b * pair_term(a, b) * grad_a(W_ab)
+
+        with a term symmetric in a and b. Since grad_b(W_ba) is
+        -grad_a(W_ab), the contribution on b is m_a * pair_term * grad_a.
+
+        """
+        cdef double ma = get_real(self._d_m, dest_pid)
+        cdef double mb = get_real(self._s_m, source_pid)
+        cdef cPoint grad = self.kernel_gradient(source_pid, dest_pid, kernel)
+        cdef double term = self.pair_term(source_pid, dest_pid)
+
+        nr_dest[0] -= mb*term*grad.x
+        nr_dest[1] -= mb*term*grad.y
+        nr_dest[2] -= mb*term*grad.z
+
+        nr_source[0] += ma*term*grad.x
+        nr_source[1] += ma*term*grad.y
+        nr_source[2] += ma*term*grad.z
+
+    cdef double pair_term(self, size_t source_pid,
+                          size_t dest_pid) nogil:
+        """ Return the term of the interaction of a pair which is
+        symmetric in the particles
+
+        Implement this in a subclass setting the `symmetric` flag
+
+        """
+        with gil:
+            raise NotImplementedError, 'SPHFunctionParticle.pair_term()'
+
+    cdef void get_positions(self, size_t source_pid, size_t dest_pid,
+                            cPoint* src, cPoint* dst) nogil:
+        """ Load the positions of a pair of particles in src and dst
+
+        In a periodic domain, src is the image of the source particle
+        nearest to the destination particle.
+
+        """
+        src.x = self.s_x.data[source_pid]
+        src.y = self.s_y.data[source_pid]
+        src.z = self.s_z.data[source_pid]
+
+        dst.x = self.d_x.data[dest_pid]
+        dst.y = self.d_y.data[dest_pid]
+        dst.z = self.d_z.data[dest_pid]
+
+        if self.periodic_domain is not None:
+            self.periodic_domain.nearest_image(src, dst[0])
+
+    cdef cPoint kernel_gradient(self, size_t source_pid, size_t dest_pid,
+                                KernelBase kernel) nogil:
+        """ Return the kernel gradient at dest_pid for the interaction
+        with source_pid, with the symmetrization selected by `hks`
+
+        The gradient is read from the pair data cache when evaluating
+        the neighbors of the cache.
+
+        """
+        cdef cPoint grad, grada, gradb, src, dst
+        cdef double ha = self.d_h.data[dest_pid]
+        cdef double hb = self.s_h.data[source_pid]
+        cdef long k = self._pair_k
+
+        self.get_positions(source_pid, dest_pid, &src, &dst)
+
+        if self.hks:
+            grada = evaluate_gradient(kernel, dst, src, ha)
+            gradb = evaluate_gradient(kernel, dst, src, hb)
+
+            grad.x = (grada.x + gradb.x)*0.5
+            grad.y = (grada.y + gradb.y)*0.5
+            grad.z = (grada.z + gradb.z)*0.5
+
+        elif k >= 0:
+            grad.x = self._pairs.gx.data[k]
+            grad.y = self._pairs.gy.data[k]
+            grad.z = self._pairs.gz.data[k]
+
+        else:
+            grad = evaluate_gradient(kernel, dst, src, 0.5*(ha + hb))
+
+        return grad
+
+    cdef double kernel_function(self, size_t source_pid, size_t dest_pid,
+                                KernelBase kernel) nogil:
+        """ Return the kernel value for the interaction of dest_pid with
+        source_pid, with the symmetrization selected by `hks`
+
+        The value is read from the pair data cache when evaluating the
+        neighbors of the cache.
+
+        """
+        cdef cPoint src, dst
+        cdef double ha = self.d_h.data[dest_pid]
+        cdef double hb = self.s_h.data[source_pid]
+        cdef long k = self._pair_k
+
+        self.get_positions(source_pid, dest_pid, &src, &dst)
+
+        if self.hks:
+            return 0.5 * (evaluate_function(kernel, dst, src, ha) +
+                          evaluate_function(kernel, dst, src, hb))
+
+        elif k >= 0:
+            return self._pairs.w.data[k]
+
+        return evaluate_function(kernel, dst, src, 0.5*(ha + hb))
+
+    cdef void eval_nbr_fused(self, size_t source_pid, size_t dest_pid,
+                             KernelBase kernel, NbrPair* pair, double* nr,
+                             double* dnr):
+        """ Computes contribution of particle at source_pid on dest_pid
+        in a fused neighbor loop
+
+        Parameters:
+        -----------
+        pair -- the separation, mean smoothing length and kernel gradient
+        of the pair, shared by all functions of the loop
+        nr, dnr -- the numerator and denominator of the result
+
+        Notes:
+        ------
+        Symmetric functions use the shared gradient unless a kernel
+        symmetrization or correction is requested. Other functions fall
+        back to `eval_nbr`. Override this to make use of `pair`.
+
+        """
+        cdef double term
+
+        if self.symmetric and not (self.hks or
+                                   self.bonnet_and_lok_correction or
+                                   self.rkpm_first_order_correction):
+            term = -get_real(self._s_m, source_pid) * self.pair_term(
+                source_pid, dest_pid)
+            nr[0] += term*pair.grad.x
+            nr[1] += term*pair.grad.y
+            nr[2] += term*pair.grad.z
+        else:
+            self.eval_nbr(source_pid, dest_pid, kernel, nr)
+
+    cpdef bint uses_pair_gradient(self):
+        """ Return True if `eval_nbr_fused` reads the kernel gradient of
+        the pair. Override this together with `eval_nbr_fused`. """
+        return self.symmetric and not (self.hks or
+                                       self.bonnet_and_lok_correction or
+                                       self.rkpm_first_order_correction)
 
     cdef double rkpm_first_order_kernel_correction(self, size_t dest_pid):
         """ Return the first order correction term for an interaction """
@@ -427,7 +871,7 @@ cdef class SPHFunctionParticle(SPHFunction):
         return alpha * (1.0 + beta1 * rab.x + beta2 * rab.y)
 
     cdef double bonnet_and_lok_gradient_correction(self, size_t dest_pid,
-                                                   cPoint * grad):
+                                                   cPoint * grad) nogil:
         """ Correct the gradient of the kernel """
 
         cdef double x, y, z
@@ -464,30 +908,64 @@ cdef class CSPHFunctionParticle(SPHFunctionParticle):
     """
 
     cdef void eval_single(self, size_t dest_pid, KernelBase kernel,
-                          double * result):
+                          double * result) nogil:
         """ Computes contribution of all neighbors on particle at dest_pid """
         cdef double dnr[3] # denominator
-        cdef LongArray nbrs = self.nbr_locator.get_nearest_particles(dest_pid)
-        cdef size_t nnbrs = nbrs.length
-        if self.exclude_self:
-            if self.src is self.dest:
-                # this works because nbrs has self particle in last position
-                nnbrs -= 1
-        
+        cdef long nnbrs
+        cdef long j, start
+        cdef long* nbrs
+        cdef int m
+
         result[0] = result[1] = result[2] = 0.0
         dnr[0] = dnr[1] = dnr[2] = 0.0
-        for j in range(nnbrs):
-            self.eval_nbr_csph(nbrs.data[j], dest_pid, kernel, result, dnr)
+
+        if self._nbr_indices != NULL:
+            start = self._nbr_offsets[dest_pid]
+            nnbrs = self._nbr_offsets[dest_pid+1] - start
+            if self.exclude_self and (self.source is self.dest):
+                nnbrs -= 1
+
+            if self._pairs is None:
+                for j in range(start, start + nnbrs):
+                    self.eval_nbr_csph(self._nbr_indices[j], dest_pid,
+                                       kernel, result, dnr)
+            else:
+                for j in range(start, start + nnbrs):
+                    self._pair_k = j
+                    self.eval_nbr_csph(self._nbr_indices[j], dest_pid,
+                                       kernel, result, dnr)
+
+                self._pair_k = -1
+
+        else:
+            # this works because nbrs has self particle in last position
+            with gil:
+                nbrs = self.nbr_locator.get_nearest_particles_ptr(
+                    dest_pid, &nnbrs, self.exclude_self)
+
+            for j in range(nnbrs):
+                self.eval_nbr_csph(nbrs[j], dest_pid, kernel, result, dnr)
         
         for m in range(3):
             if dnr[m] != 0.0:
                 result[m] /= dnr[m]
     
     cdef void eval_nbr_csph(self, size_t source_pid, size_t dest_pid,
-                            KernelBase kernel, double * result, double * dnr):
+                            KernelBase kernel, double * result,
+                            double * dnr) nogil:
         """ Compute influence when denominator is separately affected by nbrs
         
         This is used in cases such as CSPH where the summation if weighted
         by the kernel sum of all the neighboring particles
         """
-        raise NotImplementedError, 'CSPHFunctionParticle.evaleval_nbr_csph()'
+        with gil:
+            raise NotImplementedError, 'CSPHFunctionParticle.evaleval_nbr_csph()'
+
+    cdef void eval_nbr_fused(self, size_t source_pid, size_t dest_pid,
+                             KernelBase kernel, NbrPair* pair, double* nr,
+                             double* dnr):
+        """ Accumulate the numerator and denominator in a fused loop """
+        self.eval_nbr_csph(source_pid, dest_pid, kernel, nr, dnr)
+
+    cpdef bint uses_pair_gradient(self):
+        return False
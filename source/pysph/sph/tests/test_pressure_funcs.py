@@ -162,6 +162,29 @@ class SPHPressureGradientTestCase(PressureForceTestCase):
             self.assertAlmostEqual(reference_solution[i].y, tmpy[i])
             self.assertAlmostEqual(reference_solution[i].z, tmpz[i])
 
+    def test_eval_pairwise(self):
+        """ Test the evaluation once per pair of particles """
+
+        pa = self.pa
+        func = self.grad_func
+
+        self.assertTrue(func.symmetric)
+
+        k = base.CubicSplineKernel(dim=2)
+
+        tmpx = pa.properties['tmpx']
+        tmpy = pa.properties['tmpy']
+        tmpz = pa.properties['tmpz']        
+
+        func.eval_pairwise(k, tmpx, tmpy, tmpz)
+
+        reference_solution = self.get_reference_solution()
+
+        for i in range(self.np):
+            self.assertAlmostEqual(reference_solution[i].x, tmpx[i])
+            self.assertAlmostEqual(reference_solution[i].y, tmpy[i])
+            self.assertAlmostEqual(reference_solution[i].z, tmpz[i])
+
     def test_cl_eval(self):
         """ Test the PyOpenCL implementation """
 
@@ -300,6 +323,29 @@ class MomentumEquationTestCase(PressureForceTestCase):
             self.assertAlmostEqual(reference_solution[i].y, tmpy[i])
             self.assertAlmostEqual(reference_solution[i].z, tmpz[i])
 
+    def test_eval_pairwise(self):
+        """ Test the evaluation once per pair of particles """
+
+        pa = self.pa
+        func = self.mom_func
+
+        self.assertTrue(func.symmetric)
+
+        k = base.CubicSplineKernel(dim=2)
+
+        tmpx = pa.properties['tmpx']
+        tmpy = pa.properties['tmpy']
+        tmpz = pa.properties['tmpz']        
+
+        func.eval_pairwise(k, tmpx, tmpy, tmpz)
+
+        reference_solution = self.get_reference_solution()
+
+        for i in range(self.np):
+            self.assertAlmostEqual(reference_solution[i].x, tmpx[i])
+            self.assertAlmostEqual(reference_solution[i].y, tmpy[i])
+            self.assertAlmostEqual(reference_solution[i].z, tmpz[i])
+
     def test_cl_eval(self):
         """ Test the PyOpenCL implementation """
 
@@ -321,6 +367,74 @@ class MomentumEquationTestCase(PressureForceTestCase):
                 self.assertAlmostEqual(reference_solution[i].y, pa._tmpy[i], 6)
                 self.assertAlmostEqual(reference_solution[i].z, pa._tmpz[i], 6)
                 
+class NonUniformHTestCase(unittest.TestCase):
+    """ Test the pairwise evaluation with varying smoothing lengths """
+
+    def setUp(self):
+        numpy.random.seed(4)
+        x, y = numpy.mgrid[0:1:0.1, 0:1:0.1]
+        x = x.ravel() + numpy.random.uniform(-0.02, 0.02, x.size)
+        y = y.ravel() + numpy.random.uniform(-0.02, 0.02, y.size)
+
+        self.np = x.size
+
+        self.pa = base.get_particle_array(
+            name="test", x=x, y=y,
+            u=numpy.random.random(x.size), v=numpy.random.random(x.size),
+            p=numpy.random.random(x.size),
+            h=numpy.random.uniform(0.06, 0.15, x.size),
+            m=numpy.ones_like(x) * 0.01, cs=numpy.ones_like(x),
+            rho=numpy.random.uniform(0.9, 1.1, x.size),
+            tmpx=numpy.zeros_like(x), tmpy=numpy.zeros_like(x),
+            tmpz=numpy.zeros_like(x))
+
+        self.funcs = [sph.SPHPressureGradient.withargs(),
+                      sph.MomentumEquation.withargs(alpha=1.0, beta=1.0,
+                                                    gamma=1.4, eta=0.1)]
+
+    def get_func(self, func, variable_h):
+        pa = self.pa
+        func = func.get_func(pa, pa)
+        func.kernel = base.CubicSplineKernel(dim=2)
+        func.nbr_locator = base.Particles.get_neighbor_particle_locator(
+            pa, pa, variable_h=variable_h)
+
+        return func
+
+    def test_eval_pairwise(self):
+        """ Test the pairwise evaluation against `eval` """
+
+        pa = self.pa
+        k = base.CubicSplineKernel(dim=2)
+
+        for func in self.funcs:
+            func = self.get_func(func, variable_h=True)
+            self.assertTrue(func.nbr_locator.has_symmetric_lists())
+
+            func.eval(k, pa.properties['tmpx'], pa.properties['tmpy'],
+                      pa.properties['tmpz'])
+            ref = [pa.get(prop).copy() for prop in ('tmpx', 'tmpy', 'tmpz')]
+
+            func.eval_pairwise(k, pa.properties['tmpx'], pa.properties['tmpy'],
+                               pa.properties['tmpz'])
+            res = [pa.get(prop).copy() for prop in ('tmpx', 'tmpy', 'tmpz')]
+
+            for a, b in zip(ref, res):
+                self.assertTrue(numpy.allclose(a, b, rtol=1e-12, atol=1e-12))
+
+    def test_asymmetric_lists(self):
+        """ Test that the pairwise evaluation refuses asymmetric lists """
+
+        pa = self.pa
+        k = base.CubicSplineKernel(dim=2)
+
+        for func in self.funcs:
+            func = self.get_func(func, variable_h=False)
+            self.assertFalse(func.nbr_locator.has_symmetric_lists())
+
+            self.assertRaises(ValueError, func.eval_pairwise, k,
+                              pa.properties['tmpx'], pa.properties['tmpy'],
+                              pa.properties['tmpz'])
 
 if __name__ == '__main__':
     unittest.main()            
@@ -52,5 +52,272 @@ def test_sph_calc():
     assert ( abs(tmpy[0] - 2.0) < 1e-16 )
     assert ( abs(tmpz[0] - 2.0) < 1e-16 )
         
+def test_sph_calc_group():
+    """ Test the fused evaluation of calcs against separate calcs """
+
+    numpy.random.seed(0)
+    x, y = numpy.mgrid[0:1:0.1, 0:1:0.1]
+    x = x.ravel() + numpy.random.uniform(-0.02, 0.02, x.size)
+    y = y.ravel() + numpy.random.uniform(-0.02, 0.02, y.size)
+    u = numpy.random.random(x.size)
+    v = numpy.random.random(x.size)
+    p = numpy.random.random(x.size)
+    h = numpy.ones_like(x) * 0.1
+    m = numpy.ones_like(x) * 0.01
+    cs = numpy.ones_like(x)
+
+    pa = base.get_particle_array(name="test", x=x, y=y, u=u, v=v, p=p,
+                                 h=h, m=m, cs=cs)
+    names = ['rho1', 'rho2', 'ax1', 'ay1', 'az1', 'ax2', 'ay2', 'az2',
+             'e1', 'e2']
+    for name in names:
+        pa.add_property({'name':name})
+
+    particles = base.Particles(arrays=[pa,])
+    kernel = base.CubicSplineKernel(dim=2)
+
+    funcs = [sph.SPHDensityRate.withargs(),
+             sph.MomentumEquation.withargs(alpha=1.0, beta=1.0),
+             sph.EnergyEquation.withargs(alpha=1.0, beta=1.0)]
+    updates = [['rho'], ['u', 'v', 'w'], ['e']]
+
+    calcs = []
+    for func, update in zip(funcs, updates):
+        calcs.append(sph.SPHCalc(particles=particles, sources=[pa], dest=pa,
+                                 kernel=kernel, funcs=[func.get_func(pa, pa)],
+                                 updates=update, integrates=True))
+
+    calcs[0].sph('rho1')
+    calcs[1].sph('ax1', 'ay1', 'az1')
+    calcs[2].sph('e1')
+
+    group = sph.SPHCalcGroup(calcs)
+    group.sph([['rho2'], ['ax2', 'ay2', 'az2'], ['e2']])
+
+    for prop in ['rho', 'ax', 'ay', 'az', 'e']:
+        assert numpy.allclose(pa.get(prop + '1'), pa.get(prop + '2'),
+                              rtol=1e-12, atol=1e-12)
+
+    assert group.use_gradient
+
+    # summation density does not need the kernel gradient
+
+    rho_calcs = []
+    for output in ['rho1', 'rho2']:
+        func = sph.SPHRho.withargs().get_func(pa, pa)
+        rho_calcs.append(sph.SPHCalc(particles=particles, sources=[pa],
+                                     dest=pa, kernel=kernel, funcs=[func],
+                                     updates=['rho']))
+
+    rho_calcs[0].sph('rho1')
+
+    group = sph.SPHCalcGroup(rho_calcs[1:])
+    assert not group.use_gradient
+
+    group.sph([['rho2']])
+    assert numpy.allclose(pa.get('rho1'), pa.get('rho2'),
+                          rtol=1e-12, atol=1e-12)
+
+def test_single_precision():
+    """ Test the evaluation on single precision properties and outputs """
+
+    numpy.random.seed(3)
+    x, y = numpy.mgrid[0:1:0.1, 0:1:0.1]
+    x = x.ravel() + numpy.random.uniform(-0.02, 0.02, x.size)
+    y = y.ravel() + numpy.random.uniform(-0.02, 0.02, y.size)
+    u = numpy.random.random(x.size)
+    v = numpy.random.random(x.size)
+    p = numpy.random.random(x.size)
+    h = numpy.ones_like(x) * 0.1
+    m = numpy.ones_like(x) * 0.01
+    rho = numpy.random.uniform(0.9, 1.1, x.size)
+    cs = numpy.ones_like(x)
+
+    # the properties rounded to single precision
+    u, v, p, m, rho = [numpy.asarray(a, numpy.float32).astype(numpy.float64)
+                       for a in (u, v, p, m, rho)]
+
+    funcs = [sph.SPHRho.withargs(), sph.SPHDensityRate.withargs(),
+             sph.MomentumEquation.withargs(alpha=1.0, beta=1.0)]
+    updates = [['rho'], ['rho'], ['u', 'v', 'w']]
+    outputs = [['r1'], ['r2'], ['ax', 'ay', 'az']]
+    names = ['r1', 'r2', 'ax', 'ay', 'az', 'g1', 'gx', 'gy', 'gz']
+
+    results = []
+    for precision, otype in (('double', 'double'), ('single', 'float')):
+        pa = base.get_particle_array(name="test", x=x, y=y, u=u, v=v, p=p,
+                                     h=h, m=m, rho=rho, cs=cs,
+                                     precision=precision)
+        for name in names:
+            pa.add_property({'name':name, 'type':otype})
+
+        particles = base.Particles(arrays=[pa,])
+        kernel = base.CubicSplineKernel(dim=2)
+
+        calcs = []
+        for func, update, output in zip(funcs, updates, outputs):
+            calcs.append(sph.SPHCalc(particles=particles, sources=[pa],
+                                     dest=pa, kernel=kernel,
+                                     funcs=[func.get_func(pa, pa)],
+                                     updates=update,
+                                     integrates=len(calcs) > 0))
+            calcs[-1].sph(*output)
+
+        group = sph.SPHCalcGroup(calcs[1:])
+        group.sph([['g1'], ['gx', 'gy', 'gz']])
+
+        assert pa.get_carray('rho').get_c_type() == \
+               {'double':'double', 'single':'float'}[precision]
+        assert pa.get_carray('r1').get_c_type() == otype
+
+        results.append([pa.get(prop).copy() for prop in names])
+
+    # the single precision results are rounded once
+    for ref, res in zip(*results):
+        assert numpy.allclose(ref, res, rtol=1e-6, atol=1e-6*abs(ref).max())
+
+def test_pair_cache():
+    """ Test the evaluation with the pair data cache of the locators """
+
+    numpy.random.seed(1)
+    x, y = numpy.mgrid[0:1:0.1, 0:1:0.1]
+    x = x.ravel() + numpy.random.uniform(-0.02, 0.02, x.size)
+    y = y.ravel() + numpy.random.uniform(-0.02, 0.02, y.size)
+    u = numpy.random.random(x.size)
+    v = numpy.random.random(x.size)
+    h = numpy.random.uniform(0.09, 0.11, x.size)
+    m = numpy.ones_like(x) * 0.01
+    rho = numpy.random.uniform(0.9, 1.1, x.size)
+
+    funcs = [sph.SPHRho.withargs(), sph.SPHDensityRate.withargs(),
+             sph.XSPHCorrection.withargs(eps=0.5, dim=2)]
+    outputs = [['rho'], ['rho'], ['x', 'y']]
+
+    results = []
+    for budget in (0, 2**20):
+        pa = base.get_particle_array(name="test", x=x, y=y, u=u, v=v,
+                                     h=h, m=m, rho=rho)
+        for name in ['tmpx', 'tmpy', 'tmpz']:
+            pa.add_property({'name':name})
+
+        particles = base.Particles(arrays=[pa,], pair_cache_budget=budget)
+        kernel = base.CubicSplineKernel(dim=2)
+
+        result = []
+        for func, output in zip(funcs, outputs):
+            calc = sph.SPHCalc(particles=particles, sources=[pa], dest=pa,
+                               kernel=kernel, funcs=[func.get_func(pa, pa)],
+                               updates=output)
+            props = ['tmpx', 'tmpy', 'tmpz'][:len(output)]
+            calc.sph(*props)
+            result.append([pa.get(prop).copy() for prop in props])
+
+        results.append(result)
+
+        loc = particles.nnps_manager.get_neighbor_particle_locator(
+            pa, pa, kernel.radius())
+        assert loc.num_pair_builds == (budget > 0)
+
+    for ref, res in zip(*results):
+        for a, b in zip(ref, res):
+            assert numpy.allclose(a, b, rtol=1e-12, atol=1e-12)
+
+def test_pairwise_nonuniform_h():
+    """ Test the fallback to `eval` for asymmetric neighbor lists """
+
+    numpy.random.seed(5)
+    x, y = numpy.mgrid[0:1:0.1, 0:1:0.1]
+    x = x.ravel() + numpy.random.uniform(-0.02, 0.02, x.size)
+    y = y.ravel() + numpy.random.uniform(-0.02, 0.02, y.size)
+    u = numpy.random.random(x.size)
+    v = numpy.random.random(x.size)
+    p = numpy.random.random(x.size)
+    h = numpy.random.uniform(0.06, 0.15, x.size)
+    m = numpy.ones_like(x) * 0.01
+    rho = numpy.random.uniform(0.9, 1.1, x.size)
+
+    funcs = [sph.SPHDensityRate.withargs(), sph.SPHPressureGradient.withargs()]
+    outputs = [['rho'], ['u', 'v']]
+
+    for variable_h in (False, True):
+        pa = base.get_particle_array(name="test", x=x, y=y, u=u, v=v, p=p,
+                                     h=h, m=m, rho=rho)
+        for name in ['tmpx', 'tmpy', 'tmpz']:
+            pa.add_property({'name':name})
+
+        particles = base.Particles(arrays=[pa,], variable_h=variable_h)
+        kernel = base.CubicSplineKernel(dim=2)
+
+        for func, output in zip(funcs, outputs):
+            func = func.get_func(pa, pa)
+            calc = sph.SPHCalc(particles=particles, sources=[pa], dest=pa,
+                               kernel=kernel, funcs=[func], updates=output)
+            props = ['tmpx', 'tmpy', 'tmpz'][:len(output)]
+            calc.sph(*props)
+            res = [pa.get(prop).copy() for prop in props]
+
+            assert calc.use_pairwise(func) == variable_h
+
+            func.eval(kernel, pa.properties['tmpx'], pa.properties['tmpy'],
+                      pa.properties['tmpz'])
+
+            for prop, val in zip(props, res):
+                assert numpy.allclose(pa.get(prop), val, rtol=1e-12,
+                                      atol=1e-12)
+
+def test_threaded_eval():
+    """ Test the evaluation of the functions with several threads """
+
+    numpy.random.seed(2)
+    x, y = numpy.mgrid[0:1:0.05, 0:1:0.05]
+    x = x.ravel() + numpy.random.uniform(-0.01, 0.01, x.size)
+    y = y.ravel() + numpy.random.uniform(-0.01, 0.01, y.size)
+    u = numpy.random.random(x.size)
+    v = numpy.random.random(x.size)
+    p = numpy.random.random(x.size)
+    h = numpy.random.uniform(0.045, 0.055, x.size)
+    m = numpy.ones_like(x) * 0.0025
+    rho = numpy.random.uniform(0.9, 1.1, x.size)
+
+    funcs = [sph.SPHRho.withargs(), sph.SPHDensityRate.withargs(),
+             sph.SPHPressureGradient.withargs(),
+             sph.XSPHCorrection.withargs(eps=0.5, dim=2)]
+    outputs = [['rho'], ['rho'], ['u', 'v'], ['x', 'y']]
+
+    for skin in (0.0, 0.01):
+        results = []
+        for num_threads in (1, 2, 3, 8):
+            pa = base.get_particle_array(name="test", x=x, y=y, u=u, v=v,
+                                         p=p, h=h, m=m, rho=rho)
+            for name in ['tmpx', 'tmpy', 'tmpz']:
+                pa.add_property({'name':name})
+
+            particles = base.Particles(arrays=[pa,], neighbor_skin=skin)
+            kernel = base.CubicSplineKernel(dim=2)
+
+            result = []
+            for func, output in zip(funcs, outputs):
+                func = func.get_func(pa, pa)
+                func.num_threads = num_threads
+                calc = sph.SPHCalc(particles=particles, sources=[pa],
+                                   dest=pa, kernel=kernel, funcs=[func],
+                                   updates=output)
+                props = ['tmpx', 'tmpy', 'tmpz'][:len(output)]
+                calc.sph(*props)
+                result.append([pa.get(prop).copy() for prop in props])
+
+            results.append(result)
+
+        # the sum over the neighbors of a particle is in the same order
+        for res in results[1:]:
+            for a, b in zip(results[0], res):
+                for ref, val in zip(a, b):
+                    assert numpy.all(ref == val)
+
 if __name__ == '__main__':
     test_sph_calc()
+    test_sph_calc_group()
+    test_pair_cache()
+    test_single_precision()
+    test_pairwise_nonuniform_h()
+    test_threaded_eval()
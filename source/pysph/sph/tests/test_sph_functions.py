@@ -20,6 +20,30 @@ class TestSPHFuncs(unittest.TestCase):
     pass
 
 
+def run_func(func_getter, N, precision='double'):
+    """ evaluate the function between two particle arrays of N particles
+    in the precision and return the time and the result in 'tmp' """
+    kernel = kernels.CubicSplineKernel(3)
+    x = numpy.arange(N)
+    z = y = numpy.zeros(N)
+    mu = m = rho = numpy.ones(N)
+    h = 2*m
+    pa = get_particle_array(x=x, y=y, z=z, h=h, mu=mu, rho=rho, m=m, tmp=z,
+                            tx=z, ty=m, tz=z, nx=m, ny=z, nz=z, u=z, v=z, w=z,
+                            ubar=z, vbar=z, wbar=z, q=m, precision=precision)
+    pb = get_particle_array(x=x+0.1**0.5, y=y, z=z, h=h, mu=mu, rho=rho, m=m, tmp=z,
+                            tx=m, ty=z, tz=z, nx=z, ny=m, nz=z, u=z, v=z, w=z,
+                            ubar=z, vbar=z, wbar=z, q=m, precision=precision)
+    particles = Particles(arrays=[pa, pb])
+
+    func = func_getter.get_func(pa, pb)
+    calc = SPHCalc(particles, [pa], pb, kernel, [func], ['tmp']*func.num_outputs)
+    t = time.time()
+    calc.sph('tmp', 'tmp', 'tmp')
+    t = time.time() - t
+
+    return t, pb.get('tmp').copy()
+
 # function names have 't' instead of 'test' otherwise nose test collector
 # assumes them to be test functions
 def create_t_func(func_getter):
@@ -28,33 +52,9 @@ def create_t_func(func_getter):
     
     def t(self):
         ret = {}
-        da = DoubleArray()
-        pa = ParticleArray()
-        kernel = kernels.CubicSplineKernel(3)
-        get_time = time.time
         for N in Ns:
-            x = numpy.arange(N)
-            z = y = numpy.zeros(N)
-            mu = m = rho = numpy.ones(N)
-            h = 2*m
-            da = DoubleArray(N)
-            da2 = DoubleArray(N)
-            da.set_data(z)
-            da2.set_data(z)
-            pa = get_particle_array(x=x, y=y, z=z, h=h, mu=mu, rho=rho, m=m, tmp=z,
-                                    tx=z, ty=m, tz=z, nx=m, ny=z, nz=z, u=z, v=z, w=z,
-                                    ubar=z, vbar=z, wbar=z, q=m)
-            pb = get_particle_array(x=x+0.1**0.5, y=y, z=z, h=h, mu=mu, rho=rho, m=m, tmp=z,
-                                    tx=m, ty=z, tz=z, nx=z, ny=m, nz=z, u=z, v=z, w=z,
-                                    ubar=z, vbar=z, wbar=z, q=m)
-            particles = Particles(arrays=[pa, pb])
-            
-            func = func_getter.get_func(pa, pb)
-            calc = SPHCalc(particles, [pa], pb, kernel, [func], ['tmp']*func.num_outputs)
             print cls.__name__
-            t = get_time()
-            calc.sph('tmp', 'tmp', 'tmp')
-            t = get_time() - t
+            t, tmp = run_func(func_getter, N)
             
             nam = '%s'%(cls.__name__)
             ret[nam +' /%d'%(N)] = t/N
@@ -65,13 +65,35 @@ def create_t_func(func_getter):
     
     return t
 
+def create_single_t_func(func_getter):
+    """ create and return test functions for sph_funcs reading single
+    precision properties """
+    cls = func_getter.get_func_class()
+
+    def t(self):
+        for N in Ns:
+            t, tmp = run_func(func_getter, N)
+            t, tmp_single = run_func(func_getter, N, precision='single')
+
+            # the properties are exact in single precision
+            finite = numpy.isfinite(tmp)
+            self.assertEqual(list(numpy.isfinite(tmp_single)), list(finite))
+            self.assertEqual(numpy.allclose(tmp_single[finite],
+                                            tmp[finite]), True)
+
+    t.__name__ = 'test_sph_func_single__%s'%(cls.__name__)
+    t.__doc__ = 'run calc: %s on single precision properties'%(cls.__name__)
+
+    return t
+
 
 def gen_ts():
     """ generate test functions and attach them to test classes """
     for i, func in enumerate(funcs.values()):
-        t_method = create_t_func(func)
-        t_method.__name__ = t_method.__name__ + '_%d'%(i)
-        setattr(TestSPHFuncs, t_method.__name__, t_method)
+        for create in (create_t_func, create_single_t_func):
+            t_method = create(func)
+            t_method.__name__ = t_method.__name__ + '_%d'%(i)
+            setattr(TestSPHFuncs, t_method.__name__, t_method)
 
 # generate the test functions
 gen_ts()